@@ -6,26 +6,51 @@ Ce script initialise l'application web qui permet la communication entre l'IPX80
 et la box domotique Fibaro HC3.
 
 Fonctionnalités :
-- Chargement des variables d'environnement depuis un fichier .env
+- Chargement de la configuration (.env lu une seule fois, par config.py)
 - Création et configuration de l'application Flask
 - Enregistrement des routes via Blueprint
 - Lancement du serveur Flask avec gestion dynamique du port, host et mode debug
+- Lancement en production sous gunicorn (SERVER_MODE=production, voir wsgi.py)
+  ou en mode asynchrone sous uvicorn (SERVER_MODE=async, voir asgi.py)
 
 Auteur : SethiarWorks
 Date : [Date de livraison]
 """
 
-import os
+import sys
+
 from flask import Flask
-from dotenv import load_dotenv
 
-# Chargement des variables d'environnement depuis le fichier .env
-load_dotenv()
+# Configuration : le fichier .env est lu une seule fois, à l'import de config
+import config
 
 # Importation des routes définies dans un Blueprint
 from routes.fibaro_routes import fibaro_bp
 from routes.ipx_routes import ipx_bp
-from routes.fibaro_test import fibaro_test_bp
+from routes.metrics_routes import metrics_bp
+from routes.health_routes import health_bp
+from services.device_mapping import start_watching
+
+
+# Tâches de fond qui ne doivent tourner qu'une fois : dans chaque worker, elles
+# renverraient l'outbox, les relais IPX et les SMS d'alarme N fois, et multiplieraient
+# les débits autorisés par N.
+SINGLE_PROCESS_FEATURES = ("OUTBOX", "REVERSE_CHANNEL", "STATE_MIRROR", "ALARM_MONITOR", "HEALTH_PROBER",
+                           "INBOUND_GUARD")
+
+
+def check_workers(workers: int) -> None:
+    """
+    Refuse le démarrage avec plusieurs workers si une tâche de fond à instance unique
+    est activée.
+
+    Raises:
+        SystemExit: workers > 1 avec au moins une de ces options.
+    """
+    enabled = [name for name in SINGLE_PROCESS_FEATURES if getattr(config, name)]
+    if workers > 1 and enabled:
+        raise SystemExit(f"[ERREUR] SERVER_WORKERS={workers} incompatible avec {', '.join(enabled)} : "
+                         f"ces tâches tourneraient dans chaque worker. Utiliser SERVER_WORKERS=1.")
 
 
 def create_app() -> Flask:
@@ -35,25 +60,148 @@ def create_app() -> Flask:
     Returns:
         Flask: Instance configurée de l'application Flask.
     """
+    # HC3 simulée : démarrée avant la création des clients HC3, qui la ciblent
+    if config.USE_SIMULATOR:
+        from simulator.hc3 import start_simulated_hc3
+        start_simulated_hc3()
+
     app = Flask("Herve Fibaro")
     app.register_blueprint(fibaro_bp)
     app.register_blueprint(ipx_bp)
-    app.register_blueprint(fibaro_test_bp)
-    
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(health_bp)
+
+    # Authentification et limitation de débit des requêtes IPX, avant leur traitement
+    if config.INBOUND_GUARD:
+        from routes.fibaro_routes import guard_ipx_request
+        app.before_request(guard_ipx_request)
+
+    # Routes de test : importées seulement en mode debug ou simulateur
+    if config.DEBUG or config.USE_SIMULATOR:
+        from routes.fibaro_test import fibaro_test_bp
+        app.register_blueprint(fibaro_test_bp)
+
+    # Autres box HC3 : un fichier invalide empêche le démarrage plutôt que de perdre leurs commandes
+    if config.FIBARO_CONTROLLERS:
+        from services.controllers import get_controllers
+        get_controllers()
+
+    # Rechargement à chaud du fichier de mapping
+    start_watching()
+
+    # Règles sur les événements IPX, rechargées à chaud comme le mapping
+    if config.RULES:
+        from services import rules
+        rules.start_watching()
+
+    # Démarrage des threads d'envoi dès le lancement en mode asynchrone
+    if config.ASYNC_DISPATCH:
+        from controllers.control import get_dispatcher
+        get_dispatcher()
+
+    # Chargement puis suivi en tâche de fond des états de la HC3
+    if config.STATE_MIRROR:
+        from services.state_mirror import get_state_mirror
+        get_state_mirror().start()
+
+    # Recopie des changements HC3 sur les relais IPX800
+    if config.REVERSE_CHANNEL:
+        from services.reverse_channel import get_reverse_channel
+        get_reverse_channel().start(config.REVERSE_CHANNEL_SOURCE)
+
+    # Renvoi des commandes que la HC3 n'avait pas acquittées avant l'arrêt
+    if config.OUTBOX:
+        from controllers.control import replay_outbox
+        replay_outbox()
+
+    # Tick des alarmes sur l'ordonnanceur partagé
+    if config.ALARM_MONITOR:
+        from avertissements.alarm_monitor import get_alarm_monitor
+        get_alarm_monitor().start()
+
+    # Sonde de santé (/readyz) en tâche de fond
+    if config.HEALTH_PROBER:
+        from services.health import get_health_prober
+        get_health_prober().start()
+
+    # Démarrage signalé à systemd (Type=notify), puis battement du watchdog (WatchdogSec)
+    if config.SD_NOTIFY:
+        from services.sd_notify import notify, start_watchdog
+        if config.HEALTH_PROBER:
+            start_watchdog(get_health_prober().alive)
+        else:
+            start_watchdog()
+        notify("READY=1")
+
     return app
 
 
+def shutdown_app() -> None:
+    """
+    Arrête proprement les tâches de fond : les commandes déjà en file sont envoyées
+    à la HC3 avant la sortie du processus.
+    """
+    if config.SD_NOTIFY:
+        from services.sd_notify import notify
+        notify("STOPPING=1")
+
+    if config.ASYNC_DISPATCH:
+        from controllers.control import get_dispatcher
+        get_dispatcher().stop(timeout=config.SERVER_GRACEFUL_TIMEOUT)
+
+    # Files et connexions des autres box HC3
+    if config.FIBARO_CONTROLLERS:
+        from services.controllers import get_controllers
+        get_controllers().close()
+
+    if config.STATE_MIRROR:
+        from services.state_mirror import get_state_mirror
+        get_state_mirror().stop()
+
+    if config.REVERSE_CHANNEL:
+        from services.reverse_channel import get_reverse_channel
+        get_reverse_channel().stop()
+
+    if config.ALARM_MONITOR:
+        from avertissements.alarm_monitor import get_alarm_monitor
+        get_alarm_monitor().stop()
+
+    if config.HEALTH_PROBER:
+        from services.health import get_health_prober
+        get_health_prober().stop()
+
+    # Journal et alertes SMS : arrêtés seulement s'ils ont été créés (pas de thread démarré pour rien)
+    journal = getattr(sys.modules.get("services.event_journal"), "_journal", None)
+    if journal is not None:
+        journal.stop()
+
+    if config.OUTBOX:
+        from controllers.control import get_outbox
+        get_outbox().stop()
+
+    dispatcher = getattr(sys.modules.get("avertissements.sms_dispatcher"), "_dispatcher", None)
+    if dispatcher is not None:
+        dispatcher.stop()
+
+
 if __name__ == "__main__":
-    app = create_app()
+    # Mode production : gunicorn crée l'application dans chacun de ses workers
+    if config.SERVER_MODE == "production":
+        from wsgi import run_production
+        run_production()
+        raise SystemExit(0)
 
-    # Lecture des paramètres de configuration depuis les variables d'environnement
-    debug = os.getenv("FLASK_DEBUG", "False").lower() == "true"
-    host = os.getenv("FLASK_HOST", "0.0.0.0")
-    port = int(os.getenv("FLASK_PORT", 5000))
+    # Mode asynchrone : /ipx-event traité en coroutines par un serveur ASGI
+    if config.SERVER_MODE == "async":
+        from asgi import run_async
+        run_async()
+        raise SystemExit(0)
+
+    app = create_app()
 
     try:
         # Lancement de l'application Flask
-        app.run(debug=debug, host=host, port=port)
+        app.run(debug=config.DEBUG, host=config.HOST, port=config.PORT)
     except Exception as e:
         # Gestion des erreurs lors du lancement
         print(f"[ERREUR] Le serveur Flask n'a pas pu démarrer : {e}")
@@ -0,0 +1,296 @@
+"""
+asgi.py
+
+Mode asynchrone de l'application (SERVER_MODE=async), servi par un serveur ASGI
+(uvicorn).
+
+En mode gthread (wsgi.py), chaque événement IPX occupe un thread tant que la HC3
+n'a pas répondu : le nombre d'événements en cours est borné par SERVER_THREADS et
+chaque thread coûte sa pile. Ici, /ipx-event est traité dans la boucle asyncio :
+un événement en attente de la HC3 n'est qu'une coroutine, et les appels partent
+par le client asynchrone (services/async_fibaro.py, ASYNC_HC3_CONNECTIONS
+connexions keep-alive).
+
+La logique reste celle du mode synchrone : même parseur (services/ipx_parser.py),
+même mapping, même contrôleur (process_ipx_event_async). Les autres routes
+(/ipx-events, /ipx-alarms, /metrics...) sont celles de l'application Flask,
+exécutées dans un pool de SERVER_THREADS threads.
+
+Les alertes SMS gardent leur envoi en tâche de fond (SMS_ASYNC) : la session SMTP
+n'est jamais ouverte pendant le traitement d'une requête.
+
+Usage :
+    SERVER_MODE=async python app.py
+    python asgi.py
+    uvicorn --factory asgi:create_asgi_app   (sans les réglages de config.py)
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import asyncio
+import io
+import json
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import config
+from app import check_workers, create_app, shutdown_app
+from controllers.control import is_rule_input, process_ipx_event_async, resolve_ipx_command, submit_ipx_command
+from routes.fibaro_routes import IPX_PARSE_SECONDS
+from services.async_fibaro import get_async_client
+from services.device_mapping import get_fibaro_id, get_ipx_name
+from services.inbound_guard import get_inbound_guard
+from services.ipx_parser import parse_ipx_payload
+from services.logger_service import logger
+
+
+class AsyncIPXApp:
+    """
+    Application ASGI : /ipx-event en coroutines, le reste délégué à l'application Flask.
+
+    Args:
+        flask_app: Application Flask (create_app()) qui sert les autres routes.
+        threads (int): Threads du pool qui exécute l'application Flask.
+    """
+
+    def __init__(self, flask_app, threads: int = None):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(max_workers=threads or config.SERVER_THREADS,
+                                           thread_name_prefix="asgi-wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        body = await self._read_body(receive)
+        mimetype = _header(scope, b"content-type").split(";", 1)[0].strip().lower()
+        if (scope["path"] == "/ipx-event" and scope["method"] in ("GET", "POST")
+                and not mimetype.startswith("multipart/")):
+            # Contrôle d'entrée (INBOUND_GUARD) : celui des autres routes de GUARDED_PATHS
+            # (/ipx-events, /ipx-alarms, /hc3-event) est fait par app.before_request
+            refusal = _check_source(scope, body) if config.INBOUND_GUARD else None
+            if refusal is not None:
+                code, data, headers = _asgi_refusal(refusal)
+            else:
+                code, data, headers = await self.handle_ipx_event(scope["query_string"], body, mimetype)
+            await _send_json(send, code, data, headers)
+        else:
+            await self._call_wsgi(scope, body, send)
+
+    async def handle_ipx_event(self, query: bytes, body: bytes, mimetype: str) -> tuple:
+        """
+        Équivalent de routes/fibaro_routes.handle_ipx_event (mêmes codes de retour).
+
+        Returns:
+            tuple: (code HTTP, corps JSON, en-têtes supplémentaires).
+        """
+        try:
+            parse_start = time.perf_counter()
+            event = parse_ipx_payload(query, body, mimetype)
+            IPX_PARSE_SECONDS.observe(time.perf_counter() - parse_start)
+
+            if not event.complete:
+                logger.error("relais (device_id) ou etat manquants après parsing complet.")
+                return 400, {"status": "error", "message": "device_id et etat requis."}, ()
+            if event.relay is not None:
+                event.ipx_name = get_ipx_name(event.relay)
+            ipx_name = event.ipx_name
+            if ipx_name is None:
+                return 400, {"status": "error", "message": f"Aucun mapping trouvé pour ID {event.relais}"}, ()
+            if config.INBOUND_GUARD:
+                refusal = get_inbound_guard().check_device(ipx_name)
+                if refusal is not None:
+                    return _asgi_refusal(refusal)
+            device_id = get_fibaro_id(ipx_name)
+            if device_id is None and not is_rule_input(ipx_name):
+                return 400, {"status": "error", "message": f"Aucun mapping trouvé pour {ipx_name}"}, ()
+
+            if config.ASYNC_DISPATCH:
+                command = resolve_ipx_command(event)
+                if command["status"] != "OK":
+                    return 400, command, ()
+                if command["device"] is None:
+                    return 200, command, ()
+                try:
+                    # La mise en file attend le commit de la boîte d'envoi : hors de la boucle
+                    command_id = await asyncio.to_thread(submit_ipx_command, command)
+                except queue.Full:
+                    logger.warning(f"File d'envoi pleine, commande refusée pour {ipx_name}")
+                    return 503, {"status": "error", "message": "File d'envoi pleine, réessayer."}, \
+                        ((b"retry-after", b"1"),)
+                return 202, {"status": "queued", "command_id": command_id, "device": device_id,
+                             "ipx_name": ipx_name, "etat": command["etat"]}, ()
+
+            return 200, await process_ipx_event_async(event), ()
+
+        except Exception as e:
+            logger.exception(f"Erreur lors du traitement de l'événement IPX800 : {e}")
+            return 500, {"status": "error", "message": str(e)}, ()
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        return b"".join(chunks)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def close(self) -> None:
+        """
+        Arrête les tâches de fond (voir app.shutdown_app) et ferme les connexions HC3.
+        """
+        await asyncio.to_thread(shutdown_app)
+        await get_async_client().close()
+        self.executor.shutdown(wait=False)
+
+    async def _call_wsgi(self, scope, body: bytes, send) -> None:
+        status, headers, content = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._run_wsgi, _wsgi_environ(scope, body))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    def _run_wsgi(self, environ: dict) -> tuple:
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                   for name, value in headers]
+
+        iterable = self.flask_app(environ, start_response)
+        try:
+            content = b"".join(iterable)
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+        return response["status"], response["headers"], content
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _check_source(scope, body: bytes):
+    """
+    Authentification et débit de la source d'une requête /ipx-event (voir
+    routes/fibaro_routes.guard_ipx_request).
+    """
+    query = scope["query_string"]
+    token = None
+    if b"token=" in query:
+        token = dict(parse_qsl(query.decode("latin-1"))).get("token")
+    client = scope.get("client")
+    return get_inbound_guard().check_source(
+        client[0] if client else None, token or _header(scope, b"x-ipx-token"),
+        _header(scope, b"x-ipx-signature"),
+        lambda: (scope["method"].encode(), scope["path"].encode(), query, body))
+
+
+def _asgi_refusal(refusal) -> tuple:
+    code, data, headers = refusal
+    return code, data, tuple((name.lower().encode("latin-1"), value.encode("latin-1"))
+                             for name, value in headers.items())
+
+
+async def _send_json(send, code: int, data, headers=()) -> None:
+    content = json.dumps(data).encode()
+    await send({"type": "http.response.start", "status": code,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(content)).encode()), *headers]})
+    await send({"type": "http.response.body", "body": content})
+
+
+def _wsgi_environ(scope, body: bytes) -> dict:
+    """
+    Environnement WSGI (PEP 3333) construit depuis une requête ASGI.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def create_asgi_app() -> AsyncIPXApp:
+    """
+    Crée l'application ASGI (appelée dans chaque worker uvicorn).
+    """
+    return AsyncIPXApp(create_app())
+
+
+def run_async(options: dict = None) -> None:
+    """
+    Démarre uvicorn (bloquant jusqu'à l'arrêt du serveur).
+
+    Args:
+        options (dict): Réglages uvicorn qui remplacent ceux construits depuis config.py.
+    """
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("[ERREUR] uvicorn n'est pas installé : pip install uvicorn")
+
+    settings = {
+        "host": config.HOST,
+        "port": config.PORT,
+        "workers": config.SERVER_WORKERS,
+        "timeout_keep_alive": config.SERVER_KEEPALIVE,
+        "timeout_graceful_shutdown": config.SERVER_GRACEFUL_TIMEOUT,
+        "lifespan": "on",
+        # Journal d'accès désactivé : /ipx-event est déjà tracé par le logger de l'application
+        "access_log": False,
+    }
+    settings.update(options or {})
+    check_workers(settings["workers"])
+    uvicorn.run("asgi:create_asgi_app", factory=True, **settings)
+
+
+if __name__ == "__main__":
+    run_async()
@@ -0,0 +1,261 @@
+"""
+alarm_monitor.py
+
+Détection des alarmes IPX (/ipx-alarms) par machine à états, périphérique par
+périphérique :
+
+    normal     → suspect     : off reçu
+    suspect    → normal      : on maintenu ALARM_RECOVERY_DELAY s (alerte évitée)
+    suspect    → alarming    : off sans interruption depuis ALARM_DELAY s (SMS)
+    alarming   → recovering  : on reçu
+    recovering → alarming    : off reçu avant ALARM_RECOVERY_DELAY s (pas de nouveau SMS)
+    recovering → normal      : on maintenu ALARM_RECOVERY_DELAY s (SMS de retour)
+
+- suspect : un off ne déclenche rien tout de suite ; l'alarme part si le
+  périphérique reste off ALARM_DELAY secondes sans interruption. Une prise qui
+  clignote reste suspecte sans envoyer d'alerte ;
+- hystérésis : un retour à on ne compte qu'après ALARM_RECOVERY_DELAY secondes sans
+  nouveau off, pour quitter l'état suspect comme pour terminer une alarme ;
+- relances : tant que l'alarme dure, un SMS est renvoyé toutes les
+  ALARM_ESCALATE_INTERVAL secondes, ALARM_ESCALATE_MAX fois au plus ;
+- retour à la normale : un SMS signale la fin d'une alarme.
+
+Les échéances sont évaluées par un seul tick de l'ordonnanceur partagé
+(ALARM_TICK secondes), qui ne parcourt que les périphériques hors de l'état normal :
+pas de thread ni de minuterie par périphérique. L'état d'un périphérique tient dans
+un objet à slots, ce qui permet d'en suivre des centaines.
+
+L'horloge et l'envoi des notifications sont injectables : tick(now) rejoue une
+trace d'états avec une horloge simulée.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import config
+from services.logger_service import logger
+from services import metrics
+from services.scheduler import Scheduler, get_scheduler
+
+NORMAL, SUSPECT, ALARMING, RECOVERING = range(4)
+STATE_NAMES = ("normal", "suspect", "alarming", "recovering")
+
+# Notifications envoyées (notify(device, kind, level))
+ALARM, ESCALATION, RECOVERED = "alarm", "escalation", "recovered"
+
+ALARM_EVENTS = metrics.counter("fibaro_alarm_events_total",
+                               "Transitions des alarmes (suspect, suppressed, alarm, escalation, recovered)",
+                               ("event",))
+ALARMS_ACTIVE = metrics.gauge("fibaro_alarms_active", "Périphériques en alarme")
+
+
+class _AlarmSlot:
+    """
+    État d'alarme d'un périphérique.
+    """
+
+    __slots__ = ("state", "since", "off", "changed_at", "alerted_at", "level")
+
+    def __init__(self):
+        self.state = NORMAL
+        self.since = 0.0
+        self.off = False
+        self.changed_at = None
+        self.alerted_at = 0.0
+        self.level = 0
+
+
+class AlarmMonitor:
+    """
+    Machines à états des alarmes, évaluées par un tick unique.
+
+    Args:
+        notify (Callable): Fonction (device, kind, level) appelée pour chaque
+            notification (défaut : SMS envoyé hors du thread de l'ordonnanceur).
+        alarm_delay (float): Durée (s) d'un off avant l'alarme.
+        recovery_delay (float): Durée (s) d'un on avant de revenir à la normale.
+        escalate_interval (float): Intervalle (s) des relances, 0 = pas de relance.
+        escalate_max (int): Nombre maximum de relances par alarme.
+        tick (float): Période (s) du tick sur l'ordonnanceur.
+        scheduler (Scheduler): Ordonnanceur du tick (défaut : partagé).
+        clock (Callable): Horloge monotone.
+    """
+
+    def __init__(self, notify: Callable[[str, str, int], None] = None, alarm_delay: float = 60.0,
+                 recovery_delay: float = 30.0, escalate_interval: float = 1800.0, escalate_max: int = 3,
+                 tick: float = 1.0, scheduler: Scheduler = None, clock: Callable[[], float] = time.monotonic):
+        self.notify = notify or self._send_notice
+        self.alarm_delay = alarm_delay
+        self.recovery_delay = recovery_delay
+        self.escalate_interval = escalate_interval
+        self.escalate_max = escalate_max
+        self.tick_interval = tick
+        self.scheduler = scheduler or get_scheduler()
+        self.clock = clock
+        self._slots = {}
+        # Périphériques hors de l'état normal : seuls parcourus par le tick
+        self._active = {}
+        self._lock = threading.Lock()
+        self._handle = None
+        self._executor = None
+
+    def observe(self, device: str, on: bool, now: Optional[float] = None) -> str:
+        """
+        Enregistre un état reçu de l'IPX.
+
+        Returns:
+            str: État de la machine après l'échantillon.
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            slot = self._slots.get(device)
+            if slot is None:
+                slot = self._slots[device] = _AlarmSlot()
+            if slot.off == on or slot.changed_at is None:
+                slot.off = not on
+                slot.changed_at = now
+
+            if slot.state == NORMAL and not on:
+                slot.state, slot.since = SUSPECT, now
+                self._active[device] = slot
+                ALARM_EVENTS.labels("suspect").inc()
+            elif slot.state == ALARMING and on:
+                slot.state, slot.since = RECOVERING, now
+            elif slot.state == RECOVERING and not on:
+                # Retour à on trop court : l'alarme continue, sans nouveau SMS
+                slot.state = ALARMING
+            return STATE_NAMES[slot.state]
+
+    def tick(self, now: Optional[float] = None) -> int:
+        """
+        Fait avancer les machines des périphériques actifs jusqu'à `now`.
+
+        Returns:
+            int: Nombre de notifications émises.
+        """
+        now = self.clock() if now is None else now
+        notices = []
+        with self._lock:
+            for device, slot in list(self._active.items()):
+                held_on = not slot.off and now - slot.changed_at >= self.recovery_delay
+                if slot.state == SUSPECT:
+                    if held_on:
+                        slot.state = NORMAL
+                        del self._active[device]
+                        ALARM_EVENTS.labels("suppressed").inc()
+                        logger.info(f"Alarme {device} ignorée : off moins de {self.alarm_delay:g} s")
+                    elif slot.off and now - slot.changed_at >= self.alarm_delay:
+                        slot.state, slot.since = ALARMING, now
+                        slot.alerted_at, slot.level = now, 0
+                        notices.append((device, ALARM, 0))
+                elif slot.state == ALARMING:
+                    if (self.escalate_interval > 0 and slot.level < self.escalate_max
+                            and now - slot.alerted_at >= self.escalate_interval):
+                        slot.alerted_at = now
+                        slot.level += 1
+                        notices.append((device, ESCALATION, slot.level))
+                elif slot.state == RECOVERING and held_on:
+                    slot.state = NORMAL
+                    del self._active[device]
+                    notices.append((device, RECOVERED, slot.level))
+            ALARMS_ACTIVE.set(sum(1 for slot in self._active.values() if slot.state in (ALARMING, RECOVERING)))
+
+        for device, kind, level in notices:
+            ALARM_EVENTS.labels(kind).inc()
+            logger.warning(f"Alarme {device} : {kind}" + (f" (relance {level})" if kind == ESCALATION else ""))
+            try:
+                self.notify(device, kind, level)
+            except Exception as e:
+                logger.exception(f"Erreur de notification de l'alarme {device} : {e}")
+        return len(notices)
+
+    def states(self) -> Dict[str, dict]:
+        """
+        États des périphériques hors de l'état normal.
+        """
+        now = self.clock()
+        with self._lock:
+            return {device: {"state": STATE_NAMES[slot.state], "since": round(now - slot.since, 1),
+                             "off": slot.off, "escalations": slot.level}
+                    for device, slot in self._active.items()}
+
+    def state(self, device: str) -> str:
+        with self._lock:
+            slot = self._slots.get(device)
+            return STATE_NAMES[slot.state if slot is not None else NORMAL]
+
+    def start(self) -> "AlarmMonitor":
+        """
+        Planifie le tick sur l'ordonnanceur (sans effet s'il l'est déjà).
+        """
+        with self._lock:
+            if self._handle is None:
+                self._handle = self.scheduler.call_later(self.tick_interval, self._tick_due)
+        return self
+
+    def stop(self) -> None:
+        with self._lock:
+            handle, self._handle = self._handle, None
+        if handle is not None:
+            handle.cancel()
+
+    def _tick_due(self) -> None:
+        try:
+            self.tick()
+        finally:
+            with self._lock:
+                if self._handle is not None:
+                    self._handle = self.scheduler.call_later(self.tick_interval, self._tick_due)
+
+    def _send_notice(self, device: str, kind: str, level: int) -> None:
+        # L'envoi SMTP ne doit pas bloquer le thread de l'ordonnanceur
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alarm-notices")
+        self._executor.submit(send_alarm_notice, device, kind, level)
+
+
+def send_alarm_notice(device: str, kind: str, level: int) -> None:
+    """
+    Envoie le SMS correspondant à une notification d'alarme.
+    """
+    from avertissements.ipx_alarms import send_sms_alert, send_sms_notice
+    if kind == ALARM:
+        # Fréquence décidée par la machine à états : pas de cooldown
+        send_sms_alert(device, force=True)
+    elif kind == ESCALATION:
+        send_sms_notice(f"IPX Alarme {device} (relance {level})",
+                        f"Alerte : {device} toujours hors tension !!! (relance {level})")
+    else:
+        send_sms_notice(f"IPX Fin d'alarme {device}", f"{device} de nouveau sous tension.")
+
+
+# Moniteur partagé, créé au premier appel.
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_alarm_monitor() -> AlarmMonitor:
+    """
+    Retourne le moniteur d'alarmes partagé, configuré depuis config.py.
+    """
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = AlarmMonitor(alarm_delay=config.ALARM_DELAY, recovery_delay=config.ALARM_RECOVERY_DELAY,
+                                        escalate_interval=config.ALARM_ESCALATE_INTERVAL,
+                                        escalate_max=config.ALARM_ESCALATE_MAX, tick=config.ALARM_TICK)
+    return _monitor
+
+
+def set_alarm_monitor(monitor: Optional[AlarmMonitor]) -> None:
+    """
+    Remplace le moniteur partagé (tests, bancs d'essai).
+    """
+    global _monitor
+    with _monitor_lock:
+        _monitor = monitor
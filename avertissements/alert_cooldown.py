@@ -0,0 +1,163 @@
+"""
+alert_cooldown.py
+
+Limitation du nombre d'alertes SMS par périphérique (seau à jetons), partagée
+entre threads, workers gunicorn et redémarrages.
+
+Chaque périphérique a un seau de `burst` jetons, rechargé d'un jeton toutes les
+`cooldown` secondes ; une alerte consomme un jeton. Avec burst=1, c'est un simple
+délai minimum entre deux alertes.
+
+L'état est une ligne SQLite par périphérique (mode WAL) : la décision se prend dans
+une transaction BEGIN IMMEDIATE, qui verrouille l'écriture entre processus, donc
+deux workers ne peuvent pas envoyer la même alerte. Les lignes dont le seau est
+plein de nouveau (équivalentes à une absence de ligne) sont purgées régulièrement.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_cooldown (
+    device TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Ouvre la base des cooldowns (création du schéma, mode WAL, transactions manuelles).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class AlertCooldown:
+    """
+    Seau à jetons par périphérique stocké dans SQLite.
+
+    Args:
+        path (str): Chemin de la base SQLite.
+        cooldown (float): Durée (s) de recharge d'un jeton ; 0 = aucune limite.
+        burst (int): Nombre maximum de jetons (alertes d'affilée).
+        clock (Callable): Horloge murale, commune aux processus et aux redémarrages.
+    """
+
+    def __init__(self, path: str, cooldown: float = 300.0, burst: int = 1,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.cooldown = cooldown
+        self.burst = max(1, burst)
+        self.clock = clock
+        self._connection = None
+        self._pid = None
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, device: str) -> bool:
+        """
+        Consomme un jeton pour le périphérique. Retourne False si l'alerte doit être
+        ignorée (cooldown en cours).
+        """
+        if self.cooldown <= 0:
+            return True
+        with self._lock:
+            connection = self._connect()
+            now = self.clock()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT tokens, updated_at FROM alert_cooldown WHERE device = ?", (device,)
+                ).fetchone()
+                tokens = float(self.burst)
+                if row is not None:
+                    tokens = min(tokens, row[0] + max(0.0, now - row[1]) / self.cooldown)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                connection.execute(
+                    "INSERT OR REPLACE INTO alert_cooldown (device, tokens, updated_at) VALUES (?, ?, ?)",
+                    (device, tokens, now),
+                )
+                if now - self._last_purge >= self.cooldown:
+                    self._purge(connection, now)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            return allowed
+
+    def refund(self, device: str) -> None:
+        """
+        Rend le jeton consommé par une alerte qui n'a finalement pas été envoyée
+        (file des SMS pleine).
+        """
+        if self.cooldown <= 0:
+            return
+        with self._lock:
+            self._connect().execute(
+                "UPDATE alert_cooldown SET tokens = MIN(tokens + 1, ?) WHERE device = ?", (self.burst, device)
+            )
+
+    def reset(self, device: str = None) -> None:
+        """
+        Oublie le cooldown d'un périphérique (ou de tous).
+        """
+        with self._lock:
+            connection = self._connect()
+            if device is None:
+                connection.execute("DELETE FROM alert_cooldown")
+            else:
+                connection.execute("DELETE FROM alert_cooldown WHERE device = ?", (device,))
+
+    def size(self) -> int:
+        """
+        Nombre de périphériques suivis.
+        """
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM alert_cooldown").fetchone()[0]
+
+    def _purge(self, connection: sqlite3.Connection, now: float) -> None:
+        # Seau de nouveau plein : la ligne n'apporte plus rien
+        connection.execute("DELETE FROM alert_cooldown WHERE updated_at < ?", (now - self.cooldown * self.burst,))
+        self._last_purge = now
+
+    def _connect(self) -> sqlite3.Connection:
+        # Une connexion SQLite ne doit pas traverser un fork (workers gunicorn)
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = connect(self.path)
+            self._pid = os.getpid()
+        return self._connection
+
+
+# Cooldown partagé, créé au premier usage.
+_cooldown = None
+_cooldown_lock = threading.Lock()
+
+
+def get_alert_cooldown() -> AlertCooldown:
+    """
+    Retourne le cooldown des alertes partagé, configuré depuis config.py.
+    """
+    global _cooldown
+    if _cooldown is None:
+        with _cooldown_lock:
+            if _cooldown is None:
+                _cooldown = AlertCooldown(config.ALERT_COOLDOWN_PATH, cooldown=config.ALERT_COOLDOWN,
+                                          burst=config.ALERT_BURST)
+    return _cooldown
@@ -1,39 +1,42 @@
 
-import smtplib
-from email.message import EmailMessage
-import time
 import config
 
 from services.logger_service import logger
-
-LAST_ALERT = {}
+from avertissements.alert_cooldown import get_alert_cooldown
+from avertissements.sms_dispatcher import (
+    SMS_ALERTS, build_alert_message, build_notice_message, get_alert_dispatcher, get_smtp_sender
+)
 
 
 def send_sms_alert(device, force=False):
-    now = time.time()
-    
-    # Anti-flood sauf si force=True(test)
-    if not force and LAST_ALERT.get(device, 0) + config.ALERT_COOLDOWN > now:
+    # Anti-flood sauf si force=True(test) : cooldown partagé entre workers et redémarrages
+    if not force and not get_alert_cooldown().acquire(device):
         logger.info(f"Alerte récente pour {device}, sms non envoyé.")
+        SMS_ALERTS.labels("suppressed").inc()
         return
     
-    
-    LAST_ALERT[device] = now
-    
-    
-    msg = EmailMessage()
-    msg.set_content(f"Alerte : {device} hors tension !!!")
-    msg['Subject'] = f"IPX Alarme {device}"
-    msg['From'] = config.SMTP_USER
-    # Email to SMS orange
-    msg['To'] = config.SMS_TO
-    
+    # Envoi en tâche de fond, regroupé avec les autres alertes de la fenêtre
+    if config.SMS_ASYNC:
+        if not get_alert_dispatcher().submit(device) and not force:
+            # File pleine : l'alerte n'est pas partie, elle ne doit pas compter dans le cooldown
+            get_alert_cooldown().refund(device)
+        return
+
     try:
-        with smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT) as server:
-            server.starttls()
-            server.login(config.SMTP_USER, config.SMTP_PASS)
-            server.send_message(msg)
+        get_smtp_sender().send(build_alert_message([device]))
         logger.info(f"SMS envoyé pour {device}")
+        SMS_ALERTS.labels("sent").inc()
     except Exception as e:
         logger.exception(f"Erreur envoi SMS pour {device} : {e}")
-                
\ No newline at end of file
+        SMS_ALERTS.labels("error").inc()
+
+
+def send_sms_notice(subject, text):
+    # Message libre, sans cooldown : la fréquence est décidée par l'appelant (alarm_monitor)
+    try:
+        get_smtp_sender().send(build_notice_message(subject, text))
+        logger.info(f"SMS envoyé : {subject}")
+        SMS_ALERTS.labels("sent").inc()
+    except Exception as e:
+        logger.exception(f"Erreur envoi SMS ({subject}) : {e}")
+        SMS_ALERTS.labels("error").inc()
@@ -0,0 +1,292 @@
+"""
+sms_dispatcher.py
+
+Envoi des alertes SMS (email vers passerelle SMS) hors des requêtes HTTP.
+
+- SMTPSender garde une session SMTP authentifiée (STARTTLS + login faits une seule
+  fois) et la réutilise ; elle est rouverte si le serveur l'a fermée ou si elle est
+  restée inutilisée plus de idle_timeout. Chaque opération a un timeout. Une session
+  réutilisée est vérifiée (NOOP) avant l'envoi : un message n'est jamais renvoyé
+  après un échec pendant son envoi, le serveur ayant pu l'accepter.
+- AlertDispatcher reçoit les alertes dans une file bornée ; un thread unique les
+  regroupe sur une courte fenêtre et envoie un seul message pour toutes
+  (« 3 périphériques hors tension : ... »), par exemple lors d'une coupure de
+  courant qui éteint plusieurs prises à la fois.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from typing import List, Optional
+
+import config
+from services.logger_service import logger
+from services import metrics
+
+SMS_ALERTS = metrics.counter("fibaro_sms_alerts_total", "Alertes SMS par résultat (sent, suppressed, error)",
+                             ("result",))
+
+
+def build_alert_message(devices: List[str]) -> EmailMessage:
+    """
+    Construit le message d'alerte pour un ou plusieurs périphériques hors tension.
+    """
+    msg = EmailMessage()
+    if len(devices) == 1:
+        msg.set_content(f"Alerte : {devices[0]} hors tension !!!")
+        msg['Subject'] = f"IPX Alarme {devices[0]}"
+    else:
+        msg.set_content(f"Alerte : {len(devices)} périphériques hors tension : {', '.join(devices)} !!!")
+        msg['Subject'] = f"IPX Alarme {len(devices)} périphériques"
+    msg['From'] = config.SMTP_USER
+    # Email to SMS orange
+    msg['To'] = config.SMS_TO
+    return msg
+
+
+def build_notice_message(subject: str, text: str) -> EmailMessage:
+    """
+    Construit un message libre (relance ou retour à la normale d'une alarme).
+    """
+    msg = EmailMessage()
+    msg.set_content(text)
+    msg['Subject'] = subject
+    msg['From'] = config.SMTP_USER
+    msg['To'] = config.SMS_TO
+    return msg
+
+
+class SMTPSender:
+    """
+    Session SMTP authentifiée réutilisée entre les envois.
+
+    Args:
+        host (str): Serveur SMTP.
+        port (int): Port SMTP.
+        user (str): Identifiant (pas de login si vide).
+        password (str): Mot de passe.
+        starttls (bool): Chiffre la session avec STARTTLS.
+        timeout (float): Timeout (s) de connexion et de chaque commande.
+        idle_timeout (float): Une session inutilisée plus longtemps est rouverte.
+    """
+
+    def __init__(self, host: str, port: int, user: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = True, timeout: float = 10.0, idle_timeout: float = 60.0):
+        self.host = host
+        self.port = int(port or 25)
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def send(self, msg: EmailMessage) -> None:
+        """
+        Envoie un message sur la session ouverte, après une reconnexion si elle a été
+        perdue. Lève l'exception SMTP/réseau si l'envoi échoue : il n'est pas retenté.
+        """
+        with self._lock:
+            if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._close()
+            if self._server is not None and not self._alive():
+                # Session fermée côté serveur depuis le dernier envoi, rien n'est encore parti
+                self._close()
+            try:
+                self._connection().send_message(msg)
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+                # Le serveur a pu accepter le message avant l'erreur : pas de second envoi
+                self._close()
+                raise
+            self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Termine la session SMTP ouverte.
+        """
+        with self._lock:
+            self._close()
+
+    def _alive(self) -> bool:
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPServerDisconnected, OSError):
+            return False
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    server.starttls()
+                if self.user:
+                    server.login(self.user, self.password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+            self.connections += 1
+        return self._server
+
+    def _close(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+
+class AlertDispatcher:
+    """
+    File d'alertes envoyées par un thread de fond, regroupées par fenêtre.
+
+    Args:
+        sender (SMTPSender): Session SMTP utilisée pour les envois.
+        batch_window (float): Durée (s) pendant laquelle les alertes suivant la première
+            sont regroupées dans le même message.
+        queue_size (int): Nombre maximum d'alertes en attente.
+    """
+
+    def __init__(self, sender: SMTPSender, batch_window: float = 2.0, queue_size: int = 100):
+        self.sender = sender
+        self.batch_window = batch_window
+        self.messages = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, device: str) -> bool:
+        """
+        Met une alerte en file sans attendre. Retourne False si la file est pleine.
+        """
+        try:
+            self._queue.put_nowait(device)
+            return True
+        except queue.Full:
+            logger.error(f"File des SMS pleine, alerte perdue pour {device}")
+            SMS_ALERTS.labels("error").inc()
+            return False
+
+    def qsize(self) -> int:
+        """
+        Nombre d'alertes en attente d'envoi.
+        """
+        return self._queue.qsize()
+
+    def start(self) -> "AlertDispatcher":
+        """
+        Démarre le thread d'envoi (sans effet s'il tourne déjà).
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sms-alerts", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Envoie les alertes en attente, arrête le thread et ferme la session SMTP.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+        self.sender.close()
+
+    def _run(self) -> None:
+        while True:
+            devices, stop = self._next_batch()
+            if devices:
+                self._send(devices)
+            if stop:
+                return
+
+    def _next_batch(self):
+        device = self._queue.get()
+        if device is None:
+            return [], True
+        devices = [device]
+        deadline = time.monotonic() + self.batch_window
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                device = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return devices, False
+            if device is None:
+                return devices, True
+            if device not in devices:
+                devices.append(device)
+
+    def _send(self, devices: List[str]) -> None:
+        try:
+            self.sender.send(build_alert_message(devices))
+            self.messages += 1
+            logger.info(f"SMS envoyé pour {', '.join(devices)}")
+            SMS_ALERTS.labels("sent").inc(len(devices))
+        except Exception as e:
+            logger.exception(f"Erreur envoi SMS pour {', '.join(devices)} : {e}")
+            SMS_ALERTS.labels("error").inc(len(devices))
+
+
+# Session SMTP et file d'alertes partagées, créées au premier usage.
+_sender = None
+_dispatcher = None
+_lock = threading.Lock()
+
+
+def get_smtp_sender() -> SMTPSender:
+    """
+    Retourne la session SMTP partagée, configurée depuis config.py.
+    """
+    global _sender
+    if _sender is None:
+        with _lock:
+            if _sender is None:
+                _sender = SMTPSender(
+                    config.SMTP_SERVER,
+                    config.SMTP_PORT,
+                    user=config.SMTP_USER,
+                    password=config.SMTP_PASS,
+                    starttls=config.SMTP_STARTTLS,
+                    timeout=config.SMTP_TIMEOUT,
+                    idle_timeout=config.SMTP_IDLE_TIMEOUT,
+                )
+    return _sender
+
+
+def set_smtp_sender(sender: SMTPSender) -> None:
+    """
+    Remplace la session SMTP partagée (ex. pour pointer vers un serveur de test).
+    """
+    global _sender
+    with _lock:
+        if _sender is not None and _sender is not sender:
+            _sender.close()
+        _sender = sender
+
+
+def get_alert_dispatcher() -> AlertDispatcher:
+    """
+    Retourne la file d'alertes partagée, démarrée au premier appel.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        sender = get_smtp_sender()
+        with _lock:
+            if _dispatcher is None:
+                _dispatcher = AlertDispatcher(
+                    sender,
+                    batch_window=config.SMS_BATCH_WINDOW,
+                    queue_size=config.SMS_QUEUE_SIZE,
+                ).start()
+    return _dispatcher
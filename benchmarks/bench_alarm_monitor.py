@@ -0,0 +1,53 @@
+"""
+bench_alarm_monitor.py
+
+Coût de la machine à états des alarmes (avertissements/alarm_monitor.py) à
+l'échelle : N entrées alimentées par des traces en rafales (simulator/ipx_traces.py)
+pendant une heure simulée, un tick par seconde. Affiche le coût moyen d'un tick et
+la taille de l'état gardé par entrée.
+
+Le comportement des alarmes est vérifié par tests/test_alarm_monitor.py.
+
+Usage :
+    python -m benchmarks.bench_alarm_monitor [entrées]
+"""
+
+import logging
+import sys
+import time
+
+from avertissements.alarm_monitor import AlarmMonitor
+from services.scheduler import Scheduler
+from simulator.ipx_traces import bursty_trace
+
+DURATION = 3600
+TICK = 1.0
+
+
+def main() -> None:
+    logging.getLogger("fibaro_logger").setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    devices = [f"ipx_{i}" for i in range(count)]
+    events = bursty_trace(devices, duration=DURATION, rate=2.0, burst_rate=0.02, burst_size=(20, 100), seed=3)
+    monitor = AlarmMonitor(notify=lambda *args: None, alarm_delay=60, recovery_delay=30, escalate_interval=1800,
+                           scheduler=Scheduler(), clock=lambda: 0.0)
+
+    ticks, tick_time, index, at = 0, 0.0, 0, 0.0
+    while at <= DURATION:
+        while index < len(events) and events[index].at <= at:
+            monitor.observe(events[index].relais, events[index].etat == "on", now=events[index].at)
+            index += 1
+        start = time.perf_counter()
+        monitor.tick(at)
+        tick_time += time.perf_counter() - start
+        ticks += 1
+        at += TICK
+
+    slot = next(iter(monitor._slots.values()))
+    print(f"{len(monitor._slots)} entrées, {len(events)} événements sur {DURATION} s")
+    print(f"tick moyen : {tick_time / ticks * 1e6:.0f} µs  état par entrée : {sys.getsizeof(slot)} octets  "
+          f"hors état normal à la fin : {len(monitor._active)}")
+
+
+if __name__ == "__main__":
+    main()
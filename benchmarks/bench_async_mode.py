@@ -0,0 +1,157 @@
+"""
+bench_async_mode.py
+
+Mode threads (application Flask, un thread par événement en cours, client
+requests) comparé au mode asynchrone (asgi.py, une coroutine par événement,
+client asyncio), face à la HC3 simulée avec une latence injectée.
+
+Pour chaque niveau de concurrence, chaque mode tourne dans un sous-processus neuf :
+  - débit : événements /ipx-event traités par seconde ;
+  - mémoire : hausse du pic de RSS du processus pendant la charge ;
+  - threads : threads actifs au pic.
+
+Les requêtes sont passées directement à l'application (WSGI ou ASGI), sans serveur
+HTTP devant : seul le traitement des événements est comparé.
+
+Usage :
+    python -m benchmarks.bench_async_mode [latence_hc3_s] [concurrences...]
+"""
+
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+import threading
+import time
+
+from simulator.hc3 import StubHC3
+
+DEVICES = ["ipx_congelateur", "ipx_test", "ipx_essai"]
+
+
+def rss_kb(field: str = "VmRSS") -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def event_query(i: int) -> str:
+    return f"relais={DEVICES[i % len(DEVICES)]}&etat={'on' if i // len(DEVICES) % 2 else 'off'}"
+
+
+def run_threads(base_url: str, concurrency: int, events: int) -> dict:
+    from app import create_app
+    from services.fibaro_service import FibaroClient, set_client
+
+    set_client(FibaroClient(base_url=base_url, user="bench", password="bench", pool_size=concurrency))
+    app = create_app()
+    app.test_client().get("/ipx-event", query_string=event_query(0))
+
+    counter = iter(range(events))
+    lock = threading.Lock()
+    errors = []
+    peak = {"threads": 0}
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                i = next(counter, None)
+                peak["threads"] = max(peak["threads"], threading.active_count())
+            if i is None:
+                return
+            response = client.get("/ipx-event", query_string=event_query(i))
+            if response.status_code != 200 or response.get_json()["status"] != "OK":
+                errors.append(response.status_code)
+
+    base = rss_kb()
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"elapsed": elapsed, "errors": len(errors), "rss": rss_kb("VmHWM") - base, "threads": peak["threads"]}
+
+
+def run_async(base_url: str, concurrency: int, events: int) -> dict:
+    from asgi import create_asgi_app
+    from services.async_fibaro import AsyncFibaroClient, set_async_client
+
+    set_async_client(AsyncFibaroClient(base_url=base_url, user="bench", password="bench",
+                                       max_connections=concurrency))
+    app = create_asgi_app()
+
+    async def call(i: int) -> tuple:
+        scope = {"type": "http", "method": "GET", "path": "/ipx-event", "query_string": event_query(i).encode(),
+                 "headers": [], "http_version": "1.1"}
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent[0]["status"], json.loads(sent[1]["body"])
+
+    async def main() -> dict:
+        await call(0)
+        counter = iter(range(events))
+        errors = []
+
+        async def worker():
+            for i in counter:
+                status, data = await call(i)
+                if status != 200 or data["status"] != "OK":
+                    errors.append(status)
+
+        base = rss_kb()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return {"elapsed": elapsed, "errors": len(errors), "rss": rss_kb("VmHWM") - base,
+                "threads": threading.active_count()}
+
+    return asyncio.run(main())
+
+
+def child(mode: str, base_url: str, concurrency: int, events: int) -> None:
+    from services.logger_service import logger
+    logger.setLevel(logging.WARNING)
+    run = run_threads if mode == "threads" else run_async
+    print(json.dumps(run(base_url, concurrency, events)))
+
+
+def main() -> None:
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+    levels = [int(arg) for arg in sys.argv[2:]] or [8, 64, 512]
+
+    stub = StubHC3(latency=latency).start()
+    print(f"HC3 simulée : latence {latency * 1000:.0f} ms par appel")
+    print(f"{'mode':<8} {'concurrence':>11} {'événements':>10} {'évts/s':>8} {'pic RSS':>10} {'threads':>8} {'erreurs':>8}")
+    try:
+        for concurrency in levels:
+            events = max(200, concurrency * 4)
+            for mode in ("threads", "async"):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_async_mode", "--child", mode, stub.base_url,
+                     str(concurrency), str(events)],
+                    capture_output=True, text=True, check=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{mode:<8} {concurrency:>11} {events:>10} {events / result['elapsed']:>8.0f} "
+                      f"{result['rss'] / 1024:>7.1f} Mo {result['threads']:>8} {result['errors']:>8}")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        main()
@@ -0,0 +1,63 @@
+"""
+bench_batch.py
+
+Compare 20 appels /ipx-event successifs avec un seul appel /ipx-events portant les
+20 mêmes états, contre une HC3 simulée.
+
+Usage :
+    python -m benchmarks.bench_batch [latence_hc3_s] [repetitions]
+"""
+
+import logging
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+from app import create_app
+from benchmarks.bench_fibaro_client import percentile
+from simulator.hc3 import StubHC3
+from services.device_mapping import registry
+from services.fibaro_service import FibaroClient, set_client
+
+
+def main() -> None:
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    logging.getLogger("fibaro_logger").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    stub = StubHC3(latency=latency).start()
+    set_client(FibaroClient(base_url=stub.base_url, user="bench", password="bench"))
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    names = list(registry.snapshot.by_name)
+    events = [{"relais": names[i % len(names)], "etat": "on" if i % 2 else "off"} for i in range(20)]
+    session = requests.Session()
+
+    singles, batches = [], []
+    try:
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            for event in events:
+                session.get(f"{base}/ipx-event", params=event)
+            singles.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            response = session.post(f"{base}/ipx-events", json=events)
+            batches.append(time.perf_counter() - start)
+            assert response.json()["count"] == len(events)
+    finally:
+        server.shutdown()
+        stub.stop()
+
+    print(f"20 appels /ipx-event : p50={percentile(singles, 50) * 1000:.1f} ms  p99={percentile(singles, 99) * 1000:.1f} ms")
+    print(f"1 appel /ipx-events  : p50={percentile(batches, 50) * 1000:.1f} ms  p99={percentile(batches, 99) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+bench_e2e.py
+
+Banc de bout en bout du pont, lancé en sous-processus comme sous systemd, face aux
+simulateurs (simulator/) : HC3 avec latence injectée, puits SMTP et générateur
+d'événements IPX800.
+
+Scénarios :
+  - ipx-event-trace      : trace IPX800 en rafales (simulator/ipx_traces.py)
+                           rejouée en temps réel sur /ipx-event ;
+  - ipx-event-saturation : /ipx-event en boucle fermée, débit maximum ;
+  - ipx-alarms           : POST /ipx-alarms en boucle fermée, un SMS par alerte
+                           (cooldown désactivé), remis au puits SMTP.
+
+Pour chacun : événements/s, latence p50/p95/p99, pic de RSS du pont, erreurs.
+
+Les résultats sont comparés à une référence (benchmarks/baselines/e2e.json) : un
+débit en baisse ou une latence / un RSS en hausse au-delà de la tolérance, ou une
+erreur, fait échouer le banc (code de sortie 1). La référence dépend de la machine :
+la régénérer sur la cible (Raspberry Pi) avec --save-baseline.
+
+Usage :
+    python -m benchmarks.bench_e2e [--latency 0.02] [--events 1000] [--concurrency 16]
+                                   [--mode dev|production] [--save-baseline] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_fibaro_client import percentile
+from benchmarks.load_serving import free_port, wait_ready
+from services.device_mapping import registry
+from simulator.hc3 import StubHC3
+from simulator.ipx_traces import IPXEventGenerator, bursty_trace
+from simulator.smtp import StubSMTP
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "e2e.json")
+
+# Marges absolues ajoutées à la tolérance relative (bruit de mesure sur des valeurs faibles)
+SLACK_MS = 10.0
+SLACK_MB = 2.0
+
+
+def process_tree(pid: int) -> list:
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f"/proc/{parent}/task"):
+                with open(f"/proc/{parent}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def tree_rss_kb(pid: int) -> int:
+    """
+    RSS cumulé du pont et de ses processus fils (workers gunicorn).
+    """
+    total = 0
+    for child in process_tree(pid):
+        try:
+            with open(f"/proc/{child}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+class RSSSampler:
+    """
+    Relève le RSS du pont toutes les 50 ms pendant un scénario et garde le pic.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss_kb(self.pid))
+            self._stop.wait(0.05)
+
+    def __enter__(self) -> "RSSSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, tree_rss_kb(self.pid))
+
+
+def summarize(samples: list, codes: list, elapsed: float, rss_kb: int, ok_codes=(200,)) -> dict:
+    return {
+        "events": len(samples),
+        "events_s": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "rss_mb": round(rss_kb / 1024, 1),
+        "errors": sum(1 for code in codes if code not in ok_codes),
+    }
+
+
+def closed_loop(n: int, concurrency: int, request) -> tuple:
+    """
+    n requêtes par `concurrency` clients qui enchaînent sans pause.
+
+    Returns:
+        tuple: (latences en s, codes HTTP, durée totale en s).
+    """
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            code = request(session, i).status_code
+        except requests.RequestException:
+            code = 0
+        return time.perf_counter() - start, code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(n)))
+    return [latency for latency, _ in results], [code for _, code in results], time.perf_counter() - start
+
+
+def run_scenarios(args, bridge: str, pid: int, smtp: StubSMTP) -> dict:
+    devices = sorted(registry.snapshot.by_name)
+    results = {}
+
+    # Chauffe : connexions et premiers imports paresseux
+    closed_loop(20, 4, lambda session, i: session.get(f"{bridge}/ipx-event",
+                                                       params={"relais": devices[i % len(devices)], "etat": "off"}))
+
+    trace = bursty_trace(devices, duration=args.trace_seconds, rate=args.trace_rate,
+                         burst_rate=args.trace_rate / 20, seed=args.seed)
+    generator = IPXEventGenerator(f"{bridge}/ipx-event", concurrency=args.concurrency)
+    with RSSSampler(pid) as rss:
+        replayed, elapsed = generator.replay(trace)
+    results["ipx-event-trace"] = summarize([latency for latency, _ in replayed], [code for _, code in replayed],
+                                           elapsed, rss.peak)
+
+    with RSSSampler(pid) as rss:
+        samples, codes, elapsed = closed_loop(
+            args.events, args.concurrency,
+            lambda session, i: session.get(f"{bridge}/ipx-event",
+                                           params={"relais": devices[i % len(devices)],
+                                                   "etat": "on" if i // len(devices) % 2 else "off"}))
+    results["ipx-event-saturation"] = summarize(samples, codes, elapsed, rss.peak)
+
+    alarms = max(50, args.events // 4)
+    sent_before = len(smtp.messages)
+    with RSSSampler(pid) as rss:
+        samples, codes, elapsed = closed_loop(
+            alarms, args.concurrency,
+            lambda session, i: session.post(f"{bridge}/ipx-alarms",
+                                            json={"device": devices[i % len(devices)], "state": "OFF"}))
+    results["ipx-alarms"] = summarize(samples, codes, elapsed, rss.peak)
+    delivered = smtp.wait_messages(sent_before + alarms, timeout=10)
+    results["ipx-alarms"]["errors"] += 0 if delivered else alarms - (len(smtp.messages) - sent_before)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns:
+        list: Régressions par rapport à la référence (vide si aucune).
+    """
+    regressions = []
+    for name, current in results.items():
+        if current["errors"]:
+            regressions.append(f"{name} : {current['errors']} erreur(s)")
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            continue
+        if current["events_s"] < reference["events_s"] * (1 - tolerance):
+            regressions.append(f"{name} : {current['events_s']} évts/s (référence {reference['events_s']})")
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > reference[key] * (1 + tolerance) + SLACK_MS:
+                regressions.append(f"{name} : {key} {current[key]} ms (référence {reference[key]} ms)")
+        if current["rss_mb"] > reference["rss_mb"] * (1 + tolerance) + SLACK_MB:
+            regressions.append(f"{name} : RSS {current['rss_mb']} Mo (référence {reference['rss_mb']} Mo)")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Banc de bout en bout du pont IPX800 → HC3")
+    parser.add_argument("--latency", type=float, default=0.02, help="latence de la HC3 simulée (s)")
+    parser.add_argument("--events", type=int, default=1000, help="requêtes du scénario de saturation")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients simultanés")
+    parser.add_argument("--trace-seconds", type=float, default=15, help="durée de la trace IPX800 (s)")
+    parser.add_argument("--trace-rate", type=float, default=40, help="événements isolés par seconde de la trace")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", choices=("dev", "production"), default="dev")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="écart relatif toléré")
+    parser.add_argument("--save-baseline", action="store_true", help="enregistre ces résultats comme référence")
+    args = parser.parse_args()
+
+    params = {"latency": args.latency, "events": args.events, "concurrency": args.concurrency,
+              "trace_seconds": args.trace_seconds, "trace_rate": args.trace_rate, "seed": args.seed,
+              "mode": args.mode}
+
+    hc3 = StubHC3(latency=args.latency, record=False).start()
+    smtp = StubSMTP().start()
+    tmp = tempfile.mkdtemp()
+    hc3_host, hc3_port = hc3.base_url.split("//")[1].split("/")[0].split(":")
+    port = free_port()
+    env = dict(os.environ, FLASK_HOST="127.0.0.1", FLASK_PORT=str(port), FLASK_DEBUG="false",
+               FIBARO_IP=hc3_host, FIBARO_PORT=hc3_port, FIBARO_USER="bench", FIBARO_PASSWORD="bench",
+               FIBARO_POOL_SIZE=str(args.concurrency), SERVER_THREADS=str(args.concurrency),
+               MAPPING_RELOAD_INTERVAL="0", LOG_FILE_PATH=os.path.join(tmp, "action.log"),
+               SMTP_SERVER="127.0.0.1", SMTP_PORT=str(smtp.port), SMTP_USER="bench@example.org",
+               SMTP_PASS="bench", SMTP_STARTTLS="false", SMS_TO="0600000000@example.org",
+               ALERT_COOLDOWN="0", ALERT_COOLDOWN_PATH=os.path.join(tmp, "alerts.sqlite3"))
+    child = subprocess.Popen([sys.executable, "-m", "benchmarks.load_serving", "--child", args.mode],
+                             env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    bridge = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(f"{bridge}/healthz")
+        results = run_scenarios(args, bridge, child.pid, smtp)
+    finally:
+        child.send_signal(signal.SIGTERM)
+        child.wait(timeout=30)
+        smtp.stop()
+        hc3.stop()
+
+    print(f"HC3 simulée : latence {args.latency * 1000:.0f} ms, mode {args.mode}, concurrence {args.concurrency}")
+    print(f"{'scénario':<22} {'évts':>6} {'évts/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'RSS':>9} {'erreurs':>8}")
+    for name, r in results.items():
+        print(f"{name:<22} {r['events']:>6} {r['events_s']:>8.1f} {r['p50_ms']:>6.1f} ms {r['p95_ms']:>6.1f} ms "
+              f"{r['p99_ms']:>6.1f} ms {r['rss_mb']:>6.1f} Mo {r['errors']:>8}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.machine(), "python": platform.python_version(), "params": params,
+                       "scenarios": results}, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Référence enregistrée : {args.baseline}")
+        sys.exit(0)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print("Référence obtenue avec d'autres paramètres : seules les erreurs sont vérifiées")
+            baseline = {}
+    else:
+        print(f"Pas de référence ({args.baseline}) : seules les erreurs sont vérifiées")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"RÉGRESSION {regression}")
+    if not regressions and baseline:
+        print(f"Aucune régression (tolérance {args.tolerance:.0%}, référence {baseline.get('machine')})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+bench_fibaro_client.py
+
+Compare la latence d'un appel callAction vers une HC3 locale :
+  - "sans client" : un requests.get() et un HTTPBasicAuth neufs par appel (ancien code),
+  - "client partagé" : FibaroClient, session et pool keep-alive réutilisés.
+
+Usage :
+    python -m benchmarks.bench_fibaro_client [nombre_appels]
+"""
+
+import sys
+import time
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from simulator.hc3 import StubHC3
+from services.fibaro_service import FibaroClient
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(label: str, samples) -> None:
+    print(f"{label:<16} n={len(samples):<5} "
+          f"p50={percentile(samples, 50) * 1000:.3f} ms  "
+          f"p99={percentile(samples, 99) * 1000:.3f} ms")
+
+
+def bench_sans_client(base_url: str, n: int):
+    samples = []
+    url = f"{base_url}/callAction"
+    for i in range(n):
+        start = time.perf_counter()
+        auth = HTTPBasicAuth("bench", "bench")
+        requests.get(url, auth=auth, json={"deviceID": i % 20, "name": "turnOn"}, timeout=5)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_client_partage(base_url: str, n: int):
+    client = FibaroClient(base_url=base_url, user="bench", password="bench")
+    samples = []
+    try:
+        for i in range(n):
+            start = time.perf_counter()
+            client.call_action(i % 20, "turnOn")
+            samples.append(time.perf_counter() - start)
+    finally:
+        client.close()
+    return samples
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    stub = StubHC3().start()
+    try:
+        # Préchauffage : imports paresseux de requests, résolution, etc.
+        bench_sans_client(stub.base_url, 10)
+        report("sans client", bench_sans_client(stub.base_url, n))
+        report("client partagé", bench_client_partage(stub.base_url, n))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
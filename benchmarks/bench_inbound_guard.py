@@ -0,0 +1,51 @@
+"""
+bench_inbound_guard.py
+
+Coût du contrôle des requêtes entrantes (services/inbound_guard.py) : durée moyenne
+d'un contrôle admis (source + jeton, puis périphérique) et blocs mémoire restant
+alloués après N contrôles de chaque sorte.
+
+Le comportement du contrôle est vérifié par tests/test_inbound_guard.py.
+
+Usage :
+    python -m benchmarks.bench_inbound_guard [contrôles]
+"""
+
+import gc
+import logging
+import sys
+import time
+
+from services.inbound_guard import InboundGuard
+
+TOKEN = "s3cret"
+DEVICE = "ipx_flood_1"
+
+
+def main() -> None:
+    logging.getLogger("fibaro_logger").setLevel(logging.ERROR)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    guard = InboundGuard(token=TOKEN, clients=("10.0.0.1",), source_rate=1e9, source_burst=1e9,
+                         device_rate=1e9, device_burst=1e9)
+    guard.check_device(DEVICE)
+
+    gc.collect()
+    gc.disable()
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    for _ in range(n):
+        guard.check_source("10.0.0.1", TOKEN)
+    source_cost = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(n):
+        guard.check_device(DEVICE)
+    device_cost = (time.perf_counter() - start) / n
+    leaked = sys.getallocatedblocks() - blocks
+    gc.enable()
+
+    print(f"contrôle source + jeton : {source_cost * 1e6:.2f} µs  périphérique : {device_cost * 1e6:.2f} µs")
+    print(f"blocs restant alloués : {leaked} pour {2 * n} contrôles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+bench_ipx_parser.py
+
+Coût par requête du parseur des requêtes /ipx-event (services/ipx_parser.py)
+comparé à l'ancienne extraction de la route (query → form → get_json → texte
+brut), sur un corpus de formes réelles envoyées par l'IPX800, contexte de requête
+Flask compris (la base est affichée).
+
+L'équivalence des deux extractions est vérifiée par tests/test_ipx_parser.py.
+
+Usage :
+    python -m benchmarks.bench_ipx_parser [itérations]
+"""
+
+import sys
+import time
+
+from flask import Flask, request
+
+from services.ipx_parser import parse_ipx_request
+
+app = Flask("bench_ipx_parser")
+
+# Formes rencontrées sur le terrain : (query string, corps, Content-Type)
+CORPUS = [
+    ("GET query nom", "relais=ipx_congelateur&etat=1", b"", None),
+    ("GET query numéro", "relais=3&etat=on", b"", None),
+    ("POST form", "", b"relais=ipx_test&etat=off", "application/x-www-form-urlencoded"),
+    ("POST JSON device_id", "", b'{"device_id": "ipx_essai", "etat": "ON"}', "application/json"),
+    ("POST JSON numéro", "", b'{"relais": 5, "etat": 1}', "application/json"),
+    ("POST texte brut", "", b"device_id=ipx_congelateur&etat=0", "text/plain"),
+    ("POST brut sans type", "", b"relais=12&etat=off", None),
+    ("query + corps", "relais=ipx_test", b"etat=1", "text/plain"),
+]
+
+
+def legacy_parse():
+    """
+    Ancienne extraction de handle_ipx_event, à appeler dans un contexte de requête.
+    """
+    ipx_name = request.args.get('relais') or request.form.get('relais')
+    etat = request.args.get('etat') or request.form.get('etat')
+    if not ipx_name or not etat:
+        json_data = request.get_json(silent=True)
+        if json_data:
+            ipx_name = ipx_name or json_data.get('device_id') or json_data.get('relais')
+            etat = etat or json_data.get('etat')
+    if not ipx_name or not etat:
+        raw = request.data.decode(errors='ignore').strip()
+        if raw and '=' in raw:
+            params = dict(pair.split('=', 1) for pair in raw.split('&') if '=' in pair)
+            ipx_name = ipx_name or params.get('device_id') or params.get('relais')
+            etat = etat or params.get('etat')
+    return ipx_name, etat
+
+
+def context(query: str, body: bytes, content_type):
+    return app.test_request_context("/ipx-event", method="POST", query_string=query, data=body,
+                                    content_type=content_type)
+
+
+def per_request(function, query, body, content_type, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        with context(query, body, content_type):
+            function()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+
+    print(f"{'forme':<22} {'contexte seul':>14} {'ancien':>10} {'nouveau':>10}   (µs/requête)")
+    for label, query, body, content_type in CORPUS:
+        base = per_request(lambda: None, query, body, content_type, n)
+        old = per_request(legacy_parse, query, body, content_type, n)
+        new = per_request(lambda: parse_ipx_request(request), query, body, content_type, n)
+        print(f"{label:<22} {base:14.1f} {old - base:10.1f} {new - base:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+bench_logging.py
+
+Mesure le coût du logging par requête /ipx-event, vu du thread de la requête :
+  - "avant" : neuf logger.info en f-string, écrits directement dans la console et le
+    fichier tournant (ancien code) ;
+  - "après INFO" : détail de la requête au niveau DEBUG, logger en INFO (défaut) ;
+  - "après DEBUG" : détail activé, écrit via la file (QueueHandler + thread d'écriture).
+
+Le fichier peut simuler une carte SD lente : toutes les 200 lignes, une écriture
+bloque `blocage_ms` millisecondes.
+
+Usage :
+    python -m benchmarks.bench_logging [requetes] [blocage_ms]
+"""
+
+import io
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+from flask import request
+
+from app import create_app
+from benchmarks.bench_fibaro_client import percentile
+import routes.fibaro_routes as fibaro_routes
+from services.logger_service import DropOldestQueueHandler, formatter
+
+
+class SlowFileHandler(RotatingFileHandler):
+    """
+    Fichier tournant dont une écriture sur `every` bloque `stall` secondes.
+    """
+
+    def __init__(self, path: str, stall: float, every: int = 200):
+        super().__init__(path, maxBytes=1_000_000, backupCount=5)
+        self.stall = stall
+        self.every = every
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+        if self.stall and self.count % self.every == 0:
+            time.sleep(self.stall)
+        super().emit(record)
+
+
+def make_handlers(workdir: str, name: str, stall: float):
+    console = logging.StreamHandler(io.StringIO())
+    file = SlowFileHandler(os.path.join(workdir, f"{name}.log"), stall)
+    for handler in (console, file):
+        handler.setFormatter(formatter)
+    return console, file
+
+
+def make_logger(name: str, level: int, *handlers) -> logging.Logger:
+    bench_logger = logging.getLogger(f"bench_logging.{name}")
+    bench_logger.propagate = False
+    bench_logger.setLevel(level)
+    for handler in handlers:
+        bench_logger.addHandler(handler)
+    return bench_logger
+
+
+def old_dump(bench_logger, request, ipx_name=None, etat=None):
+    # Copie du bloc de logs de handle_ipx_event avant la file de logs
+    bench_logger.info(f"---- NOUVELLE REQUÊTE IPX ----")
+    bench_logger.info(f"Méthode : {request.method}")
+    bench_logger.info(f"Headers : {dict(request.headers)}")
+    bench_logger.info(f"Query string : {request.query_string.decode(errors='ignore')}")
+    bench_logger.info(f"Form data : {request.form.to_dict()}")
+    bench_logger.info(f"Raw data : {request.data.decode(errors='ignore')}")
+    bench_logger.info(f"JSON : {request.get_json(silent=True)}")
+    bench_logger.info(f"DEBUG - ipx_name={ipx_name}, etat={etat}")
+    bench_logger.info("---------------------------------")
+
+
+def new_dump(bench_logger):
+    # Même garde que handle_ipx_event, avec le logger du benchmark
+    fibaro_routes.logger = bench_logger
+    if bench_logger.isEnabledFor(fibaro_routes.REQUEST_LOG_LEVEL):
+        fibaro_routes._log_request_details()
+
+
+def measure(app, n: int, log_once) -> list:
+    samples = []
+    for i in range(n):
+        with app.test_request_context("/ipx-event", method="POST",
+                                      query_string={"relais": "ipx_congelateur", "etat": "on" if i % 2 else "off"},
+                                      headers={"User-Agent": "IPX800", "Content-Type": "text/plain"},
+                                      data="relais=ipx_congelateur&etat=on"):
+            start = time.perf_counter()
+            log_once(request)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label: str, samples) -> None:
+    print(f"{label:<13} n={len(samples):<6} "
+          f"p50={percentile(samples, 50) * 1e6:.1f} µs  "
+          f"p99={percentile(samples, 99) * 1e6:.1f} µs  "
+          f"max={max(samples) * 1e6:.1f} µs")
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    stall = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 20 / 1000
+    app = create_app()
+    workdir = tempfile.mkdtemp()
+    original_logger = fibaro_routes.logger
+
+    try:
+        sync_logger = make_logger("avant", logging.INFO, *make_handlers(workdir, "avant", stall))
+        report("avant", measure(app, n, lambda request: old_dump(sync_logger, request)))
+
+        info_logger = make_logger("apres_info", logging.INFO, *make_handlers(workdir, "apres_info", stall))
+        report("après INFO", measure(app, n, lambda request: new_dump(info_logger)))
+
+        handler = DropOldestQueueHandler(queue.Queue(maxsize=10000))
+        listener = QueueListener(handler.queue, *make_handlers(workdir, "apres_debug", stall))
+        listener.start()
+        debug_logger = make_logger("apres_debug", logging.DEBUG, handler)
+        report("après DEBUG", measure(app, n, lambda request: new_dump(debug_logger)))
+        listener.stop()
+        print(f"lignes perdues (file pleine) : {handler.dropped}")
+    finally:
+        fibaro_routes.logger = original_logger
+
+
+if __name__ == "__main__":
+    main()
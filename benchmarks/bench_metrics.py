@@ -0,0 +1,83 @@
+"""
+bench_metrics.py
+
+Coût des métriques sur le chemin chaud :
+  - opérations unitaires (Counter.inc, Histogram.observe, avec et sans étiquettes) ;
+  - surcoût par requête des hooks de routes/metrics_routes.py, mesuré sur une route
+    Flask vide avec et sans le blueprint des métriques.
+
+Usage :
+    python -m benchmarks.bench_metrics [iterations]
+"""
+
+import sys
+import time
+
+from flask import Flask
+
+from benchmarks.bench_fibaro_client import percentile
+from routes.metrics_routes import metrics_bp
+from services.metrics import Counter, Histogram
+
+
+def per_op(label: str, function, n: int) -> None:
+    start = time.perf_counter()
+    for _ in range(n):
+        function()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / n * 1e9:8.0f} ns/op")
+
+
+def make_app(with_metrics: bool) -> Flask:
+    app = Flask("bench_metrics")
+    if with_metrics:
+        app.register_blueprint(metrics_bp)
+
+    @app.route("/ping")
+    def ping():
+        return "ok"
+
+    return app
+
+
+def request_samples(apps, n: int):
+    """
+    Requêtes alternées entre les applications, pour que le bruit de la machine les
+    touche toutes de la même façon.
+    """
+    clients = [app.test_client() for app in apps]
+    samples = [[] for _ in apps]
+    for _ in range(n):
+        for client, client_samples in zip(clients, samples):
+            start = time.perf_counter()
+            client.get("/ping")
+            client_samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    counter = Counter("bench_counter", "bench")
+    labelled_counter = Counter("bench_labelled_counter", "bench", ("route", "method", "code"))
+    histogram = Histogram("bench_histogram", "bench")
+    labelled_histogram = Histogram("bench_labelled_histogram", "bench", ("action", "status"))
+
+    per_op("Counter.inc", counter.inc, n)
+    per_op("Counter.labels(3).inc", lambda: labelled_counter.labels("/ipx-event", "GET", "200").inc(), n)
+    per_op("Histogram.observe", lambda: histogram.observe(0.042), n)
+    per_op("Histogram.labels(2).observe", lambda: labelled_histogram.labels("turnOn", "200").observe(0.042), n)
+
+    requests_n = max(1000, n // 50)
+    apps = (make_app(False), make_app(True))
+    # Préchauffage, puis mesure
+    request_samples(apps, 200)
+    without, with_metrics = request_samples(apps, requests_n)
+    p50_without, p50_with = percentile(without, 50), percentile(with_metrics, 50)
+    print(f"requête Flask sans métriques     p50={p50_without * 1e6:.1f} µs")
+    print(f"requête Flask avec métriques     p50={p50_with * 1e6:.1f} µs  "
+          f"(surcoût {(p50_with - p50_without) * 1e6:.1f} µs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+bench_outbox.py
+
+Débit de la boîte d'envoi persistante (services/outbox.py) : commandes/s enregistrées
+puis acquittées par N threads concurrents, avec :
+  - une transaction (un fsync) par commande, validée dans le thread appelant ;
+  - la validation groupée (group commit), synchronous=FULL puis NORMAL.
+
+Vérifie aussi qu'après une "coupure" (boîte rouverte sans acquittement), les
+commandes non acquittées sont bien retrouvées pour être renvoyées.
+
+Usage :
+    python -m benchmarks.bench_outbox [commandes] [threads]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_fibaro_client import percentile
+from services.outbox import Outbox
+
+
+def run(label: str, path: str, n: int, threads: int, group_commit: bool, synchronous: str) -> None:
+    outbox = Outbox(path, synchronous=synchronous, group_commit=group_commit, put_timeout=30).start()
+    samples = []
+    lock = threading.Lock()
+
+    def worker(offset: int):
+        local = []
+        for i in range(offset, n, threads):
+            command = {"device": i, "ipx_name": f"ipx_{i}", "etat": "on", "action": "turnOn"}
+            start = time.perf_counter()
+            outbox.put(command)
+            local.append(time.perf_counter() - start)
+            outbox.ack(i, "turnOn")
+        with lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    outbox.stop()
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<28} {n / elapsed:9.0f} commandes/s  put p50={percentile(samples, 50) * 1000:6.2f} ms  "
+          f"p99={percentile(samples, 99) * 1000:6.2f} ms  transactions={outbox.commits}  "
+          f"restantes={len(outbox.pending())}")
+
+
+def check_replay(path: str) -> bool:
+    outbox = Outbox(path).start()
+    for i in range(10):
+        outbox.put({"device": i, "ipx_name": f"ipx_{i}", "etat": "on", "action": "turnOn"})
+    # Une commande plus récente remplace la précédente du même périphérique
+    outbox.put({"device": 3, "ipx_name": "ipx_3", "etat": "off", "action": "turnOff"})
+    for i in range(0, 10, 2):
+        outbox.ack(i, "turnOn")
+    # Acquittement d'un état dépassé : la commande turnOff reste en attente
+    outbox.ack(3, "turnOn")
+    outbox.stop()
+
+    pending = {entry["device"]: entry["action"] for entry in Outbox(path).pending()}
+    expected = {1: "turnOn", 3: "turnOff", 5: "turnOn", 7: "turnOn", 9: "turnOn"}
+    ok = pending == expected
+    print(f"rejeu après coupure : {'OK' if ok else 'ÉCHEC'}  en attente={pending}")
+    return ok
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{n} commandes, {threads} threads")
+        run("fsync par commande (FULL)", os.path.join(directory, "single.sqlite3"), n, threads,
+            group_commit=False, synchronous="FULL")
+        run("group commit (FULL)", os.path.join(directory, "group.sqlite3"), n, threads,
+            group_commit=True, synchronous="FULL")
+        run("group commit (NORMAL)", os.path.join(directory, "normal.sqlite3"), n, threads,
+            group_commit=True, synchronous="NORMAL")
+        ok = check_replay(os.path.join(directory, "replay.sqlite3"))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+bench_rules.py
+
+Coût du rapprochement d'un événement IPX avec ses règles (services/rules.py) quand
+le fichier en contient des milliers :
+
+  1. compilation : temps de build_ruleset() pour N règles (chargement et rechargement) ;
+  2. rapprochement : coût par événement avec les tables de répartition, comparé à un
+     parcours de toutes les règles (la base) ; les deux doivent déclencher les mêmes
+     règles sur le même tirage d'événements ;
+  3. stabilité : le coût par événement ne dépend pas du nombre de règles.
+
+Les actions ne sont pas exécutées (fonction vide) et les maintiens sont armés sur un
+ordonnanceur qui n'avance pas : seul le moteur est mesuré.
+
+Usage :
+    python -m benchmarks.bench_rules [règles] [périphériques] [événements]
+"""
+
+import logging
+import random
+import sys
+import time
+from datetime import datetime
+
+from services.rules import ANY, RuleEngine, RulesRegistry, build_ruleset
+from services.scheduler import Scheduler
+
+ETATS = ("on", "off")
+
+
+def make_rules(count: int, devices: int, seed: int = 1) -> list:
+    """
+    Tire `count` règles réparties sur `devices` périphériques : états précis ou "any",
+    maintiens, plages horaires et plusieurs actions.
+    """
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        when = {"device": f"ipx_{rng.randrange(devices)}", "etat": rng.choice(ETATS + (ANY,))}
+        if when["etat"] != ANY and rng.random() < 0.2:
+            when["for"] = rng.choice((30, 120, 600))
+        if rng.random() < 0.3:
+            start = rng.randrange(24)
+            when["between"] = [f"{start:02d}:00", f"{(start + rng.randint(1, 12)) % 24:02d}:00"]
+        then = [{"action": rng.choice(("turnOn", "turnOff")), "device": rng.randrange(1, 500)}
+                for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.1:
+            then.append({"sms": True})
+        if rng.random() < 0.1:
+            then.append({"scene": rng.randrange(1, 50), "delay": 60})
+        rules.append({"name": f"regle_{i}", "when": when, "then": then})
+    return rules
+
+
+def linear_match(rules: tuple, ipx_name: str, etat: str, minute: int) -> list:
+    # Base : chaque règle est examinée pour chaque événement
+    return [rule.name for rule in rules
+            if rule.device == ipx_name and rule.etat in (etat, ANY)
+            and (rule.window is None or rule.in_window(minute))]
+
+
+def bench(count: int, devices: int, events: int) -> dict:
+    specs = make_rules(count, devices)
+    start = time.perf_counter()
+    ruleset = build_ruleset({"rules": specs}, 1)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    registry = RulesRegistry("/dev/null")
+    registry.ruleset = ruleset
+    now = datetime(2026, 1, 1, 21, 15)
+    minute = now.hour * 60 + now.minute
+    fired = []
+    engine = RuleEngine(registry, execute=lambda operations, alerts: None,
+                        scheduler=Scheduler(), now=lambda: now)
+    # Mesure du rapprochement seul : les étapes ne sont pas confiées au pool
+    engine._run = lambda rule: fired.append(rule.name)
+    engine._arm_hold = lambda rule: fired.append(rule.name)
+
+    rng = random.Random(2)
+    stream = [(f"ipx_{rng.randrange(devices)}", rng.choice(ETATS)) for _ in range(events)]
+    rules = tuple(ruleset.by_name.values())
+
+    # Mêmes règles déclenchées que le parcours complet
+    for ipx_name, etat in stream[:500]:
+        fired.clear()
+        engine.on_event(ipx_name, etat)
+        if sorted(fired) != sorted(linear_match(rules, ipx_name, etat, minute)):
+            raise AssertionError(f"écart sur {ipx_name} {etat}")
+
+    fired.clear()
+    start = time.perf_counter()
+    for ipx_name, etat in stream:
+        engine.on_event(ipx_name, etat)
+    table_us = (time.perf_counter() - start) / events * 1e6
+    matched = len(fired) / events
+
+    linear_events = max(200, events // 50)
+    start = time.perf_counter()
+    for ipx_name, etat in stream[:linear_events]:
+        linear_match(rules, ipx_name, etat, minute)
+    linear_us = (time.perf_counter() - start) / linear_events * 1e6
+
+    return {"rules": count, "compile_ms": compile_ms, "table_us": table_us,
+            "linear_us": linear_us, "matched": matched}
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    events = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    logging.getLogger("fibaro_logger").setLevel(logging.ERROR)
+
+    print(f"{devices} périphériques, {events} événements\n")
+    print(f"{'règles':>8} {'compilation':>12} {'tables':>10} {'parcours':>10} {'gain':>7} {'règles/évt':>11}")
+    results = []
+    for n in sorted({count // 10, count, count * 4}):
+        result = bench(n, devices, events)
+        results.append(result)
+        print(f"{n:>8} {result['compile_ms']:>9.1f} ms {result['table_us']:>7.2f} µs "
+              f"{result['linear_us']:>7.1f} µs {result['linear_us'] / result['table_us']:>6.0f}x "
+              f"{result['matched']:>11.1f}")
+
+    # Le coût par événement suit le nombre de règles déclenchées, pas le nombre total
+    smallest, largest = results[0], results[-1]
+    per_match_small = smallest["table_us"] / max(smallest["matched"], 1)
+    per_match_large = largest["table_us"] / max(largest["matched"], 1)
+    stable = per_match_large < per_match_small * 3
+    print(f"\ncoût par règle déclenchée : {per_match_small:.2f} µs ({smallest['rules']} règles) → "
+          f"{per_match_large:.2f} µs ({largest['rules']} règles) {'OK' if stable else 'ÉCHEC'}")
+    sys.exit(0 if stable else 1)
+
+
+if __name__ == "__main__":
+    main()
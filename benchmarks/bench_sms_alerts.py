@@ -0,0 +1,89 @@
+"""
+bench_sms_alerts.py
+
+Rafale d'alertes /ipx-alarms (coupure de courant : plusieurs prises OFF en même
+temps) contre un serveur SMTP local lent (accueil + authentification coûteux).
+
+Trois modes comparés :
+  - une session SMTP par alerte, dans la requête (comportement d'origine) ;
+  - session SMTP réutilisée, toujours dans la requête ;
+  - file de fond avec regroupement (SMS_ASYNC) : la route répond aussitôt.
+
+Pour chaque mode : durée de la rafale côté IPX800, latence max d'une requête,
+délai jusqu'à réception de toutes les alertes, messages et connexions SMTP.
+
+Usage :
+    python -m benchmarks.bench_sms_alerts [alertes] [latence_handshake_s]
+"""
+
+import logging
+import sys
+import time
+
+import config
+from avertissements.sms_dispatcher import SMTPSender, set_smtp_sender
+from simulator.smtp import StubSMTP
+
+
+def run(label: str, client, stub: StubSMTP, sender: SMTPSender, n: int, expected_messages: int) -> bool:
+    set_smtp_sender(sender)
+    with stub.lock:
+        stub.messages.clear()
+        stub.connections = 0
+
+    slowest = 0.0
+    start = time.perf_counter()
+    for i in range(n):
+        request_start = time.perf_counter()
+        client.post("/ipx-alarms", json={"device": f"ipx_prise_{i}", "state": "OFF"})
+        slowest = max(slowest, time.perf_counter() - request_start)
+    burst = time.perf_counter() - start
+    delivered = stub.wait_messages(expected_messages, timeout=30)
+    total = time.perf_counter() - start
+
+    alerts = sum(len(message.get_content().split(",")) for message in stub.messages)
+    ok = delivered and alerts >= n
+    print(f"{label:<28} rafale={burst * 1000:8.1f} ms  requête max={slowest * 1000:7.1f} ms  "
+          f"livraison={total * 1000:8.1f} ms  messages={len(stub.messages):3d}  "
+          f"connexions={stub.connections:3d}  {'OK' if ok else 'ÉCHEC'}")
+    return ok
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    handshake = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    logging.getLogger("fibaro_logger").setLevel(logging.CRITICAL)
+
+    stub = StubSMTP(handshake_latency=handshake, latency=0.005).start()
+    config.SMTP_SERVER, config.SMTP_PORT = "127.0.0.1", stub.port
+    config.SMTP_USER, config.SMTP_PASS, config.SMS_TO = "bench@example.org", "bench", "0600000000@sms.example.org"
+    config.SMTP_STARTTLS = False
+    config.ALERT_COOLDOWN = 0.0
+    config.SMS_BATCH_WINDOW = 0.5
+
+    from app import create_app
+    client = create_app().test_client()
+
+    def sender(idle_timeout: float) -> SMTPSender:
+        return SMTPSender("127.0.0.1", stub.port, user=config.SMTP_USER, password=config.SMTP_PASS,
+                          starttls=False, timeout=5, idle_timeout=idle_timeout)
+
+    print(f"{n} alertes, accueil/authentification SMTP {handshake * 1000:.0f} ms")
+    results = []
+    try:
+        config.SMS_ASYNC = False
+        # idle_timeout négatif : session rouverte à chaque envoi, comme avant
+        results.append(run("session par alerte", client, stub, sender(-1), n, n))
+        results.append(run("session réutilisée", client, stub, sender(60), n, n))
+        config.SMS_ASYNC = True
+        results.append(run("file + regroupement", client, stub, sender(60), n, 1))
+    finally:
+        if config.SMS_ASYNC:
+            from avertissements.sms_dispatcher import get_alert_dispatcher
+            get_alert_dispatcher().stop()
+        stub.stop()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
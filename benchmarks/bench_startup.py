@@ -0,0 +1,153 @@
+"""
+bench_startup.py
+
+Démarrage à froid du pont (systemd le relance après un crash : le temps de
+démarrage est une coupure) :
+
+  1. imports : `python -X importtime -c "import app"`, durée totale (médiane) et
+     imports directs les plus coûteux ;
+  2. imports différés : après create_app(), les sous-systèmes rarement utilisés
+     (alertes SMS, routes de test, mode asynchrone, SQLite) ne sont pas chargés ;
+  3. premier 200 : `python app.py` lancé face à la HC3 simulée, durée jusqu'à la
+     première réponse 200 sur /ipx-event (médiane).
+
+Sortie en erreur si un import différé est chargé au démarrage, ou si la médiane
+du premier 200 dépasse le budget donné : à lancer avant de fusionner.
+
+Usage :
+    python -m benchmarks.bench_startup [lancements] [budget_ms]
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from simulator.hc3 import StubHC3
+
+# Modules qui ne doivent pas être importés au démarrage (options par défaut)
+DEFERRED = (
+    "smtplib",                        # alertes SMS
+    "avertissements.sms_dispatcher",
+    "routes.fibaro_test",             # routes de test (FLASK_DEBUG seulement)
+    "asyncio",                        # mode asynchrone (asgi.py)
+    "services.async_fibaro",
+    "sqlite3",                        # boîte d'envoi, journal, anti-rafale SMS
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times() -> tuple:
+    """
+    Returns:
+        tuple: (durée totale de `import app` en ms, [(cumul ms, module)] des imports directs).
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    total, direct = 0.0, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if name.strip() == "app" and depth == 0:
+            total = int(cumulative) / 1000
+        elif depth == 1:
+            direct.append((int(cumulative) / 1000, name.strip()))
+    return total, sorted(direct, reverse=True)
+
+
+def loaded_deferred() -> list:
+    code = ("import json, sys, app; app.create_app(); "
+            f"print(json.dumps([m for m in {list(DEFERRED)!r} if m in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                            check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_200(hc3: StubHC3, log_dir: str) -> float:
+    """
+    Lance `python app.py` et mesure le temps jusqu'au premier 200 sur /ipx-event (ms).
+    """
+    port = free_port()
+    hc3_host, hc3_port = hc3.base_url.split("//")[1].split("/")[0].split(":")
+    env = dict(os.environ, SERVER_MODE="dev", FLASK_DEBUG="False", FLASK_HOST="127.0.0.1",
+               FLASK_PORT=str(port), FIBARO_IP=hc3_host, FIBARO_PORT=hc3_port,
+               LOG_FILE_PATH=os.path.join(log_dir, "action.log"))
+    url = f"http://127.0.0.1:{port}/ipx-event"
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < 30:
+            try:
+                response = requests.get(url, params={"relais": "ipx_test", "etat": "1"}, timeout=2)
+                if response.status_code == 200:
+                    return (time.perf_counter() - start) * 1000
+            except requests.ConnectionError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"app.py s'est arrêté (code {process.returncode})")
+            time.sleep(0.005)
+        raise RuntimeError("pas de réponse 200 sur /ipx-event après 30 s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    failures = []
+
+    # Un premier lancement compile les .pyc : exclu des mesures
+    import_times()
+    totals = []
+    for _ in range(runs):
+        total, direct = import_times()
+        totals.append(total)
+    print(f"import app : {statistics.median(totals):.0f} ms (médiane sur {runs}, min {min(totals):.0f} ms)")
+    for cumulative, name in direct[:8]:
+        print(f"  {cumulative:>7.1f} ms  {name}")
+
+    loaded = loaded_deferred()
+    print(f"imports différés chargés au démarrage : {loaded or 'aucun'}")
+    if loaded:
+        failures.append(f"imports différés chargés : {loaded}")
+
+    hc3 = StubHC3().start()
+    try:
+        with tempfile.TemporaryDirectory() as log_dir:
+            first_200(hc3, log_dir)
+            timings = [first_200(hc3, log_dir) for _ in range(runs)]
+    finally:
+        hc3.stop()
+    median = statistics.median(timings)
+    print(f"premier 200 sur /ipx-event : {median:.0f} ms (médiane sur {runs}, "
+          f"min {min(timings):.0f} ms, max {max(timings):.0f} ms)")
+    if budget is not None and median > budget:
+        failures.append(f"premier 200 en {median:.0f} ms (budget {budget:.0f} ms)")
+
+    for failure in failures:
+        print(f"RÉGRESSION {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
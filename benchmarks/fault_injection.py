@@ -0,0 +1,107 @@
+"""
+fault_injection.py
+
+Banc de pannes pour le disjoncteur et l'étage de reprise : /ipx-event est appelé
+pendant que la HC3 simulée est lente (timeouts), absente ou instable (503).
+
+Pour chaque scénario, on vérifie :
+  - que les requêtes échouent vite une fois le circuit ouvert (latences affichées) ;
+  - qu'au retour de la HC3, chaque périphérique reçoit son dernier état demandé.
+
+Usage :
+    python -m benchmarks.fault_injection
+"""
+
+import logging
+import sys
+import time
+
+import config
+from benchmarks.bench_fibaro_client import percentile
+from simulator.hc3 import StubHC3
+from services.circuit_breaker import CircuitBreaker
+from services.fibaro_service import FibaroClient, set_client
+
+DEVICES = {"ipx_congelateur": 20, "ipx_test": 27, "ipx_essai": 8}
+
+
+def wait_for(predicate, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def send_events(client, n: int, offset: int = 0):
+    """
+    Envoie n événements alternés sur les périphériques ; retourne (latences, dernier état voulu).
+    """
+    names = list(DEVICES)
+    samples, desired = [], {}
+    for i in range(n):
+        name = names[i % len(names)]
+        etat = "on" if (i // len(names) + offset) % 2 == 0 else "off"
+        start = time.perf_counter()
+        client.get("/ipx-event", query_string={"relais": name, "etat": etat})
+        samples.append(time.perf_counter() - start)
+        desired[DEVICES[name]] = etat == "on"
+    return samples, desired
+
+
+def run_scenario(label: str, client, stub: StubHC3, breaker: CircuitBreaker, retry, fault, offset: int) -> bool:
+    fault(stub)
+    samples, desired = send_events(client, 30, offset)
+    state_during = breaker.state
+    print(f"{label:<8} pendant la panne : p50={percentile(samples, 50) * 1000:.1f} ms  "
+          f"max={max(samples) * 1000:.1f} ms  circuit={state_during}  refus rapides={breaker.rejected}  "
+          f"en reprise={retry.pending()}")
+
+    # Retour à la normale : les reprises doivent amener chaque périphérique à son dernier état voulu
+    stub.latency, stub.failure_rate, stub.down = 0.0, 0.0, False
+    drained = wait_for(lambda: retry.pending() == 0, timeout=10)
+    with stub.lock:
+        final = {device_id: stub.states.get(device_id) for device_id in desired}
+    ok = drained and final == desired
+    print(f"{'':<8} après retour : {'OK' if ok else 'ÉCHEC'}  voulu={desired}  HC3={final}  "
+          f"stats={retry.stats()}")
+    return ok
+
+
+def main() -> None:
+    logging.getLogger("fibaro_logger").setLevel(logging.CRITICAL)
+
+    # Réglages courts pour que le banc tourne en quelques secondes
+    config.RETRY_QUEUE = True
+    config.RETRY_BASE_DELAY, config.RETRY_MAX_DELAY, config.RETRY_TTL = 0.05, 0.5, 30
+    from app import create_app
+    from controllers.control import get_retry_scheduler
+
+    stub = StubHC3(seed=1).start()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.5)
+    set_client(FibaroClient(base_url=stub.base_url, user="bench", password="bench",
+                            connect_timeout=0.2, read_timeout=0.3, breaker=breaker))
+    client = create_app().test_client()
+    retry = get_retry_scheduler()
+
+    def slow(hc3):
+        hc3.latency = 1.0
+
+    def down(hc3):
+        hc3.down = True
+
+    def flaky(hc3):
+        hc3.failure_rate = 0.4
+
+    results = []
+    try:
+        for offset, (label, fault) in enumerate((("lente", slow), ("absente", down), ("instable", flaky))):
+            results.append(run_scenario(label, client, stub, breaker, retry, fault, offset))
+    finally:
+        stub.stop()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+load_async_dispatch.py
+
+Test de charge de /ipx-event face à une HC3 lente, en mode synchrone puis en mode
+dispatch asynchrone (ASYNC_DISPATCH=true). Chaque mode tourne dans un sous-processus
+car la configuration est lue au démarrage.
+
+Usage :
+    python -m benchmarks.load_async_dispatch [latence_hc3_s] [requetes] [concurrence]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_fibaro_client import percentile
+
+
+def run_mode(latency: float, n: int, concurrency: int) -> dict:
+    """
+    Lance la HC3 simulée et l'application Flask, puis envoie n requêtes /ipx-event.
+    """
+    import logging
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from simulator.hc3 import StubHC3
+    from services.fibaro_service import FibaroClient, set_client
+
+    logging.getLogger("fibaro_logger").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    stub = StubHC3(latency=latency).start()
+    set_client(FibaroClient(base_url=stub.base_url, user="bench", password="bench",
+                            pool_size=concurrency))
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/ipx-event"
+
+    session = requests.Session()
+    codes = {}
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        response = session.get(url, params={"relais": "ipx_congelateur", "etat": "on" if i % 2 else "off"})
+        elapsed = time.perf_counter() - start
+        with lock:
+            codes[response.status_code] = codes.get(response.status_code, 0) + 1
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(n)))
+    duration = time.perf_counter() - start
+
+    server.shutdown()
+    stub.stop()
+    return {
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "req_s": n / duration,
+        "codes": codes,
+    }
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        latency, n, concurrency = float(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+        print(json.dumps(run_mode(latency, n, concurrency)))
+        return
+
+    latency = sys.argv[1] if len(sys.argv) > 1 else "0.3"
+    n = sys.argv[2] if len(sys.argv) > 2 else "200"
+    concurrency = sys.argv[3] if len(sys.argv) > 3 else "20"
+
+    for label, async_dispatch in (("synchrone", "false"), ("asynchrone", "true")):
+        env = dict(os.environ, ASYNC_DISPATCH=async_dispatch)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.load_async_dispatch", "--child", latency, n, concurrency],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:<11} p50={result['p50_ms']:.1f} ms  p99={result['p99_ms']:.1f} ms  "
+              f"{result['req_s']:.0f} req/s  codes={result['codes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+load_serving.py
+
+Test de charge de /ipx-event face à la HC3 simulée : serveur de développement
+Werkzeug (app.run) puis mode production gunicorn (wsgi.py), avec 1 puis 2 workers.
+Chaque serveur tourne dans un sous-processus, comme sous systemd ; les clients
+gardent leurs connexions ouvertes (keep-alive).
+
+Usage :
+    python -m benchmarks.load_serving [latence_hc3_s] [requetes] [concurrence]
+"""
+
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_fibaro_client import percentile
+from simulator.hc3 import StubHC3
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_child(mode: str) -> None:
+    """
+    Sous-processus : lance le serveur demandé avec des logs réduits.
+    """
+    logging.getLogger("fibaro_logger").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    import config
+    if mode == "production":
+        from wsgi import run_production
+        run_production({"loglevel": "warning"})
+    else:
+        from app import create_app
+        create_app().run(host=config.HOST, port=config.PORT)
+
+
+def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=0.5)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"Serveur injoignable : {url}")
+
+
+def load(url: str, n: int, concurrency: int) -> dict:
+    local = threading.local()
+    codes = {}
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.get(url, params={"relais": "ipx_congelateur", "etat": "on" if i % 2 else "off"})
+        elapsed = time.perf_counter() - start
+        with lock:
+            codes[response.status_code] = codes.get(response.status_code, 0) + 1
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(n)))
+    duration = time.perf_counter() - start
+    return {
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "req_s": n / duration,
+        "codes": codes,
+    }
+
+
+def run_mode(mode: str, workers: int, stub: StubHC3, n: int, concurrency: int) -> dict:
+    host, stub_port = stub._server.server_address
+    port = free_port()
+    env = dict(os.environ, FLASK_HOST="127.0.0.1", FLASK_PORT=str(port), FLASK_DEBUG="false",
+               FIBARO_IP=host, FIBARO_PORT=str(stub_port), FIBARO_USER="bench", FIBARO_PASSWORD="bench",
+               FIBARO_POOL_SIZE=str(concurrency), SERVER_WORKERS=str(workers),
+               SERVER_THREADS=str(concurrency), MAPPING_RELOAD_INTERVAL="0")
+    child = subprocess.Popen([sys.executable, "-m", "benchmarks.load_serving", "--child", mode],
+                             env=env, stdout=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}/ipx-event"
+        wait_ready(f"http://127.0.0.1:{port}/")
+        load(url, min(n, 20), concurrency)
+        return load(url, n, concurrency)
+    finally:
+        # Arrêt comme systemd : SIGTERM puis attente de l'arrêt propre
+        child.send_signal(signal.SIGTERM)
+        child.wait(timeout=30)
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(sys.argv[2])
+        return
+
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    stub = StubHC3(latency=latency).start()
+    try:
+        modes = (("dev (app.run)", "dev", 1), ("gunicorn x1", "production", 1), ("gunicorn x2", "production", 2))
+        for label, mode, workers in modes:
+            result = run_mode(mode, workers, stub, n, concurrency)
+            print(f"{label:<14} p50={result['p50_ms']:.1f} ms  p99={result['p99_ms']:.1f} ms  "
+                  f"{result['req_s']:.0f} req/s  codes={result['codes']}")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
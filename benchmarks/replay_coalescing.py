@@ -0,0 +1,68 @@
+"""
+replay_coalescing.py
+
+Rejoue une trace d'événements IPX800 en rafales contre une HC3 simulée, avec et
+sans l'étage de regroupement, et compare le nombre d'appels reçus par la HC3.
+
+Usage :
+    python -m benchmarks.replay_coalescing [fenetre_s]
+"""
+
+import logging
+import random
+import sys
+import time
+
+from simulator.hc3 import StubHC3
+from services.coalescer import CommandCoalescer
+from services.fibaro_service import FibaroClient
+from services.scheduler import Scheduler
+
+
+def bursty_trace(devices: int = 5, bursts: int = 20, seed: int = 42):
+    """
+    Génère (délai_avant_événement_s, device_id, action) : des rafales on/off/on
+    de 2 à 6 rebonds espacés de 10 à 80 ms, puis un silence.
+    """
+    rng = random.Random(seed)
+    trace = []
+    for _ in range(bursts):
+        device_id = rng.randint(1, devices)
+        for i in range(rng.randint(2, 6)):
+            trace.append((rng.uniform(0.01, 0.08), device_id, "turnOn" if i % 2 == 0 else "turnOff"))
+        trace.append((rng.uniform(0.3, 0.6), device_id, rng.choice(("turnOn", "turnOff"))))
+    return trace
+
+
+def replay(trace, window: float) -> dict:
+    stub = StubHC3().start()
+    client = FibaroClient(base_url=stub.base_url, user="bench", password="bench")
+    scheduler = Scheduler().start()
+    coalescer = CommandCoalescer(client.call_action, window=window, scheduler=scheduler)
+    try:
+        for delay, device_id, action in trace:
+            time.sleep(delay)
+            if window > 0:
+                coalescer.submit(device_id, action)
+            else:
+                client.call_action(device_id, action)
+        # Laisse les dernières fenêtres se fermer
+        time.sleep(window * 3 + 0.1)
+        return dict(coalescer.stats(), hc3_calls=stub.calls)
+    finally:
+        scheduler.stop()
+        client.close()
+        stub.stop()
+
+
+def main() -> None:
+    logging.getLogger("fibaro_logger").setLevel(logging.WARNING)
+    window = float(sys.argv[1]) if len(sys.argv) > 1 else 0.25
+    trace = bursty_trace()
+    print(f"trace : {len(trace)} événements")
+    print(f"sans regroupement : appels HC3={replay(trace, 0)['hc3_calls']}")
+    print(f"fenêtre {window}s     : {replay(trace, window)}")
+
+
+if __name__ == "__main__":
+    main()
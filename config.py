@@ -33,13 +33,52 @@ HOST = os.getenv("FLASK_HOST", "0.0.0.0")
 SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "sethiarworks-secretkey")
 
 
+#==========================================#
+#     Serveur de production (gunicorn)     #
+#==========================================#
+
+# "dev" = serveur de développement Werkzeug (app.run), "production" = gunicorn,
+# "async" = application ASGI sous uvicorn (asgi.py)
+SERVER_MODE = os.getenv("SERVER_MODE", "dev").lower()
+
+try:
+    # Nombre de processus gunicorn. Le dispatcher, le regroupement et le miroir HC3
+    # vivent dans chaque processus : garder 1 sauf besoin particulier. Refusé au
+    # démarrage avec OUTBOX, REVERSE_CHANNEL, STATE_MIRROR, ALARM_MONITOR,
+    # HEALTH_PROBER ou INBOUND_GUARD (voir check_workers dans app.py).
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 1))
+    # Threads par processus (worker gthread) : requêtes traitées en parallèle
+    SERVER_THREADS = int(os.getenv("SERVER_THREADS", 8))
+    # Durée (s) pendant laquelle une connexion keep-alive inactive reste ouverte
+    SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", 5))
+    # Délai (s) laissé aux requêtes en cours lors d'un arrêt (SIGTERM de systemd)
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 10))
+    # Un worker bloqué plus longtemps (s) est redémarré
+    SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", 30))
+except ValueError:
+    SERVER_WORKERS = 1
+    SERVER_THREADS = 8
+    SERVER_KEEPALIVE = 5
+    SERVER_GRACEFUL_TIMEOUT = 10
+    SERVER_TIMEOUT = 30
+
+
 #===========================#
 #     Paramètres Fibaro     #
 #===========================#
 
-# Construction dynamique de l'url.
+# HC3 simulée (simulator/hc3.py) démarrée avec le pont : FIBARO_BASE_URL pointe vers elle
 USE_SIMULATOR = os.getenv("USE_SIMULATOR", "false").lower() == "true"
 
+try:
+    # Latence (s) ajoutée à chaque réponse de la HC3 simulée
+    SIMULATOR_LATENCY = float(os.getenv("SIMULATOR_LATENCY", 0.05))
+    # Proportion de réponses 503 de la HC3 simulée
+    SIMULATOR_FAILURE_RATE = float(os.getenv("SIMULATOR_FAILURE_RATE", 0))
+except ValueError:
+    SIMULATOR_LATENCY = 0.05
+    SIMULATOR_FAILURE_RATE = 0.0
+
 # Adresse IP de la box Fibaro
 FIBARO_IP = os.getenv("FIBARO_IP", "192.168.1.33")
 
@@ -59,9 +98,309 @@ if FIBARO_PORT == 80:
     FIBARO_BASE_URL = f"http://{FIBARO_IP}/api"
 else:
     FIBARO_BASE_URL = f"http://{FIBARO_IP}:{FIBARO_PORT}/api"
-    
-    
-    
+
+# Timeouts (en secondes) des appels HTTP vers la HC3 : connexion TCP puis lecture de la réponse
+try:
+    FIBARO_CONNECT_TIMEOUT = float(os.getenv("FIBARO_CONNECT_TIMEOUT", 2))
+except ValueError:
+    FIBARO_CONNECT_TIMEOUT = 2.0
+
+try:
+    FIBARO_READ_TIMEOUT = float(os.getenv("FIBARO_READ_TIMEOUT", 5))
+except ValueError:
+    FIBARO_READ_TIMEOUT = 5.0
+
+# Nombre de connexions keep-alive conservées vers la HC3
+try:
+    FIBARO_POOL_SIZE = int(os.getenv("FIBARO_POOL_SIZE", 4))
+except ValueError:
+    FIBARO_POOL_SIZE = 4
+
+# Nom du contrôleur HC3 ci-dessus dans le mapping ("controller")
+FIBARO_CONTROLLER = os.getenv("FIBARO_CONTROLLER", "hc3")
+
+# Fichier JSON des autres box HC3 (services/controllers.py), vide = une seule HC3
+FIBARO_CONTROLLERS = os.getenv("FIBARO_CONTROLLERS")
+
+try:
+    # Appels simultanés au plus vers la HC3 par défaut, 0 = pas de limite
+    FIBARO_MAX_PARALLEL = int(os.getenv("FIBARO_MAX_PARALLEL", 0))
+    # Attente maximale (s) d'une place libre vers une HC3 saturée avant de refuser l'appel
+    FIBARO_ACQUIRE_TIMEOUT = float(os.getenv("FIBARO_ACQUIRE_TIMEOUT", 0.5))
+except ValueError:
+    FIBARO_MAX_PARALLEL = 0
+    FIBARO_ACQUIRE_TIMEOUT = 0.5
+
+# Mode asynchrone (asgi.py) : connexions simultanées vers la HC3 ; les événements
+# suivants attendent une connexion libre sous forme de coroutines
+try:
+    ASYNC_HC3_CONNECTIONS = int(os.getenv("ASYNC_HC3_CONNECTIONS", 8))
+except ValueError:
+    ASYNC_HC3_CONNECTIONS = 8
+
+
+
+#==========================================#
+#   HC3 injoignable : disjoncteur, reprise #
+#==========================================#
+
+# Active le disjoncteur : après N échecs consécutifs, les appels HC3 sont refusés aussitôt
+CIRCUIT_BREAKER = os.getenv("CIRCUIT_BREAKER", "false").lower() == "true"
+
+try:
+    # Nombre d'échecs consécutifs (réseau, timeout, HTTP 5xx) qui ouvrent le circuit
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))
+    # Durée (s) du circuit ouvert avant un appel d'essai
+    CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 15))
+except ValueError:
+    CIRCUIT_FAILURE_THRESHOLD = 3
+    CIRCUIT_RESET_TIMEOUT = 15.0
+
+# Active la reprise des commandes refusées (circuit ouvert, HC3 injoignable)
+RETRY_QUEUE = os.getenv("RETRY_QUEUE", "false").lower() == "true"
+
+try:
+    # Premier délai de reprise (s), doublé à chaque échec
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 1))
+    # Délai de reprise maximum (s)
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 60))
+    # Part aléatoire du délai (0 = aucune, 1 = délai tiré entre 0 et le délai calculé)
+    RETRY_JITTER = float(os.getenv("RETRY_JITTER", 0.5))
+    # Durée de vie (s) d'une commande : au-delà, elle est abandonnée
+    RETRY_TTL = float(os.getenv("RETRY_TTL", 300))
+except ValueError:
+    RETRY_BASE_DELAY = 1.0
+    RETRY_MAX_DELAY = 60.0
+    RETRY_JITTER = 0.5
+    RETRY_TTL = 300.0
+
+
+#==========================================#
+#     Boîte d'envoi persistante (outbox)   #
+#==========================================#
+
+# Active la boîte d'envoi : les commandes non acquittées par la HC3 sont renvoyées au démarrage
+OUTBOX = os.getenv("OUTBOX", "false").lower() == "true"
+
+# Chemin de la base SQLite de la boîte d'envoi
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "logs/outbox.sqlite3")
+
+# FULL : fsync à chaque validation (coupure de courant) ; NORMAL : crash du processus seulement
+OUTBOX_SYNC = os.getenv("OUTBOX_SYNC", "FULL").upper()
+
+try:
+    # Attente maximale (s) de l'enregistrement d'une commande avant de l'envoyer quand même
+    OUTBOX_PUT_TIMEOUT = float(os.getenv("OUTBOX_PUT_TIMEOUT", 1))
+except ValueError:
+    OUTBOX_PUT_TIMEOUT = 1.0
+
+
+#==========================================#
+#     Paramètres du dispatch asynchrone    #
+#==========================================#
+
+# Active la mise en file des commandes : /ipx-event répond 202 sans attendre la HC3
+ASYNC_DISPATCH = os.getenv("ASYNC_DISPATCH", "false").lower() == "true"
+
+try:
+    # Nombre de threads qui envoient les commandes à la HC3
+    DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", 4))
+    # Taille maximale de la file (au-delà : réponse 503)
+    DISPATCH_QUEUE_SIZE = int(os.getenv("DISPATCH_QUEUE_SIZE", 100))
+    # Nombre de statuts de commandes conservés pour consultation
+    DISPATCH_HISTORY_SIZE = int(os.getenv("DISPATCH_HISTORY_SIZE", 1000))
+except ValueError:
+    DISPATCH_WORKERS = 4
+    DISPATCH_QUEUE_SIZE = 100
+    DISPATCH_HISTORY_SIZE = 1000
+
+# Attente maximale (en secondes) d'une place dans la file pleine, 0 = refus immédiat
+try:
+    DISPATCH_ENQUEUE_TIMEOUT = float(os.getenv("DISPATCH_ENQUEUE_TIMEOUT", 0))
+except ValueError:
+    DISPATCH_ENQUEUE_TIMEOUT = 0.0
+
+
+#==========================================#
+#   Regroupement des commandes (debounce)  #
+#==========================================#
+
+try:
+    # Fenêtre de regroupement par périphérique, en secondes (0 = désactivé)
+    COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 0))
+    # Durée pendant laquelle l'état confirmé par la HC3 fait ignorer une commande identique
+    COALESCE_CONFIRMED_TTL = float(os.getenv("COALESCE_CONFIRMED_TTL", 60))
+except ValueError:
+    COALESCE_WINDOW = 0.0
+    COALESCE_CONFIRMED_TTL = 60.0
+
+
+#==========================================#
+#      Envoi par lots (/ipx-events)        #
+#==========================================#
+
+try:
+    # Nombre maximum d'appels simultanés vers la HC3 pour les lots
+    BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", 4))
+    # Nombre maximum d'événements par lot
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+except ValueError:
+    BATCH_MAX_PARALLEL = 4
+    BATCH_MAX_ITEMS = 100
+
+
+#==========================================#
+#        Miroir des états de la HC3        #
+#==========================================#
+
+# Active le miroir local des états (chargement /api/devices puis suivi refreshStates)
+STATE_MIRROR = os.getenv("STATE_MIRROR", "false").lower() == "true"
+
+try:
+    # Timeout de lecture d'une requête de long-polling refreshStates
+    STATE_MIRROR_POLL_TIMEOUT = float(os.getenv("STATE_MIRROR_POLL_TIMEOUT", 35))
+    # Attente avant de retenter après une erreur de la HC3
+    STATE_MIRROR_RETRY_DELAY = float(os.getenv("STATE_MIRROR_RETRY_DELAY", 5))
+except ValueError:
+    STATE_MIRROR_POLL_TIMEOUT = 35.0
+    STATE_MIRROR_RETRY_DELAY = 5.0
+
+
+#==========================================#
+#       Mapping IPX800 → Fibaro HC3        #
+#==========================================#
+
+# Intervalle (en secondes) de vérification du fichier de mapping, 0 = pas de rechargement à chaud
+try:
+    MAPPING_RELOAD_INTERVAL = float(os.getenv("MAPPING_RELOAD_INTERVAL", 2))
+except ValueError:
+    MAPPING_RELOAD_INTERVAL = 2.0
+
+
+#==========================================#
+#      Règles sur les événements IPX       #
+#==========================================#
+
+# Active le moteur de règles (services/rules.py) sur /ipx-event, /ipx-events et /ipx-alarms
+RULES = os.getenv("RULES", "false").lower() == "true"
+
+# Fichier de règles (défaut : services/rules.json)
+RULES_FILE = os.getenv("RULES_FILE")
+
+# Intervalle (en secondes) de vérification du fichier de règles, 0 = pas de rechargement à chaud
+try:
+    RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", 2))
+except ValueError:
+    RULES_RELOAD_INTERVAL = 2.0
+
+
+#==========================================#
+#        Canal retour HC3 → IPX800         #
+#==========================================#
+
+# Recopie les changements d'état HC3 sur les relais IPX800 ("ipx_output" du mapping)
+REVERSE_CHANNEL = os.getenv("REVERSE_CHANNEL", "false").lower() == "true"
+
+# Source des changements : "poll" = long-polling refreshStates (miroir HC3),
+# "webhook" = appels de la HC3 sur /hc3-event (scène Lua) ; le webhook exige
+# INBOUND_GUARD et INBOUND_TOKEN (jeton ou signature comme pour les routes IPX)
+REVERSE_CHANNEL_SOURCE = os.getenv("REVERSE_CHANNEL_SOURCE", "poll").lower()
+
+# API HTTP de l'IPX800 (V4 : /api/xdevices.json?key=...&SetR=NN)
+IPX_BASE_URL = os.getenv("IPX_BASE_URL", "http://192.168.1.20").rstrip("/")
+IPX_API_KEY = os.getenv("IPX_API_KEY", "apikey")
+
+try:
+    # Timeout (s) des appels vers l'IPX800 (connexion et lecture)
+    IPX_TIMEOUT = float(os.getenv("IPX_TIMEOUT", 2))
+    # Durée (s) pendant laquelle l'écho d'une commande du pont est ignoré
+    REVERSE_ECHO_TTL = float(os.getenv("REVERSE_ECHO_TTL", 5))
+except ValueError:
+    IPX_TIMEOUT = 2.0
+    REVERSE_ECHO_TTL = 5.0
+
+
+#==========================================#
+#         Journal des événements           #
+#==========================================#
+
+# Active le journal SQLite des événements IPX et des commandes HC3
+EVENT_JOURNAL = os.getenv("EVENT_JOURNAL", "false").lower() == "true"
+
+# Chemin de la base SQLite du journal
+EVENT_JOURNAL_PATH = os.getenv("EVENT_JOURNAL_PATH", "logs/journal.sqlite3")
+
+try:
+    # Nombre maximum d'événements écrits par transaction
+    EVENT_JOURNAL_BATCH_SIZE = int(os.getenv("EVENT_JOURNAL_BATCH_SIZE", 200))
+    # Délai maximum (s) avant l'écriture d'un lot incomplet
+    EVENT_JOURNAL_FLUSH_INTERVAL = float(os.getenv("EVENT_JOURNAL_FLUSH_INTERVAL", 1))
+    # Nombre d'événements en attente d'écriture ; au-delà, les nouveaux sont perdus
+    EVENT_JOURNAL_QUEUE_SIZE = int(os.getenv("EVENT_JOURNAL_QUEUE_SIZE", 10000))
+except ValueError:
+    EVENT_JOURNAL_BATCH_SIZE = 200
+    EVENT_JOURNAL_FLUSH_INTERVAL = 1.0
+    EVENT_JOURNAL_QUEUE_SIZE = 10000
+
+
+#==========================================#
+#       Santé du pont (/healthz, /readyz)  #
+#==========================================#
+
+# Sonde de fond (HC3, SMTP, mapping) : /readyz répond son dernier résultat
+HEALTH_PROBER = os.getenv("HEALTH_PROBER", "false").lower() == "true"
+
+# Vérifications qui conditionnent /readyz (les autres sont seulement rapportées)
+HEALTH_READY_CHECKS = tuple(name.strip() for name in os.getenv("HEALTH_READY_CHECKS", "hc3,mapping").split(",")
+                            if name.strip())
+
+try:
+    # Intervalle (s) entre deux passages de la sonde
+    HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", 15))
+    # Timeout (s) de chaque vérification réseau (HC3, SMTP)
+    HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", 3))
+except ValueError:
+    HEALTH_INTERVAL = 15.0
+    HEALTH_TIMEOUT = 3.0
+
+# Notifications systemd (READY=1, WATCHDOG=1) si le service est lancé en Type=notify
+SD_NOTIFY = os.getenv("SD_NOTIFY", "true").lower() == "true"
+
+
+#==========================================#
+#   Requêtes entrantes IPX (limitation)    #
+#==========================================#
+
+# Authentification et limitation de débit de /ipx-event(s) et /ipx-alarms (services/inbound_guard.py)
+INBOUND_GUARD = os.getenv("INBOUND_GUARD", "false").lower() == "true"
+
+# Secret partagé : paramètre "token" de l'URL push, en-tête X-IPX-Token ou signature
+# HMAC X-IPX-Signature. Vide = pas d'authentification.
+INBOUND_TOKEN = os.getenv("INBOUND_TOKEN") or None
+
+# Adresses IP connues (séparées par des virgules), chacune avec son propre débit
+INBOUND_CLIENTS = tuple(ip.strip() for ip in os.getenv("INBOUND_CLIENTS", "").split(",") if ip.strip())
+
+# Les autres sources partagent un même débit ; false = elles sont refusées (403)
+INBOUND_ALLOW_UNKNOWN = os.getenv("INBOUND_ALLOW_UNKNOWN", "true").lower() == "true"
+
+try:
+    # Requêtes par seconde et réserve (rafale) par source
+    INBOUND_SOURCE_RATE = float(os.getenv("INBOUND_SOURCE_RATE", 20))
+    INBOUND_SOURCE_BURST = float(os.getenv("INBOUND_SOURCE_BURST", 40))
+    # Événements par seconde et réserve par périphérique
+    INBOUND_DEVICE_RATE = float(os.getenv("INBOUND_DEVICE_RATE", 5))
+    INBOUND_DEVICE_BURST = float(os.getenv("INBOUND_DEVICE_BURST", 10))
+    # Écart maximal (s) entre l'horodatage d'une signature HMAC et l'heure du pont
+    INBOUND_HMAC_WINDOW = float(os.getenv("INBOUND_HMAC_WINDOW", 300))
+except ValueError:
+    INBOUND_SOURCE_RATE = 20.0
+    INBOUND_SOURCE_BURST = 40.0
+    INBOUND_DEVICE_RATE = 5.0
+    INBOUND_DEVICE_BURST = 10.0
+    INBOUND_HMAC_WINDOW = 300.0
+
+
 #===========================#
 # ==== Config pour sms ==== #
 #===========================#
@@ -74,8 +413,60 @@ SMTP_PASS = os.getenv("SMTP_PASS")
 # Numéro destinataire
 SMS_TO = os.getenv("SMS_TO")
 
-# Cooldown entre deux alertes
-ALERT_COOLDOWN = os.getenv("ALERT_COOLDOWN")
+# Base partagée des délais entre alertes (survit aux redémarrages, commune aux workers)
+ALERT_COOLDOWN_PATH = os.getenv("ALERT_COOLDOWN_PATH", "logs/alerts.sqlite3")
+
+try:
+    # Cooldown (s) entre deux alertes d'un même périphérique, 0 = pas de limite
+    ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", 300))
+    # Nombre d'alertes autorisées d'affilée avant d'appliquer le cooldown
+    ALERT_BURST = int(os.getenv("ALERT_BURST", 1))
+except ValueError:
+    ALERT_COOLDOWN = 300.0
+    ALERT_BURST = 1
+
+# Chiffrement STARTTLS de la session SMTP (désactivable pour un relais local)
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+
+# Envoi des SMS en tâche de fond : la route /ipx-alarms répond sans attendre le serveur SMTP
+# (actif par défaut ; false pour un envoi synchrone dans la requête)
+SMS_ASYNC = os.getenv("SMS_ASYNC", "true").lower() == "true"
+
+# Alarmes par machine à états (avertissements/alarm_monitor.py) au lieu d'un SMS au premier OFF
+ALARM_MONITOR = os.getenv("ALARM_MONITOR", "false").lower() == "true"
+
+try:
+    # Durée (s) d'un OFF avant l'alarme
+    ALARM_DELAY = float(os.getenv("ALARM_DELAY", 60))
+    # Durée (s) d'un ON sans nouvel OFF avant le retour à la normale (hystérésis)
+    ALARM_RECOVERY_DELAY = float(os.getenv("ALARM_RECOVERY_DELAY", 30))
+    # Intervalle (s) des relances tant que l'alarme dure, 0 = pas de relance
+    ALARM_ESCALATE_INTERVAL = float(os.getenv("ALARM_ESCALATE_INTERVAL", 1800))
+    # Nombre maximum de relances par alarme
+    ALARM_ESCALATE_MAX = int(os.getenv("ALARM_ESCALATE_MAX", 3))
+    # Période (s) d'évaluation des échéances sur l'ordonnanceur partagé
+    ALARM_TICK = float(os.getenv("ALARM_TICK", 1))
+except ValueError:
+    ALARM_DELAY = 60.0
+    ALARM_RECOVERY_DELAY = 30.0
+    ALARM_ESCALATE_INTERVAL = 1800.0
+    ALARM_ESCALATE_MAX = 3
+    ALARM_TICK = 1.0
+
+try:
+    # Timeout (s) de connexion et de chaque commande SMTP
+    SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 10))
+    # Durée (s) au-delà de laquelle une connexion SMTP inutilisée est rouverte
+    SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", 60))
+    # Fenêtre (s) de regroupement des alertes en un seul SMS (0 = un SMS par alerte)
+    SMS_BATCH_WINDOW = float(os.getenv("SMS_BATCH_WINDOW", 2))
+    # Nombre d'alertes en attente d'envoi ; au-delà, les nouvelles sont refusées
+    SMS_QUEUE_SIZE = int(os.getenv("SMS_QUEUE_SIZE", 100))
+except ValueError:
+    SMTP_TIMEOUT = 10.0
+    SMTP_IDLE_TIMEOUT = 60.0
+    SMS_BATCH_WINDOW = 2.0
+    SMS_QUEUE_SIZE = 100
 
 
 #=================================#
@@ -88,3 +479,12 @@ LOG_FILE_PATH = os.getenv("LOG_FILE_PATH", "logs/action.log")
 # Niveau de verbosité pour les logs (INFO, DEBUG, WARNING, ERROR, CRITICAL)
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+# Niveau du détail complet de chaque requête /ipx-event (headers, corps...)
+IPX_REQUEST_LOG_LEVEL = os.getenv("IPX_REQUEST_LOG_LEVEL", "DEBUG")
+
+# Nombre de lignes de log en attente d'écriture ; au-delà, les plus anciennes sont perdues
+try:
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+except ValueError:
+    LOG_QUEUE_SIZE = 10000
+
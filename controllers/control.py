@@ -1,65 +1,681 @@
 """
 control.py
 Gestion simplifiée des événements IPX800 pour Fibaro HC3.
+
+Les fonctions *_async sont les équivalents en coroutines utilisés par le mode
+asynchrone (asgi.py) : même résolution, même boîte d'envoi, même miroir et même
+reprise, seul l'appel à la HC3 passe par le client asynchrone. asyncio et ce
+client ne sont importés qu'à leur premier appel : le mode threads n'en paie pas
+l'import au démarrage.
+
+Un périphérique d'une autre box HC3 ("controller" du mapping, voir
+services/controllers.py) est envoyé par le client et la cloison de sa box, et en
+mode asynchrone par sa propre file : il ne passe ni par la boîte d'envoi, ni par le
+miroir, le regroupement ou la reprise, qui suivent la HC3 par défaut.
 """
 
-from typing import Dict
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import config
 from services.logger_service import logger, log_action
-from services.fibaro_service import turn_off_fibaro, turn_on_fibaro
-from services.device_mapping import get_fibaro_id
+from services.fibaro_service import execute_operations, turn_off_fibaro, turn_on_fibaro
+from services.controllers import get_controllers
+from services.device_mapping import get_device, get_ipx_name, get_operations
+from services.fibaro_operations import parse_operation
+from services.ipx_parser import IPXEvent
+from services.dispatch_service import CommandDispatcher
+from services.coalescer import CommandCoalescer
+from services.retry_scheduler import RetryScheduler, is_retryable
+from services.state_mirror import get_state_mirror
+from services.reverse_channel import get_reverse_channel
 
+if TYPE_CHECKING:
+    # sqlite3 n'est importé qu'au premier usage de la boîte d'envoi
+    from services.outbox import Outbox
 
-def process_ipx_event(data: Dict[str, str]) -> Dict[str, str]:
+# Intervalle (s) entre deux tentatives de prise du verrou d'un périphérique (mode asynchrone)
+DEVICE_LOCK_POLL_INTERVAL = 0.005
+
+
+def resolve_ipx_command(data) -> Dict[str, str]:
     """
-    Traite un événement venant de l'IPX800 et envoie la commande ON/OFF à la Fibaro.
+    Valide un événement IPX800 et le traduit en commande Fibaro, sans appeler la HC3.
 
-    Le périphérique IPX est identifié par son nom (ex: 'ipx_congelateur'), qui est
-    mappé vers l'ID Fibaro correspondant via le fichier device_mapping.json.
+    Args:
+        data: IPXEvent produit par services/ipx_parser.py, ou dict {"device_id", "etat"}.
+
+    Returns:
+        dict: {"status": "OK", "device", "ipx_name", "etat", "action"} si l'événement
+        est valide, sinon un dict d'erreur {"status": "error", "message"}.
     """
-    ipx_name = data.get("device_id")
-    etat = data.get("etat")
+    event = _as_event(data)
+    command = _resolve_ipx_command(event)
+    if config.EVENT_JOURNAL:
+        from services.event_journal import get_journal
+        get_journal().record("ipx_event", ipx_name=event.ipx_name or event.relais, etat=event.etat,
+                             device_id=command.get("device"), action=command.get("action"),
+                             status=command["status"], message=command.get("message"))
+    return command
+
+
+def _as_event(data) -> IPXEvent:
+    if isinstance(data, IPXEvent):
+        return data
+    event = IPXEvent(data.get("device_id"), data.get("etat"))
+    # Un dict porte déjà le nom logique, utilisé tel quel
+    event.ipx_name = data.get("device_id")
+    return event
+
 
+def _resolve_ipx_command(event: IPXEvent) -> Dict[str, str]:
     # Validation de base
-    if not ipx_name or not etat:
-        logger.error(f"Données invalides reçues: {data}")
+    if not event.complete:
+        logger.error(f"Données invalides reçues: {event}")
         return {"status": "error", "message": "device_id et etat requis."}
 
-    # Récupération de l'ID Fibaro via le mapping
-    device_id = get_fibaro_id(ipx_name)
+    # Récupération de l'ID Fibaro via le mapping (un numéro de relais passe par son nom)
+    ipx_name = event.ipx_name
+    if ipx_name is None:
+        ipx_name = get_ipx_name(event.relay)
+    device = get_device(ipx_name) if ipx_name is not None else None
+    controller, device_id = device if device is not None else (None, None)
+
+    # Règles sur l'événement (services/rules.py) : une recherche par (périphérique, état)
+    rules = 0
+    if config.RULES and ipx_name is not None:
+        from services.rules import etat_key, get_rule_engine
+        rules = get_rule_engine().on_event(ipx_name, etat_key(event.etat, event.action))
+        if device_id is None and is_rule_input(ipx_name):
+            # Entrée sans périphérique HC3 : seules les règles s'appliquent
+            return {"status": "OK", "device": None, "ipx_name": ipx_name, "etat": event.etat,
+                    "action": None, "rules": rules}
+
     if device_id is None:
-        logger.error(f"Aucun mapping trouvé pour le périphérique IPX '{ipx_name}'")
-        return {"status": "error", "message": f"Aucun mapping trouvé pour {ipx_name}"}
+        logger.error(f"Aucun mapping trouvé pour le périphérique IPX '{ipx_name or event.relais}'")
+        return {"status": "error", "message": f"Aucun mapping trouvé pour {ipx_name or event.relais}"}
+
+    # État associé dans le mapping à des opérations HC3 (setValue, scène, variable globale)
+    operations = get_operations(ipx_name, event.etat)
+    if operations is not None:
+        command = {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": event.etat,
+                   "action": "+".join(operation.label for operation in operations),
+                   "operations": [operation.to_dict() for operation in operations]}
+    # Action déduite de l'état, normalisé par le parseur
+    elif event.action is None:
+        logger.error(f"Etat invalide reçu : {event.etat}")
+        return {"status": "error", "message": "Etat doit être 0/1/on/off/true/false/turnOn/turnOff."}
+    else:
+        command = {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": event.etat,
+                   "action": event.action}
+
+    # Périphérique d'une autre box HC3
+    if controller is not None:
+        command["controller"] = controller
+    return command
+
+
+def is_rule_input(ipx_name: str) -> bool:
+    """
+    Indique si une entrée IPX sans périphérique HC3 est portée par des règles (RULES).
+    """
+    if not config.RULES:
+        return False
+    from services.rules import get_rule_engine
+    return get_rule_engine().handles(ipx_name)
+
+
+def _call_hc3(device_id: int, action: str) -> dict:
+    """
+    Appelle la HC3 pour une action turnOn/turnOff. Une réponse définitive (succès ou
+    refus 4xx) retire la commande de la boîte d'envoi, quel que soit le chemin suivi
+    (envoi direct, regroupement, reprise).
+    """
+    _expect_echo(device_id, action)
+    send = turn_on_fibaro if action == "turnOn" else turn_off_fibaro
+    if config.FIBARO_CONTROLLERS or config.FIBARO_MAX_PARALLEL > 0:
+        # Plusieurs box : la HC3 par défaut a sa cloison, comme les autres
+        result = get_controllers().default.call(lambda client: send(device_id))
+    else:
+        result = send(device_id)
+    return _record_result(device_id, action, result)
+
+
+async def _call_hc3_async(device_id: int, action: str) -> dict:
+    from services.async_fibaro import get_async_client
+    _expect_echo(device_id, action)
+    if config.FIBARO_CONTROLLERS or config.FIBARO_MAX_PARALLEL > 0:
+        # Même cloison que les appels en threads de la HC3 par défaut
+        result = await get_controllers().default.call_async(get_async_client().call_action, device_id, action)
+    else:
+        result = await get_async_client().call_action(device_id, action)
+    return _record_result(device_id, action, result)
+
+
+def _expect_echo(device_id: int, action: str) -> None:
+    if config.REVERSE_CHANNEL:
+        # Le changement reviendra par refreshStates, parfois avant la réponse de la HC3 :
+        # annoncé avant l'appel pour ne pas le recopier vers l'IPX800
+        get_reverse_channel().expect_hc3_echo(device_id, action == "turnOn")
+
+
+def _record_result(device_id: int, action: str, result: dict) -> dict:
+    if config.REVERSE_CHANNEL and result.get("status") != "success":
+        get_reverse_channel().forget_hc3_echo(device_id)
+    if config.OUTBOX and (result.get("status") == "success" or not is_retryable(result)):
+        get_outbox().ack(device_id, action)
+    return result
+
+
+def _send_action(device_id: int, action: str) -> dict:
+    """
+    Appelle la HC3 ; si elle est injoignable et que RETRY_QUEUE est actif, la commande
+    est confiée à l'étage de reprise ({"status": "retry"}).
+    """
+    if not config.RETRY_QUEUE:
+        return _call_hc3(device_id, action)
+    # Sérialisé avec les reprises du périphérique : une reprise plus ancienne ne passe pas après cet envoi
+    with get_retry_scheduler().device_lock(device_id):
+        return _schedule_retry(device_id, action, _call_hc3(device_id, action))
+
+
+async def _send_action_async(device_id: int, action: str) -> dict:
+    """
+    Équivalent asynchrone de _send_action. Le verrou du périphérique est guetté sans
+    bloquer : une rafale sur un relais n'occupe ni la boucle ni les threads du pool.
+    """
+    import asyncio
+    if not config.RETRY_QUEUE:
+        return await _call_hc3_async(device_id, action)
+    lock = get_retry_scheduler().device_lock(device_id)
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(DEVICE_LOCK_POLL_INTERVAL)
+    try:
+        return _schedule_retry(device_id, action, await _call_hc3_async(device_id, action))
+    finally:
+        lock.release()
+
+
+def _schedule_retry(device_id: int, action: str, result: dict) -> dict:
+    if config.RETRY_QUEUE:
+        retry = get_retry_scheduler()
+        if result.get("status") == "success":
+            # Un état plus ancien en attente de reprise ne doit pas écraser celui-ci
+            retry.cancel(device_id)
+        elif is_retryable(result):
+            retry.submit(device_id, action, result.get("retry_after") or 0.0)
+            return dict(result, status="retry")
+    return result
+
+
+def accept_ipx_command(command: Dict[str, str]) -> Optional[str]:
+    """
+    Enregistre une commande acceptée dans la boîte d'envoi (si OUTBOX est actif), avant
+    tout envoi à la HC3. Seules les commandes on/off de la HC3 par défaut y passent :
+    un état par périphérique.
+
+    Returns:
+        Optional[str]: Identifiant de la ligne enregistrée, None hors boîte d'envoi.
+    """
+    if not _outboxed(command):
+        return None
+    outbox_id = uuid.uuid4().hex
+    get_outbox().put(command, outbox_id)
+    return outbox_id
+
+
+def _outboxed(command: Dict[str, str]) -> bool:
+    return config.OUTBOX and "operations" not in command and "controller" not in command
+
+
+def submit_ipx_command(command: Dict[str, str]) -> str:
+    """
+    Enregistre une commande puis la met dans la file du dispatcher asynchrone.
+
+    Raises:
+        queue.Full: File d'envoi pleine, la commande n'est pas acceptée.
+    """
+    outbox_id = accept_ipx_command(command)
+    try:
+        return _command_dispatcher(command).submit(command)
+    except queue.Full:
+        if outbox_id is not None:
+            # Cette ligne seulement : une commande plus récente du périphérique reste enregistrée
+            get_outbox().withdraw(command["device"], outbox_id)
+        raise
+
+
+def _command_dispatcher(command: Dict[str, str]) -> CommandDispatcher:
+    # Une file par box HC3 : les commandes d'une box lente n'occupent pas les threads des autres
+    if "controller" in command:
+        controller = get_controllers().get(command["controller"])
+        if controller is not None:
+            return controller.get_dispatcher(lambda queued: execute_ipx_command(queued, accept=False))
+    return get_dispatcher()
+
+
+def command_status(command_id: str):
+    """
+    Statut d'une commande mise en file (toutes files confondues), None si inconnue.
+
+    Sans ASYNC_DISPATCH, aucune commande n'est mise en file : la consultation ne crée
+    pas le dispatcher (ni ses threads).
+    """
+    if not config.ASYNC_DISPATCH:
+        return None
+    entry = _dispatcher.status(command_id) if _dispatcher is not None else None
+    if entry is None:
+        for controller in get_controllers().controllers.values():
+            if controller.dispatcher is not None:
+                entry = controller.dispatcher.status(command_id)
+                if entry is not None:
+                    break
+    return entry
+
+
+def execute_ipx_command(command: Dict[str, str], accept: bool = True) -> Dict[str, str]:
+    """
+    Envoie à la Fibaro une commande produite par resolve_ipx_command.
+
+    Args:
+        accept (bool): Enregistre d'abord la commande dans la boîte d'envoi ; False si
+            c'est déjà fait (dispatcher, rejeu au démarrage).
+    """
+    if accept:
+        accept_ipx_command(command)
+
+    if not config.EVENT_JOURNAL:
+        return _execute_ipx_command(command)
+
+    start = time.perf_counter()
+    result = _execute_ipx_command(command)
+    _journal_command(command, result, start)
+    return result
+
+
+async def execute_ipx_command_async(command: Dict[str, str], accept: bool = True) -> Dict[str, str]:
+    """
+    Comme execute_ipx_command, en coroutine : l'attente de la HC3 ne bloque pas de thread.
+    """
+    import asyncio
+    if accept and _outboxed(command):
+        # L'écriture attend le commit groupé de la boîte d'envoi : hors de la boucle
+        await asyncio.to_thread(accept_ipx_command, command)
+
+    if not config.EVENT_JOURNAL:
+        return await _execute_ipx_command_async(command)
+
+    start = time.perf_counter()
+    result = await _execute_ipx_command_async(command)
+    _journal_command(command, result, start)
+    return result
+
+
+def _journal_command(command: Dict[str, str], result: Dict[str, str], start: float) -> None:
+    from services.event_journal import get_journal
+    get_journal().record("hc3_command", ipx_name=command["ipx_name"], device_id=command["device"],
+                         etat=command["etat"], action=command["action"], status=result["status"],
+                         latency_ms=(time.perf_counter() - start) * 1000,
+                         delivery=result.get("delivery", "sent" if result["status"] == "OK" else None),
+                         message=result.get("message"))
+
+
+def _execute_ipx_command(command: Dict[str, str]) -> Dict[str, str]:
+    device_id = command["device"]
+    ipx_name = command["ipx_name"]
 
     try:
         # Log de l’action
         log_action(device_id)
-        
-        # Normalisation de l'état
-        etat = etat.strip().lower()
-        
-        # Déterminer l'action à exécuter
-        if etat in ('1', 'on', 'true', 'turnon'):
-            result = turn_on_fibaro(device_id)
-        elif etat in ('0', 'off', 'false', 'turnoff'):
-            result = turn_off_fibaro(device_id)
+
+        # Autre box HC3 : son client et sa cloison
+        if "controller" in command:
+            return _execute_on_controller(command)
+
+        # Opérations HC3 du mapping : envoyées en un lot, hors miroir, regroupement et reprise
+        if "operations" in command:
+            return _execute_operations(command)
+
+        # Écho du canal retour, ou périphérique déjà dans l'état demandé d'après le miroir HC3
+        unchanged = _unchanged_result(command)
+        if unchanged is not None:
+            return unchanged
+
+        # Passage par l'étage de regroupement s'il est activé
+        if config.COALESCE_WINDOW > 0:
+            result = get_coalescer().submit(device_id, command["action"])
         else:
-            logger.error(f"Etat invalide reçu : {etat}")
-            return {"status": "error", "message": "Etat doit être 0/1/on/off/true/false/turnOn/turnOff."}
+            result = _send_action(device_id, command["action"])
+        return _delivery_result(command, result)
 
-        # Retour et logging du résultat
-        if result.get("status") == "success":
-            logger.info(f"Action '{etat}' envoyée avec succès au périphérique {device_id} ({ipx_name})")
-            return {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": etat}
+    except Exception as e:
+        logger.exception(f"Erreur lors du traitement IPX pour device {device_id} ({ipx_name}): {e}")
+        return {"status": "error", "message": "Erreur interne serveur."}
+
+
+async def _execute_ipx_command_async(command: Dict[str, str]) -> Dict[str, str]:
+    import asyncio
+    from services.async_fibaro import get_async_client
+    device_id = command["device"]
+    ipx_name = command["ipx_name"]
+
+    try:
+        log_action(device_id)
+
+        if "controller" in command:
+            # Le client asynchrone ne cible que la HC3 par défaut
+            return await asyncio.to_thread(_execute_on_controller, command)
+
+        if "operations" in command:
+            results = await get_async_client().bulk(_command_operations(command))
+            return _operations_result(command, results)
+
+        unchanged = _unchanged_result(command)
+        if unchanged is not None:
+            return unchanged
+
+        if config.COALESCE_WINDOW > 0:
+            # L'étage de regroupement attend sa fenêtre dans un thread
+            result = await asyncio.to_thread(get_coalescer().submit, device_id, command["action"])
         else:
-            logger.warning(f"Échec de l'envoi de valeur: {result}")
-            return {
-                "status": "error",
-                "device": device_id,
-                "ipx_name": ipx_name,
-                "etat": etat,
-                "message": "Fibaro HC3 n'a pas accepté la commande"
-            }
+            result = await _send_action_async(device_id, command["action"])
+        return _delivery_result(command, result)
 
     except Exception as e:
         logger.exception(f"Erreur lors du traitement IPX pour device {device_id} ({ipx_name}): {e}")
-        return {"status": "error", "message": "Erreur interne serveur."}
\ No newline at end of file
+        return {"status": "error", "message": "Erreur interne serveur."}
+
+
+def _execute_on_controller(command: Dict[str, str]) -> Dict[str, str]:
+    """
+    Envoie une commande à la box HC3 nommée par command["controller"].
+    """
+    controller = get_controllers().get(command["controller"])
+    if controller is None:
+        logger.error(f"Contrôleur HC3 inconnu '{command['controller']}' pour {command['ipx_name']}")
+        return {"status": "error", "device": command["device"], "ipx_name": command["ipx_name"],
+                "etat": command["etat"], "message": f"Contrôleur HC3 inconnu : {command['controller']}"}
+    if "operations" in command:
+        results = controller.call(lambda client: client.bulk(_command_operations(command)))
+        if isinstance(results, dict):
+            results = [results]
+        return _operations_result(command, results)
+    device_id, action = command["device"], command["action"]
+    return _delivery_result(command, controller.call(lambda client: client.call_action(device_id, action)))
+
+
+def _unchanged_result(command: Dict[str, str]):
+    """
+    Réponse sans appel HC3 si l'événement est l'écho d'un relais piloté par le canal
+    retour ("echo") ou si le miroir HC3 indique que le périphérique est déjà dans
+    l'état demandé ("unchanged") ; sinon None.
+    """
+    device_id, ipx_name, etat = command["device"], command["ipx_name"], command["etat"]
+    if config.REVERSE_CHANNEL and get_reverse_channel().is_ipx_echo(device_id, command["action"] == "turnOn"):
+        logger.info(f"Événement '{etat}' de {ipx_name} issu du canal retour, non renvoyé à la HC3")
+        if config.OUTBOX:
+            get_outbox().ack(device_id, command["action"])
+        return {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": etat,
+                "delivery": "echo"}
+    if config.STATE_MIRROR and get_state_mirror().is_on(device_id) == (command["action"] == "turnOn"):
+        logger.info(f"Périphérique {device_id} ({ipx_name}) déjà dans l'état '{etat}', appel HC3 évité")
+        if config.OUTBOX:
+            get_outbox().ack(device_id, command["action"])
+        return {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": etat,
+                "delivery": "unchanged"}
+    return None
+
+
+def _delivery_result(command: Dict[str, str], result: dict) -> Dict[str, str]:
+    """
+    Traduit le résultat de l'appel HC3 (ou du regroupement, de la reprise) en réponse.
+    """
+    device_id, ipx_name, etat = command["device"], command["ipx_name"], command["etat"]
+    # Retour et logging du résultat
+    if result.get("status") == "success":
+        logger.info(f"Action '{etat}' envoyée avec succès au périphérique {device_id} ({ipx_name})")
+        return {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": etat}
+    elif result.get("status") == "retry":
+        logger.warning(f"HC3 injoignable, action '{etat}' mise en reprise pour le périphérique {device_id} ({ipx_name})")
+        return {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": etat,
+                "delivery": "retry"}
+    elif result.get("status") in ("pending", "suppressed"):
+        if config.OUTBOX and result["status"] == "suppressed":
+            get_outbox().ack(device_id, command["action"])
+        logger.info(f"Action '{etat}' regroupée ({result['status']}) pour le périphérique {device_id} ({ipx_name})")
+        return {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": etat,
+                "delivery": result["status"]}
+    elif result.get("status") == "busy":
+        return {"status": "error", "device": device_id, "ipx_name": ipx_name, "etat": etat,
+                "message": result["message"]}
+    else:
+        logger.warning(f"Échec de l'envoi de valeur: {result}")
+        return {
+            "status": "error",
+            "device": device_id,
+            "ipx_name": ipx_name,
+            "etat": etat,
+            "message": "Fibaro HC3 n'a pas accepté la commande"
+        }
+
+
+def _execute_operations(command: Dict) -> Dict[str, str]:
+    return _operations_result(command, execute_operations(_command_operations(command)))
+
+
+def _command_operations(command: Dict) -> list:
+    return [parse_operation(spec, command["device"]) for spec in command["operations"]]
+
+
+def _operations_result(command: Dict, results: List[dict]) -> Dict[str, str]:
+    device_id, ipx_name, etat = command["device"], command["ipx_name"], command["etat"]
+    failed = [result for result in results if result.get("status") not in ("success", "superseded")]
+    if not failed:
+        logger.info(f"État '{etat}' du périphérique {device_id} ({ipx_name}) : {command['action']} envoyé")
+        return {"status": "OK", "device": device_id, "ipx_name": ipx_name, "etat": etat}
+    logger.warning(f"Échec de {len(failed)} opération(s) sur {len(results)} pour {ipx_name} : {failed}")
+    return {
+        "status": "error",
+        "device": device_id,
+        "ipx_name": ipx_name,
+        "etat": etat,
+        "message": "Fibaro HC3 n'a pas accepté la commande"
+    }
+
+
+def process_ipx_event(data) -> Dict[str, str]:
+    """
+    Traite un événement venant de l'IPX800 (IPXEvent ou dict {"device_id", "etat"}) et
+    envoie la commande ON/OFF à la Fibaro.
+
+    Le périphérique IPX est identifié par son nom (ex: 'ipx_congelateur'), qui est
+    mappé vers l'ID Fibaro correspondant via le fichier device_mapping.json.
+    """
+    command = resolve_ipx_command(data)
+    if command["status"] != "OK" or command["device"] is None:
+        return command
+    return execute_ipx_command(command)
+
+
+async def process_ipx_event_async(data) -> Dict[str, str]:
+    """
+    Comme process_ipx_event, en coroutine (mode asynchrone).
+    """
+    command = resolve_ipx_command(data)
+    if command["status"] != "OK" or command["device"] is None:
+        return command
+    return await execute_ipx_command_async(command)
+
+
+def process_ipx_batch(events: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Traite une liste d'événements IPX800 : validation et mapping en une passe, puis
+    envoi concurrent à la HC3 (au plus BATCH_MAX_PARALLEL appels simultanés).
+
+    En mode asynchrone, les commandes valides sont mises en file au lieu d'être envoyées.
+
+    Returns:
+        list: Un résultat par événement, dans l'ordre reçu.
+    """
+    commands = [resolve_ipx_command(event) for event in events]
+    results = list(commands)
+
+    valid = [i for i, command in enumerate(commands) if command["status"] == "OK" and command["device"] is not None]
+    if config.ASYNC_DISPATCH:
+        for i in valid:
+            try:
+                command_id = submit_ipx_command(commands[i])
+                results[i] = dict(commands[i], status="queued", command_id=command_id)
+            except queue.Full:
+                results[i] = dict(commands[i], status="error", message="File d'envoi pleine, réessayer.")
+        return results
+
+    futures = [(i, get_batch_executor().submit(execute_ipx_command, commands[i])) for i in valid]
+    for i, future in futures:
+        results[i] = future.result()
+    return results
+
+
+# Pool d'envoi des lots, partagé par toutes les requêtes pour borner le parallélisme global.
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor() -> ThreadPoolExecutor:
+    """
+    Retourne le pool de threads utilisé pour envoyer les lots à la HC3.
+    """
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=config.BATCH_MAX_PARALLEL,
+                                                     thread_name_prefix="fibaro-batch")
+    return _batch_executor
+
+
+# Dispatcher du mode asynchrone, créé au premier usage.
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> CommandDispatcher:
+    """
+    Retourne le dispatcher asynchrone partagé, démarré au premier appel.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = CommandDispatcher(
+                    lambda command: execute_ipx_command(command, accept=False),
+                    workers=config.DISPATCH_WORKERS,
+                    queue_size=config.DISPATCH_QUEUE_SIZE,
+                    history_size=config.DISPATCH_HISTORY_SIZE,
+                    enqueue_timeout=config.DISPATCH_ENQUEUE_TIMEOUT,
+                ).start()
+    return _dispatcher
+
+
+# Étage de regroupement, créé au premier usage.
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer() -> CommandCoalescer:
+    """
+    Retourne l'étage de regroupement des commandes partagé.
+    """
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = CommandCoalescer(
+                    _send_action,
+                    window=config.COALESCE_WINDOW,
+                    confirmed_ttl=config.COALESCE_CONFIRMED_TTL,
+                )
+    return _coalescer
+
+
+# Étage de reprise des commandes, créé au premier usage.
+_retry_scheduler = None
+_retry_scheduler_lock = threading.Lock()
+
+
+def get_retry_scheduler() -> RetryScheduler:
+    """
+    Retourne l'étage de reprise des commandes refusées par une HC3 injoignable.
+    """
+    global _retry_scheduler
+    if _retry_scheduler is None:
+        with _retry_scheduler_lock:
+            if _retry_scheduler is None:
+                _retry_scheduler = RetryScheduler(
+                    _call_hc3,
+                    base_delay=config.RETRY_BASE_DELAY,
+                    max_delay=config.RETRY_MAX_DELAY,
+                    jitter=config.RETRY_JITTER,
+                    ttl=config.RETRY_TTL,
+                )
+    return _retry_scheduler
+
+
+# Boîte d'envoi persistante, ouverte au premier usage.
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> "Outbox":
+    """
+    Retourne la boîte d'envoi persistante partagée, démarrée au premier appel.
+    """
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                # sqlite3 importé seulement si la boîte d'envoi est utilisée
+                from services.outbox import Outbox
+                _outbox = Outbox(
+                    config.OUTBOX_PATH,
+                    synchronous=config.OUTBOX_SYNC,
+                    put_timeout=config.OUTBOX_PUT_TIMEOUT,
+                ).start()
+    return _outbox
+
+
+def replay_outbox() -> int:
+    """
+    Renvoie les commandes restées dans la boîte d'envoi (arrêt ou crash avant
+    l'acquittement de la HC3) : par le dispatcher en mode asynchrone, sinon depuis un
+    thread de fond pour ne pas retarder le démarrage.
+
+    Returns:
+        int: Nombre de commandes renvoyées.
+    """
+    commands = [{"status": "OK", "device": entry["device"], "ipx_name": entry["ipx_name"],
+                 "etat": entry["etat"], "action": entry["action"]} for entry in get_outbox().pending()]
+    if not commands:
+        return 0
+    logger.warning(f"Boîte d'envoi : {len(commands)} commande(s) non acquittée(s), renvoi en cours")
+
+    if config.ASYNC_DISPATCH:
+        dispatcher = get_dispatcher()
+        for command in commands:
+            try:
+                dispatcher.submit(command)
+            except queue.Full:
+                # Restera dans la boîte jusqu'au prochain démarrage
+                logger.warning(f"File d'envoi pleine, renvoi reporté pour le périphérique {command['device']}")
+        return len(commands)
+
+    def replay():
+        for command in commands:
+            execute_ipx_command(command, accept=False)
+
+    threading.Thread(target=replay, name="outbox-replay", daemon=True).start()
+    return len(commands)
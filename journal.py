@@ -0,0 +1,152 @@
+"""
+journal.py
+
+Outil en ligne de commande pour le journal des événements (services/event_journal.py).
+
+Commandes :
+  - query  : liste les événements d'un périphérique sur une période ;
+  - replay : rejoue les événements IPX d'une période contre une HC3 simulée et
+             compare les résultats à ceux enregistrés (régression + performance).
+
+Les dates acceptent un format ISO ("2026-10-17T08:00"), un timestamp Unix ou une
+durée relative à maintenant ("30m", "2h", "7d").
+
+Exemples :
+    python journal.py query --device ipx_congelateur --action turnOff --last
+    python journal.py query --device 20 --since 24h --json
+    python journal.py replay --since 2h --speed 10
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+import config
+from services.event_journal import query
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Options désactivées pendant un rejeu (lues depuis .env, comme en production)
+REPLAY_DISABLED = ("EVENT_JOURNAL", "OUTBOX", "REVERSE_CHANNEL", "STATE_MIRROR")
+
+
+def parse_time(text: str) -> float:
+    """
+    Convertit une date ISO, un timestamp ou une durée relative ("2h") en timestamp Unix.
+    """
+    if text[-1:] in UNITS and text[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(text[:-1]) * UNITS[text[-1]]
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def parse_device(text: str):
+    """
+    Un ID numérique désigne un périphérique Fibaro, sinon c'est un nom logique IPX.
+    """
+    return int(text) if text and text.isdigit() else text
+
+
+def format_event(event: dict) -> str:
+    when = datetime.fromtimestamp(event["ts"]).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    device = f"{event.get('ipx_name', '?')} ({event.get('device_id', '-')})"
+    latency = f"{event['latency_ms']:.1f} ms" if "latency_ms" in event else ""
+    details = event.get("delivery") or event.get("message") or ""
+    return (f"{when}  {event['kind']:<11}  {device:<30}  {str(event.get('etat', '')):<5}  "
+            f"{event.get('action', ''):<7}  {event.get('status', ''):<6}  {latency:>9}  {details}")
+
+
+def cmd_query(args) -> int:
+    events = query(args.db, device=parse_device(args.device),
+                   since=parse_time(args.since) if args.since else None,
+                   until=parse_time(args.until) if args.until else None,
+                   kind=args.kind, action=args.action, status=args.status,
+                   limit=1 if args.last else args.limit, newest_first=args.last)
+    for event in events:
+        print(json.dumps(event, ensure_ascii=False) if args.json else format_event(event))
+    return 0
+
+
+def cmd_replay(args) -> int:
+    import logging
+
+    from benchmarks.bench_fibaro_client import percentile
+    from simulator.hc3 import StubHC3
+    from controllers.control import process_ipx_event
+    from services.fibaro_service import FibaroClient, set_client
+
+    events = query(args.db, device=parse_device(args.device), kind="ipx_event",
+                   since=parse_time(args.since) if args.since else None,
+                   until=parse_time(args.until) if args.until else None)
+    if not events:
+        print("Aucun événement IPX sur cette période.")
+        return 1
+
+    # Le rejeu ne doit laisser aucune trace en production : ni dans le journal qu'il
+    # lit, ni dans la boîte d'envoi, ni en échos attendus du canal retour
+    for name in REPLAY_DISABLED:
+        setattr(config, name, False)
+    logging.getLogger("fibaro_logger").setLevel(logging.WARNING)
+    stub = StubHC3(latency=args.latency).start()
+    set_client(FibaroClient(base_url=stub.base_url, user="replay", password="replay"))
+
+    samples, mismatches = [], []
+    start = time.perf_counter()
+    try:
+        for i, event in enumerate(events):
+            if args.speed > 0 and i:
+                time.sleep(max(0.0, (event["ts"] - events[i - 1]["ts"]) / args.speed))
+            t0 = time.perf_counter()
+            result = process_ipx_event({"device_id": event.get("ipx_name"), "etat": event.get("etat")})
+            samples.append(time.perf_counter() - t0)
+            if result.get("status") != event.get("status"):
+                mismatches.append((event, result))
+    finally:
+        stub.stop()
+    duration = time.perf_counter() - start
+
+    print(f"{len(events)} événements rejoués en {duration:.2f} s, {stub.calls} appels HC3, "
+          f"p50={percentile(samples, 50) * 1000:.2f} ms  p99={percentile(samples, 99) * 1000:.2f} ms")
+    print(f"{len(mismatches)} résultat(s) différent(s) de l'enregistrement")
+    for event, result in mismatches[:20]:
+        print(f"  {format_event(event)}\n    -> {result}")
+    return 1 if mismatches else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Journal des événements IPX800 / HC3")
+    parser.add_argument("--db", default=config.EVENT_JOURNAL_PATH, help="base SQLite du journal")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = commands.add_parser("query", help="lister des événements")
+    query_parser.add_argument("--kind", choices=("ipx_event", "hc3_command"))
+    query_parser.add_argument("--action", choices=("turnOn", "turnOff"))
+    query_parser.add_argument("--status", help="OK, error...")
+    query_parser.add_argument("--limit", type=int)
+    query_parser.add_argument("--last", action="store_true", help="seulement le plus récent")
+    query_parser.add_argument("--json", action="store_true", help="une ligne JSON par événement")
+    query_parser.set_defaults(handler=cmd_query)
+
+    replay_parser = commands.add_parser("replay", help="rejouer une période contre une HC3 simulée")
+    replay_parser.add_argument("--speed", type=float, default=0,
+                               help="facteur d'accélération du rythme enregistré (0 = au plus vite)")
+    replay_parser.add_argument("--latency", type=float, default=0.0, help="latence de la HC3 simulée (s)")
+    replay_parser.set_defaults(handler=cmd_replay)
+
+    for sub in (query_parser, replay_parser):
+        sub.add_argument("--device", help="nom logique IPX ou ID Fibaro")
+        sub.add_argument("--since", help="début (ISO, timestamp ou durée : 2h)")
+        sub.add_argument("--until", help="fin (ISO, timestamp ou durée : 30m)")
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
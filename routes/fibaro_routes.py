@@ -1,14 +1,126 @@
+import logging
+import queue
+import time
+
 from flask import Blueprint, request, jsonify
 from services.logger_service import logger
 
-from controllers.control import process_ipx_event
-from services.device_mapping import DEVICE_MAP, get_fibaro_id
-
-# Inversion du mapping pour faire correspondre l'ID numérique au nom logique
-NUMERIC_DEVICE_MAP = {v: k for k, v in DEVICE_MAP.items()}
+import config
+from controllers.control import (
+    process_ipx_event, process_ipx_batch, resolve_ipx_command, submit_ipx_command, command_status, get_coalescer,
+    is_rule_input
+)
+from services.device_mapping import get_fibaro_id, get_ipx_name
+from services.ipx_parser import parse_ipx_request
+from services.state_mirror import get_state_mirror, value_is_on
+from services.reverse_channel import get_reverse_channel
+from services.inbound_guard import get_inbound_guard
+from services import metrics
 
 # Routes/fibaro_routes.py
 fibaro_bp = Blueprint('fibaro', __name__)
+
+# Niveau du détail de chaque requête IPX (DEBUG par défaut : rien n'est construit en INFO)
+REQUEST_LOG_LEVEL = logging.getLevelName(config.IPX_REQUEST_LOG_LEVEL.upper())
+if not isinstance(REQUEST_LOG_LEVEL, int):
+    REQUEST_LOG_LEVEL = logging.DEBUG
+
+IPX_PARSE_SECONDS = metrics.histogram("fibaro_ipx_parse_seconds", "Extraction de relais/etat dans /ipx-event",
+                                      buckets=metrics.FAST_BUCKETS)
+
+# Routes contrôlées par services/inbound_guard.py (INBOUND_GUARD)
+GUARDED_PATHS = frozenset(("/ipx-event", "/ipx-events", "/ipx-alarms", "/hc3-event"))
+
+
+def _signed_request() -> tuple:
+    # Champs couverts par une signature X-IPX-Signature (corps gardé en cache pour le parseur)
+    return request.method.encode(), request.path.encode(), request.query_string, request.get_data(cache=True)
+
+
+def guard_ipx_request():
+    """
+    Contrôle avant traitement des requêtes IPX (app.before_request si INBOUND_GUARD) :
+    authentification puis débit de la source.
+
+    Returns:
+        Réponse 401, 403 ou 429 si la requête est refusée, None sinon.
+    """
+    if request.path not in GUARDED_PATHS:
+        return None
+    refusal = get_inbound_guard().check_source(
+        request.remote_addr, request.args.get("token") or request.headers.get("X-IPX-Token"),
+        request.headers.get("X-IPX-Signature"), _signed_request)
+    if refusal is not None:
+        code, data, headers = refusal
+        return jsonify(data), code, headers
+    return None
+
+
+def _log_request_details():
+    """
+    Log du détail de la requête IPX en cours (headers, query, form, corps brut et JSON).
+    """
+    logger.log(REQUEST_LOG_LEVEL, "---- NOUVELLE REQUÊTE IPX ----")
+    logger.log(REQUEST_LOG_LEVEL, "Méthode : %s", request.method)
+    logger.log(REQUEST_LOG_LEVEL, "Headers : %s", dict(request.headers))
+    logger.log(REQUEST_LOG_LEVEL, "Query string : %s", request.query_string.decode(errors='ignore'))
+    logger.log(REQUEST_LOG_LEVEL, "Form data : %s", request.form.to_dict())
+    logger.log(REQUEST_LOG_LEVEL, "Raw data : %s", request.data.decode(errors='ignore'))
+    logger.log(REQUEST_LOG_LEVEL, "JSON : %s", request.get_json(silent=True))
+    logger.log(REQUEST_LOG_LEVEL, "---------------------------------")
+
+
+def _to_ipx_name(ipx_name):
+    """
+    Convertit un identifiant numérique IPX en nom logique ; un nom est retourné tel quel.
+
+    Returns:
+        str: Nom logique, ou None si l'ID numérique n'a pas de mapping.
+    """
+    try:
+        return get_ipx_name(int(ipx_name))
+    except (TypeError, ValueError):
+        # Ce n'était pas un nombre, on garde le nom tel quel
+        return ipx_name
+
+
+def _parse_batch_payload():
+    """
+    Extrait la liste des couples (périphérique, état) d'une requête de lot.
+
+    Formats acceptés :
+      - JSON : [{"relais": ..., "etat": ...}, ...] ou {"events": [...]}
+        (la clé "device_id" est acceptée à la place de "relais") ;
+      - texte clé=valeur, un enregistrement par ligne ou séparé par ';' :
+        "relais=1&etat=on;relais=2&etat=off" ou la forme courte "1=on&2=off".
+
+    Returns:
+        list: Liste de tuples (relais, etat), ou None si le corps est illisible.
+    """
+    json_data = request.get_json(silent=True)
+    if json_data is not None:
+        if isinstance(json_data, dict):
+            json_data = json_data.get("events")
+        if not isinstance(json_data, list):
+            return None
+        return [
+            (item.get("relais") or item.get("device_id"), item.get("etat")) if isinstance(item, dict) else (None, None)
+            for item in json_data
+        ]
+
+    raw = request.get_data(as_text=True).strip()
+    if not raw or '=' not in raw:
+        return None
+    pairs = []
+    for record in raw.replace(';', '\n').splitlines():
+        params = dict(pair.split('=', 1) for pair in record.strip().split('&') if '=' in pair)
+        if not params:
+            continue
+        if 'etat' in params:
+            pairs.append((params.get('relais') or params.get('device_id'), params['etat']))
+        else:
+            pairs.extend(params.items())
+    return pairs
   
   
 # Fonction qui va recevoir les événements de l'IPx800.
@@ -33,77 +145,225 @@ def handle_ipx_event():
 
     Processus :
 
-      1. Log des détails de la requête (headers, query, form, raw data).
-      2. Extraction des données dans l'ordre : query string → form → JSON → texte brut.
+      1. Log des détails de la requête (headers, query, form, raw data) au niveau
+         IPX_REQUEST_LOG_LEVEL (DEBUG par défaut).
+      2. Extraction des données en une passe (services/ipx_parser.py) : query string,
+         puis corps selon son format (form, JSON, texte brut).
       3. Validation de la présence des champs `device_id` et `etat`.
-      4. Appel de la fonction métier `process_ipx_event` pour traitement.
+      4. Appel de la fonction métier `process_ipx_event` pour traitement,
+         ou mise en file de la commande si ASYNC_DISPATCH est actif.
       5. Retour d'une réponse JSON avec le statut et message.
 
     Returns:
       - 200 : succès avec résultat du traitement.
+      - 202 : commande mise en file (mode asynchrone), suivie via /ipx-event/<command_id>.
       - 400 : données manquantes ou invalides.
+      - 401, 403, 429 : requête refusée par le contrôle d'entrée (INBOUND_GUARD).
+      - 503 : file d'envoi pleine (mode asynchrone), à réessayer plus tard.
       - 500 : erreur serveur (non gérée ici explicitement mais possible).
     """
     
-    # Mise en place des variables.
     ipx_name = None
-    etat = None
-    
+
     try:
-        # Logs pour debug
-        logger.info(f"---- NOUVELLE REQUÊTE IPX ----")
-        logger.info(f"Méthode : {request.method}")
-        logger.info(f"Headers : {dict(request.headers)}")
-        logger.info(f"Query string : {request.query_string.decode(errors='ignore')}")
-        logger.info(f"Form data : {request.form.to_dict()}")
-        logger.info(f"Raw data : {request.data.decode(errors='ignore')}")
-        logger.info(f"JSON : {request.get_json(silent=True)}")
-        logger.info(f"DEBUG - ipx_name={ipx_name}, etat={etat}")
-        logger.info("---------------------------------")
-
-        # Récupération des paramètres
-        ipx_name = request.args.get('relais') or request.form.get('relais')
-        etat = request.args.get('etat') or request.form.get('etat')
-
-        # Tentative JSON si non trouvé
-        if not ipx_name or not etat:
-            json_data = request.get_json(silent=True)
-            if json_data:
-                ipx_name = ipx_name or json_data.get('device_id') or json_data.get('relais')
-                etat = etat or json_data.get('etat')
-
-        # Tentative raw data clé=valeur
-        if not ipx_name or not etat:
-            raw = request.data.decode(errors='ignore').strip()
-            if raw and '=' in raw:
-                params = dict(pair.split('=', 1) for pair in raw.split('&') if '=' in pair)
-                ipx_name = ipx_name or params.get('device_id') or params.get('relais')
-                etat = etat or params.get('etat')
+        # Détail complet de la requête, construit seulement si le niveau est actif
+        if logger.isEnabledFor(REQUEST_LOG_LEVEL):
+            _log_request_details()
+
+        # Récupération des paramètres : corps lu une seule fois, format détecté d'emblée
+        parse_start = time.perf_counter()
+        event = parse_ipx_request(request)
+        IPX_PARSE_SECONDS.observe(time.perf_counter() - parse_start)
 
         # Vérification
-        if not ipx_name or not etat:
+        if not event.complete:
             logger.error("relais (device_id) ou etat manquants après parsing complet.")
             return jsonify({"status": "error", "message": "device_id et etat requis."}), 400
         # Si c'est un ID numérique, on récupère le nom logique correspondant
-        try:
-            ipx_num = int(ipx_name)
-            ipx_name = NUMERIC_DEVICE_MAP.get(ipx_num)
-            if ipx_name is None:
-                return jsonify({"status": "error", "message": f"Aucun mapping trouvé pour ID {ipx_num}"}), 400
-        except ValueError:
-            # Ce n'était pas un nombre, on garde le nom tel quel
-            pass
+        if event.relay is not None:
+            event.ipx_name = get_ipx_name(event.relay)
+        ipx_name = event.ipx_name
+        if ipx_name is None:
+            return jsonify({"status": "error", "message": f"Aucun mapping trouvé pour ID {event.relais}"}), 400
+
+        # Débit par périphérique, une fois son nom connu
+        if config.INBOUND_GUARD:
+            refusal = get_inbound_guard().check_device(ipx_name)
+            if refusal is not None:
+                code, data, headers = refusal
+                return jsonify(data), code, headers
           
         # Récupération de l'ID Fibaro à partir du nom logique
         device_id = get_fibaro_id(ipx_name)
-        if device_id is None:
+        if device_id is None and not is_rule_input(ipx_name):
             return jsonify({"status": "error", "message": f"Aucun mapping trouvé pour {ipx_name}"}), 400
 
+        # Mode asynchrone : la commande est validée ici puis envoyée par le dispatcher
+        if config.ASYNC_DISPATCH:
+            command = resolve_ipx_command(event)
+            if command["status"] != "OK":
+                return jsonify(command), 400
+            if command["device"] is None:
+                return jsonify(command), 200
+            try:
+                command_id = submit_ipx_command(command)
+            except queue.Full:
+                logger.warning(f"File d'envoi pleine, commande refusée pour {ipx_name}")
+                return jsonify({"status": "error", "message": "File d'envoi pleine, réessayer."}), 503, {"Retry-After": "1"}
+            return jsonify({"status": "queued", "command_id": command_id, "device": device_id,
+                            "ipx_name": ipx_name, "etat": command["etat"]}), 202
+
         # Appel de la fonction métier
-        response = process_ipx_event({"device_id": ipx_name, "etat": etat})
+        response = process_ipx_event(event)
         return jsonify(response), 200
 
     except Exception as e:
         logger.exception(f"Erreur lors du traitement de l'événement IPX800 : {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
-    
\ No newline at end of file
+
+
+# Fonction qui reçoit plusieurs états de relais en une seule requête.
+@fibaro_bp.route('/ipx-events', methods=['POST'])
+def handle_ipx_batch():
+    """
+    Point d'entrée API pour appliquer plusieurs états de relais IPX en une requête.
+
+    Les événements sont résolus via le mapping en une passe, puis les appels HC3
+    sont envoyés en parallèle (limité par BATCH_MAX_PARALLEL). Voir
+    `_parse_batch_payload` pour les formats acceptés.
+
+    Avec INBOUND_GUARD, les événements d'un périphérique au-delà de son débit sont
+    refusés un par un (statut "error"), les autres sont traités.
+
+    Returns:
+      - 200 : un résultat par événement, dans l'ordre reçu ("status" global :
+              OK, partial ou error).
+      - 400 : corps illisible ou vide.
+      - 413 : plus de BATCH_MAX_ITEMS événements.
+    """
+    try:
+        pairs = _parse_batch_payload()
+        if not pairs:
+            return jsonify({"status": "error", "message": "Liste d'événements (relais, etat) requise."}), 400
+        if len(pairs) > config.BATCH_MAX_ITEMS:
+            return jsonify({"status": "error", "message": f"Lot limité à {config.BATCH_MAX_ITEMS} événements."}), 413
+
+        logger.info(f"Lot IPX reçu : {len(pairs)} événements")
+        events = [{"device_id": _to_ipx_name(relais) if relais else None, "etat": etat} for relais, etat in pairs]
+        if config.INBOUND_GUARD:
+            results = _process_guarded_batch(events)
+        else:
+            results = process_ipx_batch(events)
+
+        accepted = sum(1 for result in results if result.get("status") in ("OK", "queued"))
+        status = "OK" if accepted == len(results) else ("partial" if accepted else "error")
+        return jsonify({"status": status, "count": len(results), "results": results}), 200
+
+    except Exception as e:
+        logger.exception(f"Erreur lors du traitement du lot IPX800 : {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _process_guarded_batch(events):
+    """
+    Traite un lot en écartant les événements des périphériques au-delà de leur débit.
+    """
+    guard = get_inbound_guard()
+    limited = {}
+    for i, event in enumerate(events):
+        refusal = guard.check_device(event["device_id"])
+        if refusal is not None:
+            limited[i] = dict(refusal[1], ipx_name=event["device_id"], etat=event["etat"])
+    if not limited:
+        return process_ipx_batch(events)
+    processed = iter(process_ipx_batch([event for i, event in enumerate(events) if i not in limited]))
+    return [limited[i] if i in limited else next(processed) for i in range(len(events))]
+
+
+# Consultation du statut d'une commande mise en file (mode asynchrone).
+@fibaro_bp.route('/ipx-event/<command_id>', methods=['GET'])
+def ipx_event_status(command_id):
+    """
+    Retourne le statut d'une commande retournée par /ipx-event en mode asynchrone.
+
+    Returns:
+      - 200 : statut (queued, running, done ou error) et résultat éventuel.
+      - 404 : commande inconnue ou trop ancienne, ou mode asynchrone désactivé.
+    """
+    entry = command_status(command_id)
+    if entry is None:
+        return jsonify({"status": "error", "message": f"Commande inconnue : {command_id}"}), 404
+    return jsonify(entry), 200
+
+
+# Compteurs de l'étage de regroupement des commandes.
+@fibaro_bp.route('/coalescer/stats', methods=['GET'])
+def coalescer_stats():
+    """
+    Retourne les événements reçus et les commandes réellement envoyées à la HC3.
+    """
+    if config.COALESCE_WINDOW <= 0:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(get_coalescer().stats(), enabled=True)), 200
+
+
+# Lecture de l'état d'un périphérique depuis le miroir local, sans appel à la HC3.
+@fibaro_bp.route('/devices/<ipx_name>/state', methods=['GET'])
+def device_state(ipx_name):
+    """
+    Retourne l'état connu d'un périphérique (nom logique ou ID numérique IPX).
+
+    Returns:
+      - 200 : valeur HC3 et interprétation on/off.
+      - 404 : périphérique sans mapping ou inconnu de la HC3.
+      - 503 : miroir désactivé ou pas encore chargé.
+    """
+    # Miroir désactivé : il n'est pas créé pour répondre
+    mirror = get_state_mirror() if config.STATE_MIRROR else None
+    if mirror is None or not mirror.ready:
+        return jsonify({"status": "error", "message": "Miroir des états HC3 indisponible."}), 503
+
+    name = _to_ipx_name(ipx_name)
+    device_id = get_fibaro_id(name) if name else None
+    if device_id is None:
+        return jsonify({"status": "error", "message": f"Aucun mapping trouvé pour {ipx_name}"}), 404
+
+    value = mirror.get(device_id)
+    if value is None:
+        return jsonify({"status": "error", "message": f"Périphérique {device_id} inconnu de la HC3"}), 404
+    return jsonify({"status": "OK", "ipx_name": name, "device": device_id, "value": value,
+                    "on": value_is_on(value), "updated_at": mirror.updated_at}), 200
+
+
+# Changements d'état envoyés par la HC3 (canal retour en mode webhook).
+@fibaro_bp.route('/hc3-event', methods=['POST'])
+def handle_hc3_event():
+    """
+    Reçoit des changements d'état de la HC3 (scène Lua) et les recopie sur l'IPX800.
+
+    Formats acceptés (JSON) : {"id": 20, "value": true}, une liste de ces objets, ou
+    {"changes": [...]} comme dans refreshStates.
+
+    La requête est authentifiée comme celles de l'IPX800 (guard_ipx_request) : sans
+    INBOUND_GUARD et INBOUND_TOKEN, la route refuse de piloter les relais.
+
+    Returns:
+      - 200 : nombre de changements pris en compte.
+      - 400 : corps illisible.
+      - 401 : jeton ou signature absent ou invalide.
+      - 503 : canal retour désactivé, alimenté par refreshStates, ou webhook non authentifié.
+    """
+    if not config.REVERSE_CHANNEL or config.REVERSE_CHANNEL_SOURCE != "webhook":
+        return jsonify({"status": "error", "message": "Canal retour HC3 → IPX800 non alimenté par webhook."}), 503
+    if not config.INBOUND_GUARD or not config.INBOUND_TOKEN:
+        logger.error("/hc3-event refusé : INBOUND_GUARD et INBOUND_TOKEN requis pour le webhook")
+        return jsonify({"status": "error", "message": "Webhook HC3 non authentifié (INBOUND_TOKEN requis)."}), 503
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("changes", [data])
+    if not isinstance(data, list):
+        return jsonify({"status": "error", "message": "Changements {id, value} attendus."}), 400
+
+    count = get_reverse_channel().apply_changes(data)
+    return jsonify({"status": "OK", "count": count}), 200
@@ -0,0 +1,60 @@
+from flask import Blueprint, jsonify, request
+
+from simulator.hc3 import get_simulated_hc3
+
+
+# Routes/fibaro_test.py
+fibaro_test_bp = Blueprint('fibaro_test', __name__)
+
+
+def _simulator_state(hc3) -> dict:
+    with hc3.lock:
+        return {
+            'latency': hc3.latency,
+            'failure_rate': hc3.failure_rate,
+            'down': hc3.down,
+            'calls': hc3.calls,
+            'failures': hc3.failures,
+            'states': {str(device_id): value for device_id, value in hc3.states.items()},
+        }
+
+
+# État de la HC3 simulée (USE_SIMULATOR).
+@fibaro_test_bp.route('/simulator/hc3', methods=['GET'])
+def simulator_state():
+    hc3 = get_simulated_hc3()
+    if hc3 is None:
+        return jsonify({'status': 'error', 'message': 'HC3 simulée non démarrée (USE_SIMULATOR)'}), 404
+    return jsonify(_simulator_state(hc3))
+
+
+# Pannes de la HC3 simulée, modifiables à chaud : {"latency", "failure_rate", "down"}.
+@fibaro_test_bp.route('/simulator/hc3', methods=['POST'])
+def simulator_configure():
+    hc3 = get_simulated_hc3()
+    if hc3 is None:
+        return jsonify({'status': 'error', 'message': 'HC3 simulée non démarrée (USE_SIMULATOR)'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'latency' in data:
+            hc3.latency = max(0.0, float(data['latency']))
+        if 'failure_rate' in data:
+            hc3.failure_rate = min(1.0, max(0.0, float(data['failure_rate'])))
+        if 'down' in data:
+            hc3.down = bool(data['down'])
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'invalid payload'}), 400
+    return jsonify(_simulator_state(hc3))
+
+
+# Changement "externe" d'un périphérique simulé (ex. interrupteur actionné à la main).
+@fibaro_test_bp.route('/simulator/hc3/devices/<int:device_id>', methods=['POST'])
+def simulator_change(device_id):
+    hc3 = get_simulated_hc3()
+    if hc3 is None:
+        return jsonify({'status': 'error', 'message': 'HC3 simulée non démarrée (USE_SIMULATOR)'}), 404
+    data = request.get_json(silent=True) or {}
+    if 'value' not in data:
+        return jsonify({'status': 'error', 'message': 'invalid payload'}), 400
+    hc3.push_change(device_id, data['value'])
+    return jsonify({'status': 'OK', 'device': device_id, 'value': data['value']})
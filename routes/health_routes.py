@@ -0,0 +1,26 @@
+import time
+
+from flask import Blueprint, Response, jsonify
+
+import config
+
+# Routes/health_routes.py
+health_bp = Blueprint('health', __name__)
+
+STARTED = time.monotonic()
+
+
+# Vivacité : le processus répond (systemd, watchdog ou supervision externe).
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok', 'uptime_s': round(time.monotonic() - STARTED, 1)})
+
+
+# Disponibilité : dernier résultat de la sonde de fond, sans appel vers la HC3.
+@health_bp.route('/readyz', methods=['GET'])
+def readyz():
+    if not config.HEALTH_PROBER:
+        return jsonify({'status': 'disabled', 'message': 'sonde de santé désactivée (HEALTH_PROBER)'}), 503
+    from services.health import get_health_prober
+    ready, body = get_health_prober().readiness()
+    return Response(body, status=200 if ready else 503, content_type="application/json")
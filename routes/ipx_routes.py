@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
+
+import config
 from services.logger_service import logger
 from services.device_mapping import get_fibaro_id
-from avertissements.ipx_alarms import send_sms_alert
 
 
 # Routes/ipx_routes.py"
@@ -12,6 +13,8 @@ ipx_bp = Blueprint('ipx', __name__)
 @ipx_bp.route('/test-sms', methods=['GET'])
 def test_sms():
     logger.info("Test SMS déclenché manuellement")
+    # Alertes SMS (smtplib, email) importées au premier usage, pas au démarrage
+    from avertissements.ipx_alarms import send_sms_alert
     send_sms_alert("TEST", force=True)
     return jsonify({'status': "sms test envoyé"})
 
@@ -30,7 +33,35 @@ def ipx_alarms():
     if not ipx_name or not state:
         logger.warning(f"Données invalides reçues : {data}")
         return jsonify({'status': 'error', 'message': 'invalid payload'}), 400
+
+    # Débit par périphérique (INBOUND_GUARD), la source étant contrôlée avant la route
+    if config.INBOUND_GUARD:
+        from services.inbound_guard import get_inbound_guard
+        refusal = get_inbound_guard().check_device(ipx_name)
+        if refusal is not None:
+            code, body, headers = refusal
+            return jsonify(body), code, headers
     
+    # Règles déclarées pour ce périphérique (RULES) : elles remplacent l'alerte par défaut
+    if config.RULES:
+        from services.ipx_parser import normalize_etat
+        from services.rules import etat_key, get_rule_engine
+        engine = get_rule_engine()
+        if engine.handles(ipx_name):
+            rules = engine.on_event(ipx_name, etat_key(*normalize_etat(state)))
+            return jsonify({'statut': 'OK', 'rules': rules})
+
+    # Machine à états : l'alarme part après ALARM_DELAY, pas au premier OFF
+    if config.ALARM_MONITOR:
+        from services.ipx_parser import normalize_etat
+        from avertissements.alarm_monitor import get_alarm_monitor
+        etat, action = normalize_etat(state)
+        if action is None:
+            logger.warning(f"État invalide reçu : {data}")
+            return jsonify({'status': 'error', 'message': 'invalid state'}), 400
+        alarm_state = get_alarm_monitor().observe(ipx_name, action == "turnOn")
+        return jsonify({'statut': 'OK', 'alarm': alarm_state})
+
     # Mapping IPX → Fibaro déclenchement des actions Fibaro.
     device_id = get_fibaro_id(ipx_name)
     if device_id is None:
@@ -38,9 +69,19 @@ def ipx_alarms():
     
     if state.upper() == 'OFF':
         logger.warning(f"{ipx_name} est hors tension -> Envoi SMS")
+        from avertissements.ipx_alarms import send_sms_alert
         send_sms_alert(ipx_name)
     else:
         logger.info(f"{ipx_name} est en état normal ({state})")
             
     return jsonify({'statut': 'OK'})
-    
\ No newline at end of file
+    
+
+
+# États des alarmes en cours (ALARM_MONITOR).
+@ipx_bp.route('/alarms', methods=['GET'])
+def alarms():
+    if not config.ALARM_MONITOR:
+        return jsonify({'enabled': False})
+    from avertissements.alarm_monitor import get_alarm_monitor
+    return jsonify({'enabled': True, 'devices': get_alarm_monitor().states()})
@@ -0,0 +1,90 @@
+import sys
+import time
+
+from flask import Blueprint, Response, g, request
+
+import config
+from services import metrics
+from services.logger_service import queue_handler
+
+# Routes/metrics_routes.py
+metrics_bp = Blueprint('metrics', __name__)
+
+HTTP_REQUESTS = metrics.counter("fibaro_http_requests_total", "Requêtes HTTP reçues",
+                                ("route", "method", "code"))
+HTTP_DURATION = metrics.histogram("fibaro_http_request_seconds", "Durée de traitement des requêtes HTTP",
+                                  ("route",))
+QUEUE_DEPTH = metrics.gauge("fibaro_queue_depth", "Éléments en attente dans les files internes", ("queue",))
+CIRCUIT_STATE = metrics.gauge("fibaro_circuit_state", "Disjoncteur HC3 : 0 fermé, 1 semi-ouvert, 2 ouvert")
+
+
+def _existing(module: str, attribute: str):
+    """
+    Objet partagé d'un module s'il a déjà été créé, sans importer le module ni créer
+    l'objet : une lecture de /metrics ne démarre aucun thread.
+    """
+    return getattr(sys.modules.get(module), attribute, None)
+
+
+def _dispatch_depth():
+    dispatcher = _existing("controllers.control", "_dispatcher")
+    return dispatcher.qsize() if dispatcher is not None else 0
+
+
+def _retry_depth():
+    scheduler = _existing("controllers.control", "_retry_scheduler")
+    return scheduler.pending() if scheduler is not None else 0
+
+
+def _sms_depth():
+    dispatcher = _existing("avertissements.sms_dispatcher", "_dispatcher")
+    return dispatcher.qsize() if dispatcher is not None else 0
+
+
+def _circuit_state():
+    from services.fibaro_service import get_client
+    return {"closed": 0, "half_open": 1, "open": 2}[get_client().breaker.state]
+
+
+def _journal_depth():
+    journal = _existing("services.event_journal", "_journal")
+    return journal.qsize() if journal is not None else 0
+
+
+# Profondeur des files lue au moment de l'export
+QUEUE_DEPTH.labels("log").set_function(lambda: queue_handler.queue.qsize())
+if config.ASYNC_DISPATCH:
+    QUEUE_DEPTH.labels("dispatch").set_function(_dispatch_depth)
+if config.EVENT_JOURNAL:
+    QUEUE_DEPTH.labels("journal").set_function(_journal_depth)
+if config.RETRY_QUEUE:
+    QUEUE_DEPTH.labels("retry").set_function(_retry_depth)
+if config.SMS_ASYNC:
+    QUEUE_DEPTH.labels("sms").set_function(_sms_depth)
+if config.CIRCUIT_BREAKER:
+    CIRCUIT_STATE.set_function(_circuit_state)
+
+
+@metrics_bp.before_app_request
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def _record_request(response):
+    start = g.get("metrics_start")
+    if start is not None:
+        # Modèle de route (ex. /devices/<ipx_name>/state) pour borner le nombre de séries
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        HTTP_DURATION.labels(route).observe(time.perf_counter() - start)
+    return response
+
+
+# Export des métriques au format Prometheus.
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Retourne toutes les métriques du processus au format texte Prometheus.
+    """
+    return Response(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
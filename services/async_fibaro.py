@@ -0,0 +1,304 @@
+"""
+async_fibaro.py
+
+Client HC3 pour le mode asynchrone (asgi.py) : même API et mêmes résultats que
+FibaroClient, mais chaque appel est une coroutine. Un événement en attente de la
+HC3 coûte une coroutine au lieu d'un thread.
+
+Le client parle HTTP/1.1 directement sur des flux asyncio (bibliothèque standard) :
+  - connexions keep-alive réutilisées, au plus `max_connections` ouvertes à la fois
+    (les appels suivants attendent une connexion libre) ;
+  - timeouts de connexion et de lecture identiques au client synchrone ;
+  - pas de renvoi automatique : un relais ne doit pas être basculé deux fois ; seule
+    exception, une connexion keep-alive réutilisée que la HC3 a fermée sans
+    répondre (ligne de statut vide) : la requête est renvoyée une fois sur une
+    connexion neuve ;
+  - disjoncteur et métrique fibaro_hc3_call_seconds partagés avec FibaroClient.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import asyncio
+import base64
+import json
+import ssl
+import threading
+import time
+from typing import List, Optional
+from urllib.parse import quote, urlsplit
+
+import config
+from services.logger_service import logger
+from services.circuit_breaker import CircuitBreaker
+from services.fibaro_operations import ACTION, KIND_ORDER, SCENE, FibaroOperation
+from services.fibaro_service import HC3_CALL_SECONDS
+
+
+class _StaleConnection(ConnectionError):
+    """
+    Connexion fermée par la HC3 sans aucune réponse.
+    """
+
+
+class _Connection:
+    """
+    Connexion keep-alive vers la HC3.
+    """
+
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def usable(self) -> bool:
+        # Connexion fermée par la HC3 pendant son inactivité
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class AsyncFibaroClient:
+    """
+    Client HTTP asynchrone vers la Fibaro HC3.
+
+    Args:
+        base_url (str): URL de l'API HC3 (ex. "http://192.168.1.33/api").
+        user (str): Utilisateur de la HC3.
+        password (str): Mot de passe de la HC3.
+        connect_timeout (float): Timeout de connexion TCP, en secondes.
+        read_timeout (float): Timeout de lecture de la réponse, en secondes.
+        max_connections (int): Connexions simultanées vers la HC3.
+        breaker (CircuitBreaker): Disjoncteur optionnel : circuit ouvert => refus immédiat.
+    """
+
+    def __init__(self, base_url: str = None, user: str = None, password: str = None,
+                 connect_timeout: float = None, read_timeout: float = None, max_connections: int = None,
+                 breaker: CircuitBreaker = None):
+        self.base_url = (base_url or config.FIBARO_BASE_URL).rstrip("/")
+        url = urlsplit(self.base_url)
+        self.host = url.hostname
+        self.ssl = ssl.create_default_context() if url.scheme == "https" else None
+        self.port = url.port or (443 if self.ssl else 80)
+        self.prefix = url.path
+        self.connect_timeout = connect_timeout if connect_timeout is not None else config.FIBARO_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout if read_timeout is not None else config.FIBARO_READ_TIMEOUT
+        self.max_connections = max_connections or config.ASYNC_HC3_CONNECTIONS
+        self.breaker = breaker
+
+        # En-têtes communs calculés une seule fois
+        host = url.netloc.rsplit("@", 1)[-1]
+        user = user if user is not None else config.FIBARO_USER
+        password = password if password is not None else config.FIBARO_PASSWORD
+        headers = f"Host: {host}\r\nAccept: application/json\r\nContent-Type: application/json\r\n"
+        if user is not None:
+            token = base64.b64encode(f"{user}:{password or ''}".encode()).decode("ascii")
+            headers += f"Authorization: Basic {token}\r\n"
+        self._headers = headers
+
+        self._idle: List[_Connection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def call_action(self, device_id: int, action: str, *args) -> dict:
+        """
+        Envoie une action (turnOn, turnOff, setValue...) à un périphérique via l'API callAction.
+        """
+        payload = {"deviceID": device_id, "name": action}
+        for i, arg in enumerate(args, 1):
+            payload[f"arg{i}"] = arg
+        return await self._send("GET", "/callAction", action, payload, f"l'action {action} sur {device_id}")
+
+    async def run_scene(self, scene_id: int) -> dict:
+        """
+        Exécute une scène de la HC3.
+        """
+        return await self._send("POST", f"/scenes/{scene_id}/execute", "scene", {}, f"la scène {scene_id}")
+
+    async def set_global_variable(self, name: str, value) -> dict:
+        """
+        Met à jour une variable globale de la HC3 (valeur transmise en texte).
+        """
+        return await self._send("PUT", f"/globalVariables/{quote(name, safe='')}", "globalVariable",
+                                {"name": name, "value": str(value)}, f"la variable globale {name}")
+
+    async def execute(self, operation: FibaroOperation) -> dict:
+        """
+        Envoie une opération typée (services/fibaro_operations.py).
+        """
+        if operation.kind == ACTION:
+            return await self.call_action(operation.target, operation.name, *operation.args)
+        if operation.kind == SCENE:
+            return await self.run_scene(operation.target)
+        return await self.set_global_variable(operation.target, operation.args[0])
+
+    async def bulk(self, operations: List[FibaroOperation]) -> List[dict]:
+        """
+        Envoie un lot d'opérations, avec les mêmes règles que FibaroClient.bulk
+        (dédoublonnage, envoi type par type, parallèle au sein d'un type).
+        """
+        results = [None] * len(operations)
+        latest = {}
+        for i, operation in enumerate(operations):
+            if operation.key is not None:
+                previous = latest.get(operation.key)
+                if previous is not None:
+                    results[previous] = {"status": "superseded"}
+                latest[operation.key] = i
+
+        for kind in KIND_ORDER:
+            indexes = [i for i, operation in enumerate(operations) if results[i] is None and operation.kind == kind]
+            sent = await asyncio.gather(*(self.execute(operations[i]) for i in indexes))
+            for i, result in zip(indexes, sent):
+                results[i] = result
+        return results
+
+    async def _send(self, method: str, path: str, label: str, payload: dict, what: str) -> dict:
+        if self.breaker is not None and not self.breaker.allow():
+            HC3_CALL_SECONDS.labels(label, "open").observe(0.0)
+            return {"status": "open", "message": "HC3 injoignable (disjoncteur ouvert)",
+                    "retry_after": self.breaker.retry_after()}
+
+        start = time.perf_counter()
+        try:
+            logger.debug(f"Envoi à Fibaro: {method} URL={self.base_url}{path}, payload={payload}")
+            status, body = await self._request(method, self.prefix + path, json.dumps(payload).encode())
+            HC3_CALL_SECONDS.labels(label, str(status)).observe(time.perf_counter() - start)
+            if self.breaker is not None:
+                # Une réponse 4xx prouve que la HC3 est joignable : seuls les 5xx comptent comme échec
+                if status >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+            text = body.decode("utf-8", errors="replace")
+            logger.debug(f"Réponse Fibaro: {text}")
+
+            try:
+                resp_json = json.loads(text) if text else {}
+            except ValueError:
+                resp_json = {}
+
+            if 200 <= status < 300:
+                return {"status": "success", "code": status, "response": resp_json}
+            logger.warning(f"Erreur {label} Fibaro ({status}): {text}")
+            return {"status": "failed", "code": status, "response": resp_json, "message": text}
+
+        except Exception as e:
+            HC3_CALL_SECONDS.labels(label, "error").observe(time.perf_counter() - start)
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            logger.error(f"Erreur lors de l'appel de {what} : {e!r}")
+            return {"status": "error", "message": str(e) or repr(e)}
+
+    async def _request(self, method: str, path: str, body: bytes) -> tuple:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        request = (f"{method} {path} HTTP/1.1\r\n{self._headers}"
+                   f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+        async with self._slots:
+            connection, reused = await self._connection()
+            try:
+                return await self._exchange(connection, request)
+            except _StaleConnection:
+                if not reused:
+                    raise
+            # Fermée par la HC3 pendant son inactivité, avant de lire la requête : une seule nouvelle tentative
+            connection, _ = await self._connection(reuse=False)
+            return await self._exchange(connection, request)
+
+    async def _exchange(self, connection: _Connection, request: bytes) -> tuple:
+        try:
+            connection.writer.write(request)
+            status, response, keep_alive = await asyncio.wait_for(self._read_response(connection.reader),
+                                                                   self.read_timeout)
+        except BaseException:
+            connection.close()
+            raise
+        if keep_alive:
+            self._idle.append(connection)
+        else:
+            connection.close()
+        return status, response
+
+    async def _connection(self, reuse: bool = True) -> tuple:
+        # (connexion, réutilisée ou non)
+        while reuse and self._idle:
+            connection = self._idle.pop()
+            if connection.usable:
+                return connection, True
+            connection.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.connect_timeout)
+        return _Connection(reader, writer), False
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> tuple:
+        status_line = await reader.readline()
+        if not status_line:
+            raise _StaleConnection("connexion fermée par la HC3 sans réponse")
+        version, status = status_line.split(None, 2)[:2]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == b"HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";", 1)[0], 16)
+                if size == 0:
+                    # Fin du corps (en-têtes de fin ignorés)
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return int(status), body, keep_alive
+
+    async def close(self) -> None:
+        """
+        Ferme les connexions inactives vers la HC3.
+        """
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+# Client partagé, créé au premier appel.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncFibaroClient:
+    """
+    Retourne le client HC3 asynchrone partagé ; il partage le disjoncteur du client
+    synchrone (reprises, miroir) pour que les deux voient la même HC3.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from services.fibaro_service import get_client
+                _client = AsyncFibaroClient(breaker=get_client().breaker)
+    return _client
+
+
+def set_async_client(client: AsyncFibaroClient) -> None:
+    """
+    Remplace le client asynchrone partagé (ex. pour pointer vers une HC3 de test).
+    """
+    global _client
+    with _client_lock:
+        _client = client
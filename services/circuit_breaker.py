@@ -0,0 +1,91 @@
+"""
+circuit_breaker.py
+
+Disjoncteur (circuit breaker) placé devant les appels à la Fibaro HC3.
+
+Quand la HC3 redémarre ou perd le Wi-Fi, chaque appel attend le timeout complet.
+Le disjoncteur compte les échecs consécutifs (erreur réseau, timeout, HTTP 5xx) :
+
+- fermé (closed) : les appels passent ; failure_threshold échecs d'affilée l'ouvrent ;
+- ouvert (open) : les appels sont refusés immédiatement pendant reset_timeout ;
+- semi-ouvert (half_open) : un seul appel d'essai passe. Un succès referme le
+  disjoncteur, un échec le rouvre pour une nouvelle période.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import threading
+import time
+from typing import Callable
+
+from services.logger_service import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur à seuil d'échecs consécutifs.
+
+    Args:
+        failure_threshold (int): Nombre d'échecs consécutifs qui ouvrent le circuit.
+        reset_timeout (float): Durée (s) pendant laquelle le circuit reste ouvert.
+        clock (Callable): Horloge monotone.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 15.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Indique si un appel peut partir. En semi-ouvert, un seul appel d'essai à la fois.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                logger.info("Disjoncteur HC3 semi-ouvert : appel d'essai")
+            if self.state == HALF_OPEN and not self._probe_running:
+                self._probe_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        """
+        Secondes restantes avant le prochain appel d'essai (0 si le circuit est fermé).
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - self.clock())
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Disjoncteur HC3 refermé : la HC3 répond de nouveau")
+            self.state = CLOSED
+            self.failures = 0
+            self._probe_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_running = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    logger.warning(f"Disjoncteur HC3 ouvert après {self.failures} échecs consécutifs")
+                self.state = OPEN
+                self.opened_at = self.clock()
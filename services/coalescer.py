@@ -0,0 +1,170 @@
+"""
+coalescer.py
+
+Étage de regroupement (coalescing) des commandes par périphérique, placé devant
+fibaro_service.
+
+Les entrées de l'IPX800 rebondissent : un relais peut envoyer on/off/on en quelques
+centaines de millisecondes. Pour chaque périphérique :
+
+- la première commande d'une période calme part immédiatement (aucune latence ajoutée)
+  et ouvre une fenêtre de COALESCE_WINDOW secondes ;
+- pendant la fenêtre, seule la dernière commande reçue est conservée ;
+- à la fin de la fenêtre, elle est envoyée, sauf si elle correspond au dernier état
+  confirmé par la HC3 (moins de COALESCE_CONFIRMED_TTL secondes).
+
+La HC3 reçoit ainsi au plus une commande par fenêtre et par périphérique.
+
+Les envois d'un même périphérique partent dans l'ordre de leur décision : chaque
+envoi prend un numéro de passage et attend la fin du précédent. Avec une HC3 lente,
+la commande regroupée de fin de fenêtre ne peut donc pas arriver avant l'envoi
+immédiat qui a ouvert la fenêtre, ni le dépasser.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from services.logger_service import logger
+from services.scheduler import Scheduler, get_scheduler
+
+
+class _DeviceSlot:
+    """
+    État de regroupement d'un périphérique.
+    """
+
+    __slots__ = ("pending", "window_open", "confirmed", "confirmed_at", "tickets", "serving", "turn")
+
+    def __init__(self, lock: threading.Lock):
+        self.pending = None
+        self.window_open = False
+        self.confirmed = None
+        self.confirmed_at = 0.0
+        # Numéro du prochain envoi et de l'envoi autorisé à partir (envois dans l'ordre)
+        self.tickets = 0
+        self.serving = 0
+        self.turn = threading.Condition(lock)
+
+
+class CommandCoalescer:
+    """
+    Regroupe les commandes rapprochées d'un même périphérique.
+
+    Args:
+        send (Callable): Fonction (device_id, action) -> dict qui appelle la HC3.
+        window (float): Durée de la fenêtre de regroupement, en secondes.
+        confirmed_ttl (float): Durée de validité du dernier état confirmé, 0 = jamais ignoré.
+        scheduler (Scheduler): Ordonnanceur des fins de fenêtre (défaut : partagé).
+        clock (Callable): Horloge monotone.
+    """
+
+    def __init__(self, send: Callable[[int, str], dict], window: float, confirmed_ttl: float = 60.0,
+                 scheduler: Scheduler = None, clock: Callable[[], float] = time.monotonic):
+        self.send = send
+        self.window = window
+        self.confirmed_ttl = confirmed_ttl
+        self.scheduler = scheduler or get_scheduler()
+        self.clock = clock
+        self._slots = {}
+        self._lock = threading.Lock()
+        # Les envois de fin de fenêtre ne doivent pas bloquer le thread de l'ordonnanceur
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="coalescer")
+        self.events_received = 0
+        self.commands_sent = 0
+        self.coalesced = 0
+        self.suppressed = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Compteurs : événements reçus vs commandes réellement envoyées à la HC3.
+        """
+        with self._lock:
+            return {
+                "events_received": self.events_received,
+                "commands_sent": self.commands_sent,
+                "coalesced": self.coalesced,
+                "suppressed": self.suppressed,
+            }
+
+    def submit(self, device_id: int, action: str) -> dict:
+        """
+        Soumet une commande (turnOn/turnOff) pour un périphérique.
+
+        Returns:
+            dict: Résultat HC3 si la commande est partie immédiatement, sinon
+            {"status": "pending"} (regroupée) ou {"status": "suppressed"} (état déjà confirmé).
+        """
+        with self._lock:
+            self.events_received += 1
+            slot = self._slots.get(device_id)
+            if slot is None:
+                slot = self._slots[device_id] = _DeviceSlot(self._lock)
+
+            if slot.window_open:
+                if slot.pending is not None:
+                    self.coalesced += 1
+                slot.pending = action
+                return {"status": "pending"}
+
+            if self._is_confirmed(slot, action):
+                self.suppressed += 1
+                return {"status": "suppressed"}
+
+            slot.window_open = True
+            self.scheduler.call_later(self.window, self._close_window, device_id)
+            ticket = self._take_ticket(slot)
+
+        return self._send(device_id, action, ticket)
+
+    def _is_confirmed(self, slot: _DeviceSlot, action: str) -> bool:
+        return (self.confirmed_ttl > 0 and slot.confirmed == action
+                and self.clock() - slot.confirmed_at < self.confirmed_ttl)
+
+    @staticmethod
+    def _take_ticket(slot: _DeviceSlot) -> int:
+        ticket = slot.tickets
+        slot.tickets += 1
+        return ticket
+
+    def _send(self, device_id: int, action: str, ticket: int) -> dict:
+        slot = self._slots[device_id]
+        with self._lock:
+            # Attend la fin de l'envoi précédent du périphérique
+            slot.turn.wait_for(lambda: slot.serving == ticket)
+        result = {"status": "error", "message": "Envoi interrompu"}
+        try:
+            result = self.send(device_id, action)
+        finally:
+            with self._lock:
+                self.commands_sent += 1
+                if result.get("status") == "success":
+                    slot.confirmed = action
+                    slot.confirmed_at = self.clock()
+                else:
+                    slot.confirmed = None
+                slot.serving += 1
+                slot.turn.notify_all()
+        return result
+
+    def _close_window(self, device_id: int) -> None:
+        with self._lock:
+            slot = self._slots[device_id]
+            action = slot.pending
+            slot.pending = None
+            if action is None:
+                slot.window_open = False
+                return
+            if self._is_confirmed(slot, action):
+                self.suppressed += 1
+                slot.window_open = False
+                return
+            # Une nouvelle fenêtre s'ouvre : au plus un envoi par fenêtre
+            self.scheduler.call_later(self.window, self._close_window, device_id)
+            ticket = self._take_ticket(slot)
+
+        logger.debug(f"Envoi regroupé {action} pour le périphérique {device_id}")
+        self._executor.submit(self._send, device_id, action, ticket)
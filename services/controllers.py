@@ -0,0 +1,262 @@
+"""
+controllers.py
+
+Plusieurs box Fibaro HC3 (contrôleurs nommés) derrière un même pont.
+
+Le contrôleur par défaut (FIBARO_CONTROLLER, "hc3") est celui de FIBARO_IP et
+utilise le client partagé de services/fibaro_service.py. Les autres sont décrits
+dans le fichier FIBARO_CONTROLLERS :
+
+  {"garage": {"ip": "192.168.2.33", "port": 80, "user": "admin", "password_env": "GARAGE_PASSWORD",
+              "connect_timeout": 2, "read_timeout": 5, "pool_size": 2, "max_parallel": 2},
+   "hc3": {"max_parallel": 4}}
+
+("base_url" remplace ip/port ; une entrée portant le nom du contrôleur par défaut
+ne règle que ses limites.) Le mapping associe un périphérique à un contrôleur avec
+"controller" (voir services/device_mapping.py).
+
+Chaque contrôleur a son client (pool de connexions, timeouts, disjoncteur) et sa
+cloison (bulkhead) : au plus max_parallel appels en cours. Un appel qui n'obtient
+pas de place en acquire_timeout secondes est refusé ({"status": "busy"}) au lieu
+d'occuper un thread de requête : une box lente ne bloque que ses propres commandes.
+En mode asynchrone, chaque contrôleur supplémentaire a sa propre file d'envoi, et
+les appels en coroutines de la HC3 par défaut passent par la même cloison (call_async).
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import config
+from services.logger_service import logger
+from services import metrics
+from services.circuit_breaker import CircuitBreaker
+from services.fibaro_service import FibaroClient, get_client
+
+CONTROLLER_IN_FLIGHT = metrics.gauge("fibaro_controller_in_flight", "Appels en cours par contrôleur HC3",
+                                     ("controller",))
+CONTROLLER_BUSY = metrics.counter("fibaro_controller_busy_total",
+                                  "Appels refusés faute de place dans la cloison du contrôleur", ("controller",))
+
+# Intervalle (s) entre deux tentatives d'obtenir une place depuis une coroutine
+SLOT_POLL_INTERVAL = 0.005
+
+
+class Controller:
+    """
+    Box HC3 nommée : client dédié et nombre d'appels simultanés borné.
+
+    Args:
+        name (str): Nom du contrôleur (celui du mapping).
+        client (FibaroClient): Client HTTP de la box (défaut : client partagé).
+        max_parallel (int): Appels simultanés au plus, 0 = pas de limite.
+        acquire_timeout (float): Attente maximale (s) d'une place avant de refuser l'appel.
+    """
+
+    def __init__(self, name: str, client: FibaroClient = None, max_parallel: int = 0,
+                 acquire_timeout: float = 0.5):
+        self.name = name
+        self._client = client
+        self.max_parallel = max_parallel
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_parallel) if max_parallel > 0 else None
+        self._in_flight = CONTROLLER_IN_FLIGHT.labels(name)
+        self._busy = CONTROLLER_BUSY.labels(name)
+        self._dispatcher = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> FibaroClient:
+        # Le contrôleur par défaut suit le client partagé (remplaçable par set_client)
+        return self._client if self._client is not None else get_client()
+
+    def call(self, fn: Callable[..., dict], *args):
+        """
+        Exécute fn(client, *args) dans la cloison du contrôleur.
+
+        Returns:
+            Le résultat de fn, ou {"status": "busy"} si aucune place ne s'est libérée à temps.
+        """
+        if self._slots is not None and not self._slots.acquire(timeout=self.acquire_timeout):
+            self._busy.inc()
+            logger.warning(f"HC3 {self.name} saturée ({self.max_parallel} appels en cours), appel refusé")
+            return {"status": "busy", "message": f"HC3 {self.name} saturée, réessayer."}
+        self._in_flight.inc()
+        try:
+            return fn(self.client, *args)
+        finally:
+            self._in_flight.dec()
+            if self._slots is not None:
+                self._slots.release()
+
+    async def call_async(self, fn: Callable[..., Awaitable[dict]], *args):
+        """
+        Équivalent asynchrone de call() : attend fn(*args) dans la même cloison. La place
+        est guettée sans bloquer la boucle ni occuper de thread.
+
+        Returns:
+            Le résultat de fn, ou {"status": "busy"} si aucune place ne s'est libérée à temps.
+        """
+        import asyncio
+        if self._slots is not None:
+            deadline = time.monotonic() + self.acquire_timeout
+            while not self._slots.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    self._busy.inc()
+                    logger.warning(f"HC3 {self.name} saturée ({self.max_parallel} appels en cours), appel refusé")
+                    return {"status": "busy", "message": f"HC3 {self.name} saturée, réessayer."}
+                await asyncio.sleep(SLOT_POLL_INTERVAL)
+        self._in_flight.inc()
+        try:
+            return await fn(*args)
+        finally:
+            self._in_flight.dec()
+            if self._slots is not None:
+                self._slots.release()
+
+    def get_dispatcher(self, handler: Callable[[dict], dict]):
+        """
+        File d'envoi propre au contrôleur (mode asynchrone), démarrée au premier appel.
+        """
+        if self._dispatcher is None:
+            from services.dispatch_service import CommandDispatcher
+            with self._lock:
+                if self._dispatcher is None:
+                    self._dispatcher = CommandDispatcher(
+                        handler,
+                        workers=self.max_parallel or config.DISPATCH_WORKERS,
+                        queue_size=config.DISPATCH_QUEUE_SIZE,
+                        history_size=config.DISPATCH_HISTORY_SIZE,
+                        enqueue_timeout=config.DISPATCH_ENQUEUE_TIMEOUT,
+                    ).start()
+        return self._dispatcher
+
+    @property
+    def dispatcher(self):
+        return self._dispatcher
+
+    def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.stop(timeout=config.SERVER_GRACEFUL_TIMEOUT)
+        if self._client is not None:
+            self._client.close()
+
+
+def build_controller(name: str, spec: dict) -> Controller:
+    """
+    Construit un contrôleur supplémentaire depuis son entrée du fichier FIBARO_CONTROLLERS.
+
+    Raises:
+        ValueError: Entrée invalide.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"contrôleur {name} : objet attendu")
+    base_url = spec.get("base_url")
+    if base_url is None:
+        if not spec.get("ip"):
+            raise ValueError(f"contrôleur {name} : \"ip\" ou \"base_url\" requis")
+        port = int(spec.get("port", 80))
+        base_url = f"http://{spec['ip']}/api" if port == 80 else f"http://{spec['ip']}:{port}/api"
+    password = spec.get("password")
+    if spec.get("password_env"):
+        password = os.getenv(spec["password_env"])
+    breaker = None
+    if config.CIRCUIT_BREAKER:
+        breaker = CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_TIMEOUT)
+    client = FibaroClient(base_url=base_url, user=spec.get("user"), password=password,
+                          connect_timeout=spec.get("connect_timeout"), read_timeout=spec.get("read_timeout"),
+                          pool_size=spec.get("pool_size"), breaker=breaker)
+    return Controller(name, client, max_parallel=int(spec.get("max_parallel", client.pool_size)),
+                      acquire_timeout=float(spec.get("acquire_timeout", config.FIBARO_ACQUIRE_TIMEOUT)))
+
+
+class ControllerRegistry:
+    """
+    Contrôleurs connus, par nom ; le contrôleur par défaut est toujours présent.
+
+    Args:
+        controllers (dict): Contrôleurs supplémentaires {nom: Controller}.
+        default (Controller): Contrôleur par défaut (défaut : client partagé, FIBARO_MAX_PARALLEL).
+    """
+
+    def __init__(self, controllers: Dict[str, Controller] = None, default: Controller = None):
+        self.default = default or Controller(config.FIBARO_CONTROLLER, max_parallel=config.FIBARO_MAX_PARALLEL,
+                                             acquire_timeout=config.FIBARO_ACQUIRE_TIMEOUT)
+        self.controllers = dict(controllers or {})
+        self.controllers[self.default.name] = self.default
+
+    def get(self, name: Optional[str]) -> Optional[Controller]:
+        """
+        Retourne un contrôleur par son nom (None = contrôleur par défaut).
+        """
+        if name is None:
+            return self.default
+        return self.controllers.get(name)
+
+    def names(self):
+        return tuple(self.controllers)
+
+    def close(self) -> None:
+        for controller in self.controllers.values():
+            controller.close()
+
+
+def load_controllers(path: Optional[str]) -> ControllerRegistry:
+    """
+    Lit le fichier FIBARO_CONTROLLERS ; sans fichier, seul le contrôleur par défaut existe.
+
+    Raises:
+        ValueError: Fichier illisible ou entrée invalide.
+    """
+    if not path:
+        return ControllerRegistry()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"fichier des contrôleurs illisible ({path}) : {e}")
+    if not isinstance(data, dict):
+        raise ValueError("le fichier des contrôleurs doit être un objet {nom: paramètres}")
+
+    default = None
+    spec = data.get(config.FIBARO_CONTROLLER)
+    if spec is not None:
+        default = Controller(config.FIBARO_CONTROLLER,
+                             max_parallel=int(spec.get("max_parallel", config.FIBARO_MAX_PARALLEL)),
+                             acquire_timeout=float(spec.get("acquire_timeout", config.FIBARO_ACQUIRE_TIMEOUT)))
+    controllers = {name: build_controller(name, spec) for name, spec in data.items()
+                   if name != config.FIBARO_CONTROLLER}
+    logger.info(f"Contrôleurs HC3 : {', '.join([config.FIBARO_CONTROLLER] + list(controllers))}")
+    return ControllerRegistry(controllers, default)
+
+
+# Registre partagé, créé au premier appel.
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_controllers() -> ControllerRegistry:
+    """
+    Retourne les contrôleurs HC3 configurés (FIBARO_CONTROLLERS).
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = load_controllers(config.FIBARO_CONTROLLERS)
+    return _registry
+
+
+def set_controllers(registry: Optional[ControllerRegistry]) -> None:
+    """
+    Remplace les contrôleurs partagés (tests, bancs d'essai).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is not None and _registry is not registry:
+            _registry.close()
+        _registry = registry
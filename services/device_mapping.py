@@ -7,9 +7,45 @@ Ce module centralise la correspondance entre les noms logiques des périphériqu
 et leurs identifiants réels sur Fibaro. Cela permet de modifier les IDs Fibaro sans
 changer le code métier ou les routes.
 
+Le fichier est chargé dans un registre (MappingRegistry) qui tient trois index :
+  - nom logique → ID Fibaro,
+  - ID numérique IPX → nom logique,
+  - ID Fibaro → noms logiques.
+
+Les index sont regroupés dans un instantané immuable (MappingSnapshot). Lorsqu'un
+changement du fichier est détecté (surveillance de la date de modification), un nouvel
+instantané est validé puis remplace l'ancien en une seule affectation : les requêtes
+en cours ne voient jamais un mapping à moitié chargé, et un fichier invalide laisse
+l'ancien mapping en place.
+
+Format du fichier : chaque nom logique est associé soit à un ID Fibaro, soit à un
+objet {"fibaro_id": 20, "ipx_id": 3}. Sans "ipx_id", l'ID numérique accepté côté IPX
+est l'ID Fibaro.
+
+L'objet peut aussi associer des états IPX autres que on/off à des opérations HC3
+(voir services/fibaro_operations.py) :
+  "ipx_volet": {"fibaro_id": 40, "dimmer": true,
+                "etats": {"nuit": {"scene": 7},
+                          "alarme": [{"variable": "Alarme", "value": "1"}, {"scene": 9}]}}
+"dimmer": true envoie un état numérique (2 à 100) en setValue sur le périphérique.
+
+"ipx_output": 5 (ou une liste) désigne les relais de l'IPX800 recopiant l'état du
+périphérique HC3 (canal retour, voir services/reverse_channel.py).
+
+"controller": "garage" place le périphérique sur une autre box HC3 (voir
+services/controllers.py) : son ID Fibaro est celui de cette box. Le miroir d'états
+et le canal retour ne suivent que la HC3 par défaut : un tel périphérique n'a pas
+d'"ipx_output" ni d'ID numérique IPX implicite (un "ipx_id" explicite reste possible).
+
 Fonctions :
 - get_fibaro_id(ipx_name: str) -> int | None : retourne l'ID Fibaro correspondant
   au nom du périphérique IPX, ou None si non trouvé.
+- get_ipx_name(ipx_id: int) -> str | None : retourne le nom logique d'un ID numérique IPX.
+- get_ipx_names(fibaro_id: int) -> tuple : retourne les noms logiques d'un ID Fibaro.
+- get_operations(ipx_name: str, etat: str) -> tuple | None : opérations HC3 associées
+  à un état particulier du périphérique.
+- get_ipx_outputs(fibaro_id: int) -> tuple : relais IPX800 qui recopient un périphérique HC3.
+- get_device(ipx_name: str) -> tuple | None : (contrôleur, ID Fibaro) d'un périphérique.
 
 Auteur : Arnaud Lefetey (SethiarWorks)
 Date : 2025-09-05
@@ -17,38 +53,322 @@ Date : 2025-09-05
 
 import json
 import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import config
 from services.logger_service import logger
+from services import metrics
+from services.scheduler import get_scheduler
+from services.fibaro_operations import parse_operations, set_value
 
 # Chemin par défaut vers le fichier de mapping
 MAPPING_FILE = os.path.join(os.path.dirname(__file__), "device_mapping.json")
 
-# Chargement du mapping
-try:
-    with open(MAPPING_FILE, "r") as f:
-        DEVICE_MAP = json.load(f)
-except FileNotFoundError:
-    DEVICE_MAP = {}
-    print(f"[WARNING] Fichier de mapping non trouvé : {MAPPING_FILE}")
-except json.JSONDecodeError as e:
-    DEVICE_MAP = {}
-    print(f"[ERROR] Erreur parsing JSON mapping : {e}")
+MAPPING_MISSES = metrics.counter("fibaro_mapping_misses_total", "Recherches sans correspondance dans le mapping",
+                                 ("index",))
+
+
+class MappingSnapshot:
+    """
+    Index immuables du mapping, à un instant donné.
+    """
+
+    __slots__ = ("by_name", "by_ipx_id", "by_fibaro_id", "operations", "dimmers", "ipx_outputs", "controllers",
+                 "version")
+
+    def __init__(self, by_name: Dict[str, int], by_ipx_id: Dict[int, str],
+                 by_fibaro_id: Dict[int, Tuple[str, ...]], version: int = 0,
+                 operations: Dict[str, Dict[str, tuple]] = None, dimmers: frozenset = frozenset(),
+                 ipx_outputs: Dict[int, Tuple[int, ...]] = None, controllers: Dict[str, str] = None):
+        self.by_name = by_name
+        self.by_ipx_id = by_ipx_id
+        self.by_fibaro_id = by_fibaro_id
+        self.operations = operations or {}
+        self.dimmers = dimmers
+        self.ipx_outputs = ipx_outputs or {}
+        # Périphériques d'une autre HC3 que celle par défaut : nom → contrôleur
+        self.controllers = controllers or {}
+        self.version = version
+
+    def get_fibaro_id(self, ipx_name: str) -> Optional[int]:
+        return self.by_name.get(ipx_name)
+
+    def get_ipx_name(self, ipx_id: int) -> Optional[str]:
+        return self.by_ipx_id.get(ipx_id)
+
+    def get_ipx_names(self, fibaro_id: int) -> Tuple[str, ...]:
+        return self.by_fibaro_id.get(fibaro_id, ())
+
+
+def build_snapshot(data, version: int = 0) -> MappingSnapshot:
+    """
+    Valide le contenu JSON du fichier de mapping et construit ses index.
+
+    Raises:
+        ValueError: Contenu invalide (type inattendu, ID non entier, ipx_id en double).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("le mapping doit être un objet JSON {nom: id}")
+
+    by_name, by_ipx_id, by_fibaro_id, operations, dimmers, ipx_outputs = {}, {}, {}, {}, set(), {}
+    controllers = {}
+    explicit_ipx_ids = set()
+    for name, entry in data.items():
+        if not name:
+            raise ValueError("nom de périphérique vide")
+        etats = outputs = controller = None
+        if isinstance(entry, dict):
+            fibaro_id = entry.get("fibaro_id")
+            ipx_id = entry.get("ipx_id")
+            etats = entry.get("etats")
+            outputs = entry.get("ipx_output")
+            controller = entry.get("controller")
+            if controller == config.FIBARO_CONTROLLER:
+                controller = None
+            if entry.get("dimmer"):
+                dimmers.add(name)
+        else:
+            fibaro_id, ipx_id = entry, None
+
+        if not isinstance(fibaro_id, int) or isinstance(fibaro_id, bool):
+            raise ValueError(f"ID Fibaro invalide pour {name} : {fibaro_id!r}")
+        if ipx_id is not None:
+            if not isinstance(ipx_id, int) or isinstance(ipx_id, bool):
+                raise ValueError(f"ipx_id invalide pour {name} : {ipx_id!r}")
+            if ipx_id in explicit_ipx_ids:
+                raise ValueError(f"ipx_id {ipx_id} utilisé plusieurs fois")
+            explicit_ipx_ids.add(ipx_id)
+        if etats is not None:
+            if not isinstance(etats, dict):
+                raise ValueError(f"etats invalides pour {name} : objet {{etat: opération}} attendu")
+            try:
+                operations[name] = {str(etat).strip().lower(): parse_operations(spec, fibaro_id)
+                                    for etat, spec in etats.items()}
+            except ValueError as e:
+                raise ValueError(f"{name} : {e}")
+        if controller is not None:
+            if not isinstance(controller, str) or not controller:
+                raise ValueError(f"contrôleur invalide pour {name} : {controller!r}")
+            if outputs is not None:
+                raise ValueError(f"{name} : ipx_output n'est possible que sur la HC3 {config.FIBARO_CONTROLLER}")
+            controllers[name] = controller
+        if outputs is not None:
+            outputs = outputs if isinstance(outputs, list) else [outputs]
+            if not outputs or not all(isinstance(output, int) and not isinstance(output, bool) and output > 0
+                                      for output in outputs):
+                raise ValueError(f"ipx_output invalide pour {name} : {entry['ipx_output']!r}")
+            known = ipx_outputs.get(fibaro_id, ())
+            ipx_outputs[fibaro_id] = known + tuple(output for output in outputs if output not in known)
+
+        by_name[name] = fibaro_id
+        if controller is None:
+            by_fibaro_id.setdefault(fibaro_id, []).append(name)
+        # Un ipx_id explicite est prioritaire sur un ID Fibaro utilisé comme ID numérique
+        if ipx_id is not None:
+            by_ipx_id[ipx_id] = name
+        elif controller is None and fibaro_id not in explicit_ipx_ids:
+            by_ipx_id[fibaro_id] = name
+
+    return MappingSnapshot(by_name, by_ipx_id,
+                           {fibaro_id: tuple(names) for fibaro_id, names in by_fibaro_id.items()},
+                           version, operations, frozenset(dimmers), ipx_outputs, controllers)
+
+
+class MappingRegistry:
+    """
+    Registre du mapping rechargeable à chaud.
+
+    Args:
+        path (str): Chemin du fichier JSON.
+    """
+
+    def __init__(self, path: str = MAPPING_FILE):
+        self.path = path
+        self.snapshot = MappingSnapshot({}, {}, {})
+        self.last_error = None
+        self._stamp = None
+        self._failed_stamp = None
+        self._lock = threading.Lock()
+        self._watch_interval = 0.0
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self) -> bool:
+        """
+        Lit et valide le fichier ; remplace l'instantané courant s'il est valide.
+
+        Returns:
+            bool: True si un nouvel instantané a été installé.
+        """
+        with self._lock:
+            try:
+                stamp = self._file_stamp()
+                with open(self.path, "r", encoding="utf-8") as f:
+                    snapshot = build_snapshot(json.load(f), self.snapshot.version + 1)
+            except FileNotFoundError:
+                self.last_error = f"Fichier de mapping non trouvé : {self.path}"
+                logger.warning(self.last_error)
+                return False
+            except (json.JSONDecodeError, ValueError) as e:
+                self.last_error = f"Mapping invalide, version précédente conservée : {e}"
+                if stamp != self._failed_stamp:
+                    logger.error(self.last_error)
+                self._failed_stamp = stamp
+                return False
+
+            # Affectation unique : les lecteurs voient l'ancien ou le nouvel instantané, jamais un mélange
+            self.snapshot = snapshot
+            self._stamp = stamp
+            self._failed_stamp = None
+            self.last_error = None
+            logger.info(f"Mapping chargé (version {snapshot.version}) : {len(snapshot.by_name)} périphériques")
+            return True
+
+    def reload_if_changed(self) -> bool:
+        """
+        Recharge le fichier si sa date de modification ou sa taille a changé.
+        """
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            return False
+        if stamp == self._stamp or stamp == self._failed_stamp:
+            return False
+        return self.load()
+
+    def watch(self, interval: float) -> None:
+        """
+        Vérifie le fichier toutes les `interval` secondes via l'ordonnanceur partagé.
+        """
+        if interval <= 0 or self._watch_interval > 0:
+            return
+        self._watch_interval = interval
+        get_scheduler().call_later(interval, self._watch_tick)
+
+    def _watch_tick(self) -> None:
+        try:
+            self.reload_if_changed()
+        finally:
+            get_scheduler().call_later(self._watch_interval, self._watch_tick)
+
+    def get_fibaro_id(self, ipx_name: str) -> Optional[int]:
+        return self.snapshot.get_fibaro_id(ipx_name)
+
+    def get_ipx_name(self, ipx_id: int) -> Optional[str]:
+        return self.snapshot.get_ipx_name(ipx_id)
+
+    def get_ipx_names(self, fibaro_id: int) -> Tuple[str, ...]:
+        return self.snapshot.get_ipx_names(fibaro_id)
+
+
+# Registre partagé, chargé à l'import.
+registry = MappingRegistry(MAPPING_FILE)
+registry.load()
+
+
+def start_watching() -> None:
+    """
+    Active le rechargement à chaud du fichier de mapping (MAPPING_RELOAD_INTERVAL).
+    """
+    registry.watch(config.MAPPING_RELOAD_INTERVAL)
 
 
 # Fonntion récupèrant l'id fibaro correpondant au périphérique IPX.
 def get_fibaro_id(ipx_name: str) -> int:
     """
     Récupère l'ID Fibaro associé à un périphérique IPX.
-    
+
     Args:
         ipx_name (str): Nom du périphérique côté IPX (ex. "ipx_congelateur").
-    
+
     Returns:
         int: ID Fibaro correspondant, ou None si non trouvé.
     """
-    return DEVICE_MAP.get(ipx_name)
+    device_id = registry.snapshot.by_name.get(ipx_name)
+    if device_id is None:
+        MAPPING_MISSES.labels("name").inc()
+    return device_id
+
+
+def get_ipx_name(ipx_id: int) -> Optional[str]:
+    """
+    Récupère le nom logique associé à un ID numérique envoyé par l'IPX.
+    """
+    name = registry.snapshot.by_ipx_id.get(ipx_id)
+    if name is None:
+        MAPPING_MISSES.labels("ipx_id").inc()
+    return name
+
+
+def get_ipx_names(fibaro_id: int) -> Tuple[str, ...]:
+    """
+    Récupère les noms logiques associés à un ID Fibaro.
+    """
+    return registry.snapshot.by_fibaro_id.get(fibaro_id, ())
+
+
+def get_operations(ipx_name: str, etat: str) -> Optional[tuple]:
+    """
+    Récupère les opérations HC3 associées à un état du périphérique (table "etats" du
+    mapping, ou setValue pour un état numérique d'un variateur).
+
+    Args:
+        ipx_name (str): Nom logique du périphérique.
+        etat (str): État normalisé (minuscules, sans espaces).
+
+    Returns:
+        tuple: Opérations à envoyer, ou None si l'état n'a pas d'opération associée.
+    """
+    snapshot = registry.snapshot
+    table = snapshot.operations.get(ipx_name)
+    if table is not None:
+        operations = table.get(etat)
+        if operations is not None:
+            return operations
+    # 0 et 1 restent turnOff / turnOn
+    if ipx_name in snapshot.dimmers and etat not in ("0", "1"):
+        try:
+            value = int(etat)
+        except (TypeError, ValueError):
+            return None
+        if 0 <= value <= 100:
+            return (set_value(snapshot.by_name[ipx_name], value),)
+    return None
+
+
+def get_device(ipx_name: str) -> Optional[Tuple[Optional[str], int]]:
+    """
+    Récupère le contrôleur et l'ID Fibaro d'un périphérique IPX.
+
+    Returns:
+        tuple: (nom du contrôleur, ID Fibaro) ; contrôleur None pour la HC3 par défaut.
+        None si le périphérique n'a pas de mapping.
+    """
+    snapshot = registry.snapshot
+    device_id = snapshot.by_name.get(ipx_name)
+    if device_id is None:
+        MAPPING_MISSES.labels("name").inc()
+        return None
+    return snapshot.controllers.get(ipx_name), device_id
+
+
+def get_ipx_outputs(fibaro_id: int) -> Tuple[int, ...]:
+    """
+    Récupère les relais IPX800 qui recopient l'état d'un périphérique HC3.
+
+    Args:
+        fibaro_id (int): ID Fibaro du périphérique.
+
+    Returns:
+        tuple: Numéros de relais (vide si le périphérique n'est pas recopié).
+    """
+    return registry.snapshot.ipx_outputs.get(fibaro_id, ())
 
 
 # --- Exemple rapide d'utilisation ---
 if __name__ == "__main__":
-    for name in DEVICE_MAP:
-        print(f"{name} -> Fibaro ID {get_fibaro_id(name)}")
\ No newline at end of file
+    for name in registry.snapshot.by_name:
+        print(f"{name} -> Fibaro ID {get_fibaro_id(name)}")
@@ -0,0 +1,139 @@
+"""
+dispatch_service.py
+
+File de commandes asynchrone vers la Fibaro HC3.
+
+Le mode "dispatch asynchrone" permet à la route /ipx-event de répondre dès que la
+commande est validée et placée en file : un pool de threads se charge ensuite de
+l'envoyer à la HC3. Une HC3 lente ou en redémarrage ne bloque donc plus les
+workers Flask.
+
+- La file est bornée : si elle est pleine, submit() lève queue.Full et la route
+  répond 503 (contre-pression vers l'IPX800).
+- Le statut des dernières commandes est conservé (queued, running, done, error)
+  pour pouvoir être interrogé via l'identifiant retourné par submit().
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from services.logger_service import logger
+
+
+class CommandDispatcher:
+    """
+    Pool de threads consommant une file bornée de commandes.
+
+    Args:
+        handler (Callable): Fonction appelée pour chaque commande, retourne un dict résultat.
+        workers (int): Nombre de threads d'envoi.
+        queue_size (int): Nombre maximum de commandes en attente.
+        history_size (int): Nombre de statuts de commandes conservés.
+        enqueue_timeout (float): Attente maximale (s) pour une place dans la file, 0 = aucune.
+    """
+
+    def __init__(self, handler: Callable[[dict], dict], workers: int = 4, queue_size: int = 100,
+                 history_size: int = 1000, enqueue_timeout: float = 0.0):
+        self.handler = handler
+        self.workers = workers
+        self.history_size = history_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self) -> "CommandDispatcher":
+        """
+        Démarre les threads d'envoi (sans effet s'ils tournent déjà).
+        """
+        if self._threads:
+            return self
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"fibaro-dispatch-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Arrête les threads après avoir vidé la file.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def qsize(self) -> int:
+        """
+        Nombre de commandes en attente d'envoi.
+        """
+        return self._queue.qsize()
+
+    def submit(self, command: dict) -> str:
+        """
+        Place une commande dans la file.
+
+        Returns:
+            str: Identifiant de la commande, à passer à status().
+
+        Raises:
+            queue.Full: La file est pleine.
+        """
+        command_id = uuid.uuid4().hex
+        self._set_status(command_id, {"command_id": command_id, "status": "queued",
+                                      "queued_at": time.time(), "command": command})
+        try:
+            if self.enqueue_timeout > 0:
+                self._queue.put((command_id, command), timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait((command_id, command))
+        except queue.Full:
+            with self._lock:
+                self._statuses.pop(command_id, None)
+            raise
+        return command_id
+
+    def status(self, command_id: str) -> Optional[Dict]:
+        """
+        Retourne le statut d'une commande, ou None si elle est inconnue ou trop ancienne.
+        """
+        with self._lock:
+            entry = self._statuses.get(command_id)
+            return dict(entry) if entry is not None else None
+
+    def _set_status(self, command_id: str, entry: dict) -> None:
+        with self._lock:
+            self._statuses[command_id] = entry
+            self._statuses.move_to_end(command_id)
+            while len(self._statuses) > self.history_size:
+                self._statuses.popitem(last=False)
+
+    def _update_status(self, command_id: str, **fields) -> None:
+        with self._lock:
+            entry = self._statuses.get(command_id)
+            if entry is not None:
+                entry.update(fields)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            command_id, command = item
+            self._update_status(command_id, status="running", started_at=time.time())
+            try:
+                result = self.handler(command)
+                status = "done" if result.get("status") == "OK" else "error"
+                self._update_status(command_id, status=status, finished_at=time.time(), result=result)
+            except Exception as e:
+                logger.exception(f"Erreur lors de l'envoi de la commande {command_id} : {e}")
+                self._update_status(command_id, status="error", finished_at=time.time(),
+                                    result={"status": "error", "message": str(e)})
@@ -0,0 +1,246 @@
+"""
+event_journal.py
+
+Journal structuré des événements IPX800 et des commandes envoyées à la HC3.
+
+Chaque événement est une ligne d'une base SQLite (mode WAL) indexée par
+périphérique et par date : retrouver « la dernière coupure de ipx_congelateur »
+devient une requête indexée au lieu d'un grep dans des logs tournants.
+
+Les threads des requêtes ne touchent jamais la base : record() dépose l'événement
+dans une file bornée (perdu et compté si elle est pleine) et un thread unique
+l'écrit par lots, une transaction par lot.
+
+Types d'événements (colonne kind) :
+  - "ipx_event"   : événement reçu de l'IPX800, après validation et mapping ;
+  - "hc3_command" : commande passée à la HC3, avec son résultat et sa latence.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import config
+from services.logger_service import logger
+
+# Colonnes indexées ; les autres champs sont conservés dans la colonne JSON `data`
+COLUMNS = ("ts", "kind", "ipx_name", "device_id", "etat", "action", "status", "latency_ms")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    ipx_name TEXT,
+    device_id INTEGER,
+    etat TEXT,
+    action TEXT,
+    status TEXT,
+    latency_ms REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_ipx_name_ts ON events (ipx_name, ts);
+CREATE INDEX IF NOT EXISTS idx_events_device_ts ON events (device_id, ts);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Ouvre la base du journal (création du schéma, mode WAL).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # En WAL, NORMAL ne perd au pire que les dernières transactions en cas de coupure de courant
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class EventJournal:
+    """
+    Écrivain du journal : file bornée + thread d'écriture par lots.
+
+    Args:
+        path (str): Chemin de la base SQLite.
+        batch_size (int): Nombre maximum d'événements par transaction.
+        flush_interval (float): Délai maximum (s) avant l'écriture d'un lot incomplet.
+        queue_size (int): Nombre maximum d'événements en attente.
+    """
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 1.0,
+                 queue_size: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, **fields) -> None:
+        """
+        Ajoute un événement au journal sans bloquer (horodaté maintenant si `ts` est absent).
+        """
+        fields.setdefault("ts", time.time())
+        fields["kind"] = kind
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def qsize(self) -> int:
+        """
+        Nombre d'événements en attente d'écriture.
+        """
+        return self._queue.qsize()
+
+    def start(self) -> "EventJournal":
+        """
+        Démarre le thread d'écriture (sans effet s'il tourne déjà).
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-journal", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Écrit les événements en attente puis arrête le thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        connection = connect(self.path)
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._write(connection, batch)
+                if stop:
+                    return
+        finally:
+            connection.close()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, connection: sqlite3.Connection, batch: List[Dict]) -> None:
+        rows = []
+        for event in batch:
+            extra = {key: value for key, value in event.items() if key not in COLUMNS and value is not None}
+            rows.append(tuple(event.get(column) for column in COLUMNS)
+                        + (json.dumps(extra, default=str) if extra else None,))
+        try:
+            with connection:
+                connection.executemany(
+                    f"INSERT INTO events ({', '.join(COLUMNS)}, data) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                    rows,
+                )
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Écriture du journal impossible, {len(rows)} événements perdus : {e}")
+
+
+def query(path: str, device=None, since: Optional[float] = None, until: Optional[float] = None,
+          kind: Optional[str] = None, action: Optional[str] = None, status: Optional[str] = None,
+          limit: Optional[int] = None, newest_first: bool = False) -> List[Dict]:
+    """
+    Lit des événements du journal.
+
+    Args:
+        device: Nom logique IPX (str) ou ID Fibaro (int).
+        since, until (float): Bornes de date (timestamp Unix), incluses.
+        kind, action, status (str): Filtres exacts.
+        limit (int): Nombre maximum d'événements.
+        newest_first (bool): Ordre chronologique inverse (ex. « dernière coupure »).
+
+    Returns:
+        list: Événements (dict), champs de `data` fusionnés.
+    """
+    clauses, params = [], []
+    if device is not None:
+        clauses.append("device_id = ?" if isinstance(device, int) else "ipx_name = ?")
+        params.append(device)
+    for column, value in (("kind", kind), ("action", action), ("status", status)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts <= ?")
+        params.append(until)
+
+    sql = f"SELECT {', '.join(COLUMNS)}, data FROM events"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY ts DESC, id DESC" if newest_first else " ORDER BY ts, id"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    connection = connect(path)
+    try:
+        events = []
+        for row in connection.execute(sql, params):
+            event = {column: value for column, value in zip(COLUMNS, row) if value is not None}
+            if row[-1]:
+                event.update(json.loads(row[-1]))
+            events.append(event)
+        return events
+    finally:
+        connection.close()
+
+
+# Journal partagé, démarré au premier appel.
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> EventJournal:
+    """
+    Retourne le journal partagé par le processus.
+    """
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = EventJournal(config.EVENT_JOURNAL_PATH,
+                                        batch_size=config.EVENT_JOURNAL_BATCH_SIZE,
+                                        flush_interval=config.EVENT_JOURNAL_FLUSH_INTERVAL,
+                                        queue_size=config.EVENT_JOURNAL_QUEUE_SIZE).start()
+    return _journal
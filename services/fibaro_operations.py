@@ -0,0 +1,155 @@
+"""
+fibaro_operations.py
+
+Opérations HC3 typées, au-delà de turnOn/turnOff :
+  - action d'un périphérique (callAction, ex. setValue 50 pour un variateur) ;
+  - exécution d'une scène ;
+  - mise à jour d'une variable globale (lue par la logique Lua de la HC3).
+
+Ce module ne fait aucun appel réseau : il décrit les opérations (fichier de mapping,
+contrôleur) ; l'envoi est fait par FibaroClient.execute()/bulk().
+
+Format d'une opération dans le fichier de mapping :
+  {"action": "setValue", "args": [50]}         action sur le périphérique de l'entrée
+  {"action": "turnOn", "device": 12}           action sur un autre périphérique
+  {"scene": 7}                                 exécution de la scène 7
+  {"variable": "Alarme", "value": "1"}         variable globale
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+from typing import Optional, Tuple
+
+ACTION = "action"
+SCENE = "scene"
+VARIABLE = "variable"
+
+# Ordre d'envoi d'un lot : variables, puis périphériques, puis scènes (qui peuvent lire les deux)
+KIND_ORDER = (VARIABLE, ACTION, SCENE)
+
+
+class FibaroOperation:
+    """
+    Opération HC3 immuable.
+
+    Attributes:
+        kind (str): ACTION, SCENE ou VARIABLE.
+        target: ID du périphérique, ID de la scène ou nom de la variable.
+        name (str): Nom de l'action (ACTION), sinon None.
+        args (tuple): Arguments de l'action, ou (valeur,) pour une variable.
+    """
+
+    __slots__ = ("kind", "target", "name", "args")
+
+    def __init__(self, kind: str, target, name: Optional[str] = None, args: tuple = ()):
+        self.kind = kind
+        self.target = target
+        self.name = name
+        self.args = tuple(args)
+
+    @property
+    def label(self) -> str:
+        """
+        Nom court de l'opération (métriques, journal).
+        """
+        if self.kind == ACTION:
+            return self.name
+        return "scene" if self.kind == SCENE else "globalVariable"
+
+    @property
+    def key(self):
+        """
+        Clé de regroupement d'un lot : la dernière opération d'une même clé l'emporte.
+        Une scène n'est jamais fusionnée (chaque exécution compte).
+        """
+        if self.kind == SCENE:
+            return None
+        return (self.kind, self.target)
+
+    def to_dict(self) -> dict:
+        """
+        Description JSON de l'opération, relue par parse_operation().
+        """
+        if self.kind == ACTION:
+            return {"action": self.name, "device": self.target, "args": list(self.args)}
+        if self.kind == SCENE:
+            return {"scene": self.target}
+        return {"variable": self.target, "value": self.args[0]}
+
+    def __eq__(self, other):
+        return (isinstance(other, FibaroOperation) and (self.kind, self.target, self.name, self.args)
+                == (other.kind, other.target, other.name, other.args))
+
+    def __hash__(self):
+        return hash((self.kind, self.target, self.name, self.args))
+
+    def __repr__(self):
+        if self.kind == ACTION:
+            return f"FibaroOperation({self.name}{list(self.args)} -> {self.target})"
+        if self.kind == SCENE:
+            return f"FibaroOperation(scene {self.target})"
+        return f"FibaroOperation({self.target} = {self.args[0]!r})"
+
+
+def call_action(device_id: int, name: str, *args) -> FibaroOperation:
+    return FibaroOperation(ACTION, device_id, name, args)
+
+
+def set_value(device_id: int, value) -> FibaroOperation:
+    return FibaroOperation(ACTION, device_id, "setValue", (value,))
+
+
+def run_scene(scene_id: int) -> FibaroOperation:
+    return FibaroOperation(SCENE, scene_id)
+
+
+def set_variable(name: str, value) -> FibaroOperation:
+    return FibaroOperation(VARIABLE, name, args=(str(value),))
+
+
+def _int_id(value, what: str) -> int:
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{what} invalide : {value!r}")
+    return value
+
+
+def parse_operation(spec, device_id: int) -> FibaroOperation:
+    """
+    Construit une opération depuis sa description JSON (voir l'en-tête du module).
+
+    Args:
+        spec (dict): Description de l'opération.
+        device_id (int): Périphérique par défaut des actions (celui de l'entrée du mapping).
+
+    Raises:
+        ValueError: Description invalide.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"opération invalide : {spec!r}")
+    if "action" in spec:
+        name = spec["action"]
+        if not isinstance(name, str) or not name:
+            raise ValueError(f"nom d'action invalide : {name!r}")
+        args = spec.get("args", ())
+        if not isinstance(args, (list, tuple)):
+            args = (args,)
+        return call_action(_int_id(spec.get("device", device_id), "ID de périphérique"), name, *args)
+    if "scene" in spec:
+        return run_scene(_int_id(spec["scene"], "ID de scène"))
+    if "variable" in spec:
+        name = spec["variable"]
+        if not isinstance(name, str) or not name or "value" not in spec:
+            raise ValueError(f"variable globale invalide : {spec!r}")
+        return set_variable(name, spec["value"])
+    raise ValueError(f"opération inconnue : {spec!r}")
+
+
+def parse_operations(spec, device_id: int) -> Tuple[FibaroOperation, ...]:
+    """
+    Comme parse_operation, pour une opération seule ou une liste d'opérations.
+    """
+    if isinstance(spec, list):
+        if not spec:
+            raise ValueError("liste d'opérations vide")
+        return tuple(parse_operation(item, device_id) for item in spec)
+    return (parse_operation(spec, device_id),)
@@ -3,35 +3,281 @@ fibaro_service.py
 
 Module pour envoyer des commandes de l'IPX800 vers la Fibaro HC3 via HTTP POST JSON.
 
-Il permet de changer l'état des appareils (ex. allumer/éteindre une lumière) en fonction des événements reçus.
+Il permet de changer l'état des appareils (ex. allumer/éteindre une lumière, régler un
+variateur), d'exécuter des scènes et de mettre à jour des variables globales en fonction
+des événements reçus, à l'unité ou par lots (execute_operations).
+Tous les appels passent par un client partagé (FibaroClient) qui conserve les connexions
+HTTP ouvertes vers la HC3.
 
 Auteur : Arnaud Lefetey (SethiarWorks)
 Date : 2025-08-05
 """
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from urllib.parse import quote
+
 # Importation pour faire des appels HTTP vers la box FIbaro HC3.
 import requests
-# Module pour la gestion des données JSON.
-import json
 # Importation de config
 import config
 
 # Importation afin de pouvoir faire des logging de suivi.
 from services.logger_service import logger
+from services import metrics
+from services.circuit_breaker import CircuitBreaker
+from services.fibaro_operations import ACTION, KIND_ORDER, SCENE, FibaroOperation
 
 # Permet de gérer l'authentification HTTP Basic(nom d'utilisateur et password en entête)
 from requests.auth import HTTPBasicAuth
+# Adapter HTTP permettant de régler le pool de connexions keep-alive.
+from requests.adapters import HTTPAdapter
+
+HC3_CALL_SECONDS = metrics.histogram("fibaro_hc3_call_seconds",
+                                     "Durée des appels vers la HC3 (actions, scènes, variables)",
+                                     ("action", "status"))
+
+
+class FibaroClient:
+    """
+    Client HTTP longue durée vers la Fibaro HC3.
+
+    Une seule `requests.Session` est partagée par tous les appels : la connexion TCP
+    vers la HC3 est conservée (keep-alive) au lieu d'être rouverte à chaque événement
+    IPX. L'URL et l'authentification sont calculées une seule fois à la création.
+
+    Args:
+        base_url (str): URL de l'API HC3 (ex. "http://192.168.1.33/api").
+        user (str): Utilisateur de la HC3.
+        password (str): Mot de passe de la HC3.
+        connect_timeout (float): Timeout de connexion TCP, en secondes.
+        read_timeout (float): Timeout de lecture de la réponse, en secondes.
+        pool_size (int): Nombre de connexions conservées dans le pool.
+        breaker (CircuitBreaker): Disjoncteur optionnel : circuit ouvert => refus immédiat.
+    """
+
+    def __init__(self, base_url: str = None, user: str = None, password: str = None,
+                 connect_timeout: float = None, read_timeout: float = None, pool_size: int = None,
+                 breaker: CircuitBreaker = None):
+        self.base_url = (base_url or config.FIBARO_BASE_URL).rstrip("/")
+        self.call_action_url = f"{self.base_url}/callAction"
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else config.FIBARO_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else config.FIBARO_READ_TIMEOUT,
+        )
+        pool_size = pool_size or config.FIBARO_POOL_SIZE
+        self.pool_size = pool_size
+        self.breaker = breaker
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        self.session = requests.Session()
+        user = user if user is not None else config.FIBARO_USER
+        password = password if password is not None else config.FIBARO_PASSWORD
+        if user is not None:
+            self.session.auth = HTTPBasicAuth(user, password)
+
+        # Pas de retry automatique : un relais ne doit pas être basculé deux fois.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def call_action(self, device_id: int, action: str, *args) -> dict:
+        """
+        Envoie une action (turnOn, turnOff, setValue...) à un périphérique via l'API callAction.
+
+        Args:
+            device_id (int): Identifiant du périphérique cible.
+            action (str) : Action sur le périphérique.
+            *args : Arguments de l'action (arg1, arg2... ; ex. la valeur de setValue).
+
+        Returns:
+            dict: Résultat de l'opération ; {"status": "open"} si le disjoncteur refuse l'appel.
+        """
+        # Paramètres GET
+        payload = {
+            "deviceID": device_id,
+            "name": action
+        }
+        for i, arg in enumerate(args, 1):
+            payload[f"arg{i}"] = arg
+        return self._send("GET", self.call_action_url, action, payload, f"l'action {action} sur {device_id}")
+
+    def run_scene(self, scene_id: int) -> dict:
+        """
+        Exécute une scène de la HC3.
+        """
+        return self._send("POST", f"{self.base_url}/scenes/{scene_id}/execute", "scene", {},
+                          f"la scène {scene_id}")
+
+    def set_global_variable(self, name: str, value) -> dict:
+        """
+        Met à jour une variable globale de la HC3 (valeur transmise en texte).
+        """
+        return self._send("PUT", f"{self.base_url}/globalVariables/{quote(name, safe='')}", "globalVariable",
+                          {"name": name, "value": str(value)}, f"la variable globale {name}")
+
+    def execute(self, operation: FibaroOperation) -> dict:
+        """
+        Envoie une opération typée (services/fibaro_operations.py).
+        """
+        if operation.kind == ACTION:
+            return self.call_action(operation.target, operation.name, *operation.args)
+        if operation.kind == SCENE:
+            return self.run_scene(operation.target)
+        return self.set_global_variable(operation.target, operation.args[0])
+
+    def bulk(self, operations: List[FibaroOperation]) -> List[dict]:
+        """
+        Envoie un lot d'opérations.
+
+        Les opérations sont regroupées par type et envoyées type par type (variables,
+        puis périphériques, puis scènes) ; celles d'un même type partent en parallèle sur
+        le pool de connexions du client. Pour un même périphérique ou une même variable,
+        seule la dernière opération du lot est envoyée.
+
+        Returns:
+            list: Un résultat par opération, dans l'ordre reçu ({"status": "superseded"}
+            pour une opération remplacée par une plus récente du lot).
+        """
+        results = [None] * len(operations)
+        latest = {}
+        for i, operation in enumerate(operations):
+            if operation.key is not None:
+                previous = latest.get(operation.key)
+                if previous is not None:
+                    results[previous] = {"status": "superseded"}
+                latest[operation.key] = i
+
+        groups = {kind: [] for kind in KIND_ORDER}
+        for i, operation in enumerate(operations):
+            if results[i] is None:
+                groups[operation.kind].append(i)
+
+        for kind in KIND_ORDER:
+            indexes = groups[kind]
+            if len(indexes) == 1:
+                results[indexes[0]] = self.execute(operations[indexes[0]])
+            elif indexes:
+                futures = [(i, self._bulk_executor().submit(self.execute, operations[i])) for i in indexes]
+                for i, future in futures:
+                    results[i] = future.result()
+        return results
+
+    def _bulk_executor(self) -> ThreadPoolExecutor:
+        # Autant de threads que de connexions dans le pool : pas d'attente de connexion
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.pool_size,
+                                                        thread_name_prefix="fibaro-bulk")
+        return self._executor
+
+    def _send(self, method: str, url: str, label: str, payload: dict, what: str) -> dict:
+        if self.breaker is not None and not self.breaker.allow():
+            HC3_CALL_SECONDS.labels(label, "open").observe(0.0)
+            return {"status": "open", "message": "HC3 injoignable (disjoncteur ouvert)",
+                    "retry_after": self.breaker.retry_after()}
+
+        start = time.perf_counter()
+        try:
+            logger.debug(f"Envoi à Fibaro: {method} URL={url}, payload={payload}")
+            response = self.session.request(method, url, json=payload, timeout=self.timeout)
+            HC3_CALL_SECONDS.labels(label, str(response.status_code)).observe(time.perf_counter() - start)
+            if self.breaker is not None:
+                # Une réponse 4xx prouve que la HC3 est joignable : seuls les 5xx comptent comme échec
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+            logger.debug(f"Réponse Fibaro: {response.text}")
 
-# Chargment des variables définies dans .env.
-from dotenv import load_dotenv
+            try:
+                resp_json = response.json()
+            except ValueError:
+                resp_json = {}
 
-load_dotenv()
+            if 200 <= response.status_code < 300:
+                return {"status": "success", "code": response.status_code, "response": resp_json}
+            else:
+                logger.warning(f"Erreur {label} Fibaro ({response.status_code}): {response.text}")
+                return {"status": "failed", "code": response.status_code, "response": resp_json, "message": response.text}
+
+        except Exception as e:
+            HC3_CALL_SECONDS.labels(label, "error").observe(time.perf_counter() - start)
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            logger.exception(f"Erreur lors de l'appel de {what}")
+            return {"status": "error", "message": str(e)}
+
+    def get_json(self, path: str, params: dict = None, read_timeout: float = None):
+        """
+        Lecture GET d'une ressource de l'API HC3 (ex. "/devices", "/refreshStates").
+
+        Args:
+            path (str): Chemin relatif à l'URL de l'API.
+            params (dict): Paramètres de query string.
+            read_timeout (float): Timeout de lecture spécifique (ex. long-polling).
+
+        Returns:
+            tuple: (code HTTP, JSON décodé ou None).
+
+        Raises:
+            requests.RequestException: Erreur réseau vers la HC3.
+        """
+        timeout = self.timeout if read_timeout is None else (self.timeout[0], read_timeout)
+        response = self.session.get(f"{self.base_url}{path}", params=params, timeout=timeout)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def close(self) -> None:
+        """
+        Ferme les connexions ouvertes vers la HC3.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+# Client partagé, créé au premier appel.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> FibaroClient:
+    """
+    Retourne le client Fibaro partagé par tout le processus.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                breaker = None
+                if config.CIRCUIT_BREAKER:
+                    breaker = CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_TIMEOUT)
+                _client = FibaroClient(breaker=breaker)
+    return _client
+
+
+def set_client(client: FibaroClient) -> None:
+    """
+    Remplace le client partagé (ex. pour pointer vers une HC3 de test).
+    """
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
 
 
 # Fonction qui va envoyer la valeur d'état du bouton à la Fibaro.
 def _call_action(device_id: int, action: str) -> dict:
     """
-    Met à jour la valeur d'un périphérique Fibaro HC3 via l'API setValue.
+    Met à jour la valeur d'un périphérique Fibaro HC3 via l'API callAction.
     
     Args:
         device_id (int): Identifiant du périphérique cible.
@@ -40,36 +286,7 @@ def _call_action(device_id: int, action: str) -> dict:
     Returns:
         dict: Résultat de l'opération.    
     """
-    auth = HTTPBasicAuth(config.FIBARO_USER, config.FIBARO_PASSWORD)
-    
-    base_url = f"http://{config.FIBARO_IP}" if config.FIBARO_PORT == 80 else f"http://{config.FIBARO_IP}:{config.FIBARO_PORT}"
-    url = f"{base_url}/api/callAction"
- 
-    # Paramètres GET
-    payload = {
-        "deviceID": device_id,
-        "name": action
-    }
-    
-    try:
-        logger.debug(f"Envoi à Fibaro: URL={url}, payload={payload}")
-        response = requests.get(url, auth=auth, json=payload, timeout=5)
-        logger.debug(f"Réponse Fibaro: {response.text}")
-        
-        try:
-            resp_json = response.json()
-        except ValueError:
-            resp_json = {}
-
-        if response.status_code == 200:
-            return {"status": "success", "code": response.status_code, "response": resp_json}   
-        else:
-            logger.warning(f"Erreur callAction Fibaro ({response.status_code}): {response.text}")
-            return {"status": "failed", "code": response.status_code, "response": resp_json, "message": response.text}
-        
-    except Exception as e:
-        logger.exception(f"Erreur lors de l'appel de l'action {action} sur {device_id}")
-        return {"status": "error", "message": str(e)}
+    return get_client().call_action(device_id, action)
     
 
 
@@ -107,4 +324,11 @@ def set_fibaro(device_id: int, etat) -> dict:
         return turn_on_fibaro(device_id)
     else:
         logger.warning(f"Etat invalide pour le périphérique {device_id}: {etat}")
-        return {"status": "error", "message": f"Etat invalide: {etat}"}
\ No newline at end of file
+        return {"status": "error", "message": f"Etat invalide: {etat}"}
+
+
+def execute_operations(operations: List[FibaroOperation]) -> List[dict]:
+    """
+    Envoie un lot d'opérations typées avec le client partagé (voir FibaroClient.bulk).
+    """
+    return get_client().bulk(operations)
@@ -0,0 +1,222 @@
+"""
+health.py
+
+Sonde de santé du pont : un thread de fond vérifie la HC3 (API joignable), le
+serveur SMTP (accueil 220) et le fichier de mapping (valide et non vide) toutes
+les HEALTH_INTERVAL secondes, et garde le résultat en cache.
+
+/readyz ne fait que lire ce cache (corps JSON déjà construit) : une supervision
+qui interroge le pont souvent n'ajoute aucune requête vers la HC3. Un résultat
+plus vieux que stale_after n'est plus considéré comme prêt (sonde bloquée).
+
+Seules les vérifications de HEALTH_READY_CHECKS conditionnent l'état prêt ; les
+autres sont rapportées dans le détail (ex. SMTP en panne : alertes dégradées,
+mais les événements IPX passent).
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+import config
+from services import metrics
+from services.device_mapping import MappingRegistry, registry
+from services.fibaro_service import FibaroClient
+from services.logger_service import logger
+
+HEALTH_CHECK = metrics.gauge("fibaro_health_check", "Dernier résultat de la sonde de santé : 1 OK, 0 en échec",
+                             ("check",))
+
+_STARTING = json.dumps({"status": "starting", "checks": {}})
+
+
+def check_hc3(client: FibaroClient, timeout: float) -> str:
+    """
+    Vérifie que l'API de la HC3 répond (GET /settings/info).
+    """
+    code, data = client.get_json("/settings/info", read_timeout=timeout)
+    if code != 200:
+        raise RuntimeError(f"HTTP {code}")
+    version = data.get("softVersion") if isinstance(data, dict) else None
+    return f"HC3 {version}" if version else "HTTP 200"
+
+
+def check_smtp(host: str, port: int, timeout: float) -> str:
+    """
+    Vérifie que le serveur SMTP accepte une connexion (accueil 220), sans s'authentifier.
+    """
+    with socket.create_connection((host, int(port or 25)), timeout=timeout) as sock:
+        banner = sock.makefile("rb").readline().decode(errors="replace").strip()
+        if not banner.startswith("220"):
+            raise RuntimeError(banner or "connexion fermée sans accueil")
+        try:
+            sock.sendall(b"QUIT\r\n")
+        except OSError:
+            pass
+    return banner[:80]
+
+
+def check_mapping(mapping: MappingRegistry) -> str:
+    """
+    Vérifie que le fichier de mapping est valide (dernière lecture réussie) et non vide.
+    """
+    if mapping.last_error:
+        raise RuntimeError(mapping.last_error)
+    snapshot = mapping.snapshot
+    if not snapshot.by_name:
+        raise RuntimeError("mapping vide")
+    return f"version {snapshot.version}, {len(snapshot.by_name)} périphériques"
+
+
+class HealthProber:
+    """
+    Exécute les vérifications à intervalle régulier et garde le dernier résultat.
+
+    Args:
+        checks (dict): {nom: fonction} ; une fonction retourne un détail ou lève une exception.
+        required (Iterable): Vérifications qui conditionnent l'état prêt.
+        interval (float): Délai (s) entre deux passages.
+        stale_after (float): Âge (s) au-delà duquel le résultat n'est plus fiable (défaut : 3 intervalles).
+        clock (Callable): Horloge monotone.
+    """
+
+    def __init__(self, checks: Dict[str, Callable[[], str]], required: Iterable[str] = (), interval: float = 15.0,
+                 stale_after: float = None, clock: Callable[[], float] = time.monotonic):
+        self.checks = dict(checks)
+        self.required = tuple(name for name in required if name in self.checks)
+        self.interval = interval
+        self.stale_after = stale_after if stale_after is not None else 3 * interval
+        self.clock = clock
+        self.results: Dict[str, dict] = {}
+        # (prêt, corps JSON, instant du passage) : remplacé d'un bloc à chaque passage
+        self._state = None
+        self._started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def probe_once(self) -> bool:
+        """
+        Exécute toutes les vérifications et met le résultat en cache.
+
+        Returns:
+            bool: True si toutes les vérifications requises ont réussi.
+        """
+        results = {}
+        for name, check in self.checks.items():
+            start = time.perf_counter()
+            try:
+                ok, detail = True, check()
+            except Exception as e:
+                ok, detail = False, str(e) or type(e).__name__
+            results[name] = {"ok": ok, "detail": detail,
+                             "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+            HEALTH_CHECK.labels(name).set(1 if ok else 0)
+            previous = self.results.get(name)
+            if previous is not None and previous["ok"] != ok:
+                if ok:
+                    logger.info(f"Santé : {name} de nouveau disponible ({detail})")
+                else:
+                    logger.warning(f"Santé : {name} en échec ({detail})")
+            elif previous is None and not ok:
+                logger.warning(f"Santé : {name} en échec ({detail})")
+
+        ready = all(results[name]["ok"] for name in self.required)
+        body = json.dumps({"status": "ready" if ready else "not_ready", "checks": results})
+        self.results = results
+        self._state = (ready, body, self.clock())
+        return ready
+
+    def readiness(self) -> Tuple[bool, str]:
+        """
+        Dernier résultat en cache, sans aucune vérification.
+
+        Returns:
+            tuple: (prêt, corps JSON).
+        """
+        state = self._state
+        if state is None:
+            return False, _STARTING
+        ready, body, checked_at = state
+        age = self.clock() - checked_at
+        if age > self.stale_after:
+            return False, json.dumps({"status": "stale", "age_s": round(age, 1), "checks": self.results})
+        return ready, body
+
+    def alive(self) -> bool:
+        """
+        Indique si la sonde tourne et a terminé un passage récemment (pour le watchdog systemd).
+        """
+        state = self._state
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        # Premier passage en cours après un démarrage : laissé le temps de finir
+        last = max(state[2], self._started_at) if state is not None else self._started_at
+        return self.clock() - last <= self.stale_after
+
+    def start(self) -> "HealthProber":
+        """
+        Démarre le thread de la sonde (sans effet s'il tourne déjà).
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._started_at = self.clock()
+            self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.probe_once()
+            self._stop.wait(self.interval)
+
+
+# Sonde partagée, créée au premier appel.
+_prober = None
+_prober_lock = threading.Lock()
+
+
+def get_health_prober() -> HealthProber:
+    """
+    Retourne la sonde partagée (non démarrée : voir start()).
+    """
+    global _prober
+    if _prober is None:
+        with _prober_lock:
+            if _prober is None:
+                timeout = config.HEALTH_TIMEOUT
+                # Client dédié, sans disjoncteur : la sonde ne perturbe pas les commandes
+                client = FibaroClient(pool_size=1)
+                checks = {
+                    "hc3": lambda: check_hc3(client, timeout),
+                    "mapping": lambda: check_mapping(registry),
+                }
+                # Autres box HC3 : rapportées, non requises par défaut ("hc3:garage" dans HEALTH_READY_CHECKS)
+                if config.FIBARO_CONTROLLERS:
+                    from services.controllers import get_controllers
+                    for name, controller in get_controllers().controllers.items():
+                        if name != config.FIBARO_CONTROLLER:
+                            checks[f"hc3:{name}"] = lambda c=controller: check_hc3(c.client, timeout)
+                if config.SMTP_SERVER:
+                    checks["smtp"] = lambda: check_smtp(config.SMTP_SERVER, config.SMTP_PORT, timeout)
+                _prober = HealthProber(checks, config.HEALTH_READY_CHECKS, config.HEALTH_INTERVAL,
+                                       stale_after=3 * config.HEALTH_INTERVAL + len(checks) * timeout)
+    return _prober
+
+
+def set_health_prober(prober: HealthProber) -> None:
+    """
+    Remplace la sonde partagée (ex. pour surveiller des services de test).
+    """
+    global _prober
+    with _prober_lock:
+        if _prober is not None and _prober is not prober:
+            _prober.stop()
+        _prober = prober
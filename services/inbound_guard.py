@@ -0,0 +1,233 @@
+"""
+inbound_guard.py
+
+Contrôle des requêtes entrantes de l'IPX800 (/ipx-event, /ipx-events, /ipx-alarms) :
+authentification par secret partagé et limitation de débit par seau à jetons.
+
+Authentification (INBOUND_TOKEN) : la requête porte le secret, soit tel quel
+(paramètre "token" de l'URL ou en-tête X-IPX-Token, seule option pour une URL push
+de l'IPX800), soit sous forme de signature HMAC-SHA256 (en-tête
+X-IPX-Signature: "<horodatage>:<hex>") calculée sur
+"<horodatage>\n<méthode>\n<chemin>\n<query string>\n<corps>", avec un horodatage à
+moins de INBOUND_HMAC_WINDOW secondes. Les comparaisons sont en temps constant.
+
+Limitation : un seau par adresse source et un seau par périphérique (nom logique).
+Les seaux des sources connues (INBOUND_CLIENTS) et des périphériques du mapping
+sont créés à l'avance ; les autres partagent un seau « inconnu ». Contrôler une
+requête revient à une recherche dans un dict et quelques opérations sur des
+flottants, sans verrou ni objet créé par requête. Sans verrou, deux requêtes
+simultanées peuvent lire le même nombre de jetons : le dépassement est borné à
+quelques requêtes, sans conséquence pour un plafond anti-inondation.
+
+Une requête refusée reçoit 401 (authentification), 403 (source inconnue refusée) ou
+429 avec Retry-After (débit dépassé), comptés par fibaro_inbound_rejected_total.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import hashlib
+import hmac
+import math
+import threading
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+import config
+from services import metrics
+from services.device_mapping import registry
+
+INBOUND_REJECTED = metrics.counter("fibaro_inbound_rejected_total", "Requêtes IPX refusées par motif",
+                                   ("reason",))
+
+# Réponses de refus : (code HTTP, corps JSON, en-têtes)
+UNAUTHORIZED = (401, {"status": "error", "message": "Authentification requise."}, {})
+FORBIDDEN = (403, {"status": "error", "message": "Source non autorisée."}, {})
+TOO_MANY = {"status": "error", "message": "Trop de requêtes, réessayer plus tard."}
+
+
+def _too_many(wait: float) -> tuple:
+    return 429, TOO_MANY, {"Retry-After": str(math.ceil(wait))}
+
+
+class TokenBucket:
+    """
+    Seau à jetons : `rate` jetons par seconde, au plus `burst` en réserve.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "rejected")
+
+    def __init__(self, rate: float, burst: float, rejected=None, now: float = 0.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+        self.rejected = rejected
+
+    def take(self, now: float) -> float:
+        """
+        Prend un jeton.
+
+        Returns:
+            float: 0 si la requête est admise, sinon l'attente (s) avant le prochain jeton.
+        """
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.stamp = now
+        if tokens < 1.0:
+            self.tokens = tokens
+            return (1.0 - tokens) / self.rate
+        self.tokens = tokens - 1.0
+        return 0.0
+
+
+class InboundGuard:
+    """
+    Authentification et limitation des requêtes entrantes.
+
+    Args:
+        token (str): Secret partagé, vide = pas d'authentification.
+        clients (Iterable): Adresses sources connues (un seau chacune).
+        allow_unknown (bool): Accepte les autres sources (seau partagé) ; sinon 403.
+        source_rate, source_burst (float): Débit et réserve par source.
+        device_rate, device_burst (float): Débit et réserve par périphérique.
+        hmac_window (float): Écart maximal (s) de l'horodatage d'une signature.
+        devices (Callable): Fonction () -> (version, noms) des périphériques connus
+            (défaut : mapping courant).
+        clock (Callable): Horloge monotone des seaux.
+        wall_clock (Callable): Horloge des horodatages signés.
+    """
+
+    def __init__(self, token: Optional[str] = None, clients: Iterable[str] = (), allow_unknown: bool = True,
+                 source_rate: float = 20.0, source_burst: float = 40.0, device_rate: float = 5.0,
+                 device_burst: float = 10.0, hmac_window: float = 300.0,
+                 devices: Callable[[], Tuple[int, Iterable[str]]] = None,
+                 clock: Callable[[], float] = time.monotonic, wall_clock: Callable[[], float] = time.time):
+        self.token = token.encode() if token else None
+        self.allow_unknown = allow_unknown
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.hmac_window = hmac_window
+        self.devices = devices or (lambda: (registry.snapshot.version, registry.snapshot.by_name))
+        self.clock = clock
+        self.wall_clock = wall_clock
+
+        now = clock()
+        rejected = INBOUND_REJECTED.labels("rate_source")
+        self._sources = {client: TokenBucket(source_rate, source_burst, rejected, now) for client in clients}
+        self._unknown_source = TokenBucket(source_rate, source_burst, rejected, now) if allow_unknown else None
+        self._device_rejected = INBOUND_REJECTED.labels("rate_device")
+        self._unknown_device = TokenBucket(device_rate, device_burst, self._device_rejected, now)
+        self._device_version = None
+        self._device_buckets = {}
+        self._rebuild_lock = threading.Lock()
+        self._auth_rejected = INBOUND_REJECTED.labels("auth")
+        self._source_rejected = INBOUND_REJECTED.labels("source")
+
+    def check_source(self, source: Optional[str], token: Optional[str] = None, signature: Optional[str] = None,
+                     signed: Callable[[], tuple] = None):
+        """
+        Contrôle une requête avant son traitement : authentification puis débit de la source.
+
+        Args:
+            source (str): Adresse IP de l'émetteur.
+            token (str): Secret transmis tel quel (paramètre ou en-tête).
+            signature (str): En-tête X-IPX-Signature.
+            signed (Callable): Fonction () -> (méthode, chemin, query string, corps) en
+                octets, appelée seulement pour vérifier une signature.
+
+        Returns:
+            tuple: (code, corps, en-têtes) si la requête est refusée, None sinon.
+        """
+        if self.token is not None and not self._authenticated(token, signature, signed):
+            self._auth_rejected.inc()
+            return UNAUTHORIZED
+        bucket = self._sources.get(source, self._unknown_source)
+        if bucket is None:
+            self._source_rejected.inc()
+            return FORBIDDEN
+        wait = bucket.take(self.clock())
+        if wait:
+            bucket.rejected.inc()
+            return _too_many(wait)
+        return None
+
+    def check_device(self, ipx_name: Optional[str]):
+        """
+        Contrôle le débit d'un périphérique, une fois son nom extrait de la requête.
+
+        Returns:
+            tuple: (429, corps, en-têtes) si le débit est dépassé, None sinon.
+        """
+        version, names = self.devices()
+        if version != self._device_version:
+            self._rebuild_devices(version, names)
+        bucket = self._device_buckets.get(ipx_name, self._unknown_device)
+        wait = bucket.take(self.clock())
+        if wait:
+            bucket.rejected.inc()
+            return _too_many(wait)
+        return None
+
+    def _rebuild_devices(self, version: int, names: Iterable[str]) -> None:
+        # Au chargement et à chaque nouvelle version du mapping : les seaux existants sont conservés
+        with self._rebuild_lock:
+            if version == self._device_version:
+                return
+            now = self.clock()
+            previous = self._device_buckets
+            self._device_buckets = {name: previous.get(name) or TokenBucket(self.device_rate, self.device_burst,
+                                                                          self._device_rejected, now)
+                                    for name in names}
+            self._device_version = version
+
+    def _authenticated(self, token: Optional[str], signature: Optional[str], signed) -> bool:
+        if token:
+            return hmac.compare_digest(token.encode(), self.token)
+        if not signature or signed is None:
+            return False
+        stamp, _, digest = signature.partition(":")
+        try:
+            if abs(self.wall_clock() - float(stamp)) > self.hmac_window:
+                return False
+        except ValueError:
+            return False
+        method, path, query, body = signed()
+        expected = sign(self.token, stamp.encode(), method, path, query, body)
+        return hmac.compare_digest(digest.encode(), expected.encode())
+
+
+def sign(secret: bytes, stamp: bytes, method: bytes, path: bytes, query: bytes, body: bytes) -> str:
+    """
+    Signature HMAC-SHA256 d'une requête (hex), pour l'en-tête X-IPX-Signature "<stamp>:<hex>".
+    """
+    return hmac.new(secret, b"\n".join((stamp, method, path, query, body)), hashlib.sha256).hexdigest()
+
+
+# Contrôle partagé, créé au premier appel.
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_inbound_guard() -> InboundGuard:
+    """
+    Retourne le contrôle des requêtes entrantes, configuré depuis config.py.
+    """
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                _guard = InboundGuard(config.INBOUND_TOKEN, config.INBOUND_CLIENTS, config.INBOUND_ALLOW_UNKNOWN,
+                                      config.INBOUND_SOURCE_RATE, config.INBOUND_SOURCE_BURST,
+                                      config.INBOUND_DEVICE_RATE, config.INBOUND_DEVICE_BURST,
+                                      config.INBOUND_HMAC_WINDOW)
+    return _guard
+
+
+def set_inbound_guard(guard: Optional[InboundGuard]) -> None:
+    """
+    Remplace le contrôle partagé (tests, bancs d'essai).
+    """
+    global _guard
+    with _guard_lock:
+        _guard = guard
@@ -0,0 +1,109 @@
+"""
+ipx_client.py
+
+Client HTTP de l'IPX800 (API V4 /api/xdevices.json), utilisé par le canal retour
+pour piloter les relais depuis les changements d'état de la HC3.
+
+  - SetR=NN allume le relais NN, ClearR=NN l'éteint ;
+  - une seule `requests.Session` : la connexion vers l'IPX800 est conservée ;
+  - pas de renvoi automatique, comme pour la HC3.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from services.logger_service import logger
+from services import metrics
+
+IPX_CALL_SECONDS = metrics.histogram("fibaro_ipx_call_seconds", "Durée des appels vers l'IPX800",
+                                     ("action", "status"))
+
+
+class IPXClient:
+    """
+    Client HTTP longue durée vers l'IPX800.
+
+    Args:
+        base_url (str): URL de l'IPX800 (ex. "http://192.168.1.20").
+        api_key (str): Clé de l'API (paramètre `key`).
+        timeout (float): Timeout de connexion et de lecture, en secondes.
+        pool_size (int): Nombre de connexions conservées dans le pool.
+    """
+
+    def __init__(self, base_url: str = None, api_key: str = None, timeout: float = None, pool_size: int = 2):
+        self.base_url = (base_url or config.IPX_BASE_URL).rstrip("/")
+        self.url = f"{self.base_url}/api/xdevices.json"
+        self.api_key = api_key if api_key is not None else config.IPX_API_KEY
+        self.timeout = timeout if timeout is not None else config.IPX_TIMEOUT
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def set_output(self, relay: int, on: bool) -> dict:
+        """
+        Allume ou éteint un relais de l'IPX800.
+
+        Returns:
+            dict: {"status": "success"}, {"status": "failed", "code"} ou {"status": "error", "message"}.
+        """
+        action = "SetR" if on else "ClearR"
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self.url, params={"key": self.api_key, action: f"{relay:02d}"},
+                                        timeout=self.timeout)
+            IPX_CALL_SECONDS.labels(action, str(response.status_code)).observe(time.perf_counter() - start)
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            # L'IPX800 répond 200 {"status": "Success"} ; une clé refusée donne un autre statut
+            if response.status_code == 200 and str(data.get("status", "Success")).lower() == "success":
+                return {"status": "success"}
+            logger.warning(f"Erreur {action} {relay} IPX800 ({response.status_code}): {response.text}")
+            return {"status": "failed", "code": response.status_code, "message": response.text}
+        except requests.RequestException as e:
+            IPX_CALL_SECONDS.labels(action, "error").observe(time.perf_counter() - start)
+            logger.warning(f"IPX800 injoignable pour {action} {relay} : {e}")
+            return {"status": "error", "message": str(e)}
+
+    def close(self) -> None:
+        """
+        Ferme les connexions ouvertes vers l'IPX800.
+        """
+        self.session.close()
+
+
+# Client partagé, créé au premier appel.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ipx_client() -> IPXClient:
+    """
+    Retourne le client IPX800 partagé par tout le processus.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = IPXClient()
+    return _client
+
+
+def set_ipx_client(client: IPXClient) -> None:
+    """
+    Remplace le client partagé (ex. pour pointer vers un IPX800 de test).
+    """
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
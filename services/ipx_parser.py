@@ -0,0 +1,161 @@
+"""
+ipx_parser.py
+
+Lecture en une passe des événements envoyés par l'IPX800 à /ipx-event.
+
+L'IPX800 peut transmettre relais/etat dans la query string, en formulaire, en JSON
+ou en texte brut clé=valeur. Le corps est lu une seule fois et son format est
+choisi d'après le Content-Type puis le premier octet ('{' = JSON), au lieu
+d'essayer chaque décodage tour à tour.
+
+Priorité des sources (identique à l'ancienne route) : query string, puis corps ;
+dans le corps, "device_id" est accepté à la place de "relais" (JSON, texte brut).
+
+L'état est normalisé dans la même passe (action turnOn/turnOff) et un identifiant
+de relais numérique ("3", " 03 ") est converti en entier.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+from typing import Optional
+from urllib.parse import parse_qsl
+
+# Valeurs d'état acceptées (après strip + lower) et action Fibaro correspondante
+ETAT_ACTIONS = {
+    "1": "turnOn", "on": "turnOn", "true": "turnOn", "turnon": "turnOn",
+    "0": "turnOff", "off": "turnOff", "false": "turnOff", "turnoff": "turnOff",
+}
+
+
+def normalize_etat(etat) -> tuple:
+    """
+    Normalise un état reçu de l'IPX800.
+
+    Returns:
+        tuple: (etat normalisé ou None, action "turnOn"/"turnOff" ou None si invalide).
+    """
+    if etat is None:
+        return None, None
+    etat = str(etat).strip().lower()
+    return etat, ETAT_ACTIONS.get(etat)
+
+
+def _relay_number(relais) -> Optional[int]:
+    try:
+        return int(relais)
+    except (TypeError, ValueError):
+        return None
+
+
+class IPXEvent:
+    """
+    Événement IPX800 extrait d'une requête.
+
+    Attributes:
+        relais: Identifiant reçu tel quel (nom logique ou numéro), None si absent.
+        relay (int): Numéro de relais si l'identifiant est numérique, sinon None.
+        ipx_name (str): Nom logique ; égal à `relais` pour un nom, à renseigner via
+            le mapping pour un numéro.
+        etat (str): État normalisé (minuscules, sans espaces), None si absent.
+        action (str): "turnOn" / "turnOff", None si l'état est absent ou invalide.
+        complete (bool): Identifiant et état présents.
+    """
+
+    __slots__ = ("relais", "relay", "ipx_name", "etat", "action", "complete")
+
+    def __init__(self, relais=None, etat=None):
+        self.relais = relais
+        self.relay = _relay_number(relais)
+        self.ipx_name = relais if self.relay is None else None
+        self.etat, self.action = normalize_etat(etat)
+        # Identifiant et état présents (un état invalide est signalé plus loin, à la résolution)
+        self.complete = bool(relais) and bool(etat)
+
+    def __repr__(self):
+        return f"IPXEvent(relais={self.relais!r}, ipx_name={self.ipx_name!r}, etat={self.etat!r})"
+
+
+def _first_values(pairs) -> dict:
+    """
+    Première valeur (même vide) de chaque clé, comme MultiDict.get.
+    """
+    values = {}
+    for key, value in pairs:
+        if key not in values:
+            values[key] = value
+    return values
+
+
+def _parse_qs(data: bytes) -> dict:
+    return _first_values(parse_qsl(data.decode("utf-8", errors="replace"), keep_blank_values=True,
+                                   errors="replace"))
+
+
+def _query_fields(query: bytes) -> tuple:
+    if not query:
+        return None, None
+    params = _parse_qs(query)
+    return params.get("relais"), params.get("etat")
+
+
+def _body_event(relais, etat, body: bytes, mimetype: str, form) -> IPXEvent:
+    if form is not None or mimetype == "application/x-www-form-urlencoded":
+        # Formulaire : le corps n'est lu que sous cette forme
+        params = form if form is not None else _parse_qs(body)
+        return IPXEvent(relais or params.get("relais"), etat or params.get("etat"))
+
+    if not body:
+        return IPXEvent(relais, etat)
+
+    text = body.decode("utf-8", errors="ignore").strip()
+    if mimetype == "application/json" or mimetype.endswith("+json") or text[:1] == "{":
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            relais = relais or data.get("device_id") or data.get("relais")
+            etat = etat or data.get("etat")
+            if relais and etat:
+                return IPXEvent(relais, etat)
+
+    if "=" in text:
+        # Texte brut clé=valeur : pas de décodage %xx, la dernière occurrence d'une clé l'emporte
+        params = dict(pair.split("=", 1) for pair in text.split("&") if "=" in pair)
+        relais = relais or params.get("device_id") or params.get("relais")
+        etat = etat or params.get("etat")
+    return IPXEvent(relais, etat)
+
+
+def parse_ipx_payload(query: bytes, body: bytes, mimetype: str = "", form=None) -> IPXEvent:
+    """
+    Extrait relais/etat d'une requête IPX800 en lisant chaque source une seule fois.
+
+    Args:
+        query (bytes): Query string brute.
+        body (bytes): Corps brut de la requête.
+        mimetype (str): Content-Type sans paramètres (ex. "application/json").
+        form (dict): Champs de formulaire déjà décodés (multipart), prioritaires sur le corps.
+
+    Returns:
+        IPXEvent: Événement extrait (IPXEvent.complete indique si relais et etat sont présents).
+    """
+    relais, etat = _query_fields(query)
+    if relais and etat:
+        return IPXEvent(relais, etat)
+    return _body_event(relais, etat, body, mimetype, form)
+
+
+def parse_ipx_request(request) -> IPXEvent:
+    """
+    Extrait relais/etat de la requête Flask en cours (voir parse_ipx_payload) ; le
+    corps n'est pas lu si la query string suffit.
+    """
+    relais, etat = _query_fields(request.query_string)
+    if relais and etat:
+        return IPXEvent(relais, etat)
+    mimetype = request.mimetype
+    if mimetype.startswith("multipart/"):
+        return _body_event(relais, etat, b"", mimetype, request.form)
+    return _body_event(relais, etat, request.get_data(cache=True), mimetype, None)
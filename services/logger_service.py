@@ -1,7 +1,29 @@
-import os
+"""
+logger_service.py
+
+Logger de l'application (fibaro_logger).
+
+Les threads qui journalisent n'écrivent jamais eux-mêmes sur la console ni sur la
+carte SD : chaque ligne est déposée dans une file bornée (QueueHandler) et un thread
+unique (QueueListener) l'écrit ensuite dans la console et le fichier tournant. Une
+rotation ou une écriture lente ne se voit donc plus dans la latence des requêtes.
+
+Si la file est pleine, la ligne la plus ancienne est abandonnée et comptée ; le
+nombre de lignes perdues est signalé dans le log dès que le thread d'écriture
+rattrape son retard.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import atexit
 import logging
+import os
+import queue
+import threading
 
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import config
 
 
 #============================#
@@ -9,21 +31,74 @@ from logging.handlers import RotatingFileHandler
 #============================#
 
 
+# Chemin du fichier log
+LOG_FILE = config.LOG_FILE_PATH
+
 # Créer le dossier logs/ s'il n'existe pas.
-LOG_DIR = "logs"
+LOG_DIR = os.path.dirname(LOG_FILE) or "."
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# Chemin du fichier log
-LOG_FILE = os.path.join("logs", "action.log")
+
+class DropOldestQueueHandler(QueueHandler):
+    """
+    QueueHandler non bloquant : file pleine => la ligne la plus ancienne est abandonnée.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    oldest = self.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                with self._drop_lock:
+                    self.dropped += 1
+                if oldest is QueueListener._sentinel:
+                    # Arrêt demandé : la sentinelle est remise en file, la ligne ne serait plus écrite
+                    self.queue.put(oldest)
+                    return
+
+
+class _LogListener(QueueListener):
+    """
+    Thread d'écriture : signale les lignes abandonnées avant d'écrire la suivante.
+    """
+
+    def __init__(self, log_queue: queue.Queue, source: DropOldestQueueHandler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.source = source
+        self.reported = 0
+
+    def handle(self, record: logging.LogRecord) -> None:
+        dropped = self.source.dropped
+        if dropped != self.reported:
+            warning = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                        "%d ligne(s) de log perdue(s) : file d'écriture pleine",
+                                        (dropped - self.reported,), None)
+            self.reported = dropped
+            super().handle(warning)
+        super().handle(record)
+
+    def enqueue_sentinel(self) -> None:
+        # Attente d'une place plutôt qu'un abandon : la sentinelle doit arriver
+        self.queue.put(self._sentinel)
 
 
 # Création du logger
 logger = logging.getLogger("fibaro_logger")
-logger.setLevel(logging.INFO)  
+logger.setLevel(getattr(logging, config.LOG_LEVEL.upper(), logging.INFO))
 
 # Format du log
 formatter = logging.Formatter(
-    "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s", 
+    "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s",
     datefmt="%d-%m-%Y %H:%M:%S"
 )
 
@@ -35,17 +110,55 @@ console_handler.setFormatter(formatter)
 file_handler = RotatingFileHandler(
     LOG_FILE,
     # Max : 1 Mo
-    maxBytes=1_000_000,  
+    maxBytes=1_000_000,
     # Garde les 5 derniers fichiers
-    backupCount=5  
+    backupCount=5,
+    # Fichier ouvert à la première ligne écrite, par le thread d'écriture
+    delay=True
 )
 
 file_handler.setFormatter(formatter)
 
+# Handler de file : seul handler attaché au logger, les deux autres sont servis par le listener
+queue_handler = DropOldestQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+_listener = None
+
+
+def start_logging() -> None:
+    """
+    Démarre le thread d'écriture des logs (nouvelle file après un fork, ex. gunicorn).
+    """
+    global _listener
+    queue_handler.queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    _listener = _LogListener(queue_handler.queue, queue_handler, console_handler, file_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Écrit les lignes encore en file puis arrête le thread d'écriture.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    """
+    Nombre de lignes de log abandonnées depuis le démarrage (file pleine).
+    """
+    return queue_handler.dropped
+
+
 # Ajout du handler au logger
 if not logger.hasHandlers():
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(queue_handler)
+    start_logging()
+    atexit.register(stop_logging)
+    # Le thread d'écriture n'existe pas dans un processus fils : on en relance un
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=start_logging)
 
 
 #============================#
@@ -58,4 +171,3 @@ def log_action(device_id):
     Log une valeur d'un device avec le niveau INFO
     """
     logger.info(f"Device {device_id}")
-    
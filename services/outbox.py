@@ -0,0 +1,217 @@
+"""
+outbox.py
+
+Boîte d'envoi persistante des commandes HC3 (SQLite, mode WAL).
+
+Une commande acceptée est enregistrée avant d'être envoyée à la HC3, puis effacée
+quand la HC3 l'a acquittée. Après un crash ou un redémarrage systemd, les commandes
+restées dans la boîte sont renvoyées au démarrage (create_app).
+
+- Une ligne par périphérique : seul le dernier état souhaité compte, une nouvelle
+  commande remplace la précédente.
+- Validation groupée (group commit) : les threads déposent leurs écritures et
+  attendent ; un thread unique les valide toutes dans une seule transaction, donc
+  un seul fsync pour toutes les commandes arrivées pendant le précédent.
+- L'acquittement n'attend pas la validation : un acquittement perdu ne provoque
+  qu'un renvoi du même état au redémarrage, sans effet sur le relais.
+- Une commande refusée après son enregistrement (file d'envoi pleine) est retirée
+  par son identifiant (withdraw()) : une commande plus récente du même
+  périphérique, enregistrée entre-temps, reste en place.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+from services.logger_service import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    device_id INTEGER PRIMARY KEY,
+    ipx_name TEXT,
+    etat TEXT,
+    action TEXT NOT NULL,
+    accepted_at REAL NOT NULL,
+    command_id TEXT
+);
+"""
+
+
+def connect(path: str, synchronous: str = "FULL") -> sqlite3.Connection:
+    """
+    Ouvre la base de la boîte d'envoi (création du schéma, mode WAL).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # FULL : fsync à chaque transaction (survit à une coupure de courant) ;
+    # NORMAL : survit à un crash du processus, pas forcément à une coupure.
+    connection.execute(f"PRAGMA synchronous={'NORMAL' if synchronous.upper() == 'NORMAL' else 'FULL'}")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class _Write:
+    """
+    Écriture en attente de validation.
+    """
+
+    __slots__ = ("sql", "params", "done", "error")
+
+    def __init__(self, sql: str, params: tuple, wait: bool):
+        self.sql = sql
+        self.params = params
+        self.done = threading.Event() if wait else None
+        # Erreur SQLite de la transaction, si elle a échoué
+        self.error = None
+
+
+class Outbox:
+    """
+    Boîte d'envoi persistante, une commande par périphérique.
+
+    Args:
+        path (str): Chemin de la base SQLite.
+        synchronous (str): "FULL" (fsync par transaction) ou "NORMAL".
+        group_commit (bool): Valide les écritures par lots depuis un thread dédié ;
+            sinon chaque commande est validée dans le thread appelant.
+        put_timeout (float): Attente maximale (s) de la validation d'une commande.
+    """
+
+    def __init__(self, path: str, synchronous: str = "FULL", group_commit: bool = True,
+                 put_timeout: float = 1.0):
+        self.path = path
+        self.group_commit = group_commit
+        self.put_timeout = put_timeout
+        self.commits = 0
+        self._connection = connect(path, synchronous)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def pending(self) -> List[Dict]:
+        """
+        Commandes non acquittées, de la plus ancienne à la plus récente.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT device_id, ipx_name, etat, action, accepted_at FROM outbox ORDER BY accepted_at"
+            ).fetchall()
+        return [{"device": device_id, "ipx_name": ipx_name, "etat": etat, "action": action,
+                 "accepted_at": accepted_at} for device_id, ipx_name, etat, action, accepted_at in rows]
+
+    def put(self, command: Dict, command_id: str = None) -> bool:
+        """
+        Enregistre une commande (remplace celle du même périphérique) et attend qu'elle
+        soit validée sur disque.
+
+        Args:
+            command_id (str): Identifiant de la ligne, pour un éventuel withdraw().
+
+        Returns:
+            bool: False si la validation a échoué ou n'a pas eu lieu dans put_timeout.
+        """
+        write = _Write(
+            "INSERT OR REPLACE INTO outbox (device_id, ipx_name, etat, action, accepted_at, command_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (command["device"], command.get("ipx_name"), command.get("etat"), command["action"], time.time(),
+             command_id),
+            wait=True,
+        )
+        if not self.group_commit:
+            self._commit([write])
+        else:
+            self._queue.put(write)
+            if not write.done.wait(self.put_timeout):
+                logger.warning(f"Boîte d'envoi lente : commande {command['action']} pour {command['device']} "
+                               f"envoyée avant d'être enregistrée")
+                return False
+        if write.error is not None:
+            logger.warning(f"Commande {command['action']} pour {command['device']} envoyée sans être "
+                           f"enregistrée : {write.error}")
+            return False
+        return True
+
+    def ack(self, device_id: int, action: str) -> None:
+        """
+        Efface la commande d'un périphérique si l'action acquittée est bien l'état souhaité
+        (une commande plus récente et différente reste en attente).
+        """
+        write = _Write("DELETE FROM outbox WHERE device_id = ? AND action = ?", (device_id, action), wait=False)
+        if self.group_commit:
+            self._queue.put(write)
+        else:
+            self._commit([write])
+
+    def withdraw(self, device_id: int, command_id: str) -> None:
+        """
+        Retire une commande refusée après son enregistrement, si la ligne du périphérique
+        est toujours la sienne.
+        """
+        write = _Write("DELETE FROM outbox WHERE device_id = ? AND command_id = ?", (device_id, command_id),
+                       wait=False)
+        if self.group_commit:
+            self._queue.put(write)
+        else:
+            self._commit([write])
+
+    def start(self) -> "Outbox":
+        """
+        Démarre le thread de validation groupée (sans effet s'il tourne déjà).
+        """
+        if self.group_commit and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-commit", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Valide les écritures en attente puis arrête le thread.
+        """
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _commit(self, writes: List[_Write]) -> None:
+        try:
+            with self._lock, self._connection:
+                for write in writes:
+                    self._connection.execute(write.sql, write.params)
+            self.commits += 1
+        except sqlite3.Error as e:
+            logger.error(f"Écriture de la boîte d'envoi impossible ({len(writes)} opérations) : {e}")
+            # Toute la transaction est annulée : chaque écriture a échoué
+            for write in writes:
+                write.error = e
+        finally:
+            for write in writes:
+                if write.done is not None:
+                    write.done.set()
+
+    def _run(self) -> None:
+        while True:
+            write = self._queue.get()
+            stop = write is None
+            writes = [] if stop else [write]
+            # Tout ce qui est arrivé pendant la validation précédente part dans la même transaction
+            while True:
+                try:
+                    write = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if write is None:
+                    stop = True
+                    continue
+                writes.append(write)
+            if writes:
+                self._commit(writes)
+            if stop:
+                return
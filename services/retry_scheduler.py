@@ -0,0 +1,247 @@
+"""
+retry_scheduler.py
+
+Reprise des commandes que la HC3 n'a pas pu recevoir (circuit ouvert, erreur
+réseau, timeout, HTTP 5xx).
+
+- Un seul état souhaité est conservé par périphérique : une commande plus récente
+  remplace celle en attente (inutile de rejouer on puis off).
+- Les tentatives s'espacent exponentiellement (RETRY_BASE_DELAY, doublé à chaque
+  échec, plafonné à RETRY_MAX_DELAY) avec une part aléatoire (jitter) pour ne pas
+  envoyer toutes les reprises au même instant au retour de la HC3.
+- Une commande plus vieille que RETRY_TTL est abandonnée.
+- Un envoi réussi par le chemin normal annule la reprise en attente (cancel()).
+- Les envois d'un périphérique sont sérialisés (device_lock()) : le chemin normal
+  attend la fin d'une reprise en cours, et une reprise annulée pendant cette attente
+  n'est pas envoyée. Une reprise plus ancienne ne peut donc pas atteindre la HC3
+  après l'envoi direct qui l'a remplacée.
+
+Les échéances passent par l'ordonnanceur partagé ; les envois partent d'un petit
+pool de threads pour ne pas bloquer le thread de l'ordonnanceur.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from services.logger_service import logger
+from services.scheduler import Scheduler, get_scheduler
+
+
+def is_retryable(result: dict) -> bool:
+    """
+    Indique si un échec d'appel HC3 vaut la peine d'être retenté (HC3 injoignable ou
+    en erreur interne, ou saturée) ; un refus 4xx ne changera pas en réessayant.
+    """
+    status = result.get("status")
+    if status in ("open", "error", "busy"):
+        return True
+    return status == "failed" and (result.get("code") or 0) >= 500
+
+
+class _RetrySlot:
+    """
+    Dernier état souhaité d'un périphérique, en attente de reprise.
+    """
+
+    __slots__ = ("action", "expires_at", "attempt", "version", "handle", "in_flight", "cancelled")
+
+    def __init__(self):
+        self.action = None
+        self.expires_at = 0.0
+        self.attempt = 0
+        self.version = 0
+        self.handle = None
+        self.in_flight = False
+        # Annulée pendant une tentative en cours : retirée à la fin de celle-ci
+        self.cancelled = False
+
+
+class RetryScheduler:
+    """
+    Reprise différée des commandes HC3, une par périphérique.
+
+    Args:
+        send (Callable): Fonction (device_id, action) -> dict qui appelle la HC3.
+        base_delay (float): Premier délai de reprise, en secondes.
+        max_delay (float): Délai maximum entre deux tentatives.
+        jitter (float): Part aléatoire du délai, entre 0 et 1.
+        ttl (float): Durée de vie d'une commande, en secondes.
+        scheduler (Scheduler): Ordonnanceur des tentatives (défaut : partagé).
+        clock (Callable): Horloge monotone.
+        rng (random.Random): Générateur aléatoire (injectable pour des essais reproductibles).
+    """
+
+    def __init__(self, send: Callable[[int, str], dict], base_delay: float = 1.0, max_delay: float = 60.0,
+                 jitter: float = 0.5, ttl: float = 300.0, scheduler: Scheduler = None,
+                 clock: Callable[[], float] = time.monotonic, rng: random.Random = None):
+        self.send = send
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.ttl = ttl
+        self.scheduler = scheduler or get_scheduler()
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._slots = {}
+        self._lock = threading.Lock()
+        # Un verrou d'envoi par périphérique, partagé avec le chemin normal
+        self._device_locks = {}
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hc3-retry")
+        self.scheduled = 0
+        self.sent = 0
+        self.expired = 0
+        self.dropped = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Compteurs : commandes mises en reprise, envoyées, expirées, abandonnées (refus 4xx).
+        """
+        with self._lock:
+            return {
+                "pending": self._pending(),
+                "scheduled": self.scheduled,
+                "sent": self.sent,
+                "expired": self.expired,
+                "dropped": self.dropped,
+            }
+
+    def pending(self) -> int:
+        """
+        Nombre de périphériques ayant une commande en attente de reprise.
+        """
+        with self._lock:
+            return self._pending()
+
+    def _pending(self) -> int:
+        # Appelé avec self._lock
+        return sum(1 for slot in self._slots.values() if not slot.cancelled)
+
+    def pending_action(self, device_id: int):
+        """
+        Action en attente de reprise pour un périphérique, ou None.
+        """
+        with self._lock:
+            slot = self._slots.get(device_id)
+            return slot.action if slot is not None and not slot.cancelled else None
+
+    def device_lock(self, device_id: int) -> threading.Lock:
+        """
+        Verrou des envois d'un périphérique : à tenir pendant un envoi direct et
+        l'annulation ou la mise en reprise qui le suit.
+        """
+        lock = self._device_locks.get(device_id)
+        if lock is None:
+            with self._lock:
+                lock = self._device_locks.setdefault(device_id, threading.Lock())
+        return lock
+
+    def submit(self, device_id: int, action: str, retry_after: float = 0.0) -> None:
+        """
+        Met en reprise l'état souhaité d'un périphérique (remplace l'état précédent).
+
+        Args:
+            retry_after (float): Délai minimum avant la tentative (ex. fin du circuit ouvert).
+        """
+        with self._lock:
+            slot = self._slots.get(device_id)
+            if slot is None:
+                slot = self._slots[device_id] = _RetrySlot()
+            slot.action = action
+            slot.expires_at = self.clock() + self.ttl
+            slot.version += 1
+            slot.cancelled = False
+            self.scheduled += 1
+            if slot.handle is None and not slot.in_flight:
+                self._schedule(device_id, slot, retry_after)
+
+    def cancel(self, device_id: int) -> None:
+        """
+        Abandonne la reprise d'un périphérique (un envoi plus récent a réussi).
+
+        Une tentative déjà lancée garde son emplacement, marqué annulé : elle ne
+        s'envoie pas si elle n'a pas encore obtenu le verrou du périphérique.
+        """
+        with self._lock:
+            slot = self._slots.get(device_id)
+            if slot is None:
+                return
+            if slot.handle is not None:
+                slot.handle.cancel()
+                slot.handle = None
+            if slot.in_flight:
+                slot.cancelled = True
+                slot.version += 1
+            else:
+                del self._slots[device_id]
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * (1 - self.jitter * self.rng.random())
+
+    def _schedule(self, device_id: int, slot: _RetrySlot, minimum: float = 0.0) -> None:
+        # Appelé avec self._lock
+        slot.handle = self.scheduler.call_later(max(self._delay(slot.attempt), minimum), self._fire, device_id)
+
+    def _fire(self, device_id: int) -> None:
+        with self._lock:
+            slot = self._slots.get(device_id)
+            if slot is None:
+                return
+            slot.handle = None
+            if self.clock() >= slot.expires_at:
+                del self._slots[device_id]
+                self.expired += 1
+                logger.warning(f"Reprise abandonnée pour le périphérique {device_id} ({slot.action}) : délai dépassé")
+                return
+            slot.in_flight = True
+            action, version = slot.action, slot.version
+        self._executor.submit(self._attempt, device_id, action, version)
+
+    def _attempt(self, device_id: int, action: str, version: int) -> None:
+        with self.device_lock(device_id):
+            with self._lock:
+                slot = self._slots.get(device_id)
+                if slot is None or slot.cancelled:
+                    # Un envoi direct a réussi pendant l'attente du verrou
+                    self._slots.pop(device_id, None)
+                    return
+                # Dernier état souhaité, peut-être plus récent qu'à l'échéance
+                action, version = slot.action, slot.version
+            try:
+                result = self.send(device_id, action)
+            except Exception as e:
+                logger.exception(f"Erreur lors de la reprise pour le périphérique {device_id} : {e}")
+                result = {"status": "error", "message": str(e)}
+            self._attempted(device_id, action, version, result)
+
+    def _attempted(self, device_id: int, action: str, version: int, result: dict) -> None:
+        with self._lock:
+            slot = self._slots.get(device_id)
+            if slot is None:
+                return
+            slot.in_flight = False
+            if slot.cancelled:
+                del self._slots[device_id]
+                return
+            if result.get("status") == "success":
+                if slot.version == version:
+                    del self._slots[device_id]
+                    self.sent += 1
+                    logger.info(f"Reprise réussie : {action} envoyé au périphérique {device_id}")
+                    return
+                # Un état plus récent est arrivé pendant l'envoi : on l'envoie sans attendre
+                self.sent += 1
+                slot.attempt = 0
+                slot.handle = self.scheduler.call_later(0, self._fire, device_id)
+            elif is_retryable(result):
+                slot.attempt += 1
+                self._schedule(device_id, slot, result.get("retry_after") or 0.0)
+            else:
+                del self._slots[device_id]
+                self.dropped += 1
+                logger.warning(f"Reprise abandonnée pour le périphérique {device_id} : {result}")
@@ -0,0 +1,242 @@
+"""
+reverse_channel.py
+
+Canal retour HC3 → IPX800 : un changement d'état d'un périphérique HC3 est recopié
+sur les relais IPX800 déclarés dans le mapping ("ipx_output").
+
+Les changements arrivent soit par le miroir HC3 (long-polling refreshStates, voir
+services/state_mirror.py), soit par la route /hc3-event appelée depuis une scène
+de la HC3 (authentifiée par INBOUND_TOKEN, comme les requêtes de l'IPX800). Un thread unique pilote l'IPX800 ; pour un même relais, seul le dernier
+état demandé est envoyé.
+
+Anti-boucle, dans les deux sens (clé : ID Fibaro, durée REVERSE_ECHO_TTL) :
+  - une commande envoyée à la HC3 par le pont revient en changement refreshStates :
+    elle n'est pas recopiée vers l'IPX800 ;
+  - un relais piloté par le canal retour déclenche un événement /ipx-event de
+    l'IPX800 : il n'est pas renvoyé à la HC3.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Dict
+
+import config
+from services.device_mapping import get_ipx_outputs
+from services.ipx_client import IPXClient, get_ipx_client
+from services.logger_service import logger
+from services import metrics
+from services.state_mirror import get_state_mirror, value_is_on
+
+REVERSE_CHANGES = metrics.counter("fibaro_reverse_changes_total",
+                                  "Changements HC3 reçus par le canal retour, par suite donnée", ("result",))
+
+
+class EchoGuard:
+    """
+    États attendus en retour d'une commande, par clé.
+
+    Args:
+        ttl (float): Durée (s) pendant laquelle un écho est attendu.
+        clock (Callable): Horloge monotone.
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._expected: Dict[object, list] = {}
+        self._lock = threading.Lock()
+
+    def expect(self, key, on: bool) -> None:
+        """
+        Annonce un écho (on/off) pour la clé ; plusieurs annonces du même état s'additionnent.
+        """
+        with self._lock:
+            now = self.clock()
+            entry = self._expected.get(key)
+            if entry is not None and entry[0] == on and entry[2] > now:
+                entry[1] += 1
+                entry[2] = now + self.ttl
+            else:
+                self._expected[key] = [on, 1, now + self.ttl]
+
+    def consume(self, key, on: bool) -> bool:
+        """
+        Indique si cet état est un écho attendu (et le retire).
+        """
+        with self._lock:
+            entry = self._expected.get(key)
+            if entry is None:
+                return False
+            if entry[2] <= self.clock() or entry[0] != on:
+                del self._expected[key]
+                return False
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._expected[key]
+            return True
+
+    def forget(self, key) -> None:
+        with self._lock:
+            self._expected.pop(key, None)
+
+
+class ReverseChannel:
+    """
+    Recopie des changements HC3 sur les relais IPX800.
+
+    Args:
+        client (IPXClient): Client de l'IPX800.
+        echo_ttl (float): Durée (s) pendant laquelle l'écho d'une commande est ignoré.
+    """
+
+    def __init__(self, client: IPXClient, echo_ttl: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        # Commandes envoyées à la HC3 par le pont, attendues en retour dans refreshStates
+        self.hc3_echoes = EchoGuard(echo_ttl, clock)
+        # Relais pilotés par le canal retour, attendus en retour dans /ipx-event
+        self.ipx_echoes = EchoGuard(echo_ttl, clock)
+        self.counts = {"received": 0, "pushed": 0, "echo": 0, "unmapped": 0, "failed": 0}
+        self._pending: Dict[int, tuple] = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listening = False
+
+    def expect_hc3_echo(self, device_id: int, on: bool) -> None:
+        """
+        À appeler avant l'envoi d'une commande on/off à la HC3.
+        """
+        self.hc3_echoes.expect(device_id, on)
+
+    def forget_hc3_echo(self, device_id: int) -> None:
+        """
+        À appeler si la HC3 n'a pas accepté la commande annoncée.
+        """
+        self.hc3_echoes.forget(device_id)
+
+    def is_ipx_echo(self, device_id: int, on: bool) -> bool:
+        """
+        Indique si un événement IPX800 est l'écho d'un relais piloté par le canal retour.
+        """
+        return self.ipx_echoes.consume(device_id, on)
+
+    def on_change(self, device_id: int, value) -> None:
+        """
+        Changement d'état HC3 (abonné du miroir ou /hc3-event) : met les relais recopiés en file.
+        """
+        on = value_is_on(value)
+        self._count("received")
+        if self.hc3_echoes.consume(device_id, on):
+            self._count("echo")
+            return
+        outputs = get_ipx_outputs(device_id)
+        if not outputs:
+            self._count("unmapped")
+            return
+        with self._lock:
+            for relay in outputs:
+                if relay not in self._pending:
+                    self._queue.put(relay)
+                # Le dernier état demandé l'emporte si le relais est déjà en file
+                self._pending[relay] = (device_id, on)
+
+    def apply_changes(self, changes) -> int:
+        """
+        Applique une liste de changements ({"id": ..., "value": ...}), ex. reçus par webhook.
+
+        Returns:
+            int: Nombre de changements valides.
+        """
+        applied = 0
+        for change in changes:
+            if not isinstance(change, dict) or "id" not in change or "value" not in change:
+                continue
+            self.on_change(change["id"], change["value"])
+            applied += 1
+        return applied
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts, pending=len(self._pending))
+
+    def start(self, source: str = "poll") -> "ReverseChannel":
+        """
+        Démarre le thread d'envoi ; avec source="poll", s'abonne au miroir HC3 et le démarre.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ipx-reverse", daemon=True)
+            self._thread.start()
+        if source == "poll":
+            mirror = get_state_mirror()
+            if not self._listening:
+                self._listening = True
+                mirror.add_listener(self.on_change)
+            mirror.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Arrête le thread d'envoi (et le suivi refreshStates qu'il avait démarré).
+        """
+        if self._listening:
+            get_state_mirror().stop()
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread = None
+
+    def _count(self, result: str) -> None:
+        REVERSE_CHANGES.labels(result).inc()
+        with self._lock:
+            self.counts[result] += 1
+
+    def _run(self) -> None:
+        while True:
+            relay = self._queue.get()
+            if relay is None:
+                return
+            with self._lock:
+                device_id, on = self._pending.pop(relay)
+            # Annoncé avant l'envoi : l'IPX800 peut notifier le pont avant de répondre
+            self.ipx_echoes.expect(device_id, on)
+            result = self.client.set_output(relay, on)
+            if result["status"] == "success":
+                self._count("pushed")
+                logger.info(f"Canal retour : relais IPX {relay} {'allumé' if on else 'éteint'} (HC3 {device_id})")
+            else:
+                self.ipx_echoes.forget(device_id)
+                self._count("failed")
+
+
+# Canal retour partagé, créé au premier appel.
+_channel = None
+_channel_lock = threading.Lock()
+
+
+def get_reverse_channel() -> ReverseChannel:
+    """
+    Retourne le canal retour partagé (non démarré : voir start()).
+    """
+    global _channel
+    if _channel is None:
+        with _channel_lock:
+            if _channel is None:
+                _channel = ReverseChannel(get_ipx_client(), echo_ttl=config.REVERSE_ECHO_TTL)
+    return _channel
+
+
+def set_reverse_channel(channel: ReverseChannel) -> None:
+    """
+    Remplace le canal retour partagé (ex. pour piloter un IPX800 de test).
+    """
+    global _channel
+    with _channel_lock:
+        if _channel is not None and _channel is not channel:
+            _channel.stop()
+        _channel = channel
@@ -0,0 +1,497 @@
+"""
+rules.py
+
+Moteur de règles sur les événements IPX800.
+
+Les règles sont décrites dans un fichier JSON (services/rules.json par défaut) :
+
+  {"rules": [
+    {"name": "congelateur_coupe",
+     "when": {"device": "ipx_congelateur", "etat": "off", "for": 120},
+     "then": [{"sms": true}, {"action": "turnOn", "device": 45}]},
+    {"name": "entree_x",
+     "when": {"device": "ipx_entree_x", "etat": "on"},
+     "then": [{"action": "turnOn", "device": 30}, {"action": "turnOn", "device": 31}]},
+    {"name": "portail_nuit",
+     "when": {"device": "ipx_portail", "etat": "on", "between": ["22:00", "06:00"]},
+     "then": [{"action": "turnOn", "device": 50}, {"action": "turnOff", "device": 50, "delay": 300}]}
+  ]}
+
+"when" :
+  - "device" : nom logique IPX (celui envoyé par l'IPX800, mappé ou non vers la HC3) ;
+  - "etat" : "on", "off", "any" ou un autre état normalisé (ex. "nuit") ;
+  - "for" (optionnel) : secondes pendant lesquelles l'état doit se maintenir ; un
+    autre état du même périphérique avant l'échéance annule la règle ;
+  - "between" (optionnel) : plage horaire ["HH:MM", "HH:MM"], éventuellement à
+    cheval sur minuit, vérifiée à la réception de l'événement.
+
+"then" : opérations HC3 (format de services/fibaro_operations.py, "device" obligatoire
+pour une action) ou {"sms": true} (SMS d'alerte pour le périphérique déclencheur) /
+{"sms": "nom"}. "delay" (secondes) retarde une action.
+
+Le fichier est compilé en tables de répartition par (périphérique, état) : un
+événement est rapproché de ses règles par une seule recherche dans un dict, quel que
+soit le nombre de règles. Les maintiens ("for") et les délais passent par
+l'ordonnanceur partagé (services/scheduler.py), sans thread par minuterie ; les
+actions sont exécutées hors du thread de l'ordonnanceur.
+
+Le fichier est rechargé à chaud comme le mapping (date de modification) ; un fichier
+invalide laisse les règles précédentes en place. Une minuterie en cours retrouve sa
+règle par son nom à l'échéance : une règle supprimée entre-temps n'est pas exécutée.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+import config
+from services.logger_service import logger
+from services import metrics
+from services.scheduler import Scheduler, get_scheduler
+from services.fibaro_operations import parse_operation
+
+# Chemin par défaut vers le fichier de règles
+RULES_FILE = os.path.join(os.path.dirname(__file__), "rules.json")
+
+ANY = "any"
+
+RULES_EVENTS = metrics.counter("fibaro_rules_total", "Règles déclenchées, maintenues, annulées ou hors plage",
+                               ("outcome",))
+
+
+def etat_key(etat: Optional[str], action: Optional[str]) -> Optional[str]:
+    """
+    Clé d'état d'un événement pour les tables de règles : "on"/"off" pour un état
+    binaire (1, true, turnOn...), l'état normalisé sinon.
+    """
+    if action == "turnOn":
+        return "on"
+    if action == "turnOff":
+        return "off"
+    return etat
+
+
+def _minutes(value) -> int:
+    try:
+        hours, minutes = str(value).split(":")
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        raise ValueError(f"heure invalide : {value!r}")
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"heure invalide : {value!r}")
+    return hours * 60 + minutes
+
+
+class Rule:
+    """
+    Règle compilée.
+
+    Attributes:
+        steps (tuple): Étapes (délai, opérations HC3, noms à alerter par SMS), triées par délai.
+    """
+
+    __slots__ = ("name", "device", "etat", "hold", "window", "steps")
+
+    def __init__(self, name: str, device: str, etat: str, hold: float = 0.0,
+                 window: Optional[Tuple[int, int]] = None, steps: tuple = ()):
+        self.name = name
+        self.device = device
+        self.etat = etat
+        self.hold = hold
+        self.window = window
+        self.steps = steps
+
+    def in_window(self, minute: int) -> bool:
+        start, end = self.window
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end
+
+
+def compile_rule(spec, index: int = 0) -> Rule:
+    """
+    Compile la description JSON d'une règle.
+
+    Raises:
+        ValueError: Description invalide.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"règle invalide : {spec!r}")
+    name = spec.get("name") or f"regle_{index}"
+    when = spec.get("when")
+    if not isinstance(when, dict) or not isinstance(when.get("device"), str) or not when["device"]:
+        raise ValueError(f"{name} : \"when\" doit désigner un périphérique")
+    etat = str(when.get("etat", ANY)).strip().lower()
+    etat = etat_key(etat, {"1": "turnOn", "true": "turnOn", "0": "turnOff", "false": "turnOff"}.get(etat))
+
+    try:
+        hold = float(when.get("for", 0))
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} : durée \"for\" invalide")
+    if hold < 0 or (hold > 0 and etat == ANY):
+        raise ValueError(f"{name} : \"for\" demande un état précis et une durée positive")
+
+    window = None
+    if "between" in when:
+        between = when["between"]
+        if not isinstance(between, (list, tuple)) or len(between) != 2:
+            raise ValueError(f"{name} : \"between\" attend [\"HH:MM\", \"HH:MM\"]")
+        window = (_minutes(between[0]), _minutes(between[1]))
+
+    actions = spec.get("then")
+    if isinstance(actions, dict):
+        actions = [actions]
+    if not isinstance(actions, list) or not actions:
+        raise ValueError(f"{name} : \"then\" doit contenir au moins une action")
+
+    steps = {}
+    for action in actions:
+        if not isinstance(action, dict):
+            raise ValueError(f"{name} : action invalide : {action!r}")
+        try:
+            delay = float(action.get("delay", 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} : délai invalide : {action!r}")
+        if delay < 0:
+            raise ValueError(f"{name} : délai invalide : {action!r}")
+        operations, alerts = steps.setdefault(delay, ([], []))
+        if "sms" in action:
+            target = action["sms"]
+            if target is True:
+                alerts.append(when["device"])
+            elif isinstance(target, str) and target:
+                alerts.append(target)
+            else:
+                raise ValueError(f"{name} : destinataire SMS invalide : {action!r}")
+            continue
+        if "action" in action and "device" not in action:
+            raise ValueError(f"{name} : une action HC3 doit préciser \"device\"")
+        try:
+            operations.append(parse_operation({k: v for k, v in action.items() if k != "delay"}, None))
+        except ValueError as e:
+            raise ValueError(f"{name} : {e}")
+
+    return Rule(name, when["device"], etat, hold, window,
+                tuple((delay, tuple(ops), tuple(alerts)) for delay, (ops, alerts) in sorted(steps.items())))
+
+
+class RuleSet:
+    """
+    Règles compilées en tables de répartition (instantané immuable).
+
+    Attributes:
+        table (dict): (périphérique, état) → règles.
+        any_table (dict): périphérique → règles valables pour tout état.
+        holds (dict): périphérique → règles à maintien ("for"), pour les annuler.
+        by_name (dict): nom → règle, pour les minuteries en cours.
+    """
+
+    def __init__(self, rules: Tuple[Rule, ...] = (), version: int = 0):
+        table, any_table, holds = {}, {}, {}
+        for rule in rules:
+            if rule.etat == ANY:
+                any_table.setdefault(rule.device, []).append(rule)
+            else:
+                table.setdefault((rule.device, rule.etat), []).append(rule)
+            if rule.hold:
+                holds.setdefault(rule.device, []).append(rule)
+        self.table = {key: tuple(value) for key, value in table.items()}
+        self.any_table = {key: tuple(value) for key, value in any_table.items()}
+        self.holds = {key: tuple(value) for key, value in holds.items()}
+        self.by_name = {rule.name: rule for rule in rules}
+        self.devices = frozenset(rule.device for rule in rules)
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+
+def build_ruleset(data, version: int = 0) -> RuleSet:
+    """
+    Compile le contenu du fichier de règles ({"rules": [...]} ou une liste).
+
+    Raises:
+        ValueError: Règle invalide ou nom en double.
+    """
+    specs = data.get("rules") if isinstance(data, dict) else data
+    if not isinstance(specs, list):
+        raise ValueError("le fichier doit contenir une liste \"rules\"")
+    rules = [compile_rule(spec, i) for i, spec in enumerate(specs)]
+    names = set()
+    for rule in rules:
+        if rule.name in names:
+            raise ValueError(f"nom de règle en double : {rule.name}")
+        names.add(rule.name)
+    return RuleSet(tuple(rules), version)
+
+
+class RulesRegistry:
+    """
+    Fichier de règles rechargeable à chaud (même principe que MappingRegistry).
+
+    Args:
+        path (str): Chemin du fichier JSON.
+    """
+
+    def __init__(self, path: str = RULES_FILE):
+        self.path = path
+        self.ruleset = RuleSet()
+        self.last_error = None
+        self._stamp = None
+        self._failed_stamp = None
+        self._lock = threading.Lock()
+        self._watch_interval = 0.0
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self) -> bool:
+        """
+        Lit et compile le fichier ; remplace les règles courantes s'il est valide.
+
+        Returns:
+            bool: True si de nouvelles règles ont été installées.
+        """
+        with self._lock:
+            try:
+                stamp = self._file_stamp()
+                with open(self.path, "r", encoding="utf-8") as f:
+                    ruleset = build_ruleset(json.load(f), self.ruleset.version + 1)
+            except FileNotFoundError:
+                self.last_error = f"Fichier de règles non trouvé : {self.path}"
+                logger.warning(self.last_error)
+                return False
+            except (json.JSONDecodeError, ValueError) as e:
+                self.last_error = f"Règles invalides, version précédente conservée : {e}"
+                if stamp != self._failed_stamp:
+                    logger.error(self.last_error)
+                self._failed_stamp = stamp
+                return False
+
+            self.ruleset = ruleset
+            self._stamp = stamp
+            self._failed_stamp = None
+            self.last_error = None
+            logger.info(f"Règles chargées (version {ruleset.version}) : {len(ruleset)} règles")
+            return True
+
+    def reload_if_changed(self) -> bool:
+        """
+        Recharge le fichier si sa date de modification ou sa taille a changé.
+        """
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            return False
+        if stamp == self._stamp or stamp == self._failed_stamp:
+            return False
+        return self.load()
+
+    def watch(self, interval: float) -> None:
+        """
+        Vérifie le fichier toutes les `interval` secondes via l'ordonnanceur partagé.
+        """
+        if interval <= 0 or self._watch_interval > 0:
+            return
+        self._watch_interval = interval
+        get_scheduler().call_later(interval, self._watch_tick)
+
+    def _watch_tick(self) -> None:
+        try:
+            self.reload_if_changed()
+        finally:
+            get_scheduler().call_later(self._watch_interval, self._watch_tick)
+
+
+class RuleEngine:
+    """
+    Rapproche les événements IPX des règles et planifie leurs actions.
+
+    Args:
+        registry (RulesRegistry): Règles courantes.
+        execute (Callable): Fonction (opérations, noms à alerter) qui exécute une étape ;
+            appelée dans un pool de threads (défaut : HC3 puis SMS d'alerte).
+        scheduler (Scheduler): Ordonnanceur des maintiens et délais (défaut : partagé).
+        now (Callable): Heure locale, pour les plages horaires.
+    """
+
+    def __init__(self, registry: RulesRegistry, execute: Callable[[tuple, tuple], None] = None,
+                 scheduler: Scheduler = None, now: Callable[[], datetime] = datetime.now):
+        self.registry = registry
+        self.execute = execute or execute_step
+        self.scheduler = scheduler or get_scheduler()
+        self.now = now
+        # Maintiens en cours : nom de règle → (jeton, minuterie)
+        self._holds = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def handles(self, ipx_name: str) -> bool:
+        """
+        Indique si des règles portent sur ce périphérique.
+        """
+        return ipx_name in self.registry.ruleset.devices
+
+    def pending(self) -> int:
+        """
+        Nombre de maintiens ("for") en attente d'échéance.
+        """
+        with self._lock:
+            return len(self._holds)
+
+    def on_event(self, ipx_name: str, etat: Optional[str]) -> int:
+        """
+        Applique les règles d'un événement.
+
+        Args:
+            ipx_name (str): Nom logique du périphérique IPX.
+            etat (str): Clé d'état (voir etat_key).
+
+        Returns:
+            int: Nombre de règles déclenchées ou armées.
+        """
+        ruleset = self.registry.ruleset
+        holds = ruleset.holds.get(ipx_name)
+        if holds:
+            self._cancel_holds(holds, etat)
+        rules = ruleset.table.get((ipx_name, etat), ()) + ruleset.any_table.get(ipx_name, ())
+        if not rules:
+            return 0
+
+        minute = None
+        fired = 0
+        for rule in rules:
+            if rule.window is not None:
+                if minute is None:
+                    now = self.now()
+                    minute = now.hour * 60 + now.minute
+                if not rule.in_window(minute):
+                    RULES_EVENTS.labels("out_of_window").inc()
+                    continue
+            if rule.hold:
+                self._arm_hold(rule)
+            else:
+                self._run(rule)
+            fired += 1
+        return fired
+
+    def _cancel_holds(self, holds: Tuple[Rule, ...], etat: Optional[str]) -> None:
+        with self._lock:
+            for rule in holds:
+                if rule.etat != etat and rule.name in self._holds:
+                    self._holds.pop(rule.name)[1].cancel()
+                    RULES_EVENTS.labels("cancelled").inc()
+                    logger.info(f"Règle {rule.name} annulée : {rule.device} n'est plus {rule.etat}")
+
+    def _arm_hold(self, rule: Rule) -> None:
+        with self._lock:
+            # Un état répété ne repousse pas l'échéance
+            if rule.name in self._holds:
+                return
+            token = object()
+            self._holds[rule.name] = (token, self.scheduler.call_later(rule.hold, self._hold_due, rule.name, token))
+        RULES_EVENTS.labels("held").inc()
+
+    def _hold_due(self, name: str, token: object) -> None:
+        with self._lock:
+            entry = self._holds.get(name)
+            if entry is None or entry[0] is not token:
+                return
+            del self._holds[name]
+        rule = self.registry.ruleset.by_name.get(name)
+        if rule is not None:
+            logger.info(f"Règle {name} : {rule.device} {rule.etat} depuis {rule.hold:g} s")
+            self._run(rule)
+
+    def _run(self, rule: Rule) -> None:
+        RULES_EVENTS.labels("fired").inc()
+        for index, (delay, _, _) in enumerate(rule.steps):
+            if delay > 0:
+                self.scheduler.call_later(delay, self._step_due, rule.name, index, rule.steps)
+            else:
+                self._submit(rule, index)
+
+    def _step_due(self, name: str, index: int, steps: tuple) -> None:
+        # Règle supprimée ou étapes modifiées depuis la planification : l'index ne désigne
+        # plus la même étape, elle est abandonnée
+        rule = self.registry.ruleset.by_name.get(name)
+        if rule is None or rule.steps != steps:
+            RULES_EVENTS.labels("cancelled").inc()
+            logger.info(f"Règle {name} : étape différée abandonnée, règle modifiée ou supprimée depuis")
+            return
+        self._submit(rule, index)
+
+    def _submit(self, rule: Rule, index: int) -> None:
+        _, operations, alerts = rule.steps[index]
+        # Appels HC3 et SMS : jamais dans le thread de l'ordonnanceur ni dans la requête
+        self._get_executor().submit(self._execute, rule.name, operations, alerts)
+
+    def _execute(self, name: str, operations: tuple, alerts: tuple) -> None:
+        try:
+            self.execute(operations, alerts)
+        except Exception as e:
+            logger.exception(f"Erreur lors de l'exécution de la règle {name} : {e}")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rules")
+        return self._executor
+
+
+def execute_step(operations: tuple, alerts: tuple) -> None:
+    """
+    Exécute une étape de règle : opérations HC3 en lot, puis SMS d'alerte (cooldown compris).
+    """
+    if operations:
+        from services.fibaro_service import execute_operations
+        for operation, result in zip(operations, execute_operations(list(operations))):
+            if result.get("status") not in ("success", "superseded"):
+                logger.error(f"Règle : échec de {operation.label} : {result.get('message')}")
+    if alerts:
+        from avertissements.ipx_alarms import send_sms_alert
+        for device in alerts:
+            send_sms_alert(device)
+
+
+# Moteur partagé, créé au premier appel.
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_rule_engine() -> RuleEngine:
+    """
+    Retourne le moteur de règles partagé (fichier RULES_FILE chargé au premier appel).
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                registry = RulesRegistry(config.RULES_FILE or RULES_FILE)
+                registry.load()
+                _engine = RuleEngine(registry)
+    return _engine
+
+
+def set_rule_engine(engine: Optional[RuleEngine]) -> None:
+    """
+    Remplace le moteur partagé (tests, bancs d'essai).
+    """
+    global _engine
+    with _engine_lock:
+        _engine = engine
+
+
+def start_watching() -> None:
+    """
+    Charge les règles et active leur rechargement à chaud (RULES_RELOAD_INTERVAL).
+    """
+    get_rule_engine().registry.watch(config.RULES_RELOAD_INTERVAL)
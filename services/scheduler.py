@@ -0,0 +1,159 @@
+"""
+scheduler.py
+
+Ordonnanceur de minuteries partagé par tout le processus.
+
+Un seul thread et un tas (heapq) trié par échéance : planifier un délai ne crée ni
+thread ni threading.Timer. Les callbacks doivent rester courts (ils s'exécutent dans
+le thread de l'ordonnanceur) ; un appel lent vers la HC3 doit être délégué.
+
+L'horloge est injectable et run_due() permet de faire avancer le temps à la main,
+sans thread, pour rejouer des scénarios avec une horloge simulée.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+from services.logger_service import logger
+
+
+class TimerHandle:
+    """
+    Minuterie planifiée, annulable via cancel().
+    """
+
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Exécute des callbacks à une échéance donnée depuis un thread unique.
+
+    Args:
+        clock (Callable): Horloge monotone utilisée pour les échéances.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def call_at(self, when: float, callback: Callable, *args) -> TimerHandle:
+        """
+        Planifie callback(*args) à l'instant `when` (même référence que clock()).
+        """
+        handle = TimerHandle(when, callback, args)
+        with self._cond:
+            heapq.heappush(self._heap, (when, next(self._counter), handle))
+            # Réveil du thread seulement si cette échéance devient la plus proche
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """
+        Planifie callback(*args) dans `delay` secondes.
+        """
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def pending(self) -> int:
+        """
+        Nombre de minuteries en attente (annulées comprises).
+        """
+        with self._cond:
+            return len(self._heap)
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """
+        Exécute les minuteries échues à `now` (défaut : clock()) dans le thread appelant.
+
+        Returns:
+            int: Nombre de callbacks exécutés.
+        """
+        count = 0
+        while True:
+            with self._cond:
+                current = self.clock() if now is None else now
+                if not self._heap or self._heap[0][0] > current:
+                    return count
+                _, _, handle = heapq.heappop(self._heap)
+            if not handle.cancelled:
+                self._execute(handle)
+                count += 1
+
+    def start(self) -> "Scheduler":
+        """
+        Démarre le thread de l'ordonnanceur (sans effet s'il tourne déjà).
+        """
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _execute(self, handle: TimerHandle) -> None:
+        try:
+            handle.callback(*handle.args)
+        except Exception as e:
+            logger.exception(f"Erreur dans une minuterie planifiée : {e}")
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - self.clock()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+                _, _, handle = heapq.heappop(self._heap)
+            if not handle.cancelled:
+                self._execute(handle)
+
+
+# Ordonnanceur partagé, démarré au premier appel.
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """
+    Retourne l'ordonnanceur partagé par le processus.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler().start()
+    return _scheduler
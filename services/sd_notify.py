@@ -0,0 +1,101 @@
+"""
+sd_notify.py
+
+Notifications systemd (protocole sd_notify), sans dépendance externe.
+
+Sous systemd avec Type=notify, la variable NOTIFY_SOCKET désigne la socket où
+envoyer READY=1 (démarrage terminé) ; avec WatchdogSec=, WATCHDOG_USEC donne le
+délai au-delà duquel systemd relance le service s'il n'a pas reçu WATCHDOG=1.
+Hors systemd, ces fonctions ne font rien.
+
+Le battement du watchdog passe par l'ordonnanceur partagé et n'est envoyé que si
+la fonction `alive` le confirme : un pont bloqué n'est plus signalé vivant.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import os
+import socket
+from typing import Callable, Optional
+
+import config
+from services.logger_service import logger
+from services.scheduler import get_scheduler
+
+
+def notify(message: str) -> bool:
+    """
+    Envoie un message à systemd (ex. "READY=1", "WATCHDOG=1", "STATUS=...").
+
+    Returns:
+        bool: True si le message a été envoyé.
+    """
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not config.SD_NOTIFY or not address:
+        return False
+    # Socket de l'espace de noms abstrait (Linux) : "@" remplacé par un octet nul
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(message.encode())
+        return True
+    except OSError as e:
+        logger.warning(f"Notification systemd impossible ({message}) : {e}")
+        return False
+
+
+def watchdog_interval() -> Optional[float]:
+    """
+    Délai (s) du watchdog systemd pour ce processus, ou None s'il n'est pas actif.
+
+    Sous gunicorn, systemd surveille le maître (WATCHDOG_PID) mais l'application
+    tourne dans ses workers : un worker dont le parent est le processus surveillé
+    bat pour lui (NotifyAccess=all dans l'unité systemd).
+    """
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not config.SD_NOTIFY or not usec:
+        return None
+    if pid and pid not in (str(os.getpid()), str(os.getppid())):
+        return None
+    try:
+        return int(usec) / 1_000_000
+    except ValueError:
+        return None
+
+
+# Démarré une seule fois par processus
+_watchdog_started = False
+
+
+def start_watchdog(alive: Callable[[], bool] = lambda: True) -> bool:
+    """
+    Envoie WATCHDOG=1 deux fois par délai du watchdog, tant que alive() est vrai.
+
+    Returns:
+        bool: True si le watchdog systemd est actif pour ce processus.
+    """
+    global _watchdog_started
+    interval = watchdog_interval()
+    if interval is None or _watchdog_started:
+        return interval is not None
+    _watchdog_started = True
+
+    confirmed = [True]
+
+    def beat() -> None:
+        try:
+            ok = alive()
+            if ok:
+                notify("WATCHDOG=1")
+            elif confirmed[0]:
+                logger.error("Watchdog systemd non confirmé : la sonde de santé ne répond plus")
+            confirmed[0] = ok
+        finally:
+            get_scheduler().call_later(interval / 2, beat)
+
+    get_scheduler().call_later(0, beat)
+    logger.info(f"Watchdog systemd actif : battement toutes les {interval / 2:.1f}s")
+    return True
@@ -0,0 +1,200 @@
+"""
+state_mirror.py
+
+Miroir en mémoire de l'état des périphériques de la Fibaro HC3.
+
+Au démarrage, un chargement complet de /api/devices remplit le miroir ; ensuite un
+thread suit l'API de long-polling /api/refreshStates avec le curseur `last` et
+applique les changements au fil de l'eau. Les lectures (get, is_on) ne font aucun
+appel réseau.
+
+Le miroir utilise son propre client Fibaro : la requête de long-polling reste
+ouverte plusieurs dizaines de secondes et ne doit pas occuper le pool des commandes.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import config
+from services.fibaro_service import FibaroClient
+from services.logger_service import logger
+
+
+def value_is_on(value) -> bool:
+    """
+    Interprète la valeur HC3 d'un périphérique (booléen, niveau 0-99, texte) comme allumé/éteint.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value > 0
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("true", "on"):
+            return True
+        try:
+            return float(text) > 0
+        except ValueError:
+            return False
+    return False
+
+
+class DeviceStateMirror:
+    """
+    Copie locale de la propriété `value` de chaque périphérique HC3.
+
+    Args:
+        client (FibaroClient): Client dédié au miroir.
+        poll_timeout (float): Timeout de lecture d'une requête refreshStates, en secondes.
+        retry_delay (float): Attente avant une nouvelle tentative après une erreur.
+    """
+
+    def __init__(self, client: FibaroClient, poll_timeout: float = 35.0, retry_delay: float = 5.0):
+        self.client = client
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self.last = 0
+        self.ready = False
+        self.updated_at = 0.0
+        self._values = {}
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, device_id: int):
+        """
+        Retourne la dernière valeur connue d'un périphérique, ou None.
+        """
+        return self._values.get(device_id)
+
+    def is_on(self, device_id: int) -> Optional[bool]:
+        """
+        Retourne True/False selon l'état connu, ou None si le miroir ne le connaît pas.
+        """
+        if not self.ready or device_id not in self._values:
+            return None
+        return value_is_on(self._values[device_id])
+
+    def snapshot(self) -> Dict[int, object]:
+        """
+        Copie de toutes les valeurs connues.
+        """
+        return dict(self._values)
+
+    def add_listener(self, listener: Callable[[int, object], None]) -> None:
+        """
+        Enregistre une fonction appelée (device_id, valeur) à chaque changement reçu.
+        """
+        self._listeners.append(listener)
+
+    def load(self) -> None:
+        """
+        Chargement complet de /api/devices.
+
+        Raises:
+            RuntimeError: La HC3 a répondu avec une erreur.
+        """
+        code, devices = self.client.get_json("/devices")
+        if code != 200 or not isinstance(devices, list):
+            raise RuntimeError(f"Chargement /devices impossible (HTTP {code})")
+        for device in devices:
+            properties = device.get("properties") or {}
+            if "id" in device and "value" in properties:
+                self._values[device["id"]] = properties["value"]
+        self.ready = True
+        self.updated_at = time.time()
+        logger.info(f"Miroir HC3 chargé : {len(self._values)} périphériques")
+
+    def poll_once(self) -> int:
+        """
+        Une requête de long-polling refreshStates à partir du curseur courant.
+
+        Returns:
+            int: Nombre de changements appliqués.
+        """
+        code, data = self.client.get_json("/refreshStates", params={"last": self.last},
+                                          read_timeout=self.poll_timeout)
+        if code != 200 or not isinstance(data, dict):
+            raise RuntimeError(f"refreshStates en erreur (HTTP {code})")
+        applied = self.apply_changes(data.get("changes") or [])
+        self.last = data.get("last", self.last)
+        self.updated_at = time.time()
+        return applied
+
+    def apply_changes(self, changes) -> int:
+        """
+        Applique une liste de changements refreshStates ({"id": ..., "value": ...}).
+        """
+        applied = 0
+        for change in changes:
+            if "id" not in change or "value" not in change:
+                continue
+            device_id, value = change["id"], change["value"]
+            self._values[device_id] = value
+            applied += 1
+            for listener in self._listeners:
+                try:
+                    listener(device_id, value)
+                except Exception as e:
+                    logger.exception(f"Erreur dans un abonné du miroir HC3 : {e}")
+        return applied
+
+    def start(self) -> "DeviceStateMirror":
+        """
+        Démarre le thread de chargement puis de suivi (sans effet s'il tourne déjà).
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="hc3-state-mirror", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self.ready:
+                    self.load()
+                self.poll_once()
+            except Exception as e:
+                # Après une coupure, on ne peut plus faire confiance au miroir : rechargement complet
+                self.ready = False
+                self.last = 0
+                logger.warning(f"Miroir HC3 indisponible, nouvelle tentative dans {self.retry_delay}s : {e}")
+                self._stop.wait(self.retry_delay)
+
+
+# Miroir partagé, créé au premier appel.
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_state_mirror() -> DeviceStateMirror:
+    """
+    Retourne le miroir d'états partagé (non démarré : voir start()).
+    """
+    global _mirror
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = DeviceStateMirror(FibaroClient(pool_size=1),
+                                            poll_timeout=config.STATE_MIRROR_POLL_TIMEOUT,
+                                            retry_delay=config.STATE_MIRROR_RETRY_DELAY)
+    return _mirror
+
+
+def set_state_mirror(mirror: DeviceStateMirror) -> None:
+    """
+    Remplace le miroir partagé (ex. pour suivre une HC3 de test).
+    """
+    global _mirror
+    with _mirror_lock:
+        if _mirror is not None and _mirror is not mirror:
+            _mirror.stop()
+        _mirror = mirror
@@ -0,0 +1,251 @@
+"""
+hc3.py
+
+Fausse Fibaro HC3 locale utilisée par les benchmarks et par le mode simulateur
+(USE_SIMULATOR, voir start_simulated_hc3()).
+
+Le serveur parle HTTP/1.1 (keep-alive) et imite les API utilisées par le pont :
+  - /api/callAction : 200 + JSON, met à jour l'état du périphérique (turnOn,
+    turnOff, setValue avec arg1) ;
+  - POST /api/scenes/<id>/execute : 202, exécution comptée dans `scenes` ;
+  - PUT /api/globalVariables/<nom> : 200, valeur conservée dans `variables` ;
+  - /api/devices : liste des périphériques et de leur propriété `value` ;
+  - /api/settings/info : informations de la box (sonde de disponibilité) ;
+  - /api/refreshStates?last=N : changements postérieurs au curseur N, avec attente
+    (long-polling) s'il n'y en a pas encore.
+
+Des changements "externes" (ex. un interrupteur actionné à la main) peuvent être
+injectés avec push_change(). Chaque appel reçu (hors refreshStates) est enregistré
+dans `recorded` : (méthode, chemin, corps JSON).
+
+Injection de pannes (modifiable à chaud) :
+  - latency      : HC3 lente, la commande est appliquée mais la réponse tarde
+                   (au-delà du timeout de lecture du client = timeouts) ;
+  - failure_rate : HC3 instable, proportion de réponses HTTP 503 ;
+  - down         : HC3 absente, la connexion est coupée sans réponse.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class _HC3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Sans TCP_NODELAY, Nagle + ACK retardé ajoutent ~40 ms par requête keep-alive.
+    disable_nagle_algorithm = True
+
+    def _send_json(self, code: int, data) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Le client a abandonné (timeout) : comme une vraie HC3, on ne s'en soucie pas
+            self.close_connection = True
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def _handle(self, method: str):
+        stub = self.server.stub
+        # Le client envoie un corps JSON même en GET : on le lit pour garder la connexion propre.
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/api/refreshStates":
+            last = int(query.get("last", ["0"])[0])
+            self._send_json(200, stub.refresh_states(last))
+            return
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+        if stub.record:
+            with stub.lock:
+                stub.recorded.append((method, url.path, payload))
+
+        if stub.down:
+            # Connexion coupée sans réponse : le client voit une erreur réseau
+            self.close_connection = True
+            return
+
+        if stub.failure_rate and stub.rng.random() < stub.failure_rate:
+            with stub.lock:
+                stub.failures += 1
+            self._send_json(503, {"message": "Service Unavailable"})
+            return
+
+        with stub.lock:
+            stub.calls += 1
+
+        if url.path == "/api/callAction":
+            device_id = payload.get("deviceID") or int(query.get("deviceID", ["0"])[0])
+            action = payload.get("name") or query.get("name", [""])[0]
+            if action in ("turnOn", "turnOff"):
+                stub.push_change(device_id, action == "turnOn")
+            elif action == "setValue":
+                stub.push_change(device_id, payload.get("arg1", query.get("arg1", [None])[0]))
+            # La commande est appliquée dès réception, seule la réponse tarde
+            if stub.latency:
+                time.sleep(stub.latency)
+            self._send_json(200, {"endTimestampMillis": int(time.time() * 1000), "message": "Accepted"})
+        elif method == "POST" and url.path.startswith("/api/scenes/") and url.path.endswith("/execute"):
+            scene_id = int(url.path.split("/")[3])
+            with stub.lock:
+                stub.scenes[scene_id] = stub.scenes.get(scene_id, 0) + 1
+            if stub.latency:
+                time.sleep(stub.latency)
+            self._send_json(202, {})
+        elif method == "PUT" and url.path.startswith("/api/globalVariables/"):
+            name = unquote(url.path[len("/api/globalVariables/"):])
+            with stub.lock:
+                stub.variables[name] = payload.get("value")
+            if stub.latency:
+                time.sleep(stub.latency)
+            self._send_json(200, {"name": name, "value": payload.get("value")})
+        elif url.path == "/api/devices":
+            if stub.latency:
+                time.sleep(stub.latency)
+            with stub.lock:
+                devices = [{"id": device_id, "name": f"device_{device_id}", "properties": {"value": value}}
+                           for device_id, value in stub.states.items()]
+            self._send_json(200, devices)
+        elif url.path == "/api/settings/info":
+            self._send_json(200, {"serialNumber": "HC3-STUB", "softVersion": "5.150.0"})
+        else:
+            self._send_json(404, {"message": "Not found"})
+
+    def log_message(self, format, *args):
+        # Pas de log par requête : on mesure le client, pas la console.
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # File d'attente de connexions assez longue pour les bancs à forte concurrence
+    request_queue_size = 1024
+
+
+class StubHC3:
+    """
+    HC3 simulée dans un thread, à démarrer avec start() et arrêter avec stop().
+
+    Args:
+        latency (float): Délai ajouté à chaque réponse (hors refreshStates), en secondes.
+        devices (dict): États initiaux {device_id: valeur}.
+        poll_hold (float): Durée maximale d'attente d'un refreshStates sans changement.
+        failure_rate (float): Proportion de réponses 503 (hors refreshStates).
+        seed (int): Graine du tirage des pannes.
+        record (bool): Enregistre chaque appel dans `recorded` (à couper pour un usage longue durée).
+        max_changes (int): Changements conservés pour refreshStates.
+    """
+
+    def __init__(self, latency: float = 0.0, devices: dict = None, poll_hold: float = 1.0,
+                 failure_rate: float = 0.0, seed: int = None, record: bool = True, max_changes: int = 10000):
+        self.latency = latency
+        self.poll_hold = poll_hold
+        self.failure_rate = failure_rate
+        self.down = False
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.states = dict(devices or {})
+        self.scenes = {}
+        self.variables = {}
+        self.record = record
+        self.recorded = []
+        self.changes = deque(maxlen=max_changes)
+        self.last = 1
+        self.lock = threading.Condition()
+        self._server = _StubServer(("127.0.0.1", 0), _HC3Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api"
+
+    def count(self, path: str = "/api/callAction") -> int:
+        """
+        Nombre d'appels enregistrés sur `path` (par défaut les commandes callAction).
+        """
+        with self.lock:
+            return sum(1 for _, recorded_path, _ in self.recorded if recorded_path == path)
+
+    def push_change(self, device_id: int, value) -> None:
+        """
+        Change l'état d'un périphérique et publie le changement pour refreshStates.
+        """
+        with self.lock:
+            self.states[device_id] = value
+            self.last += 1
+            self.changes.append((self.last, {"id": device_id, "value": value}))
+            self.lock.notify_all()
+
+    def refresh_states(self, last: int) -> dict:
+        deadline = time.monotonic() + self.poll_hold
+        with self.lock:
+            while self.last <= last and time.monotonic() < deadline:
+                self.lock.wait(deadline - time.monotonic())
+            changes = [change for cursor, change in self.changes if cursor > last]
+            return {"last": self.last, "status": "IDLE", "changes": changes,
+                    "timestamp": int(time.time())}
+
+    def start(self) -> "StubHC3":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# HC3 simulée du mode USE_SIMULATOR, démarrée par create_app().
+_simulated = None
+_simulated_lock = threading.Lock()
+
+
+def start_simulated_hc3() -> StubHC3:
+    """
+    Démarre la HC3 simulée (périphériques du mapping, éteints) et y dirige le pont
+    (config.FIBARO_BASE_URL) ; à appeler avant la création des clients HC3.
+    """
+    global _simulated
+    import config
+    from services.device_mapping import registry
+
+    with _simulated_lock:
+        if _simulated is None:
+            devices = {fibaro_id: False for fibaro_id in registry.snapshot.by_fibaro_id}
+            _simulated = StubHC3(latency=config.SIMULATOR_LATENCY, devices=devices,
+                                 failure_rate=config.SIMULATOR_FAILURE_RATE, record=False).start()
+            config.FIBARO_BASE_URL = _simulated.base_url
+        return _simulated
+
+
+def get_simulated_hc3():
+    """
+    Retourne la HC3 simulée du mode USE_SIMULATOR, ou None si elle n'est pas démarrée.
+    """
+    return _simulated
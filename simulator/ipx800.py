@@ -0,0 +1,120 @@
+"""
+ipx800.py
+
+Faux IPX800 (V4) local utilisé par les benchmarks du canal retour. Les événements
+envoyés par l'IPX800 au pont sont générés et rejoués par simulator/ipx_traces.py.
+
+  - /api/xdevices.json?key=...&SetR=NN / ClearR=NN : allume / éteint le relais NN,
+    répond {"status": "Success"} ({"status": "Error"} si la clé est fausse) ;
+  - chaque appel est enregistré dans `recorded` : (action, relais) ;
+  - si `push_url` est renseigné, chaque changement de relais est notifié comme le
+    fait l'IPX800 : GET <push_url>?relais=NN&etat=0|1, depuis un thread séparé.
+
+press() simule un relais actionné localement (bouton, scénario de l'IPX800).
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+
+class _IPXHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send_json(self, code: int, data) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path != "/api/xdevices.json":
+            self._send_json(404, {"status": "Error"})
+            return
+        if query.get("key", [""])[0] != stub.api_key:
+            self._send_json(200, {"product": "IPX800_V4", "status": "Error"})
+            return
+
+        for action, on in (("SetR", True), ("ClearR", False)):
+            if action in query:
+                relay = int(query[action][0])
+                with stub.lock:
+                    stub.recorded.append((action, relay))
+                stub.set_relay(relay, on)
+        self._send_json(200, {"product": "IPX800_V4", "status": "Success"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class StubIPX800:
+    """
+    Faux IPX800 à lancer dans un thread.
+
+    Args:
+        api_key (str): Clé attendue dans le paramètre `key`.
+        push_url (str): URL notifiée à chaque changement de relais (ex. "http://.../ipx-event").
+    """
+
+    def __init__(self, api_key: str = "apikey", push_url: str = None):
+        self.api_key = api_key
+        self.push_url = push_url
+        self.relays = {}
+        self.recorded = []
+        self.pushes = 0
+        self.lock = threading.Lock()
+        self._server = _StubServer(("127.0.0.1", 0), _IPXHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def set_relay(self, relay: int, on: bool) -> None:
+        """
+        Change l'état d'un relais ; un changement réel est notifié à push_url.
+        """
+        with self.lock:
+            changed = self.relays.get(relay) != on
+            self.relays[relay] = on
+        if changed and self.push_url:
+            threading.Thread(target=self._push, args=(relay, on), daemon=True).start()
+
+    def press(self, relay: int, on: bool) -> None:
+        """
+        Relais actionné sur l'IPX800 lui-même (sans passer par l'API).
+        """
+        self.set_relay(relay, on)
+
+    def _push(self, relay: int, on: bool) -> None:
+        try:
+            requests.get(self.push_url, params={"relais": relay, "etat": int(on)}, timeout=5)
+            with self.lock:
+                self.pushes += 1
+        except requests.RequestException:
+            pass
+
+    def start(self) -> "StubIPX800":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,168 @@
+"""
+ipx_traces.py
+
+Générateur d'événements IPX800 : traces d'événements /ipx-event (relais, état,
+instant) construites, enregistrées ou extraites du journal, puis rejouées contre
+le pont comme le ferait l'IPX800 (GET /ipx-event?relais=...&etat=...).
+
+Une trace réaliste n'est pas un débit constant :
+  - fond : événements isolés (arrivées de Poisson), chaque relais alterne on/off ;
+  - rafales : un scénario de l'IPX800 bascule plusieurs relais en quelques millisecondes ;
+  - rebonds : un contact ou un double appui envoie on/off/on en moins de 100 ms.
+
+Le rejeu est en boucle ouverte : chaque événement part à son instant prévu, que
+les précédents aient répondu ou non. La latence est comptée depuis cet instant
+prévu, pas depuis l'envoi effectif : un pont saturé ne masque pas son retard.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, NamedTuple, Sequence, Tuple
+
+import requests
+
+
+class IPXTraceEvent(NamedTuple):
+    at: float
+    relais: str
+    etat: str
+
+
+def bursty_trace(devices: Sequence[str], duration: float = 60.0, rate: float = 2.0, burst_rate: float = 0.1,
+                 burst_size: Tuple[int, int] = (3, 10), bounce: float = 0.05, seed: int = None) -> List[IPXTraceEvent]:
+    """
+    Construit une trace IPX800 en rafales.
+
+    Args:
+        devices (Sequence): Noms logiques IPX (clés du mapping).
+        duration (float): Durée de la trace, en secondes.
+        rate (float): Événements isolés par seconde.
+        burst_rate (float): Rafales (scénarios) par seconde.
+        burst_size (tuple): Nombre minimum et maximum de relais par rafale.
+        bounce (float): Proportion d'événements isolés suivis de rebonds.
+        seed (int): Graine du tirage.
+
+    Returns:
+        list: Événements triés par instant.
+    """
+    rng = random.Random(seed)
+    states = {device: False for device in devices}
+    events = []
+
+    def toggle(at: float, device: str) -> None:
+        states[device] = not states[device]
+        events.append(IPXTraceEvent(at, device, "on" if states[device] else "off"))
+
+    at = rng.expovariate(rate) if rate > 0 else duration
+    while at < duration:
+        device = rng.choice(devices)
+        toggle(at, device)
+        if rng.random() < bounce:
+            offset = at
+            for _ in range(2):
+                offset += rng.uniform(0.02, 0.08)
+                toggle(offset, device)
+        at += rng.expovariate(rate)
+
+    at = rng.expovariate(burst_rate) if burst_rate > 0 else duration
+    while at < duration:
+        on = rng.random() < 0.5
+        size = min(len(devices), rng.randint(*burst_size))
+        offset = at
+        for device in rng.sample(list(devices), size):
+            offset += rng.uniform(0.001, 0.01)
+            states[device] = on
+            events.append(IPXTraceEvent(offset, device, "on" if on else "off"))
+        at += rng.expovariate(burst_rate)
+
+    events.sort(key=lambda event: event.at)
+    return events
+
+
+def save_trace(trace: Iterable[IPXTraceEvent], path: str) -> None:
+    """
+    Enregistre une trace en JSON lines ({"at", "relais", "etat"}).
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for event in trace:
+            f.write(json.dumps(event._asdict(), ensure_ascii=False) + "\n")
+
+
+def load_trace(path: str) -> List[IPXTraceEvent]:
+    """
+    Relit une trace enregistrée par save_trace().
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [IPXTraceEvent(float(data["at"]), str(data["relais"]), str(data["etat"]))
+                for data in map(json.loads, f) if data]
+
+
+def trace_from_journal(events: Iterable[dict]) -> List[IPXTraceEvent]:
+    """
+    Construit une trace à partir des événements "ipx_event" du journal (services/event_journal.py).
+    """
+    rows = [event for event in events if event.get("kind") == "ipx_event" and event.get("ipx_name")]
+    if not rows:
+        return []
+    origin = min(row["ts"] for row in rows)
+    return sorted((IPXTraceEvent(row["ts"] - origin, str(row["ipx_name"]), str(row.get("etat", "")))
+                   for row in rows), key=lambda event: event.at)
+
+
+class IPXEventGenerator:
+    """
+    Rejoue des traces contre /ipx-event, comme l'IPX800.
+
+    Args:
+        url (str): URL de /ipx-event (ex. "http://127.0.0.1:5000/ipx-event").
+        concurrency (int): Requêtes simultanées au plus (connexions HTTP).
+        timeout (float): Timeout de chaque requête, en secondes.
+    """
+
+    def __init__(self, url: str, concurrency: int = 16, timeout: float = 10.0):
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def send(self, relais: str, etat: str) -> int:
+        """
+        Envoie un événement et retourne le code HTTP (0 si erreur réseau).
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        try:
+            return session.get(self.url, params={"relais": relais, "etat": etat}, timeout=self.timeout).status_code
+        except requests.RequestException:
+            return 0
+
+    def replay(self, trace: Sequence[IPXTraceEvent], speed: float = 1.0) -> Tuple[List[Tuple[float, int]], float]:
+        """
+        Rejoue la trace en boucle ouverte, `speed` fois plus vite que le temps réel.
+
+        Returns:
+            tuple: ([(latence en s depuis l'instant prévu, code HTTP)], durée totale en s).
+        """
+        results = []
+        lock = threading.Lock()
+        start = time.perf_counter()
+
+        def one(event: IPXTraceEvent) -> None:
+            planned = start + event.at / speed
+            code = self.send(event.relais, event.etat)
+            with lock:
+                results.append((time.perf_counter() - planned, code))
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for event in trace:
+                delay = start + event.at / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(one, event)
+        return results, time.perf_counter() - start
@@ -0,0 +1,134 @@
+"""
+smtp.py
+
+Faux serveur SMTP local (puits à messages) utilisé par les benchmarks, sans
+dépendance externe.
+
+Il accepte EHLO/HELO, AUTH PLAIN/LOGIN (tout identifiant), MAIL, RCPT, DATA, RSET,
+NOOP et QUIT, et conserve les messages reçus. Pas de STARTTLS : le client doit être
+configuré avec SMTP_STARTTLS=false.
+
+  - handshake_latency : délai ajouté à l'accueil et à l'authentification, pour
+                        imiter un fournisseur distant (TLS + login de plusieurs
+                        centaines de millisecondes) ;
+  - latency           : délai ajouté à chaque autre commande ;
+  - down              : serveur indisponible, chaque connexion reçoit 421 puis est fermée.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import socketserver
+import threading
+import time
+from email import message_from_bytes, policy
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.connections += 1
+        if stub.down:
+            self._reply("421 stub-smtp Service not available")
+            return
+        time.sleep(stub.handshake_latency)
+        self._reply("220 stub-smtp ESMTP")
+
+        data_mode, data = False, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if data_mode:
+                if line in (b".\r\n", b".\n"):
+                    data_mode = False
+                    time.sleep(stub.latency)
+                    stub.record(b"".join(data))
+                    data = []
+                    self._reply("250 OK")
+                else:
+                    # Point doublé en début de ligne (RFC 5321)
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                continue
+
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-stub-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                time.sleep(stub.handshake_latency)
+                if command.upper().startswith("AUTH LOGIN") and len(command.split()) < 3:
+                    # Identifiant puis mot de passe, chacun après une invite 334
+                    self._reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self._reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                elif command.upper().startswith("AUTH LOGIN"):
+                    self._reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                self._reply("235 Authentication successful")
+            elif verb == "DATA":
+                data_mode = True
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                time.sleep(stub.latency)
+                self._reply("250 OK")
+            else:
+                self._reply("502 Command not implemented")
+
+
+class StubSMTP:
+    """
+    Serveur SMTP simulé dans un thread, à démarrer avec start() et arrêter avec stop().
+
+    Args:
+        latency (float): Délai ajouté à chaque commande SMTP, en secondes.
+        handshake_latency (float): Délai ajouté à l'accueil et à l'authentification.
+    """
+
+    def __init__(self, latency: float = 0.0, handshake_latency: float = 0.0):
+        self.latency = latency
+        self.handshake_latency = handshake_latency
+        self.down = False
+        self.connections = 0
+        self.messages = []
+        self.lock = threading.Condition()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SMTPHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def record(self, raw: bytes) -> None:
+        message = message_from_bytes(raw, policy=policy.default)
+        with self.lock:
+            self.messages.append(message)
+            self.lock.notify_all()
+
+    def wait_messages(self, count: int, timeout: float) -> bool:
+        """
+        Attend que count messages aient été reçus.
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while len(self.messages) < count and time.monotonic() < deadline:
+                self.lock.wait(deadline - time.monotonic())
+            return len(self.messages) >= count
+
+    def start(self) -> "StubSMTP":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,111 @@
+"""
+conftest.py
+
+Fixtures partagées des tests : HC3 simulée (simulator/hc3.py), mapping temporaire,
+application Flask et attente bornée d'une condition.
+
+Les tests modifient config et les objets partagés (client HC3, mapping) : chaque
+fixture rétablit l'état d'origine à la fin du test, et les options de config sont
+changées avec monkeypatch.
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+import pytest
+
+# Fichiers d'exécution (log, bases SQLite) hors du dépôt : fixés avant le premier
+# import de config, qui lit ces chemins une seule fois
+_RUNTIME_DIR = tempfile.mkdtemp(prefix="fibaro-tests-")
+os.environ["LOG_FILE_PATH"] = os.path.join(_RUNTIME_DIR, "action.log")
+for _name, _file in (("OUTBOX_PATH", "outbox.sqlite3"), ("EVENT_JOURNAL_PATH", "journal.sqlite3"),
+                     ("ALERT_COOLDOWN_PATH", "alerts.sqlite3")):
+    os.environ[_name] = os.path.join(_RUNTIME_DIR, _file)
+
+from simulator.hc3 import StubHC3
+from services.device_mapping import registry
+from services.fibaro_service import FibaroClient, set_client
+
+
+def _wait_for(predicate, timeout: float = 3.0, interval: float = 0.005) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return bool(predicate())
+
+
+@pytest.fixture(autouse=True, scope="session")
+def quiet_logger():
+    # Les tests vérifient des comportements, pas les lignes de log
+    logging.getLogger("fibaro_logger").setLevel(logging.CRITICAL)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+
+@pytest.fixture
+def wait_for():
+    """
+    Fonction wait_for(predicate, timeout=3.0) -> bool : attend qu'une condition soit vraie.
+    """
+    return _wait_for
+
+
+@pytest.fixture
+def hc3_factory():
+    """
+    Fabrique de HC3 simulées (mêmes arguments que StubHC3), arrêtées en fin de test.
+    """
+    stubs = []
+
+    def make(**kwargs) -> StubHC3:
+        stub = StubHC3(**kwargs).start()
+        stubs.append(stub)
+        return stub
+
+    yield make
+    for stub in stubs:
+        stub.stop()
+
+
+@pytest.fixture
+def hc3(hc3_factory):
+    """
+    HC3 simulée vers laquelle pointe le client partagé du pont.
+    """
+    stub = hc3_factory()
+    set_client(FibaroClient(base_url=stub.base_url, user="test", password="test", pool_size=8))
+    yield stub
+    set_client(None)
+
+
+@pytest.fixture
+def mapping(tmp_path):
+    """
+    Fonction mapping(data) -> chemin : installe `data` comme fichier de mapping du pont.
+    """
+    saved = registry.path, registry.snapshot, registry._stamp
+
+    def install(data) -> str:
+        registry.path = str(tmp_path / "device_mapping.json")
+        with open(registry.path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        assert registry.load(), registry.last_error
+        return registry.path
+
+    yield install
+    registry.path, registry.snapshot, registry._stamp = saved
+
+
+@pytest.fixture
+def http():
+    """
+    Client de test de l'application Flask, créée avec la config du test en cours.
+    """
+    from app import create_app
+    return create_app().test_client()
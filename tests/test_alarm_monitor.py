@@ -0,0 +1,118 @@
+"""
+Tests de la machine à états des alarmes (avertissements/alarm_monitor.py) : traces
+d'états rejouées avec une horloge simulée, puis route /ipx-alarms avec le tick réel.
+"""
+
+import pytest
+
+import config
+from avertissements.alarm_monitor import ALARM, ESCALATION, RECOVERED, AlarmMonitor, set_alarm_monitor
+from services.scheduler import Scheduler
+from simulator.ipx_traces import bursty_trace
+
+ALARM_DELAY = 60
+RECOVERY_DELAY = 30
+ESCALATE_INTERVAL = 1800
+ESCALATE_MAX = 3
+TICK = 1.0
+
+
+def flicker(device: str, period: float, off_for: float, duration: float) -> list:
+    trace, at = [], 0.0
+    while at < duration:
+        trace += [(at, device, False), (at + off_for, device, True)]
+        at += period
+    return trace
+
+
+def replay(trace: list, end: float) -> list:
+    """
+    Rejoue la trace (instant, périphérique, on) en faisant avancer l'horloge tick par
+    tick ; retourne les notifications (instant, type).
+    """
+    now = [0.0]
+    notices = []
+    monitor = AlarmMonitor(notify=lambda device, kind, level: notices.append((now[0], kind)),
+                           alarm_delay=ALARM_DELAY, recovery_delay=RECOVERY_DELAY,
+                           escalate_interval=ESCALATE_INTERVAL, escalate_max=ESCALATE_MAX,
+                           scheduler=Scheduler(), clock=lambda: now[0])
+    events = iter(sorted(trace, key=lambda event: event[0]))
+    pending = next(events, None)
+    tick = 0.0
+    while tick <= end:
+        while pending is not None and pending[0] <= tick:
+            now[0] = pending[0]
+            monitor.observe(pending[1], pending[2])
+            pending = next(events, None)
+        now[0] = tick
+        monitor.tick()
+        tick += TICK
+    return notices
+
+
+def test_flickering_outlet_never_alerts():
+    assert replay(flicker("ipx_congelateur", period=10, off_for=2, duration=600), 700) == []
+
+
+def test_held_off_alerts_then_escalates():
+    notices = replay([(0, "ipx_congelateur", True), (100, "ipx_congelateur", False)], 100 + 7200)
+    assert [kind for _, kind in notices] == [ALARM] + [ESCALATION] * ESCALATE_MAX
+    assert notices[0][0] == 100 + ALARM_DELAY
+    assert all(b[0] - a[0] == ESCALATE_INTERVAL for a, b in zip(notices, notices[1:]))
+
+
+def test_bouncing_recovery_sends_one_notice():
+    trace = [(0, "ipx_congelateur", False), (200, "ipx_congelateur", True), (210, "ipx_congelateur", False),
+             (215, "ipx_congelateur", True), (225, "ipx_congelateur", False), (230, "ipx_congelateur", True)]
+    notices = replay(trace, 400)
+    assert [kind for _, kind in notices] == [ALARM, RECOVERED]
+    assert notices[-1][0] == 230 + RECOVERY_DELAY
+
+
+def test_short_off_does_not_alert():
+    assert replay([(0, "ipx_test", False), (ALARM_DELAY - 5, "ipx_test", True)], 300) == []
+
+
+def test_delay_counts_from_last_off():
+    notices = replay([(0, "ipx_test", False), (50, "ipx_test", True), (52, "ipx_test", False)], 300)
+    assert notices == [(52 + ALARM_DELAY, ALARM)]
+
+
+def test_tracks_many_inputs():
+    devices = [f"ipx_{i}" for i in range(500)]
+    events = bursty_trace(devices, duration=600, rate=2.0, burst_rate=0.02, burst_size=(20, 100), seed=3)
+    monitor = AlarmMonitor(notify=lambda *args: None, alarm_delay=ALARM_DELAY, recovery_delay=RECOVERY_DELAY,
+                           escalate_interval=ESCALATE_INTERVAL, scheduler=Scheduler(), clock=lambda: 0.0)
+    for event in events:
+        monitor.observe(event.relais, event.etat == "on", now=event.at)
+    monitor.tick(600)
+    # Une entrée par périphérique ayant envoyé un état
+    assert len(monitor._slots) == len({event.relais for event in events}) > 400
+
+
+@pytest.fixture
+def monitored(monkeypatch):
+    notices = []
+    monitor = AlarmMonitor(notify=lambda device, kind, level: notices.append(kind), alarm_delay=0.2,
+                           recovery_delay=0.1, escalate_interval=0, tick=0.05)
+    set_alarm_monitor(monitor)
+    monkeypatch.setattr(config, "ALARM_MONITOR", True)
+    from app import create_app
+    yield create_app().test_client(), notices
+    monitor.stop()
+    set_alarm_monitor(None)
+
+
+def test_ipx_alarms_route(monitored, wait_for):
+    http, notices = monitored
+    response = http.post("/ipx-alarms", json={"device": "ipx_congelateur", "state": "OFF"})
+    assert response.get_json().get("alarm") == "suspect"
+    assert wait_for(lambda: notices == [ALARM])
+    assert http.get("/alarms").get_json()["devices"]["ipx_congelateur"]["state"] == "alarming"
+
+    http.post("/ipx-alarms", json={"device": "ipx_congelateur", "state": "ON"})
+    assert wait_for(lambda: notices == [ALARM, RECOVERED])
+    assert http.get("/alarms").get_json()["devices"] == {}
+
+    response = http.post("/ipx-alarms", json={"device": "ipx_congelateur", "state": "peut-être"})
+    assert response.status_code == 400
@@ -0,0 +1,82 @@
+"""
+Tests du cooldown partagé des alertes (avertissements/alert_cooldown.py).
+"""
+
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from avertissements.alert_cooldown import AlertCooldown
+
+
+@pytest.mark.parametrize("burst", [1, 3])
+def test_concurrent_threads_get_burst_alerts(tmp_path, burst):
+    cooldown = AlertCooldown(str(tmp_path / "cooldown.db"), cooldown=60, burst=burst)
+    barrier = threading.Barrier(32)
+    allowed = []
+
+    def worker():
+        barrier.wait()
+        if cooldown.acquire("ipx_congelateur"):
+            allowed.append(1)
+
+    pool = [threading.Thread(target=worker) for _ in range(32)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    assert len(allowed) == burst
+
+
+def _process_worker(path: str, start_at: float, results) -> None:
+    cooldown = AlertCooldown(path, cooldown=60)
+    time.sleep(max(0.0, start_at - time.time()))
+    results.put(sum(cooldown.acquire("ipx_congelateur") for _ in range(5)))
+
+
+def test_processes_share_the_cooldown(tmp_path):
+    # Comme des workers gunicorn sur la même base
+    path = str(tmp_path / "cooldown.db")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    start_at = time.time() + 1.0
+    pool = [context.Process(target=_process_worker, args=(path, start_at, results)) for _ in range(4)]
+    for process in pool:
+        process.start()
+    total = sum(results.get(timeout=30) for _ in pool)
+    for process in pool:
+        process.join()
+    assert total == 1
+
+
+def test_cooldown_survives_restart(tmp_path):
+    path = str(tmp_path / "cooldown.db")
+    assert AlertCooldown(path, cooldown=60).acquire("ipx_congelateur")
+    assert not AlertCooldown(path, cooldown=60).acquire("ipx_congelateur")
+
+
+def test_refill_and_purge(tmp_path):
+    now = [1000.0]
+    cooldown = AlertCooldown(str(tmp_path / "cooldown.db"), cooldown=10, clock=lambda: now[0])
+    assert cooldown.acquire("a")
+    now[0] += 5
+    assert not cooldown.acquire("a")
+    now[0] += 5
+    assert cooldown.acquire("a")
+
+    for i in range(100):
+        cooldown.acquire(f"device_{i}")
+    now[0] += 30
+    cooldown.acquire("b")
+    assert cooldown.size() == 1
+
+
+def test_refund_gives_back_one_token(tmp_path):
+    cooldown = AlertCooldown(str(tmp_path / "cooldown.db"), cooldown=60)
+    assert cooldown.acquire("a")
+    cooldown.refund("a")
+    cooldown.refund("a")
+    assert cooldown.acquire("a")
+    assert not cooldown.acquire("a")
@@ -0,0 +1,126 @@
+"""
+Tests du client HC3 asynchrone (services/async_fibaro.py) : lecture des réponses
+HTTP/1.1 et reprise d'une connexion keep-alive fermée par la HC3.
+"""
+
+import asyncio
+
+import pytest
+
+from services.async_fibaro import AsyncFibaroClient
+
+OK = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}"
+
+
+def read(data: bytes) -> tuple:
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await AsyncFibaroClient._read_response(reader)
+    return asyncio.run(run())
+
+
+def test_content_length_keeps_connection():
+    assert read(OK + b"HTTP/1.1 200 OK\r\n") == (200, b"{}", True)
+
+
+def test_chunked_body():
+    data = (b"HTTP/1.1 202 Accepted\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"4;ext=1\r\n{\"a\"\r\n3\r\n: 1\r\n1\r\n}\r\n0\r\nX-Fin: 1\r\n\r\n")
+    assert read(data) == (202, b'{"a": 1}', True)
+
+
+def test_connection_close():
+    data = b"HTTP/1.1 500 Erreur\r\nConnection: close\r\nContent-Length: 3\r\n\r\nnon"
+    assert read(data) == (500, b"non", False)
+
+
+def test_body_until_eof_closes_connection():
+    assert read(b"HTTP/1.0 200 OK\r\n\r\n{\"ok\": 1}") == (200, b'{"ok": 1}', False)
+
+
+def test_empty_status_line_raises():
+    with pytest.raises(ConnectionError):
+        read(b"")
+
+
+class StubServer:
+    """
+    Serveur HTTP minimal : `script` dit, requête par requête sur chaque connexion,
+    s'il faut répondre (True) ou fermer sans réponse (False) ; None = ne jamais répondre.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            for answer in self.script:
+                request = await reader.readuntil(b"\r\n\r\n")
+                length = [line for line in request.split(b"\r\n") if line.lower().startswith(b"content-length")]
+                await reader.readexactly(int(length[0].split(b":")[1]))
+                self.requests += 1
+                if answer is None:
+                    await asyncio.sleep(10)
+                if not answer:
+                    break
+                writer.write(OK)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return AsyncFibaroClient(base_url=f"http://127.0.0.1:{port}/api", user="test", password="test",
+                                 connect_timeout=1, read_timeout=0.2, max_connections=1)
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+
+def test_stale_keep_alive_connection_is_retried_once():
+    async def run():
+        # Première connexion : une réponse, puis fermée à la requête suivante sans réponse
+        server = StubServer([True, False])
+        async with server as client:
+            first = await client.call_action(20, "turnOn")
+            second = await client.call_action(20, "turnOff")
+            await client.close()
+        return server, first, second
+
+    server, first, second = asyncio.run(run())
+    assert first["status"] == "success" and second["status"] == "success"
+    assert server.connections == 2
+    # La requête perdue, puis son renvoi
+    assert server.requests == 3
+
+
+def test_fresh_connection_closed_without_response_is_not_retried():
+    async def run():
+        server = StubServer([False])
+        async with server as client:
+            result = await client.call_action(20, "turnOn")
+        return server, result
+
+    server, result = asyncio.run(run())
+    assert result["status"] == "error"
+    assert server.connections == 1 and server.requests == 1
+
+
+def test_read_timeout():
+    async def run():
+        server = StubServer([None])
+        async with server as client:
+            result = await client.call_action(20, "turnOn")
+        return server, result
+
+    server, result = asyncio.run(run())
+    assert result["status"] == "error"
+    assert server.requests == 1
@@ -0,0 +1,113 @@
+"""
+Tests de l'étage de regroupement (services/coalescer.py).
+"""
+
+import threading
+import time
+
+import pytest
+
+from services.coalescer import CommandCoalescer
+from services.fibaro_service import FibaroClient
+from services.scheduler import Scheduler
+
+WINDOW = 10.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def coalescer(sent, clock):
+    # Horloge simulée : les fenêtres se ferment à l'appel de run_due()
+    def send(device_id, action):
+        sent.append((device_id, action))
+        return {"status": "success"}
+
+    return CommandCoalescer(send, window=WINDOW, confirmed_ttl=60, scheduler=Scheduler(clock), clock=clock)
+
+
+def close_windows(coalescer, clock, wait_for, expected: int, sent) -> None:
+    clock.now += WINDOW
+    coalescer.scheduler.run_due()
+    assert wait_for(lambda: len(sent) >= expected)
+
+
+def test_first_command_is_sent_immediately(coalescer, sent):
+    assert coalescer.submit(20, "turnOn")["status"] == "success"
+    assert sent == [(20, "turnOn")]
+
+
+def test_burst_is_coalesced_to_last_command(coalescer, clock, sent, wait_for):
+    coalescer.submit(20, "turnOn")
+    for action in ("turnOff", "turnOn", "turnOff"):
+        assert coalescer.submit(20, action) == {"status": "pending"}
+    close_windows(coalescer, clock, wait_for, 2, sent)
+    assert sent == [(20, "turnOn"), (20, "turnOff")]
+    assert coalescer.stats() == {"events_received": 4, "commands_sent": 2, "coalesced": 2, "suppressed": 0}
+
+
+def test_pending_command_matching_confirmed_state_is_suppressed(coalescer, clock, sent, wait_for):
+    coalescer.submit(20, "turnOn")
+    coalescer.submit(20, "turnOff")
+    coalescer.submit(20, "turnOn")
+    clock.now += WINDOW
+    coalescer.scheduler.run_due()
+    assert sent == [(20, "turnOn")]
+    assert coalescer.stats()["suppressed"] == 1
+    # Fenêtre refermée : une commande déjà confirmée n'est pas renvoyée
+    assert coalescer.submit(20, "turnOn") == {"status": "suppressed"}
+
+
+def test_devices_are_coalesced_independently(coalescer, sent):
+    coalescer.submit(20, "turnOn")
+    coalescer.submit(27, "turnOn")
+    assert coalescer.submit(20, "turnOff") == {"status": "pending"}
+    assert sent == [(20, "turnOn"), (27, "turnOn")]
+
+
+def test_coalesced_command_waits_for_slow_immediate_send(hc3_factory, wait_for):
+    """
+    HC3 lente pour turnOn seulement : sans ordre des envois, le turnOff regroupé
+    arriverait avant le turnOn immédiat et le relais finirait allumé.
+    """
+    stub = hc3_factory(devices={20: False})
+    client = FibaroClient(base_url=stub.base_url, user="test", password="test", pool_size=4)
+    received = []
+
+    def send(device_id, action):
+        if action == "turnOn":
+            # Latence avant que la commande n'atteigne la HC3
+            time.sleep(0.3)
+        received.append(action)
+        return client.call_action(device_id, action)
+
+    scheduler = Scheduler().start()
+    coalescer = CommandCoalescer(send, window=0.05, scheduler=scheduler)
+    try:
+        first = threading.Thread(target=coalescer.submit, args=(20, "turnOn"))
+        first.start()
+        time.sleep(0.01)
+        assert coalescer.submit(20, "turnOff") == {"status": "pending"}
+        first.join()
+        assert wait_for(lambda: coalescer.stats()["commands_sent"] == 2)
+        assert received == ["turnOn", "turnOff"]
+        assert stub.states[20] is False
+    finally:
+        scheduler.stop()
+        client.close()
@@ -0,0 +1,120 @@
+"""
+Tests des envois en coroutines (controllers/control.py, mode async) : verrou du
+périphérique partagé avec l'étage de reprise et cloison de la HC3 par défaut.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import config
+from controllers import control
+from services import async_fibaro
+from services.controllers import Controller, ControllerRegistry, set_controllers
+from services.retry_scheduler import RetryScheduler
+
+
+class FakeAsyncClient:
+    """
+    Client HC3 asynchrone simulé : chaque appel dure `latency` secondes.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def call_action(self, device_id: int, action: str) -> dict:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            self.calls.append((device_id, action))
+            return {"status": "success"}
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeAsyncClient()
+    monkeypatch.setattr(async_fibaro, "_client", client)
+    for name in ("OUTBOX", "REVERSE_CHANNEL", "FIBARO_CONTROLLERS"):
+        monkeypatch.setattr(config, name, False)
+    monkeypatch.setattr(config, "FIBARO_MAX_PARALLEL", 0)
+    return client
+
+
+@pytest.fixture
+def retry(monkeypatch):
+    monkeypatch.setattr(config, "RETRY_QUEUE", True)
+    scheduler = RetryScheduler(lambda device_id, action: {"status": "success"})
+    monkeypatch.setattr(control, "_retry_scheduler", scheduler)
+    return scheduler
+
+
+def test_burst_on_held_device_uses_no_threads(client, retry):
+    lock = retry.device_lock(20)
+    lock.acquire()
+
+    async def burst():
+        tasks = [asyncio.ensure_future(control._send_action_async(20, "turnOn")) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        # Verrou tenu par une reprise : les envois attendent sans thread du pool
+        waiting = threading.active_count()
+        assert not any(task.done() for task in tasks)
+        lock.release()
+        results = await asyncio.gather(*tasks)
+        return waiting, results
+
+    before = threading.active_count()
+    waiting, results = asyncio.run(burst())
+    assert waiting == before
+    assert all(result["status"] == "success" for result in results)
+    assert len(client.calls) == 20 and not lock.locked()
+
+
+def test_cancelled_wait_does_not_keep_device_lock(client, retry):
+    lock = retry.device_lock(20)
+    lock.acquire()
+
+    async def cancel():
+        task = asyncio.ensure_future(control._send_action_async(20, "turnOn"))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(cancel())
+    lock.release()
+    assert not lock.locked() and client.calls == []
+
+
+@pytest.fixture
+def bulkhead(monkeypatch, client):
+    monkeypatch.setattr(config, "FIBARO_MAX_PARALLEL", 1)
+    set_controllers(ControllerRegistry(default=Controller("hc3", max_parallel=1, acquire_timeout=0.05)))
+    yield
+    set_controllers(None)
+
+
+def test_async_calls_use_default_bulkhead(bulkhead, client):
+    client.latency = 0.2
+
+    async def run():
+        return await asyncio.gather(control._call_hc3_async(20, "turnOn"), control._call_hc3_async(27, "turnOn"))
+
+    results = asyncio.run(run())
+    assert sorted(result["status"] for result in results) == ["busy", "success"]
+    assert client.max_in_flight == 1
+
+
+def test_bulkhead_slot_is_waited_for(bulkhead, client):
+    client.latency = 0.01
+
+    async def run():
+        return await asyncio.gather(*(control._call_hc3_async(20, "turnOn") for _ in range(3)))
+
+    assert [result["status"] for result in asyncio.run(run())] == ["success"] * 3
+    assert client.max_in_flight == 1
@@ -0,0 +1,154 @@
+"""
+Tests de plusieurs box HC3 derrière le pont (services/controllers.py), simulées par
+trois StubHC3 : "hc3" (par défaut) et "garage" rapides, "grange" lente. Les trois box
+utilisent les mêmes ID Fibaro : seul le couple (contrôleur, ID) du mapping les distingue.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+from controllers import control
+from services.controllers import load_controllers, set_controllers
+from services.fibaro_service import FibaroClient, set_client
+
+THREADS = 8
+SLOW_LATENCY = 0.5
+FAST_LATENCY = 0.005
+DURATION = 1.0
+DEVICES = range(1, 6)
+FAST = [f"ipx_{name}_{device_id}" for name in ("hc3", "garage") for device_id in DEVICES]
+SLOW = [f"ipx_grange_{device_id}" for device_id in DEVICES]
+# Un événement sur quatre vers la box lente
+MIXED = [name for pair in zip(FAST, FAST[5:] + SLOW) for name in pair]
+
+
+@pytest.fixture
+def stubs(hc3_factory, mapping):
+    stubs = {"hc3": hc3_factory(latency=FAST_LATENCY), "garage": hc3_factory(latency=FAST_LATENCY),
+             "grange": hc3_factory(latency=SLOW_LATENCY)}
+    entries = {}
+    for name in stubs:
+        for device_id in DEVICES:
+            entry = {"fibaro_id": device_id, "ipx_id": 100 * len(entries) + device_id}
+            if name != "hc3":
+                entry["controller"] = name
+            entries[f"ipx_{name}_{device_id}"] = entry
+    mapping(entries)
+    set_client(FibaroClient(base_url=stubs["hc3"].base_url, user="test", password="test", pool_size=4))
+    yield stubs
+    set_controllers(None)
+    set_client(None)
+
+
+@pytest.fixture
+def controllers(monkeypatch, tmp_path, stubs):
+    """
+    Fonction controllers(slow_parallel) : installe les trois box, la lente limitée à
+    `slow_parallel` appels simultanés (0 = sans cloison).
+    """
+    def install(slow_parallel: int) -> str:
+        path = str(tmp_path / f"controllers_{slow_parallel}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "hc3": {"max_parallel": 4},
+                "garage": {"base_url": stubs["garage"].base_url, "user": "test", "password": "test",
+                           "pool_size": 4, "max_parallel": 4},
+                "grange": {"base_url": stubs["grange"].base_url, "user": "test", "password": "test",
+                           "pool_size": 4, "max_parallel": slow_parallel, "acquire_timeout": 0.02,
+                           "read_timeout": 5},
+            }, f)
+        monkeypatch.setattr(config, "FIBARO_CONTROLLERS", path)
+        set_controllers(load_controllers(path))
+        return path
+
+    install(2)
+    return install
+
+
+def run_load(http, names: list, duration: float) -> dict:
+    """
+    THREADS threads envoient les événements de `names` en boucle pendant `duration`
+    (boucle fermée, comme les threads gthread de gunicorn).
+
+    Returns:
+        dict: Réponses OK par contrôleur, et réponses refusées (box saturée).
+    """
+    counts = {"hc3": 0, "garage": 0, "grange": 0, "busy": 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def worker(offset: int):
+        i = offset
+        while time.monotonic() < stop:
+            name = names[i % len(names)]
+            i += 1
+            etat = "on" if (i // len(names)) % 2 else "off"
+            body = http.get("/ipx-event", query_string={"relais": name, "etat": etat}).get_json()
+            with lock:
+                if body.get("status") == "OK":
+                    counts[name.split("_")[1]] += 1
+                elif "saturée" in (body.get("message") or ""):
+                    counts["busy"] += 1
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        for t in range(THREADS):
+            pool.submit(worker, t * 7)
+    return counts
+
+
+def fast_rate(counts: dict) -> float:
+    return (counts["hc3"] + counts["garage"]) / DURATION
+
+
+def test_routing_by_controller_and_id(controllers, stubs, http):
+    for name in stubs:
+        response = http.get("/ipx-event", query_string={"relais": f"ipx_{name}_3", "etat": "on"})
+        assert response.status_code == 200 and response.get_json()["status"] == "OK"
+    assert {name: stub.count() for name, stub in stubs.items()} == {"hc3": 1, "garage": 1, "grange": 1}
+    assert all(stub.states.get(3) is True for stub in stubs.values())
+
+
+def test_slow_controller_is_isolated(controllers, http):
+    alone = run_load(http, FAST, DURATION)
+    mixed = run_load(http, MIXED, DURATION)
+    # Les événements de la box lente sont refusés vite : trois quarts du débit, avec une marge
+    assert fast_rate(mixed) >= fast_rate(alone) * 3 / 4 * 0.7
+    # Au plus 2 appels simultanés vers la box lente
+    assert mixed["grange"] <= 2 * DURATION / SLOW_LATENCY + 2
+    assert mixed["busy"] > 0
+
+    controllers(0)
+    unbounded = run_load(http, MIXED, DURATION)
+    # Sans cloison, la box lente occupe tous les threads
+    assert fast_rate(unbounded) < fast_rate(mixed) / 2
+
+
+def test_async_mode_has_one_queue_per_controller(monkeypatch, controllers, http, wait_for):
+    monkeypatch.setattr(config, "ASYNC_DISPATCH", True)
+    monkeypatch.setattr(control, "_dispatcher", None)
+
+    def queue(names: list) -> list:
+        return [http.get("/ipx-event", query_string={"relais": name, "etat": "off"}).get_json()["command_id"]
+                for name in names]
+
+    def done(command_ids: list) -> bool:
+        return all((http.get(f"/ipx-event/{command_id}").get_json() or {}).get("status") in ("done", "error")
+                   for command_id in command_ids)
+
+    try:
+        start = time.monotonic()
+        slow_ids = queue(SLOW + SLOW[:1])
+        fast_ids = queue(FAST * 2)
+        # Les box rapides sont servies pendant que la file de la box lente se vide
+        assert wait_for(lambda: done(fast_ids), SLOW_LATENCY)
+        assert time.monotonic() - start < SLOW_LATENCY
+        assert not done(slow_ids)
+        assert wait_for(lambda: done(slow_ids), 10)
+    finally:
+        if control._dispatcher is not None:
+            control._dispatcher.stop()
@@ -0,0 +1,51 @@
+"""
+Tests du dispatch asynchrone (services/dispatch_service.py, ASYNC_DISPATCH).
+"""
+
+import queue
+import threading
+
+import pytest
+
+import config
+from controllers import control
+from services.dispatch_service import CommandDispatcher
+
+
+def test_status_route_does_not_start_dispatcher_when_disabled(monkeypatch, http):
+    monkeypatch.setattr(config, "ASYNC_DISPATCH", False)
+    monkeypatch.setattr(control, "_dispatcher", None)
+    threads = threading.active_count()
+    response = http.get("/ipx-event/0123456789abcdef")
+    assert response.status_code == 404
+    assert control._dispatcher is None
+    assert threading.active_count() == threads
+
+
+def test_dispatcher_reports_command_status(wait_for):
+    dispatcher = CommandDispatcher(lambda command: {"status": "OK", "device": command["device"]}, workers=1).start()
+    try:
+        command_id = dispatcher.submit({"device": 20})
+        assert wait_for(lambda: dispatcher.status(command_id)["status"] == "done")
+        assert dispatcher.status(command_id)["result"] == {"status": "OK", "device": 20}
+        assert dispatcher.status("inconnue") is None
+    finally:
+        dispatcher.stop()
+
+
+def test_full_queue_refuses_command():
+    release = threading.Event()
+    dispatcher = CommandDispatcher(lambda command: release.wait(2) and {"status": "OK"}, workers=1,
+                                   queue_size=1).start()
+    try:
+        dispatcher.submit({"device": 1})
+        # Le premier est pris par le thread ; on remplit la file
+        accepted = 1
+        with pytest.raises(queue.Full):
+            for _ in range(3):
+                dispatcher.submit({"device": 1})
+                accepted += 1
+        assert accepted <= 2
+    finally:
+        release.set()
+        dispatcher.stop()
@@ -0,0 +1,128 @@
+"""
+Tests du journal des événements (services/event_journal.py) et de son outil en
+ligne de commande (journal.py).
+"""
+
+import json
+import logging
+
+import pytest
+
+import config
+import journal
+from controllers import control
+from services.event_journal import EventJournal, query
+from services.fibaro_service import set_client
+
+MAPPING = {"ipx_congelateur": 20, "ipx_test": 27}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.sqlite3")
+
+
+@pytest.fixture
+def events(path):
+    """
+    Journal de cinq événements, un par seconde à partir de ts=100.
+    """
+    writer = EventJournal(path).start()
+    rows = [("ipx_event", "ipx_congelateur", 20, "off", "turnOff", "OK"),
+            ("hc3_command", "ipx_congelateur", 20, "off", "turnOff", "OK"),
+            ("ipx_event", "ipx_test", 27, "on", "turnOn", "OK"),
+            ("ipx_event", "ipx_congelateur", 20, "on", "turnOn", "error"),
+            ("ipx_event", "ipx_congelateur", 20, "off", "turnOff", "OK")]
+    for i, (kind, ipx_name, device_id, etat, action, status) in enumerate(rows):
+        writer.record(kind, ts=100.0 + i, ipx_name=ipx_name, device_id=device_id, etat=etat, action=action,
+                      status=status, latency_ms=1.5 if kind == "hc3_command" else None, delivery="direct")
+    writer.stop()
+    return path
+
+
+def test_events_are_written_in_batches(monkeypatch, path):
+    writer = EventJournal(path, batch_size=3, flush_interval=60)
+    batches = []
+    write = writer._write
+    monkeypatch.setattr(writer, "_write", lambda connection, batch: (batches.append(len(batch)),
+                                                                       write(connection, batch)))
+    for i in range(7):
+        writer.record("ipx_event", ts=float(i), ipx_name="ipx_test")
+    writer.start().stop()
+    # Le dernier lot incomplet est écrit à l'arrêt, sans attendre flush_interval
+    assert batches == [3, 3, 1]
+    assert writer.written == 7 and len(query(path)) == 7
+
+
+def test_full_queue_drops_and_counts(path):
+    writer = EventJournal(path, queue_size=2)
+    for i in range(5):
+        writer.record("ipx_event", ts=float(i))
+    assert writer.dropped == 3
+    writer.start().stop()
+    assert [event["ts"] for event in query(path)] == [0.0, 1.0]
+
+
+def test_query_device_by_name_or_fibaro_id(events):
+    assert len(query(events, device="ipx_congelateur")) == 4
+    assert [event["ipx_name"] for event in query(events, device=27)] == ["ipx_test"]
+    # "27" (texte) est un nom IPX, pas un ID Fibaro
+    assert query(events, device="27") == []
+
+
+def test_query_filters_and_order(events):
+    assert len(query(events, kind="ipx_event", action="turnOff")) == 2
+    assert [event["ts"] for event in query(events, since=101, until=103)] == [101.0, 102.0, 103.0]
+    assert query(events, status="error")[0]["etat"] == "on"
+    last = query(events, device="ipx_congelateur", action="turnOff", limit=1, newest_first=True)
+    assert [event["ts"] for event in last] == [104.0]
+    assert [event["ts"] for event in query(events, limit=2)] == [100.0, 101.0]
+
+
+def test_query_merges_extra_fields(events):
+    command = query(events, kind="hc3_command")[0]
+    assert command["latency_ms"] == 1.5 and command["delivery"] == "direct"
+    assert "latency_ms" not in query(events, kind="ipx_event")[0]
+
+
+def test_cli_query(events, capsys):
+    assert journal.main(["--db", events, "query", "--device", "20", "--action", "turnOff", "--last", "--json"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1 and json.loads(lines[0])["ts"] == 104.0
+
+    assert journal.main(["--db", events, "query", "--device", "ipx_test"]) == 0
+    assert "ipx_test (27)" in capsys.readouterr().out
+
+
+def test_parse_time():
+    assert journal.parse_time("1700000000") == 1700000000.0
+    assert abs(journal.parse_time("2h") - (journal.time.time() - 7200)) < 5
+
+
+@pytest.fixture
+def replayed(monkeypatch, mapping):
+    mapping(MAPPING)
+    # Options de production lues depuis .env : le rejeu doit les désactiver
+    for name in journal.REPLAY_DISABLED:
+        monkeypatch.setattr(config, name, True)
+    monkeypatch.setattr(control, "_outbox", None)
+    level = logging.getLogger("fibaro_logger").level
+    yield
+    set_client(None)
+    logging.getLogger("fibaro_logger").setLevel(level)
+
+
+def test_cli_replay_matches_recording(replayed, events, capsys):
+    # Le 4e événement avait échoué : le rejeu (HC3 simulée) réussit, donc un écart
+    assert journal.main(["--db", events, "replay", "--device", "ipx_congelateur"]) == 1
+    out = capsys.readouterr().out
+    assert "3 événements rejoués" in out and "1 résultat(s) différent(s)" in out
+    assert journal.main(["--db", events, "replay", "--device", "ipx_test"]) == 0
+
+
+def test_cli_replay_leaves_no_production_trace(replayed, events):
+    journal.main(["--db", events, "replay"])
+    assert not any(getattr(config, name) for name in journal.REPLAY_DISABLED)
+    assert control._outbox is None
+    # Rien d'ajouté au journal rejoué
+    assert len(query(events)) == 5
@@ -0,0 +1,79 @@
+"""
+Tests des opérations HC3 au-delà de turnOn/turnOff (services/fibaro_operations.py)
+contre la HC3 simulée.
+"""
+
+import time
+
+import pytest
+
+from services.device_mapping import build_snapshot, get_operations
+from services.fibaro_operations import run_scene, set_value, set_variable
+from services.fibaro_service import get_client
+
+MAPPING = {
+    "ipx_volet": {"fibaro_id": 40, "dimmer": True,
+                  "etats": {"Nuit": {"scene": 7},
+                            "alarme": [{"variable": "Alarme", "value": 1}, {"scene": 9},
+                                       {"action": "setValue", "args": [0]}]}},
+    "ipx_test": 27,
+}
+
+
+@pytest.fixture
+def stub(hc3, mapping):
+    hc3.states.update({40: 0, 27: False})
+    mapping(MAPPING)
+    return hc3
+
+
+def test_mapping_operations(stub):
+    assert get_operations("ipx_volet", "nuit") == (run_scene(7),)
+    assert get_operations("ipx_volet", "50") == (set_value(40, 50),)
+    # 0/1 restent on/off
+    assert get_operations("ipx_volet", "1") is None
+    assert get_operations("ipx_volet", "150") is None
+    assert get_operations("ipx_test", "50") is None
+
+
+@pytest.mark.parametrize("etats", [{"x": {"bof": 1}}, {"x": {"scene": "7"}}, {"x": []}],
+                         ids=["operation_inconnue", "scene_non_entiere", "liste_vide"])
+def test_invalid_operations_are_rejected(etats):
+    with pytest.raises(ValueError):
+        build_snapshot({"a": {"fibaro_id": 1, "etats": etats}})
+
+
+def test_custom_etat_runs_variable_scene_and_set_value(stub, http):
+    response = http.get("/ipx-event", query_string={"relais": "ipx_volet", "etat": "Alarme"})
+    assert response.status_code == 200
+    with stub.lock:
+        assert stub.variables == {"Alarme": "1"}
+        assert stub.scenes == {9: 1}
+        assert stub.states[40] == 0
+
+    response = http.get("/ipx-event", query_string={"relais": "ipx_volet", "etat": "35"})
+    assert response.status_code == 200
+    assert stub.states[40] == 35
+
+
+def test_bulk_deduplicates_and_orders(stub):
+    with stub.lock:
+        stub.recorded.clear()
+    results = get_client().bulk([run_scene(3), set_value(40, 10), set_variable("Mode", "jour"),
+                                 set_value(40, 80), set_variable("Mode", "nuit")])
+    assert [result["status"] for result in results] == ["success", "superseded", "superseded", "success",
+                                                        "success"]
+    with stub.lock:
+        # La dernière valeur l'emporte ; variables → périphériques → scènes
+        assert stub.variables["Mode"] == "nuit" and stub.states[40] == 80
+        assert [method for method, _, _ in stub.recorded] == ["PUT", "GET", "POST"]
+
+
+def test_bulk_runs_operations_in_parallel(stub):
+    stub.latency = 0.2
+    start = time.perf_counter()
+    results = get_client().bulk([set_variable(f"v{i}", i) for i in range(8)])
+    elapsed = time.perf_counter() - start
+    assert all(result["status"] == "success" for result in results)
+    # Environ une latence pour le lot, et non huit
+    assert elapsed < 0.2 * 3
@@ -0,0 +1,177 @@
+"""
+Tests de /healthz, /readyz et de la sonde de santé (services/health.py) face à une
+HC3, un serveur SMTP et un fichier de mapping simulés, ainsi que des notifications
+systemd (services/sd_notify.py).
+"""
+
+import json
+import os
+import socket
+import time
+
+import pytest
+
+import config
+from simulator.smtp import StubSMTP
+from services import sd_notify
+from services.device_mapping import MappingRegistry
+from services.fibaro_service import FibaroClient
+from services.health import HealthProber, check_hc3, check_mapping, check_smtp, set_health_prober
+from services.scheduler import Scheduler
+
+INTERVAL = 0.1
+MAPPING = {"ipx_congelateur": 20, "ipx_test": 27}
+
+
+@pytest.fixture
+def smtp():
+    smtp = StubSMTP().start()
+    yield smtp
+    smtp.stop()
+
+
+@pytest.fixture
+def mapping_file(tmp_path):
+    path = tmp_path / "device_mapping.json"
+    path.write_text(json.dumps(MAPPING), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def prober(hc3_factory, smtp, mapping_file):
+    hc3 = hc3_factory()
+    mapping = MappingRegistry(str(mapping_file))
+    mapping.load()
+    client = FibaroClient(base_url=hc3.base_url, user="test", password="test", pool_size=1,
+                          connect_timeout=0.5, read_timeout=0.5)
+    prober = HealthProber({
+        "hc3": lambda: check_hc3(client, 0.5),
+        "smtp": lambda: check_smtp("127.0.0.1", smtp.port, 0.5),
+        "mapping": lambda: check_mapping(mapping),
+    }, required=("hc3", "mapping"), interval=INTERVAL, stale_after=0.5)
+    prober.hc3, prober.mapping = hc3, mapping
+    set_health_prober(prober)
+    yield prober
+    set_health_prober(None)
+
+
+@pytest.fixture
+def readyz(monkeypatch, prober):
+    monkeypatch.setattr(config, "HEALTH_PROBER", True)
+    monkeypatch.setattr(config, "SD_NOTIFY", False)
+    from app import create_app
+    http = create_app().test_client()
+
+    def get():
+        response = http.get("/readyz")
+        return response.status_code, response.get_json()
+    return get
+
+
+def test_healthz(http):
+    assert http.get("/healthz").status_code == 200
+
+
+def test_hc3_outage_makes_bridge_unready(readyz, prober, wait_for):
+    assert wait_for(lambda: readyz()[0] == 200)
+    prober.hc3.down = True
+    assert wait_for(lambda: readyz()[0] == 503)
+    assert readyz()[1]["checks"]["hc3"]["ok"] is False
+    prober.hc3.down = False
+    assert wait_for(lambda: readyz()[0] == 200)
+
+
+def test_smtp_outage_is_reported_but_not_required(readyz, smtp, wait_for):
+    assert wait_for(lambda: readyz()[0] == 200)
+    smtp.down = True
+    assert wait_for(lambda: readyz()[1]["checks"]["smtp"]["ok"] is False)
+    assert readyz()[0] == 200
+    smtp.down = False
+    assert wait_for(lambda: readyz()[1]["checks"]["smtp"]["ok"] is True)
+
+
+def test_invalid_mapping_makes_bridge_unready(readyz, prober, mapping_file, wait_for):
+    assert wait_for(lambda: readyz()[0] == 200)
+    mapping_file.write_text("{invalide", encoding="utf-8")
+    prober.mapping.load()
+    assert wait_for(lambda: readyz()[0] == 503)
+    mapping_file.write_text(json.dumps(MAPPING), encoding="utf-8")
+    prober.mapping.load()
+    assert wait_for(lambda: readyz()[0] == 200)
+
+
+def test_readyz_answers_from_cache(readyz, prober, wait_for):
+    assert wait_for(lambda: readyz()[0] == 200)
+    prober.stop()
+    time.sleep(INTERVAL * 2)
+    calls = len(prober.hc3.recorded)
+    for _ in range(20):
+        readyz()
+    assert len(prober.hc3.recorded) == calls
+    # Sonde arrêtée : le résultat vieillit
+    assert wait_for(lambda: readyz()[1]["status"] == "stale")
+    assert readyz()[0] == 503
+
+
+@pytest.fixture
+def notify_socket(monkeypatch, tmp_path):
+    address = str(tmp_path / "notify.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    listener.bind(address)
+    listener.settimeout(0.5)
+    monkeypatch.setattr(config, "SD_NOTIFY", True)
+    monkeypatch.setenv("NOTIFY_SOCKET", address)
+    yield listener
+    listener.close()
+
+
+def test_ready_notification(notify_socket):
+    assert sd_notify.notify("READY=1")
+    assert notify_socket.recv(64) == b"READY=1"
+
+
+def test_watchdog_from_gunicorn_worker(monkeypatch, notify_socket):
+    monkeypatch.setenv("WATCHDOG_USEC", "30000000")
+    # Worker gunicorn : systemd surveille le maître, parent du worker
+    monkeypatch.setenv("WATCHDOG_PID", str(os.getppid()))
+    assert sd_notify.watchdog_interval() == 30.0
+    monkeypatch.setenv("WATCHDOG_PID", str(os.getpid() + os.getppid()))
+    assert sd_notify.watchdog_interval() is None
+
+
+def drain(listener) -> list:
+    messages = []
+    try:
+        while True:
+            messages.append(listener.recv(64))
+    except socket.timeout:
+        return messages
+
+
+def test_watchdog_beats_only_while_prober_is_alive(monkeypatch, notify_socket, prober):
+    monkeypatch.setenv("WATCHDOG_USEC", "200000")
+    monkeypatch.setenv("WATCHDOG_PID", str(os.getpid()))
+    # Ordonnanceur propre au test : les battements s'arrêtent avec lui
+    scheduler = Scheduler().start()
+    monkeypatch.setattr(sd_notify, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(sd_notify, "_watchdog_started", False)
+    prober.start()
+    try:
+        assert sd_notify.start_watchdog(prober.alive)
+        beats = 0
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            try:
+                beats += notify_socket.recv(64) == b"WATCHDOG=1"
+            except socket.timeout:
+                break
+        # WatchdogSec=0,2 s : un battement toutes les 0,1 s
+        assert beats >= 3
+
+        prober.stop()
+        time.sleep(0.15)
+        notify_socket.settimeout(0.3)
+        drain(notify_socket)
+        assert drain(notify_socket) == []
+    finally:
+        scheduler.stop()
@@ -0,0 +1,201 @@
+"""
+Tests du contrôle des requêtes entrantes (services/inbound_guard.py) devant une HC3
+simulée : débit par source et par périphérique, authentification par jeton ou
+signature HMAC, et même contrôle en mode asynchrone (ASGI).
+"""
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+from services import metrics
+from services.inbound_guard import InboundGuard, set_inbound_guard, sign
+
+THREADS = 8
+DURATION = 0.5
+DEVICES = [f"ipx_flood_{i}" for i in range(1, 9)]
+TOKEN = "s3cret"
+KNOWN = {"REMOTE_ADDR": "10.0.0.1"}
+
+
+def rejected(reason: str) -> float:
+    return metrics.REGISTRY.get("fibaro_inbound_rejected_total").labels(reason).value
+
+
+@pytest.fixture
+def http(monkeypatch, hc3, mapping):
+    """
+    Client de l'application créée avec le contrôle actif, devant la HC3 simulée.
+    """
+    mapping({name: {"fibaro_id": i, "ipx_id": i} for i, name in enumerate(DEVICES, 1)})
+    monkeypatch.setattr(config, "INBOUND_GUARD", True)
+    from app import create_app
+    yield create_app().test_client()
+    set_inbound_guard(None)
+
+
+def flood(http, sources: list, names: list, duration: float = DURATION) -> dict:
+    """
+    THREADS threads envoient les événements de `names` depuis `sources` pendant `duration`.
+
+    Returns:
+        dict: Nombre de réponses par code HTTP, et en-tête Retry-After d'un 429.
+    """
+    counts = {}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def worker(offset: int):
+        i = offset
+        while time.monotonic() < stop:
+            i += 1
+            response = http.get("/ipx-event", query_string={"relais": names[i % len(names)],
+                                                            "etat": "on" if i % 2 else "off"},
+                                environ_base={"REMOTE_ADDR": sources[i % len(sources)]})
+            with lock:
+                counts[response.status_code] = counts.get(response.status_code, 0) + 1
+                if response.status_code == 429:
+                    counts["retry_after"] = response.headers.get("Retry-After")
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        for t in range(THREADS):
+            pool.submit(worker, t * 7)
+    return counts
+
+
+def test_flooding_source_is_capped(http, hc3):
+    set_inbound_guard(InboundGuard(clients=("10.0.0.1",), source_rate=20, source_burst=40,
+                                   device_rate=1000, device_burst=1000))
+    before = rejected("rate_source")
+    start = time.monotonic()
+    counts = flood(http, ["10.0.0.1"], DEVICES)
+    cap = 40 + 20 * (time.monotonic() - start)
+    assert hc3.count() <= cap + THREADS
+    assert counts.get(429, 0) > 0 and counts.get(200, 0) == hc3.count()
+    assert counts["retry_after"] == "1"
+    assert rejected("rate_source") - before == counts[429]
+
+
+def test_flooding_device_leaves_others_served(http, hc3):
+    set_inbound_guard(InboundGuard(clients=("10.0.0.1", "10.0.0.2", "10.0.0.3"), source_rate=1000,
+                                   source_burst=1000, device_rate=5, device_burst=10))
+    before = rejected("rate_device")
+    other = []
+    stop = threading.Event()
+
+    def other_device():
+        while not stop.wait(0.05):
+            other.append(http.get("/ipx-event", query_string={"relais": DEVICES[1], "etat": "on"},
+                                  environ_base={"REMOTE_ADDR": "10.0.0.3"}).status_code)
+
+    thread = threading.Thread(target=other_device)
+    start = time.monotonic()
+    thread.start()
+    counts = flood(http, ["10.0.0.1", "10.0.0.2"], DEVICES[:1])
+    stop.set()
+    thread.join()
+    cap = 10 + 5 * (time.monotonic() - start)
+    assert hc3.count() - other.count(200) <= cap + THREADS
+    assert rejected("rate_device") - before == counts[429]
+    assert other and all(code == 200 for code in other)
+
+
+def test_batch_refuses_only_events_over_the_rate(http):
+    set_inbound_guard(InboundGuard(clients=("10.0.0.3",), device_rate=5, device_burst=10))
+    batch = http.post("/ipx-events", json=[{"relais": DEVICES[2], "etat": "on"}] * 15,
+                      environ_base={"REMOTE_ADDR": "10.0.0.3"}).get_json()
+    assert [result["status"] for result in batch["results"]] == ["OK"] * 10 + ["error"] * 5
+    assert batch["status"] == "partial"
+
+
+def signed_headers(method: str, path: str, query: str, body: bytes, stamp: float = None) -> dict:
+    stamp = str(int(time.time() if stamp is None else stamp))
+    digest = sign(TOKEN.encode(), stamp.encode(), method.encode(), path.encode(), query.encode(), body)
+    return {"X-IPX-Signature": f"{stamp}:{digest}"}
+
+
+@pytest.fixture
+def authenticated(http):
+    set_inbound_guard(InboundGuard(token=TOKEN, clients=("10.0.0.1",), allow_unknown=False))
+    return http
+
+
+QUERY = {"relais": DEVICES[3], "etat": "on"}
+
+
+def test_token(authenticated):
+    http = authenticated
+    before = rejected("auth")
+    assert http.get("/ipx-event", query_string=QUERY, environ_base=KNOWN).status_code == 401
+    assert http.get("/ipx-event", query_string=dict(QUERY, token="x"), environ_base=KNOWN).status_code == 401
+    assert http.get("/ipx-event", query_string=dict(QUERY, token=TOKEN), environ_base=KNOWN).status_code == 200
+    assert http.get("/ipx-event", query_string=QUERY, headers={"X-IPX-Token": TOKEN},
+                    environ_base=KNOWN).status_code == 200
+    assert rejected("auth") - before == 2
+
+
+def test_signature(authenticated, hc3):
+    http = authenticated
+    body = json.dumps({"relais": DEVICES[3], "etat": "off"}).encode()
+
+    def post(data: bytes, stamp: float = None) -> int:
+        return http.post("/ipx-event", data=data, content_type="application/json", environ_base=KNOWN,
+                         headers=signed_headers("POST", "/ipx-event", "", body, stamp)).status_code
+
+    assert post(body) == 200 and hc3.states.get(4) is False
+    # Corps modifié après signature, puis signature périmée
+    assert post(body.replace(b"off", b"on")) == 401
+    assert post(body, time.time() - 600) == 401
+
+
+def test_unknown_source_is_forbidden(authenticated):
+    response = authenticated.get("/ipx-event", query_string=dict(QUERY, token=TOKEN),
+                                 environ_base={"REMOTE_ADDR": "10.9.9.9"})
+    assert response.status_code == 403
+
+
+def test_guarded_routes(authenticated):
+    http = authenticated
+    alarm = {"device": DEVICES[3], "state": "on"}
+    assert http.post("/ipx-alarms", json=alarm, environ_base=KNOWN).status_code == 401
+    assert http.post("/ipx-alarms", json=alarm, environ_base=KNOWN, headers={"X-IPX-Token": TOKEN}).status_code == 200
+    # Routes hors IPX non contrôlées
+    assert http.get("/metrics", environ_base=KNOWN).status_code == 200
+
+
+def asgi_request(app, path: str, query: bytes, client: str = "10.0.0.1") -> int:
+    """
+    Envoie une requête GET à l'application ASGI sans serveur et retourne le code HTTP.
+    """
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query, "headers": [],
+             "client": (client, 40000), "server": ("127.0.0.1", 80), "scheme": "http", "root_path": ""}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return sent[0]["status"]
+
+
+def test_async_mode_is_guarded(http):
+    from asgi import AsyncIPXApp
+    app = AsyncIPXApp(http.application, threads=2)
+    set_inbound_guard(InboundGuard(token=TOKEN, clients=("10.0.0.1",), device_burst=1, device_rate=0.01))
+    query = f"relais={DEVICES[4]}&etat=on".encode()
+    try:
+        assert asgi_request(app, "/ipx-event", query) == 401
+        assert asgi_request(app, "/ipx-event", query + f"&token={TOKEN}".encode()) == 200
+        assert asgi_request(app, "/ipx-event", query + f"&token={TOKEN}".encode()) == 429
+        # Route servie par Flask : même contrôle
+        assert asgi_request(app, "/ipx-events", b"") == 401
+    finally:
+        app.executor.shutdown()
@@ -0,0 +1,76 @@
+"""
+Tests de la route de lot /ipx-events (routes/fibaro_routes.py) : formats de corps
+acceptés et résultat par événement, devant une HC3 simulée.
+"""
+
+import json
+
+import pytest
+
+import config
+
+MAPPING = {
+    "ipx_congelateur": {"fibaro_id": 20, "ipx_id": 1},
+    "ipx_test": {"fibaro_id": 27, "ipx_id": 2},
+}
+
+
+@pytest.fixture
+def batch(hc3, mapping, http):
+    mapping(MAPPING)
+
+    def post(**kwargs):
+        response = http.post("/ipx-events", **kwargs)
+        return response.status_code, response.get_json()
+    return post
+
+
+def summary(body: dict) -> list:
+    return [(result.get("ipx_name"), result["status"]) for result in body["results"]]
+
+
+ALL_OK = [("ipx_congelateur", "OK"), ("ipx_test", "OK")]
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"json": [{"relais": "ipx_congelateur", "etat": "on"}, {"relais": "ipx_test", "etat": "off"}]},
+    {"json": {"events": [{"device_id": "1", "etat": "on"}, {"relais": 2, "etat": "off"}]}},
+    {"data": "relais=1&etat=on;relais=ipx_test&etat=off", "content_type": "text/plain"},
+    {"data": "relais=ipx_congelateur&etat=on\ndevice_id=2&etat=off\n", "content_type": "text/plain"},
+    {"data": "1=on&2=off", "content_type": "text/plain"},
+], ids=["json_list", "json_events", "semicolons", "lines", "short_form"])
+def test_accepted_formats(batch, hc3, kwargs):
+    code, body = batch(**kwargs)
+    assert code == 200
+    assert body["status"] == "OK" and body["count"] == 2
+    assert summary(body) == ALL_OK
+    assert hc3.states.get(20) is True and hc3.states.get(27) is False
+
+
+def test_partial_failure_keeps_order(batch, hc3):
+    code, body = batch(json=[{"relais": "ipx_inconnu", "etat": "on"}, {"relais": "ipx_test", "etat": "on"},
+                             "pas un objet", {"relais": "ipx_congelateur"}])
+    assert code == 200 and body["status"] == "partial" and body["count"] == 4
+    assert [result["status"] for result in body["results"]] == ["error", "OK", "error", "error"]
+    assert hc3.count() == 1 and hc3.states.get(27) is True
+
+
+def test_all_items_invalid(batch, hc3):
+    code, body = batch(data="relais=ipx_inconnu&etat=on", content_type="text/plain")
+    assert code == 200 and body["status"] == "error"
+    assert hc3.count() == 0
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"json": []},
+    {"json": {"relais": "ipx_test", "etat": "on"}},
+    {"data": "rien à lire", "content_type": "text/plain"},
+    {"data": json.dumps("texte"), "content_type": "application/json"},
+])
+def test_unreadable_body(batch, kwargs):
+    assert batch(**kwargs)[0] == 400
+
+
+def test_batch_size_limit(monkeypatch, batch):
+    monkeypatch.setattr(config, "BATCH_MAX_ITEMS", 3)
+    assert batch(data="1=on;2=on;1=off;2=off", content_type="text/plain")[0] == 413
@@ -0,0 +1,102 @@
+"""
+Tests du parseur des requêtes /ipx-event (services/ipx_parser.py).
+
+Propriété : sur des requêtes générées (formats, Content-Type, clés en double, valeurs
+vides, casse et espaces de l'état), le parseur donne le même relais, le même état et
+la même décision « données manquantes » que l'ancienne extraction de la route.
+"""
+
+import json
+from urllib.parse import quote_plus
+
+from flask import Flask, request
+from hypothesis import given, settings, strategies as st
+
+from services.ipx_parser import normalize_etat, parse_ipx_request
+
+app = Flask("test_ipx_parser")
+
+VALUES = ["ipx_congelateur", "ipx_test", "3", " 07 ", "12", "", "on", "OFF", " 1 ", "0", "true",
+          "TurnOn", "bof", "a b", "%41", "é"]
+KEYS = ["relais", "device_id", "etat", "autre"]
+
+
+def legacy_parse():
+    """
+    Ancienne extraction de handle_ipx_event, à appeler dans un contexte de requête.
+    """
+    ipx_name = request.args.get('relais') or request.form.get('relais')
+    etat = request.args.get('etat') or request.form.get('etat')
+    if not ipx_name or not etat:
+        json_data = request.get_json(silent=True)
+        if json_data:
+            ipx_name = ipx_name or json_data.get('device_id') or json_data.get('relais')
+            etat = etat or json_data.get('etat')
+    if not ipx_name or not etat:
+        raw = request.data.decode(errors='ignore').strip()
+        if raw and '=' in raw:
+            params = dict(pair.split('=', 1) for pair in raw.split('&') if '=' in pair)
+            ipx_name = ipx_name or params.get('device_id') or params.get('relais')
+            etat = etat or params.get('etat')
+    return ipx_name, etat
+
+
+def context(query: str, body: bytes, content_type):
+    return app.test_request_context("/ipx-event", method="POST", query_string=query, data=body,
+                                    content_type=content_type)
+
+
+def encode(pairs, quote: bool) -> str:
+    if quote:
+        return "&".join(f"{quote_plus(k)}={quote_plus(v)}" for k, v in pairs)
+    return "&".join(f"{k}={v}" for k, v in pairs)
+
+
+pairs = st.lists(st.tuples(st.sampled_from(KEYS), st.sampled_from(VALUES)), max_size=4)
+
+
+@st.composite
+def json_bodies(draw):
+    data = {}
+    for key, value in draw(pairs):
+        # Un numéro peut arriver en nombre JSON
+        data[key] = int(value) if value.strip().isdigit() and draw(st.booleans()) else value
+    content_type = draw(st.sampled_from(["application/json", "application/json; charset=utf-8"]))
+    return json.dumps(data).encode(), content_type
+
+
+bodies = st.one_of(
+    pairs.map(lambda p: (encode(p, quote=True).encode(), "application/x-www-form-urlencoded")),
+    json_bodies(),
+    st.tuples(pairs.map(lambda p: encode(p, quote=False).encode()), st.sampled_from(["text/plain", None])),
+    st.just((b"", None)),
+)
+
+
+@settings(max_examples=500, deadline=None)
+@given(query=st.one_of(st.just(""), pairs.map(lambda p: encode(p, quote=True))), body=bodies)
+def test_parser_matches_legacy_extraction(query, body):
+    body, content_type = body
+    with context(query, body, content_type):
+        expected_relais, expected_etat = legacy_parse()
+    with context(query, body, content_type):
+        event = parse_ipx_request(request)
+
+    expected_complete = bool(expected_relais) and bool(expected_etat)
+    assert event.complete == expected_complete
+    if expected_complete:
+        assert event.relais == expected_relais
+        assert event.etat == normalize_etat(expected_etat)[0]
+
+
+def test_json_body_without_json_content_type():
+    # Écart volontaire : l'ancienne route répondait 400
+    with context("", b'{"relais": "ipx_test", "etat": "on"}', "text/plain"):
+        event = parse_ipx_request(request)
+    assert (event.relais, event.action) == ("ipx_test", "turnOn")
+
+
+def test_numeric_relay_and_etat_normalization():
+    with context("relais=%2003%20&etat=%20ON%20", b"", None):
+        event = parse_ipx_request(request)
+    assert (event.relay, event.etat, event.action) == (3, "on", "turnOn")
@@ -0,0 +1,96 @@
+"""
+Tests du logger (services/logger_service.py) : file bornée qui abandonne la ligne
+la plus ancienne, signalement des lignes perdues, arrêt et relance après un fork.
+"""
+
+import logging
+import os
+import queue
+import threading
+
+import pytest
+
+from services import logger_service
+from services.logger_service import DropOldestQueueHandler, _LogListener
+
+QUEUE_SIZE = 3
+
+
+class BlockedHandler(logging.Handler):
+    """
+    Handler lent : bloqué sur sa première ligne jusqu'à release().
+    """
+
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.messages = []
+        self.entered = threading.Event()
+        self._release = threading.Event()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.entered.set()
+        self._release.wait(5)
+        self.messages.append(record.getMessage())
+
+    def release(self) -> None:
+        self._release.set()
+
+
+@pytest.fixture
+def blocked():
+    """
+    (handler de file, handler bloqué, listener) : le listener est bloqué sur "r0".
+    """
+    handler = DropOldestQueueHandler(queue.Queue(maxsize=QUEUE_SIZE))
+    slow = BlockedHandler()
+    listener = _LogListener(handler.queue, handler, slow)
+    listener.start()
+    log(handler, "r0")
+    assert slow.entered.wait(2)
+    yield handler, slow, listener
+    slow.release()
+    if listener._thread is not None:
+        listener.stop()
+
+
+def log(handler: DropOldestQueueHandler, *messages: str) -> None:
+    for message in messages:
+        handler.handle(logging.makeLogRecord({"msg": message, "levelno": logging.INFO, "levelname": "INFO"}))
+
+
+def test_full_queue_drops_oldest_and_reports(blocked):
+    handler, slow, listener = blocked
+    log(handler, "r1", "r2", "r3", "r4", "r5")
+    assert handler.dropped == 2
+    slow.release()
+    listener.stop()
+    assert slow.messages == ["r0", "2 ligne(s) de log perdue(s) : file d'écriture pleine", "r3", "r4", "r5"]
+
+
+def test_stop_sentinel_is_never_dropped(blocked, wait_for):
+    handler, slow, listener = blocked
+    log(handler, "r1", "r2")
+    # Arrêt demandé file pleine : la sentinelle attend derrière r1 et r2
+    stopper = threading.Thread(target=listener.stop)
+    stopper.start()
+    assert wait_for(lambda: handler.queue.full())
+    # Trois lignes de plus : sans protection, la troisième évincerait la sentinelle
+    log(handler, "r3", "r4", "r5")
+    slow.release()
+    stopper.join(2)
+    assert not stopper.is_alive()
+    assert slow.messages[0] == "r0" and slow.messages[-2:] == ["r3", "r4"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork indisponible")
+def test_writer_thread_restarted_after_fork():
+    parent_queue = logger_service.queue_handler.queue
+    pid = os.fork()
+    if pid == 0:
+        # Processus fils : nouvelle file et thread d'écriture vivant
+        listener = logger_service._listener
+        ok = (logger_service.queue_handler.queue is not parent_queue and listener is not None
+              and listener._thread.is_alive())
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
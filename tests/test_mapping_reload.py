@@ -0,0 +1,94 @@
+"""
+Tests du rechargement à chaud du mapping (services/device_mapping.py).
+"""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from services.device_mapping import build_snapshot, get_fibaro_id, registry
+
+VERSION_A = {"ipx_congelateur": 20, "ipx_test": 27, "ipx_ajout": {"fibaro_id": 99, "ipx_id": 199}}
+VERSION_B = {"ipx_congelateur": {"fibaro_id": 21, "ipx_id": 120}, "ipx_test": 28}
+
+
+def write_atomic(path: str, data, bump: int = 0) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+    os.replace(tmp, path)
+    # Horodatage distinct même sur un système de fichiers à résolution grossière
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + bump))
+
+
+def test_reload_installs_new_version(mapping):
+    path = mapping(VERSION_A)
+    version = registry.snapshot.version
+    write_atomic(path, VERSION_B, 1)
+    assert registry.reload_if_changed()
+    assert registry.snapshot.version == version + 1
+    assert get_fibaro_id("ipx_congelateur") == 21
+    assert get_fibaro_id("ipx_ajout") is None
+    assert not registry.reload_if_changed()
+
+
+def test_invalid_file_keeps_previous_version(mapping):
+    path = mapping(VERSION_A)
+    snapshot = registry.snapshot
+    write_atomic(path, "{invalide", 1)
+    assert not registry.reload_if_changed()
+    assert registry.snapshot is snapshot
+    assert registry.last_error is not None
+    write_atomic(path, {"ipx_a": {"fibaro_id": "x"}}, 2)
+    assert not registry.reload_if_changed()
+    assert registry.snapshot is snapshot
+
+
+def test_duplicate_ipx_id_is_rejected():
+    with pytest.raises(ValueError):
+        build_snapshot({"ipx_a": {"fibaro_id": 1, "ipx_id": 5}, "ipx_b": {"fibaro_id": 2, "ipx_id": 5}})
+
+
+def test_requests_never_see_a_partial_mapping(mapping, hc3):
+    """
+    Des threads envoient des événements pendant que le fichier alterne entre deux
+    versions : chaque requête voit l'une ou l'autre, jamais un mapping incomplet.
+    """
+    path = mapping(VERSION_A)
+    from app import create_app
+    app = create_app()
+    stop = threading.Event()
+    errors, done = [], [0]
+    lock = threading.Lock()
+
+    def load_generator():
+        client = app.test_client()
+        while not stop.is_set():
+            for relais in ("ipx_congelateur", "ipx_test"):
+                response = client.get("/ipx-event", query_string={"relais": relais, "etat": "on"})
+                body = response.get_json()
+                with lock:
+                    done[0] += 1
+                    if response.status_code != 200 or body.get("device") not in (20, 21, 27, 28):
+                        errors.append((relais, response.status_code, body))
+
+    workers = [threading.Thread(target=load_generator) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    reloads = 0
+    deadline = time.monotonic() + 1.0
+    try:
+        while time.monotonic() < deadline:
+            write_atomic(path, VERSION_B if reloads % 2 == 0 else VERSION_A, reloads)
+            if registry.reload_if_changed():
+                reloads += 1
+            time.sleep(0.005)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    assert reloads > 10 and done[0] > 10
+    assert errors == []
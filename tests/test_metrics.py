@@ -0,0 +1,79 @@
+"""
+Tests du registre de métriques (services/metrics.py) et de /metrics.
+"""
+
+import sys
+import threading
+
+import pytest
+
+from services import metrics
+from services.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_base_metric_is_abstract():
+    with pytest.raises(TypeError):
+        metrics._Metric("test_total", "doc")
+
+
+def test_render_counter_gauge_histogram():
+    registry = MetricsRegistry()
+    requests = registry.register(Counter("test_requests_total", "Requêtes", ("route",)))
+    queue = registry.register(Gauge("test_queue_size", "File"))
+    latency = registry.register(Histogram("test_latency_seconds", "Latence", buckets=(0.1, 1.0)))
+
+    requests.labels("/ipx-event").inc()
+    requests.labels("/ipx-event").inc(2)
+    queue.set_function(lambda: 7)
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    text = registry.render()
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{route="/ipx-event"} 3' in text
+    assert 'test_queue_size 7' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count 2' in text
+
+
+def test_label_values_are_checked_and_escaped():
+    counter = Counter("test_escape_total", "doc", ("name",))
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+    counter.labels('a"b\n').inc()
+    registry = MetricsRegistry()
+    registry.register(counter)
+    assert 'test_escape_total{name="a\\"b\\n"} 1' in registry.render()
+
+
+def test_failing_gauge_function_is_omitted():
+    gauge = Gauge("test_broken", "doc")
+    gauge.set_function(lambda: 1 / 0)
+    registry = MetricsRegistry()
+    registry.register(gauge)
+    assert "\ntest_broken " not in registry.render()
+
+
+def test_register_keeps_existing_metric():
+    registry = MetricsRegistry()
+    first = registry.register(Counter("test_same_total", "doc"))
+    assert registry.register(Counter("test_same_total", "doc")) is first
+
+
+def test_metrics_route(http):
+    response = http.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE" in response.get_data(as_text=True)
+
+
+def test_scrape_does_not_start_lazy_queues(monkeypatch, http):
+    # Modules déjà importés par d'autres tests : retirés le temps du test
+    monkeypatch.delitem(sys.modules, "avertissements.sms_dispatcher", raising=False)
+    monkeypatch.delitem(sys.modules, "services.event_journal", raising=False)
+    threads = {thread.name for thread in threading.enumerate()}
+    text = http.get("/metrics").get_data(as_text=True)
+    assert 'fibaro_queue_depth{queue="log"}' in text
+    assert "avertissements.sms_dispatcher" not in sys.modules
+    assert "services.event_journal" not in sys.modules
+    assert {thread.name for thread in threading.enumerate()} <= threads
@@ -0,0 +1,75 @@
+"""
+Tests de la boîte d'envoi persistante (services/outbox.py).
+"""
+
+import queue
+
+import pytest
+
+import config
+from controllers import control
+from services.outbox import Outbox
+
+
+def command(device: int, action: str) -> dict:
+    return {"status": "OK", "device": device, "ipx_name": f"ipx_{device}",
+            "etat": "on" if action == "turnOn" else "off", "action": action}
+
+
+@pytest.fixture(params=[True, False], ids=["group_commit", "direct"])
+def outbox(request, tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), group_commit=request.param).start()
+    yield outbox
+    outbox.stop()
+
+
+def pending(outbox) -> dict:
+    # Vide la file de validation avant de relire la base
+    outbox.stop()
+    return {entry["device"]: entry["action"] for entry in outbox.pending()}
+
+
+def test_put_then_ack(outbox):
+    assert outbox.put(command(20, "turnOn"))
+    assert outbox.put(command(27, "turnOn"))
+    outbox.ack(20, "turnOn")
+    # Une commande différente plus récente reste en attente
+    outbox.put(command(27, "turnOff"))
+    outbox.ack(27, "turnOn")
+    assert pending(outbox) == {27: "turnOff"}
+
+
+def test_failed_commit_is_reported(outbox):
+    with outbox._lock:
+        outbox._connection.execute("DROP TABLE outbox")
+    assert not outbox.put(command(20, "turnOn"))
+
+
+def test_withdraw_keeps_newer_command(outbox):
+    outbox.put(command(20, "turnOn"), "first")
+    outbox.put(command(20, "turnOn"), "second")
+    outbox.withdraw(20, "first")
+    assert pending(outbox) == {20: "turnOn"}
+    outbox.start().withdraw(20, "second")
+    assert pending(outbox) == {}
+
+
+def test_refused_command_does_not_remove_newer_one(monkeypatch, tmp_path):
+    """
+    File d'envoi pleine : seule la ligne de la commande refusée est retirée, pas
+    celle d'une commande identique acceptée entre-temps pour le même périphérique.
+    """
+    outbox = Outbox(str(tmp_path / "outbox.db"), group_commit=False)
+    monkeypatch.setattr(config, "OUTBOX", True)
+    monkeypatch.setattr(control, "_outbox", outbox)
+
+    class FullDispatcher:
+        def submit(self, queued):
+            # Une autre requête enregistre le même état pendant ce temps
+            control.accept_ipx_command(command(20, "turnOn"))
+            raise queue.Full
+
+    monkeypatch.setattr(control, "_command_dispatcher", lambda queued: FullDispatcher())
+    with pytest.raises(queue.Full):
+        control.submit_ipx_command(command(20, "turnOn"))
+    assert [entry["device"] for entry in outbox.pending()] == [20]
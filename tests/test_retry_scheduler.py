@@ -0,0 +1,167 @@
+"""
+Tests de l'étage de reprise (services/retry_scheduler.py).
+"""
+
+import random
+import threading
+import time
+
+import pytest
+
+import config
+from controllers import control
+from services.retry_scheduler import RetryScheduler, is_retryable
+from services.scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeHC3:
+    """
+    HC3 simulée au niveau de l'envoi : réponses programmées et envois bloquables.
+    """
+
+    def __init__(self):
+        self.delivered = []
+        self.results = []
+        self.gates = {}
+
+    def send(self, device_id, action):
+        gate = self.gates.get(action)
+        if gate is not None:
+            # Latence avant que la commande n'atteigne la HC3
+            gate.wait(2)
+        self.delivered.append(action)
+        return self.results.pop(0) if self.results else {"status": "success"}
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def fake():
+    return FakeHC3()
+
+
+@pytest.fixture
+def retry(fake, clock):
+    retry = RetryScheduler(fake.send, base_delay=1.0, max_delay=8.0, jitter=0.0, ttl=30.0,
+                           scheduler=Scheduler(clock), clock=clock, rng=random.Random(0))
+    yield retry
+    retry._executor.shutdown(wait=True)
+
+
+def fire(retry, clock, delay: float) -> None:
+    clock.now += delay
+    retry.scheduler.run_due()
+    # Les tentatives partent du pool de threads
+    retry._executor.submit(lambda: None).result()
+
+
+def test_is_retryable():
+    assert is_retryable({"status": "open"})
+    assert is_retryable({"status": "failed", "code": 503})
+    assert not is_retryable({"status": "failed", "code": 404})
+    assert not is_retryable({"status": "success"})
+
+
+def test_backoff_until_success(retry, fake, clock):
+    fake.results = [{"status": "error"}, {"status": "error"}]
+    retry.submit(20, "turnOn")
+    fire(retry, clock, 1.0)
+    fire(retry, clock, 2.0)
+    assert retry.pending() == 1
+    # Troisième délai : 4 s, rien avant
+    fire(retry, clock, 3.0)
+    assert fake.delivered == ["turnOn", "turnOn"]
+    fire(retry, clock, 1.0)
+    assert fake.delivered == ["turnOn"] * 3
+    assert retry.stats()["pending"] == 0 and retry.stats()["sent"] == 1
+
+
+def test_newer_state_replaces_pending_one(retry, fake, clock):
+    retry.submit(20, "turnOn")
+    retry.submit(20, "turnOff")
+    assert retry.pending_action(20) == "turnOff"
+    fire(retry, clock, 1.0)
+    assert fake.delivered == ["turnOff"]
+
+
+def test_refused_command_is_dropped(retry, fake, clock):
+    fake.results = [{"status": "failed", "code": 404}]
+    retry.submit(20, "turnOn")
+    fire(retry, clock, 1.0)
+    assert retry.pending() == 0 and retry.stats()["dropped"] == 1
+
+
+def test_expired_command_is_not_sent(retry, fake, clock):
+    retry.submit(20, "turnOn")
+    fire(retry, clock, 31.0)
+    assert fake.delivered == []
+    assert retry.stats()["expired"] == 1
+
+
+def test_cancelled_attempt_waiting_for_device_is_not_sent(retry, fake, clock):
+    """
+    La reprise est lancée pendant un envoi direct : annulée par celui-ci, elle ne
+    part pas après lui.
+    """
+    retry.submit(20, "turnOn")
+    with retry.device_lock(20):
+        clock.now += 1.0
+        retry.scheduler.run_due()
+        fake.send(20, "turnOff")
+        retry.cancel(20)
+        assert retry.pending() == 0
+    retry._executor.submit(lambda: None).result()
+    assert fake.delivered == ["turnOff"]
+    assert retry._slots == {}
+
+
+@pytest.fixture
+def direct(monkeypatch, retry, fake):
+    # Chemin normal de control.py, branché sur la même HC3 simulée
+    monkeypatch.setattr(config, "RETRY_QUEUE", True)
+    monkeypatch.setattr(config, "OUTBOX", False)
+    monkeypatch.setattr(control, "_retry_scheduler", retry)
+    monkeypatch.setattr(control, "_call_hc3", fake.send)
+    return control._send_action
+
+
+def test_direct_send_waits_for_in_flight_retry(direct, retry, fake, clock, wait_for):
+    """
+    HC3 lente pour la reprise turnOn : l'envoi direct turnOff, plus récent, doit
+    arriver après elle pour que le relais finisse éteint.
+    """
+    fake.gates["turnOn"] = gate = threading.Event()
+    retry.submit(20, "turnOn")
+    clock.now += 1.0
+    retry.scheduler.run_due()
+    assert wait_for(lambda: retry.device_lock(20).locked())
+
+    sender = threading.Thread(target=direct, args=(20, "turnOff"))
+    sender.start()
+    time.sleep(0.05)
+    assert fake.delivered == []
+    gate.set()
+    sender.join(2)
+    assert fake.delivered == ["turnOn", "turnOff"]
+    assert retry.pending() == 0
+
+
+def test_direct_failure_is_handed_to_retry(direct, retry, fake, clock):
+    fake.results = [{"status": "open", "retry_after": 2.0}]
+    assert direct(20, "turnOn")["status"] == "retry"
+    fire(retry, clock, 1.0)
+    assert fake.delivered == ["turnOn"]
+    fire(retry, clock, 1.0)
+    assert fake.delivered == ["turnOn", "turnOn"]
+    assert retry.pending() == 0
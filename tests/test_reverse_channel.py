@@ -0,0 +1,173 @@
+"""
+Tests de bout en bout du canal retour HC3 → IPX800 (services/reverse_channel.py),
+avec la HC3 simulée, l'IPX800 simulé et le pont servi en HTTP. L'IPX800 simulé
+notifie le pont (/ipx-event) à chaque changement de relais, comme le vrai.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+import config
+from simulator.ipx800 import StubIPX800
+from services.fibaro_service import FibaroClient
+from services.inbound_guard import InboundGuard, set_inbound_guard, sign
+from services.ipx_client import IPXClient
+from services.reverse_channel import ReverseChannel, set_reverse_channel
+from services.state_mirror import DeviceStateMirror, get_state_mirror, set_state_mirror
+
+MAPPING = {
+    "ipx_congelateur": {"fibaro_id": 20, "ipx_id": 1, "ipx_output": 1},
+    "ipx_test": {"fibaro_id": 27, "ipx_id": 2, "ipx_output": 2},
+    "ipx_essai": 8,
+}
+
+
+def hc3_actions(hc3) -> list:
+    with hc3.lock:
+        return [payload for method, path, payload in hc3.recorded if path == "/api/callAction"]
+
+
+@pytest.fixture
+def ipx():
+    ipx = StubIPX800().start()
+    yield ipx
+    ipx.stop()
+
+
+@pytest.fixture
+def channel(monkeypatch, hc3, mapping, ipx):
+    monkeypatch.setattr(config, "REVERSE_CHANNEL", True)
+    monkeypatch.setattr(config, "REVERSE_CHANNEL_SOURCE", "poll")
+    hc3.states.update({20: False, 27: False, 8: False})
+    hc3.poll_hold = 0.5
+    mapping(MAPPING)
+    mirror = DeviceStateMirror(FibaroClient(base_url=hc3.base_url, user="test", password="test", pool_size=1),
+                               poll_timeout=5, retry_delay=0.2)
+    set_state_mirror(mirror)
+    channel = ReverseChannel(IPXClient(base_url=ipx.base_url), echo_ttl=3)
+    set_reverse_channel(channel)
+    yield channel
+    set_reverse_channel(None)
+    set_state_mirror(None)
+
+
+@pytest.fixture
+def bridge(channel, ipx, wait_for):
+    """
+    Pont servi en HTTP (create_app démarre le canal retour et le miroir), notifié par l'IPX800.
+    """
+    from app import create_app
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ipx.push_url = f"http://127.0.0.1:{server.server_port}/ipx-event"
+    assert wait_for(lambda: get_state_mirror().ready, 5)
+    yield server
+    server.shutdown()
+
+
+def test_hc3_change_drives_relay_without_echo(bridge, hc3, ipx, wait_for):
+    hc3.push_change(20, True)
+    assert wait_for(lambda: ipx.relays.get(1) is True, 5)
+    assert wait_for(lambda: ipx.pushes >= 1)
+    time.sleep(0.2)
+    # La notification de l'IPX800 qui en découle n'est pas renvoyée à la HC3
+    assert hc3_actions(hc3) == []
+
+
+def test_ipx_press_reaches_hc3_without_echo(bridge, channel, hc3, ipx, wait_for):
+    ipx.press(2, True)
+    assert wait_for(lambda: hc3.states.get(27) is True, 5)
+    # Le changement refreshStates qui en découle est reconnu comme écho
+    assert wait_for(lambda: channel.counts["echo"] >= 1, 5)
+    time.sleep(0.2)
+    with ipx.lock:
+        assert ("SetR", 2) not in ipx.recorded
+
+
+def test_last_state_wins(bridge, channel, hc3, ipx, wait_for):
+    for value in (True, False, True, False):
+        hc3.push_change(20, value)
+    assert wait_for(lambda: ipx.relays.get(1) is False and channel.pending() == 0, 5)
+
+
+def test_device_without_output_is_ignored(bridge, channel, hc3, wait_for):
+    unmapped = channel.counts["unmapped"]
+    hc3.push_change(8, True)
+    assert wait_for(lambda: channel.counts["unmapped"] > unmapped, 5)
+
+
+@pytest.fixture
+def webhook(monkeypatch, channel):
+    monkeypatch.setattr(config, "REVERSE_CHANNEL_SOURCE", "webhook")
+    monkeypatch.setattr(config, "INBOUND_GUARD", True)
+    monkeypatch.setattr(config, "INBOUND_TOKEN", "secret")
+    set_inbound_guard(InboundGuard("secret"))
+    yield channel
+    set_inbound_guard(None)
+
+
+CHANGE = json.dumps({"changes": [{"id": 27, "value": 1}]})
+
+
+def test_webhook_requires_authentication(webhook, http, ipx):
+    response = http.post("/hc3-event", data=CHANGE, content_type="application/json")
+    assert response.status_code == 401
+    response = http.post("/hc3-event", data=CHANGE, content_type="application/json",
+                         headers={"X-IPX-Token": "faux"})
+    assert response.status_code == 401
+    assert ipx.recorded == []
+
+
+def test_webhook_with_token_drives_relay(webhook, http, ipx, wait_for):
+    response = http.post("/hc3-event?token=secret", data=CHANGE, content_type="application/json")
+    assert response.status_code == 200 and response.get_json()["count"] == 1
+    assert wait_for(lambda: ipx.relays.get(2) is True)
+
+
+def test_webhook_with_signature_drives_relay(webhook, http, ipx, wait_for):
+    stamp = str(int(time.time()))
+    digest = sign(b"secret", stamp.encode(), b"POST", b"/hc3-event", b"", CHANGE.encode())
+    response = http.post("/hc3-event", data=CHANGE, content_type="application/json",
+                         headers={"X-IPX-Signature": f"{stamp}:{digest}"})
+    assert response.status_code == 200
+    assert wait_for(lambda: ipx.relays.get(2) is True)
+
+
+def test_webhook_refused_without_inbound_token(monkeypatch, webhook):
+    monkeypatch.setattr(config, "INBOUND_GUARD", False)
+    from app import create_app
+    response = create_app().test_client().post("/hc3-event", data=CHANGE, content_type="application/json")
+    assert response.status_code == 503
+
+
+def test_webhook_requires_authentication_in_async_mode(webhook, ipx):
+    from app import create_app
+    from asgi import AsyncIPXApp
+    app = AsyncIPXApp(create_app(), threads=1)
+
+    def call(query: bytes) -> int:
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": CHANGE.encode(), "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/hc3-event", "raw_path": b"/hc3-event",
+                 "query_string": query, "headers": [(b"content-type", b"application/json")],
+                 "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 80), "scheme": "http",
+                 "http_version": "1.1", "root_path": ""}
+        asyncio.run(app(scope, receive, send))
+        return messages[0]["status"]
+
+    try:
+        assert call(b"") == 401
+        assert call(b"token=secret") == 200
+    finally:
+        app.executor.shutdown()
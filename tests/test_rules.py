@@ -0,0 +1,211 @@
+"""
+Tests du moteur de règles (services/rules.py) avec une horloge simulée.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import config
+from services.rules import RULES_EVENTS, RuleEngine, RulesRegistry, set_rule_engine
+from services.scheduler import Scheduler
+
+RULES = {"rules": [
+    {"name": "entree_x", "when": {"device": "ipx_entree_x", "etat": "on"},
+     "then": [{"action": "turnOn", "device": 30}, {"action": "turnOn", "device": 31},
+              {"action": "turnOn", "device": 32}]},
+    {"name": "congelateur", "when": {"device": "ipx_congelateur", "etat": "off", "for": 120},
+     "then": [{"sms": True}, {"action": "turnOn", "device": 45}]},
+    {"name": "portail_nuit", "when": {"device": "ipx_portail", "etat": "on", "between": ["22:00", "06:00"]},
+     "then": [{"action": "turnOn", "device": 50}, {"action": "turnOff", "device": 50, "delay": 300}]},
+]}
+
+
+def write_atomic(path: str, data, bump: int = 0) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+    os.replace(tmp, path)
+    # Horodatage distinct même sur un système de fichiers à résolution grossière
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + bump))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Steps:
+    """
+    Étapes exécutées par le moteur : (opérations, alertes SMS).
+    """
+
+    def __init__(self):
+        self.executed = []
+        self.done = threading.Condition()
+
+    def __call__(self, operations, alerts):
+        with self.done:
+            self.executed.append(([operation.label for operation in operations], list(alerts)))
+            self.done.notify_all()
+
+    def drain(self, count: int) -> list:
+        # Les étapes s'exécutent dans le pool du moteur : attente bornée
+        with self.done:
+            self.done.wait_for(lambda: len(self.executed) >= count, timeout=2.0)
+            steps, self.executed = self.executed, []
+        return steps
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = str(tmp_path / "rules.json")
+    write_atomic(path, RULES)
+    return path
+
+
+@pytest.fixture
+def registry(rules_path):
+    registry = RulesRegistry(rules_path)
+    assert registry.load()
+    return registry
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def steps():
+    return Steps()
+
+
+@pytest.fixture
+def hour():
+    # Heure murale vue par le moteur (minute 30)
+    return [12]
+
+
+@pytest.fixture
+def engine(registry, clock, steps, hour):
+    return RuleEngine(registry, execute=steps, scheduler=Scheduler(clock),
+                      now=lambda: datetime(2026, 1, 1, hour[0], 30))
+
+
+def advance(engine, clock, seconds: float) -> None:
+    clock.now += seconds
+    engine.scheduler.run_due()
+
+
+def test_one_input_drives_three_devices(engine, steps):
+    assert engine.on_event("ipx_entree_x", "on") == 1
+    assert steps.drain(1) == [(["turnOn"] * 3, [])]
+    assert engine.on_event("ipx_entree_x", "off") == 0
+
+
+def test_held_state_fires_once_after_delay(engine, steps, clock):
+    engine.on_event("ipx_congelateur", "off")
+    advance(engine, clock, 60)
+    assert steps.drain(0) == [] and engine.pending() == 1
+    # Un off répété ne repousse pas l'échéance
+    engine.on_event("ipx_congelateur", "off")
+    advance(engine, clock, 61)
+    assert steps.drain(1) == [(["turnOn"], ["ipx_congelateur"])]
+
+
+def test_held_state_cancelled_by_return_to_on(engine, steps, clock):
+    engine.on_event("ipx_congelateur", "off")
+    clock.now += 100
+    engine.on_event("ipx_congelateur", "on")
+    advance(engine, clock, 100)
+    assert steps.drain(0) == [] and engine.pending() == 0
+
+
+def test_time_window_across_midnight(engine, steps, hour):
+    assert engine.on_event("ipx_portail", "on") == 0
+    hour[0] = 23
+    assert engine.on_event("ipx_portail", "on") == 1
+    hour[0] = 3
+    assert engine.on_event("ipx_portail", "on") == 1
+    assert len(steps.drain(2)) == 2
+
+
+def test_delayed_action_uses_the_scheduler(engine, steps, clock, hour):
+    hour[0] = 23
+    before = threading.active_count()
+    engine.on_event("ipx_portail", "on")
+    assert steps.drain(1) == [(["turnOn"], [])]
+    assert engine.scheduler.pending() >= 1
+    assert threading.active_count() <= before + 2
+    advance(engine, clock, 301)
+    assert steps.drain(1) == [(["turnOff"], [])]
+
+
+def test_hot_reload(engine, registry, rules_path, steps, clock):
+    engine.on_event("ipx_congelateur", "off")
+    rules = json.loads(json.dumps(RULES))
+    rules["rules"] = [rule for rule in rules["rules"] if rule["name"] != "congelateur"]
+    rules["rules"].append({"name": "nouvelle", "when": {"device": "ipx_nouveau", "etat": "any"},
+                           "then": {"scene": 7}})
+    write_atomic(rules_path, rules, 1)
+    assert registry.reload_if_changed() and registry.ruleset.version == 2
+    assert engine.on_event("ipx_nouveau", "nuit") == 1
+    steps.drain(1)
+    # Minuterie d'une règle supprimée : non exécutée
+    advance(engine, clock, 200)
+    assert steps.drain(0) == []
+
+    write_atomic(rules_path, "{invalide", 2)
+    assert not registry.reload_if_changed()
+    assert registry.ruleset.version == 2 and registry.last_error is not None
+
+
+def test_route_accepts_rule_only_input(monkeypatch, engine, steps):
+    monkeypatch.setattr(config, "RULES", True)
+    set_rule_engine(engine)
+    try:
+        from app import create_app
+        http = create_app().test_client()
+        response = http.get("/ipx-event", query_string={"relais": "ipx_entree_x", "etat": "on"})
+        assert response.status_code == 200 and response.get_json().get("rules") == 1
+        steps.drain(1)
+        response = http.get("/ipx-event", query_string={"relais": "ipx_inconnu", "etat": "on"})
+        assert response.status_code == 400
+    finally:
+        set_rule_engine(None)
+
+
+def test_delayed_step_dropped_when_its_rule_changed(engine, registry, rules_path, steps, clock, hour):
+    hour[0] = 23
+    engine.on_event("ipx_portail", "on")
+    steps.drain(1)
+    rules = json.loads(json.dumps(RULES))
+    # Étapes réordonnées : l'index 1 désignerait maintenant une autre action
+    rules["rules"][2]["then"] = [{"action": "turnOff", "device": 50},
+                                 {"action": "turnOn", "device": 51, "delay": 300}]
+    write_atomic(rules_path, rules, 1)
+    assert registry.reload_if_changed()
+    cancelled = RULES_EVENTS.labels("cancelled").value
+    advance(engine, clock, 301)
+    assert RULES_EVENTS.labels("cancelled").value == cancelled + 1
+    assert steps.drain(0) == []
+
+
+def test_delayed_step_kept_when_other_rules_change(engine, registry, rules_path, steps, clock, hour):
+    hour[0] = 23
+    engine.on_event("ipx_portail", "on")
+    steps.drain(1)
+    rules = json.loads(json.dumps(RULES))
+    rules["rules"] = [rule for rule in rules["rules"] if rule["name"] != "entree_x"]
+    write_atomic(rules_path, rules, 1)
+    assert registry.reload_if_changed()
+    advance(engine, clock, 301)
+    assert steps.drain(1) == [(["turnOff"], [])]
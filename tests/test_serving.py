@@ -0,0 +1,39 @@
+"""
+Tests du lancement en production (wsgi.py) : nombre de workers accepté selon les
+tâches de fond activées.
+"""
+
+import pytest
+
+import config
+from app import SINGLE_PROCESS_FEATURES, check_workers
+
+
+@pytest.fixture
+def features(monkeypatch):
+    for name in SINGLE_PROCESS_FEATURES:
+        monkeypatch.setattr(config, name, False)
+
+    def enable(name: str) -> None:
+        monkeypatch.setattr(config, name, True)
+    return enable
+
+
+def test_several_workers_without_background_tasks(features):
+    check_workers(4)
+
+
+@pytest.mark.parametrize("name", SINGLE_PROCESS_FEATURES)
+def test_single_process_feature_refuses_several_workers(features, name):
+    features(name)
+    check_workers(1)
+    with pytest.raises(SystemExit, match=name):
+        check_workers(2)
+
+
+def test_production_server_is_not_started(features):
+    pytest.importorskip("gunicorn")
+    from wsgi import run_production
+    features("OUTBOX")
+    with pytest.raises(SystemExit, match="OUTBOX"):
+        run_production({"workers": 2})
@@ -0,0 +1,57 @@
+"""
+Tests du simulateur (simulator/) : HC3 simulée et traces IPX800.
+"""
+
+import pytest
+import requests
+
+from simulator.ipx_traces import IPXTraceEvent, bursty_trace, load_trace, save_trace, trace_from_journal
+
+
+def test_call_action_updates_state_and_is_recorded(hc3_factory):
+    stub = hc3_factory(devices={20: False})
+    response = requests.get(f"{stub.base_url}/callAction", params={"deviceID": 20, "name": "turnOn"}, timeout=2)
+    assert response.status_code == 200
+    assert stub.states[20] is True
+    assert stub.count() == 1
+    assert stub.count("/api/devices") == 0
+
+
+def test_refresh_states_returns_changes_after_cursor(hc3_factory):
+    stub = hc3_factory(devices={20: False}, poll_hold=0.1)
+    last = stub.refresh_states(0)["last"]
+    stub.push_change(20, True)
+    changes = stub.refresh_states(last)
+    assert changes["changes"] == [{"id": 20, "value": True}]
+    assert stub.refresh_states(changes["last"])["changes"] == []
+
+
+def test_failure_injection(hc3_factory):
+    stub = hc3_factory(failure_rate=1.0, seed=1)
+    assert requests.get(f"{stub.base_url}/devices", timeout=2).status_code == 503
+    stub.failure_rate, stub.down = 0.0, True
+    with pytest.raises(requests.ConnectionError):
+        requests.get(f"{stub.base_url}/devices", timeout=2)
+
+
+def test_bursty_trace_is_reproducible_and_sorted():
+    devices = [f"ipx_{i}" for i in range(10)]
+    trace = bursty_trace(devices, duration=30, seed=7)
+    assert trace == bursty_trace(devices, duration=30, seed=7)
+    assert [event.at for event in trace] == sorted(event.at for event in trace)
+    assert {event.relais for event in trace} <= set(devices)
+    assert {event.etat for event in trace} <= {"on", "off"}
+
+
+def test_trace_round_trip(tmp_path):
+    trace = bursty_trace(["ipx_a", "ipx_b"], duration=10, seed=1)
+    path = str(tmp_path / "trace.jsonl")
+    save_trace(trace, path)
+    assert load_trace(path) == trace
+
+
+def test_trace_from_journal_keeps_ipx_events_only():
+    events = [{"kind": "ipx_event", "ts": 12.5, "ipx_name": "ipx_b", "etat": "off"},
+              {"kind": "hc3_call", "ts": 11.0},
+              {"kind": "ipx_event", "ts": 10.0, "ipx_name": "ipx_a", "etat": "on"}]
+    assert trace_from_journal(events) == [IPXTraceEvent(0.0, "ipx_a", "on"), IPXTraceEvent(2.5, "ipx_b", "off")]
@@ -0,0 +1,110 @@
+"""
+Tests de l'envoi des alertes SMS (avertissements/sms_dispatcher.py, ipx_alarms.py).
+"""
+
+import smtplib
+
+import pytest
+
+import config
+from avertissements import ipx_alarms
+from avertissements.alert_cooldown import AlertCooldown
+from avertissements.sms_dispatcher import AlertDispatcher, SMTPSender, build_alert_message
+
+
+class FakeSMTP:
+    """
+    Session SMTP simulée : chaque instance est une connexion.
+    """
+
+    sessions = []
+
+    def __init__(self, host, port, timeout=None):
+        self.messages = []
+        self.closed = False
+        # Exceptions à lever au prochain NOOP / à l'envoi
+        self.noop_error = None
+        self.send_error = None
+        FakeSMTP.sessions.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def noop(self):
+        if self.noop_error is not None:
+            raise self.noop_error
+        return 250, b"OK"
+
+    def send_message(self, msg):
+        self.messages.append(msg["Subject"])
+        if self.send_error is not None:
+            raise self.send_error
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    FakeSMTP.sessions = []
+    monkeypatch.setattr(smtplib, "SMTP", FakeSMTP)
+    return SMTPSender("smtp.test", 587, user="user", password="secret")
+
+
+def test_session_is_reused(sender):
+    sender.send(build_alert_message(["ipx_a"]))
+    sender.send(build_alert_message(["ipx_b"]))
+    assert sender.connections == 1
+    assert FakeSMTP.sessions[0].messages == ["IPX Alarme ipx_a", "IPX Alarme ipx_b"]
+
+
+def test_session_closed_by_server_is_reopened_before_sending(sender):
+    sender.send(build_alert_message(["ipx_a"]))
+    FakeSMTP.sessions[0].noop_error = smtplib.SMTPServerDisconnected("fermée")
+    sender.send(build_alert_message(["ipx_b"]))
+    assert sender.connections == 2
+    assert FakeSMTP.sessions[0].messages == ["IPX Alarme ipx_a"]
+    assert FakeSMTP.sessions[1].messages == ["IPX Alarme ipx_b"]
+
+
+def test_message_is_not_resent_after_failure_during_send(sender):
+    sender.send(build_alert_message(["ipx_a"]))
+    # Déconnexion après que le serveur a reçu le message
+    FakeSMTP.sessions[0].send_error = smtplib.SMTPServerDisconnected("coupée")
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        sender.send(build_alert_message(["ipx_b"]))
+    assert len(FakeSMTP.sessions) == 1
+    assert FakeSMTP.sessions[0].messages == ["IPX Alarme ipx_a", "IPX Alarme ipx_b"]
+    assert FakeSMTP.sessions[0].closed
+
+
+def test_dispatcher_batches_alerts(sender, wait_for):
+    dispatcher = AlertDispatcher(sender, batch_window=0.2).start()
+    try:
+        for device in ("ipx_a", "ipx_b", "ipx_a"):
+            assert dispatcher.submit(device)
+        assert wait_for(lambda: dispatcher.messages == 1)
+    finally:
+        dispatcher.stop()
+    assert FakeSMTP.sessions[0].messages == ["IPX Alarme 2 périphériques"]
+
+
+def test_full_queue_refunds_cooldown(monkeypatch, sender, tmp_path):
+    cooldown = AlertCooldown(str(tmp_path / "cooldown.db"), cooldown=300)
+    # Thread d'envoi non démarré : la file reste pleine
+    dispatcher = AlertDispatcher(sender, queue_size=1)
+    dispatcher.submit("ipx_autre")
+    monkeypatch.setattr(config, "SMS_ASYNC", True)
+    monkeypatch.setattr(ipx_alarms, "get_alert_cooldown", lambda: cooldown)
+    monkeypatch.setattr(ipx_alarms, "get_alert_dispatcher", lambda: dispatcher)
+
+    ipx_alarms.send_sms_alert("ipx_congelateur")
+    assert cooldown.acquire("ipx_congelateur")
+    assert not cooldown.acquire("ipx_congelateur")
+
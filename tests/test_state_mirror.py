@@ -0,0 +1,76 @@
+"""
+Tests du miroir des états HC3 (services/state_mirror.py) contre la HC3 simulée.
+"""
+
+import pytest
+
+import config
+from services.fibaro_service import FibaroClient
+from services import state_mirror
+from services.state_mirror import DeviceStateMirror, set_state_mirror
+
+
+@pytest.fixture
+def stub(hc3):
+    hc3.states.update({20: False, 27: True, 31: 0})
+    hc3.poll_hold = 0.5
+    return hc3
+
+
+@pytest.fixture
+def mirror(stub, wait_for):
+    mirror = DeviceStateMirror(FibaroClient(base_url=stub.base_url, user="test", password="test", pool_size=1),
+                               poll_timeout=2, retry_delay=0.1).start()
+    set_state_mirror(mirror)
+    assert wait_for(lambda: mirror.ready)
+    yield mirror
+    set_state_mirror(None)
+
+
+@pytest.fixture
+def client(stub):
+    client = FibaroClient(base_url=stub.base_url, user="test", password="test")
+    yield client
+    client.close()
+
+
+def test_initial_load(mirror):
+    assert mirror.is_on(20) is False
+    assert mirror.is_on(27) is True
+    assert mirror.get(31) == 0
+
+
+def test_follows_bridge_commands(mirror, client, wait_for):
+    client.call_action(20, "turnOn")
+    assert wait_for(lambda: mirror.is_on(20) is True)
+
+
+def test_follows_external_changes(mirror, stub, wait_for):
+    last = mirror.last
+    stub.push_change(31, 75)
+    assert wait_for(lambda: mirror.get(31) == 75)
+    assert mirror.last > last
+
+
+def test_redundant_events_do_not_call_hc3(monkeypatch, mapping, mirror, stub):
+    monkeypatch.setattr(config, "STATE_MIRROR", True)
+    mapping({"ipx_congelateur": 20, "ipx_test": 27})
+    from app import create_app
+    http = create_app().test_client()
+
+    calls = stub.count()
+    for _ in range(10):
+        body = http.get("/ipx-event", query_string={"relais": "ipx_test", "etat": "on"}).get_json()
+        assert body["delivery"] == "unchanged"
+    assert stub.count() == calls
+
+    body = http.get("/ipx-event", query_string={"relais": "ipx_congelateur", "etat": "on"}).get_json()
+    assert body["status"] == "OK" and body.get("delivery") != "unchanged"
+    assert stub.count() == calls + 1
+
+
+def test_disabled_mirror_is_not_created(monkeypatch, http):
+    monkeypatch.setattr(config, "STATE_MIRROR", False)
+    monkeypatch.setattr(state_mirror, "_mirror", None)
+    assert http.get("/devices/ipx_congelateur/state").status_code == 503
+    assert state_mirror._mirror is None
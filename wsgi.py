@@ -0,0 +1,84 @@
+"""
+wsgi.py
+
+Lancement de l'application en production sous gunicorn (worker gthread).
+
+Le serveur de développement de Flask (app.run) traite les requêtes dans un seul
+processus, sans keep-alive ni arrêt propre. Ici, gunicorn gère les connexions et
+les threads ; chaque worker appelle create_app() après le fork, donc les threads
+de fond (dispatcher, ordonnanceur, miroir HC3) démarrent dans le bon processus.
+
+Les réglages sont lus depuis config.py : SERVER_WORKERS, SERVER_THREADS,
+SERVER_KEEPALIVE, SERVER_GRACEFUL_TIMEOUT, SERVER_TIMEOUT, FLASK_HOST et FLASK_PORT.
+À l'arrêt (SIGTERM de systemd), les requêtes en cours disposent de
+SERVER_GRACEFUL_TIMEOUT secondes, puis shutdown_app() vide la file d'envoi.
+
+Plusieurs workers ne sont acceptés que sans les tâches de fond à instance unique
+(outbox, canal retour, miroir HC3, alarmes, sonde de santé, contrôle des entrées) :
+voir check_workers() dans app.py.
+
+Usage :
+    SERVER_MODE=production python app.py
+    python wsgi.py
+    gunicorn -k gthread --threads 8 "wsgi:create_app()"   (sans les réglages de config.py)
+
+Auteur : Arnaud Lefetey (SethiarWorks)
+"""
+
+import config
+from app import check_workers, create_app, shutdown_app
+
+
+def gunicorn_options() -> dict:
+    """
+    Réglages gunicorn construits à partir de config.py.
+    """
+    return {
+        "bind": f"{config.HOST}:{config.PORT}",
+        "worker_class": "gthread",
+        "workers": config.SERVER_WORKERS,
+        "threads": config.SERVER_THREADS,
+        "keepalive": config.SERVER_KEEPALIVE,
+        "graceful_timeout": config.SERVER_GRACEFUL_TIMEOUT,
+        "timeout": config.SERVER_TIMEOUT,
+        # Journal d'accès désactivé : /ipx-event est déjà tracé par le logger de l'application
+        "accesslog": None,
+        "errorlog": "-",
+        "worker_exit": lambda server, worker: shutdown_app(),
+    }
+
+
+def run_production(options: dict = None) -> None:
+    """
+    Démarre gunicorn (bloquant jusqu'à l'arrêt du serveur).
+
+    Args:
+        options (dict): Réglages gunicorn qui remplacent ceux de gunicorn_options().
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("[ERREUR] gunicorn n'est pas installé : pip install gunicorn")
+
+    settings = dict(gunicorn_options(), **(options or {}))
+    check_workers(settings["workers"])
+
+    class ProductionServer(BaseApplication):
+
+        def __init__(self, settings: dict):
+            self.settings = settings
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Appelé dans chaque worker après le fork
+            return create_app()
+
+    ProductionServer(settings).run()
+
+
+if __name__ == "__main__":
+    run_production()